@@ -0,0 +1,135 @@
+# app/alert_ledger.py
+"""
+Alert ledger — sổ cảnh báo đã gửi, idempotent qua restart/rerun và giữa các job.
+
+- Khoá = (job, ticker, bar_ts, side). bar_ts chuẩn hoá bằng pd.Timestamp → cùng một nến
+  ra cùng một khoá dù là str/Timestamp/datetime.
+- Lưu trong SQLite (ALERT_LEDGER_FILE, WAL); hit được giữ trong dict bộ nhớ → tra O(1),
+  miss mới hỏi DB (process khác — vd. CLI alerts_on_date — có thể vừa ghi).
+- TTL (ALERT_LEDGER_TTL_DAYS): entry cũ hơn coi như chưa gửi và được dọn khi mở ledger.
+- Job kiểm tra ledger TRƯỚC khi render/gửi, chỉ ghi (record) SAU khi gửi thành công
+  → gửi lỗi thì lần chạy sau vẫn gửi lại.
+- Fan-out nhiều subscriber: khoá gốc chỉ ghi khi MỌI chat đã nhận; mỗi chat nhận xong ghi khoá riêng
+  (subscriber_key: job@chat/topic) → lần sau chỉ gửi lại cho chat bị lỗi.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from .config import CFG
+
+Key = Tuple[str, str, str, str]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent_alerts (
+    job     TEXT NOT NULL,
+    ticker  TEXT NOT NULL,
+    bar_ts  TEXT NOT NULL,
+    side    TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (job, ticker, bar_ts, side)
+) WITHOUT ROWID
+"""
+
+
+def _norm_ts(bar_ts) -> str:
+    try:
+        return pd.Timestamp(bar_ts).isoformat()
+    except (TypeError, ValueError):
+        return str(bar_ts)
+
+
+def make_key(job: str, ticker: str, bar_ts, side: str = "BUY") -> Key:
+    return (str(job), str(ticker).upper(), _norm_ts(bar_ts), str(side).upper())
+
+
+def subscriber_key(key: Key, chat_id, thread_id=None) -> Key:
+    """Khoá của một chat/topic cho cùng cảnh báo: job → job@chat/topic."""
+    job, ticker, bar_ts, side = key
+    return (f"{job}@{chat_id}/{thread_id or 0}", ticker, bar_ts, side)
+
+
+class AlertLedger:
+    def __init__(self, path: str | Path, ttl_days: float = 7.0):
+        self.path = Path(path)
+        self.ttl = float(ttl_days) * 86400.0
+        self._lock = threading.Lock()
+        self._hits: Dict[Key, float] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self.purge()
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl
+
+    def seen(self, key: Key) -> bool:
+        """Khoá đã gửi (còn hạn TTL)?"""
+        cutoff = self._cutoff()
+        sent_at = self._hits.get(key)
+        if sent_at is not None and sent_at >= cutoff:
+            return True
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sent_at FROM sent_alerts WHERE job=? AND ticker=? AND bar_ts=? AND side=?", key
+            ).fetchone()
+        if row is None or row[0] < cutoff:
+            return False
+        self._hits[key] = row[0]
+        return True
+
+    def unseen(self, keys: Iterable[Key]) -> List[Key]:
+        """Giữ thứ tự, bỏ các khoá đã gửi."""
+        return [k for k in keys if not self.seen(k)]
+
+    def record(self, keys: Iterable[Key]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sent_alerts VALUES (?, ?, ?, ?, ?)", [(*k, now) for k in keys]
+            )
+        for k in keys:
+            self._hits[k] = now
+
+    def forget(self, job: str, bar_ts=None) -> int:
+        """Xoá entry của một job, kể cả khoá theo chat (tuỳ chọn: chỉ một nến) — dùng khi muốn gửi lại chủ động."""
+        sql, args = "DELETE FROM sent_alerts WHERE (job=? OR job LIKE ?)", [job, f"{job}@%"]
+        if bar_ts is not None:
+            sql += " AND bar_ts=?"
+            args.append(_norm_ts(bar_ts))
+        with self._lock:
+            n = self._conn.execute(sql, args).rowcount
+        self._hits = {k: v for k, v in self._hits.items()
+                      if not (k[0].split("@", 1)[0] == job and (bar_ts is None or k[2] == _norm_ts(bar_ts)))}
+        return n
+
+    def purge(self) -> int:
+        """Dọn entry hết hạn TTL."""
+        cutoff = self._cutoff()
+        with self._lock:
+            n = self._conn.execute("DELETE FROM sent_alerts WHERE sent_at < ?", (cutoff,)).rowcount
+        self._hits = {k: v for k, v in self._hits.items() if v >= cutoff}
+        return n
+
+
+_ledger: Optional[AlertLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> AlertLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = AlertLedger(Path(CFG.alert_ledger_file).resolve(), ttl_days=CFG.alert_ledger_ttl_days)
+        return _ledger
@@ -0,0 +1,284 @@
+# app/bar_store.py
+"""
+Bar store '1d' + lớp điều chỉnh giá (corporate actions) cho EOD.
+
+- Lưu nến GỐC (adjusted=False) theo mã: BAR_STORE_DIR/raw/<TICKER>.parquet — không bao giờ phải sửa lại.
+- Timeline hệ số điều chỉnh: BAR_STORE_DIR/adjustments.parquet (ticker, ex_date, price_factor, volume_factor).
+  Nến có time < ex_date được nhân price_factor (OHLC) và volume_factor (volume).
+- sync(): mã mới → tải BAR_HISTORY_SESSIONS phiên; mã đã có → chỉ tải BAR_REFRESH_SESSIONS phiên gần nhất.
+  Mỗi lần tải lấy cả giá gốc lẫn giá điều chỉnh của cùng cửa sổ; bước nhảy của tỷ lệ adjusted/raw
+  giữa hai phiên liên tiếp = một sự kiện (cổ tức/chia tách) → ghi vào timeline và chỉ xoá feature cache
+  của đúng mã đó.
+- read_adjusted(): áp hệ số lúc đọc (lazy), trả về khung giống Fetch_Trading_Data(adjusted=True).get_data().
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import CFG
+from .universe import DAILY_FIELDS, iter_daily_chunks
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+ADJ_COLUMNS = ['ticker', 'ex_date', 'price_factor', 'volume_factor', 'detected_at']
+
+
+def _by_ticker(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Tách dữ liệu vendor theo mã, cột 'time' datetime64, sort theo thời gian."""
+    if df is None or df.empty:
+        return {}
+    ts_col = next((c for c in ['timestamp', 'time', 'date'] if c in df.columns), None)
+    if ts_col is None:
+        raise KeyError("[bar_store] Thiếu cột thời gian ('timestamp'/'time'/'date').")
+    cols = [c for c in DAILY_FIELDS if c in df.columns]
+    out = pd.DataFrame({'time': pd.to_datetime(df[ts_col]).dt.tz_localize(None).dt.normalize()})
+    for c in cols:
+        out[c] = pd.to_numeric(df[c], errors='coerce').astype('float64')
+    tickers = df['ticker'].astype(str).str.upper().to_numpy()
+    return {
+        t: g.sort_values('time').drop_duplicates('time', keep='last').reset_index(drop=True)
+        for t, g in out.groupby(tickers, sort=False)
+    }
+
+
+def _segment_median(r: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    return np.array([np.nanmedian(r[a:b]) if b > a else np.nan for a, b in zip(bounds[:-1], bounds[1:])])
+
+
+def detect_adjustments(
+    times: np.ndarray,
+    raw: pd.DataFrame,
+    adj: pd.DataFrame,
+    tol: float = 0.005,
+) -> List[Tuple[pd.Timestamp, float, float]]:
+    """
+    Sự kiện điều chỉnh trong một cửa sổ nến (raw/adj cùng thứ tự `times`):
+    tỷ lệ adjusted/raw (tổng OHLC, giảm nhiễu làm tròn) nhảy quá `tol` giữa hai phiên liên tiếp
+    → ex_date = phiên sau, factor = median(tỷ lệ trước) / median(tỷ lệ sau).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = adj[PRICE_COLUMNS].sum(axis=1).to_numpy() / raw[PRICE_COLUMNS].sum(axis=1).to_numpy()
+        rv = adj['volume'].to_numpy() / raw['volume'].to_numpy() if 'volume' in raw else np.full(len(r), np.nan)
+    r[~np.isfinite(r) | (r <= 0)] = np.nan
+    rv[~np.isfinite(rv) | (rv <= 0)] = np.nan
+    ok = np.flatnonzero(~np.isnan(r))
+    if len(ok) < 2:
+        return []
+    jump = np.abs(r[ok[1:]] / r[ok[:-1]] - 1) > tol
+    if not jump.any():
+        return []
+    cuts = ok[1:][jump]
+    bounds = np.concatenate(([0], cuts, [len(r)]))
+    med, med_v = _segment_median(r, bounds), _segment_median(rv, bounds)
+    events = []
+    for k, j in enumerate(cuts):
+        pf = med[k] / med[k + 1]
+        if not np.isfinite(pf) or abs(pf - 1) <= tol:
+            continue
+        vf = med_v[k] / med_v[k + 1]
+        events.append((pd.Timestamp(times[j]), float(pf), float(vf) if np.isfinite(vf) else 1.0))
+    return events
+
+
+class BarStore:
+    def __init__(
+        self,
+        root: str | Path,
+        history_sessions: int = 260,
+        refresh_sessions: int = 5,
+        max_sessions: int = 400,
+        tol: float = 0.005,
+    ):
+        self.root = Path(root)
+        self.raw_dir = self.root / "raw"
+        self.adj_path = self.root / "adjustments.parquet"
+        self.history_sessions = history_sessions
+        self.refresh_sessions = max(2, refresh_sessions)
+        self.max_sessions = max(max_sessions, history_sessions)
+        self.tol = tol
+        self._adj: Optional[pd.DataFrame] = None
+        self._events: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self.raw_dir.mkdir(parents=True, exist_ok=True)
+
+    # ---- nến gốc ----
+    def _raw_path(self, ticker: str) -> Path:
+        return self.raw_dir / f"{ticker}.parquet"
+
+    def read_raw(self, ticker: str, columns: Optional[Sequence[str]] = None) -> Optional[pd.DataFrame]:
+        path = self._raw_path(ticker)
+        if not path.exists():
+            return None
+        return pd.read_parquet(path, columns=list(columns) if columns else None)
+
+    def last_time(self, ticker: str) -> Optional[pd.Timestamp]:
+        df = self.read_raw(ticker, columns=['time'])
+        return None if df is None or df.empty else df['time'].max()
+
+    def _write_raw(self, ticker: str, df: pd.DataFrame) -> None:
+        path = self._raw_path(ticker)
+        tmp = path.with_suffix(".parquet.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    # ---- timeline điều chỉnh ----
+    def adjustments(self) -> pd.DataFrame:
+        if self._adj is None:
+            self._adj = (
+                pd.read_parquet(self.adj_path) if self.adj_path.exists()
+                else pd.DataFrame(columns=ADJ_COLUMNS)
+            )
+            self._events = {}
+        return self._adj
+
+    def _write_adjustments(self, df: pd.DataFrame) -> None:
+        tmp = self.adj_path.with_suffix(".parquet.tmp")
+        df.sort_values(['ticker', 'ex_date']).to_parquet(tmp, index=False)
+        os.replace(tmp, self.adj_path)
+        self._adj, self._events = df, {}
+
+    def _ticker_events(self, ticker: str):
+        """(ex_date ns, hậu tích price_factor, hậu tích volume_factor) của một mã (cache trong RAM)."""
+        if ticker not in self._events:
+            adj = self.adjustments()
+            ev = adj[adj['ticker'] == ticker].sort_values('ex_date')
+            ex = pd.to_datetime(ev['ex_date']).to_numpy('datetime64[ns]')
+            # suffix[k] = tích các factor từ sự kiện k trở đi; suffix[len] = 1
+            pf = np.append(np.cumprod(ev['price_factor'].to_numpy(float)[::-1])[::-1], 1.0)
+            vf = np.append(np.cumprod(ev['volume_factor'].to_numpy(float)[::-1])[::-1], 1.0)
+            self._events[ticker] = (ex, pf, vf)
+        return self._events[ticker]
+
+    def factors(self, ticker: str, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Hệ số giá / khối lượng cho từng nến (tích các sự kiện có ex_date > time)."""
+        ex, pf, vf = self._ticker_events(ticker)
+        idx = np.searchsorted(ex, np.asarray(times, dtype='datetime64[ns]'), side='right')
+        return pf[idx], vf[idx]
+
+    # ---- đọc đã điều chỉnh ----
+    def read_adjusted(self, tickers: Iterable[str], sessions: Optional[int] = None) -> pd.DataFrame:
+        parts = []
+        for t in tickers:
+            raw = self.read_raw(t)
+            if raw is None or raw.empty:
+                continue
+            if sessions:
+                raw = raw.iloc[-sessions:]
+            pf, vf = self.factors(t, raw['time'].to_numpy())
+            out = raw.rename(columns={'time': 'timestamp'})
+            for c in PRICE_COLUMNS:
+                if c in out.columns:
+                    out[c] = out[c].to_numpy() * pf
+            if 'volume' in out.columns:
+                out['volume'] = out['volume'].to_numpy() * vf
+            out.insert(0, 'ticker', t)
+            parts.append(out)
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+    # ---- đồng bộ với vendor ----
+    def _fetch(self, client, tickers: Sequence[str], period: int) -> Tuple[Dict[str, pd.DataFrame], Dict[str, pd.DataFrame]]:
+        raw, adj = {}, {}
+        for chunk in iter_daily_chunks(client, tickers, period=period, adjusted=False):
+            raw.update(_by_ticker(chunk))
+        for chunk in iter_daily_chunks(client, tickers, period=period, adjusted=True):
+            adj.update(_by_ticker(chunk))
+        return raw, adj
+
+    def _ingest(self, ticker: str, raw: pd.DataFrame, adj: Optional[pd.DataFrame], bootstrap: bool):
+        """Ghi nến gốc + trả về (trạng thái, các sự kiện mới). trạng thái: 'ok' | 'gap'."""
+        old = None if bootstrap else self.read_raw(ticker)
+        if old is not None and not old.empty and raw['time'].min() > old['time'].max():
+            return 'gap', []
+        events = []
+        if adj is not None and not adj.empty:
+            both = raw[['time'] + PRICE_COLUMNS + ['volume']].merge(
+                adj[['time'] + PRICE_COLUMNS + ['volume']], on='time', suffixes=('', '_adj')
+            )
+            events = detect_adjustments(
+                both['time'].to_numpy(),
+                both[PRICE_COLUMNS + ['volume']],
+                both[[f"{c}_adj" for c in PRICE_COLUMNS + ['volume']]].set_axis(PRICE_COLUMNS + ['volume'], axis=1),
+                self.tol,
+            )
+        merged = raw if old is None else pd.concat([old, raw], ignore_index=True)
+        merged = merged.drop_duplicates('time', keep='last').sort_values('time').iloc[-self.max_sessions:]
+        self._write_raw(ticker, merged.reset_index(drop=True))
+        return 'ok', events
+
+    def sync(self, client, tickers: Sequence[str]) -> Set[str]:
+        """Cập nhật tăng dần; trả về tập mã có sự kiện điều chỉnh MỚI (đã xoá feature cache của chúng)."""
+        tickers = list(dict.fromkeys(str(t).upper() for t in tickers))
+        fresh = [t for t in tickers if not self._raw_path(t).exists()]
+        stale = [t for t in tickers if self._raw_path(t).exists()]
+
+        adj = self.adjustments()
+        known = set(zip(adj['ticker'], pd.to_datetime(adj['ex_date'])))
+        new_rows, rebuilt, changed = [], set(), set()
+        now = datetime.now()
+
+        rounds = [(stale, self.refresh_sessions, False), (fresh, self.history_sessions, True)]
+        while rounds:
+            group, period, bootstrap = rounds.pop(0)
+            if not group:
+                continue
+            raw_map, adj_map = self._fetch(client, group, period)
+            gaps = []
+            for t in group:
+                raw = raw_map.get(t)
+                if raw is None or raw.empty:
+                    continue
+                status, events = self._ingest(t, raw, adj_map.get(t), bootstrap)
+                if status == 'gap':
+                    # Bỏ lỡ nhiều phiên hơn cửa sổ refresh → tải lại toàn bộ lịch sử mã này
+                    gaps.append(t)
+                    continue
+                if bootstrap:
+                    rebuilt.add(t)
+                for ex, pf, vf in events:
+                    if not bootstrap and (t, ex) in known:
+                        continue
+                    known.add((t, ex))
+                    new_rows.append({'ticker': t, 'ex_date': ex, 'price_factor': pf,
+                                     'volume_factor': vf, 'detected_at': now})
+                    if not bootstrap:
+                        changed.add(t)
+            if gaps:
+                rounds.append((gaps, self.history_sessions, True))
+
+        if new_rows or rebuilt:
+            # Mã tải lại toàn bộ: timeline suy ra lại từ đầu cửa sổ lịch sử
+            parts = [adj[~adj['ticker'].isin(rebuilt)], pd.DataFrame(new_rows, columns=ADJ_COLUMNS)]
+            parts = [p for p in parts if not p.empty]
+            merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=ADJ_COLUMNS)
+            self._write_adjustments(merged)
+
+        if changed:
+            print(f"[bar_store] Sự kiện điều chỉnh mới: {', '.join(sorted(changed))}")
+            from .strategy_adapter import get_feature_cache
+            cache = get_feature_cache()
+            if cache is not None:
+                for t in changed:
+                    cache.invalidate(t)
+        return changed
+
+
+_store: Optional[BarStore] = None
+
+
+def get_bar_store() -> BarStore:
+    global _store
+    if _store is None:
+        _store = BarStore(
+            Path(CFG.bar_store_dir).resolve(),
+            history_sessions=CFG.bar_history_sessions,
+            refresh_sessions=CFG.bar_refresh_sessions,
+            max_sessions=CFG.bar_max_sessions,
+            tol=CFG.bar_adj_tol,
+        )
+    return _store
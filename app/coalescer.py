@@ -0,0 +1,203 @@
+# app/coalescer.py
+"""
+Coalescer — bộ đệm có giới hạn, gộp theo mã giữa feed realtime và phần đánh giá chiến lược.
+
+- offer(df) chạy trên thread callback của vendor: chỉ ghi "mã → frame mới nhất chứa mã" (O(số mã),
+  không tách/tính pandas). Cập nhật mới của một mã đang chờ thay bản cũ (merged).
+- Một thread flush đánh giá tuần tự → tối đa một lượt tính tại một thời điểm, cách nhau ít nhất
+  COALESCE_MIN_GAP giây (giới hạn CPU). Mỗi lượt thức dậy:
+    * dựng frame gồm nến của các mã đang chờ (lấy từ frame mới nhất của từng mã),
+    * bỏ mã không đổi so với lần đánh giá trước (dropped_unchanged),
+    * đánh giá ngay nếu có thay đổi đáng kể (nến mới, mã mới, |Δclose| ≥ COALESCE_MIN_CHANGE),
+      hoặc khi cập nhật cũ nhất đã chờ COALESCE_INTERVAL giây → độ trễ cảnh báo có chặn trên.
+- Quá COALESCE_MAX_PENDING mã đang chờ → mã mới bị bỏ (dropped_overflow).
+- metrics(): received / merged / dropped_* / evals / độ trễ; xem qua server snapshot (/metrics).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from .config import CFG
+from .snapshot import register_metrics
+
+
+@dataclass
+class CoalescerMetrics:
+    received: int = 0           # cập nhật (mã × callback) nhận vào
+    merged: int = 0             # bị bản mới hơn của cùng mã thay trước khi đánh giá
+    dropped_unchanged: int = 0  # không đổi so với lần đánh giá trước
+    dropped_overflow: int = 0   # bỏ vì quá COALESCE_MAX_PENDING
+    evals: int = 0
+    evaluated_tickers: int = 0
+    eval_errors: int = 0
+    pending: int = 0
+    last_eval_ms: float = 0.0
+    last_lag_ms: float = 0.0    # từ cập nhật cũ nhất đang chờ tới lúc đánh giá
+    max_lag_ms: float = 0.0
+
+
+class BarCoalescer:
+    def __init__(
+        self,
+        on_flush: Callable[[pd.DataFrame], None],
+        interval: Optional[float] = None,
+        min_gap: Optional[float] = None,
+        min_change: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        name: str = "coalescer",
+    ):
+        self.on_flush = on_flush
+        self.interval = CFG.coalesce_interval if interval is None else interval
+        self.min_gap = CFG.coalesce_min_gap if min_gap is None else min_gap
+        self.min_change = CFG.coalesce_min_change if min_change is None else min_change
+        self.max_pending = CFG.coalesce_max_pending if max_pending is None else max_pending
+        self.name = name
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pending: Dict[str, int] = {}          # mã → id frame mới nhất
+        self._frames: Dict[int, pd.DataFrame] = {}
+        self._seq = 0
+        self._oldest: Optional[float] = None         # thời điểm cập nhật cũ nhất đang chờ
+        self._evaluated: Dict[str, Tuple] = {}       # mã → (nến, close, volume) lần đánh giá trước
+        self._m = CoalescerMetrics()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- thread callback ----
+    def offer(self, df: pd.DataFrame) -> None:
+        if df is None or df.empty:
+            return
+        tickers = pd.unique(df["ticker"].to_numpy())
+        with self._lock:
+            self._seq += 1
+            fid = self._seq
+            self._frames[fid] = df
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            for t in tickers:
+                t = str(t)
+                if t in self._pending:
+                    self._m.merged += 1
+                elif len(self._pending) >= self.max_pending:
+                    self._m.dropped_overflow += 1
+                    continue
+                self._pending[t] = fid
+            self._m.received += len(tickers)
+            self._m.pending = len(self._pending)
+            # frame không còn mã nào trỏ tới → bỏ tham chiếu
+            live = set(self._pending.values())
+            for k in [k for k in self._frames if k not in live]:
+                del self._frames[k]
+        self._wake.set()
+
+    # ---- thread flush ----
+    def _take(self) -> Tuple[pd.DataFrame, Optional[float]]:
+        with self._lock:
+            pending, frames, oldest = self._pending, self._frames, self._oldest
+            self._pending, self._frames, self._oldest = {}, {}, None
+            self._m.pending = 0
+        by_frame: Dict[int, list] = {}
+        for t, fid in pending.items():
+            by_frame.setdefault(fid, []).append(t)
+        parts = [frames[fid][frames[fid]["ticker"].isin(ts)] for fid, ts in by_frame.items()]
+        return (pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()), oldest
+
+    def _restore(self, df: pd.DataFrame, oldest: float) -> None:
+        """Chưa tới lượt đánh giá → trả các mã về hàng chờ (bản mới hơn đến sau được ưu tiên)."""
+        with self._lock:
+            self._seq += 1
+            fid = self._seq
+            self._frames[fid] = df
+            for t in pd.unique(df["ticker"].to_numpy()):
+                t = str(t)
+                if t in self._pending:
+                    self._m.merged += 1
+                else:
+                    self._pending[t] = fid
+            self._oldest = oldest if self._oldest is None else min(self._oldest, oldest)
+            self._m.pending = len(self._pending)
+
+    def _changes(self, df: pd.DataFrame):
+        """(mã đã đổi, có thay đổi đáng kể?, trạng thái mới từng mã) theo nến cuối mỗi mã."""
+        ts = "timestamp" if "timestamp" in df.columns else "time"
+        last = df.sort_values(["ticker", ts], kind="stable").groupby("ticker", sort=False).tail(1)
+        state = dict(zip(last["ticker"].astype(str),
+                         zip(last[ts].tolist(), last["close"].tolist(), last["volume"].tolist())))
+        changed, material = set(), False
+        for t, (bar, close, vol) in state.items():
+            prev = self._evaluated.get(t)
+            if prev == (bar, close, vol):
+                continue
+            changed.add(t)
+            if prev is None or prev[0] != bar:
+                material = True
+            elif not material and prev[1]:
+                material = abs(close / prev[1] - 1) >= self.min_change
+        return changed, material, state
+
+    def _flush_once(self) -> None:
+        df, oldest = self._take()
+        if df.empty:
+            return
+        changed, material, state = self._changes(df)
+        self._m.dropped_unchanged += len(state) - len(changed)
+        df = df[df["ticker"].astype(str).isin(changed).to_numpy()]
+        if df.empty:
+            return
+        now = time.monotonic()
+        if not material and now - oldest < self.interval:
+            self._restore(df, oldest)
+            return
+        t0 = time.perf_counter()
+        try:
+            self.on_flush(df)
+        except Exception as exc:
+            self._m.eval_errors += 1
+            print(f"[{self.name}] đánh giá lỗi: {exc}")
+        for t in changed:
+            self._evaluated[t] = state[t]
+        m = self._m
+        m.evals += 1
+        m.evaluated_tickers += len(changed)
+        m.last_eval_ms = (time.perf_counter() - t0) * 1e3
+        m.last_lag_ms = (now - oldest) * 1e3
+        m.max_lag_ms = max(m.max_lag_ms, m.last_lag_ms)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            t0 = time.monotonic()
+            self._flush_once()
+            # giới hạn CPU: hai lượt đánh giá cách nhau ít nhất min_gap
+            rest = self.min_gap - (time.monotonic() - t0)
+            if rest > 0:
+                self._stop.wait(rest)
+
+    def start(self) -> "BarCoalescer":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+        register_metrics(self.name, self.metrics)
+        return self
+
+    def stop(self, flush: bool = False) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.interval = 0.0
+            self._flush_once()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return asdict(self._m)
@@ -19,13 +19,97 @@ class Settings:
         if s.strip()
     )
     tz: str         = os.getenv("TIMEZONE", "Asia/Ho_Chi_Minh")
+    # Ngày nghỉ bổ sung ngoài bảng VN_HOLIDAYS (app/utils/trading_calendar.py), mỗi dòng YYYY-MM-DD
+    holidays_file: str = os.getenv("HOLIDAYS_FILE", "holidays.txt")
     # Scheduling (configurable):
     eod_hour: int    = int(os.getenv("EOD_HOUR", "15"))
     eod_minute: int  = int(os.getenv("EOD_MINUTE", "5"))
+    # EOD theo dữ liệu: thăm dò nến chốt từ EOD_WATCH_START, gửi khi đủ mã hoặc tới EOD_DEADLINE
+    use_eod_watcher: bool  = bool(int(os.getenv("USE_EOD_WATCHER", "0")))
+    eod_watch_start: str   = os.getenv("EOD_WATCH_START", "14:50")
+    eod_deadline: str      = os.getenv("EOD_DEADLINE", "15:45")
+    eod_min_coverage: float = float(os.getenv("EOD_MIN_COVERAGE", "0.9"))
+    eod_poll_seconds: float = float(os.getenv("EOD_POLL_SECONDS", "30"))
+    eod_stable_polls: int  = int(os.getenv("EOD_STABLE_POLLS", "2"))
     # EOD-only: intraday OFF by default
     use_intraday: bool = bool(int(os.getenv("USE_INTRADAY", "0")))
+    # Realtime: số process worker tính callback 15m/1d theo shard mã (0 = tính ngay trên thread callback)
+    realtime_shards: int  = int(os.getenv("REALTIME_SHARDS", "0"))
+    shard_queue_size: int = int(os.getenv("SHARD_QUEUE_SIZE", "64"))
+    # Order-flow 15' (app/orderflow.py): cửa sổ nến, ngưỡng imbalance / khối lượng tương đối, profile theo khung giờ
+    of_window: int           = int(os.getenv("OF_WINDOW", "4"))
+    of_min_imbalance: float  = float(os.getenv("OF_MIN_IMBALANCE", "0.1"))
+    of_min_rvol: float       = float(os.getenv("OF_MIN_RVOL", "1.5"))
+    of_profile_days: int     = int(os.getenv("OF_PROFILE_DAYS", "20"))
+    of_profile_min_days: int = int(os.getenv("OF_PROFILE_MIN_DAYS", "3"))
+    of_atr_period: int       = int(os.getenv("OF_ATR_PERIOD", "14"))
+    # Điều kiện theo dòng tiền phiên (app/intraday_flow.py): close so với VWAP, khối ngoại ròng / khối lượng (-1 = tắt)
+    of_min_vwap_dev: float      = float(os.getenv("OF_MIN_VWAP_DEV", "-1"))
+    of_min_foreign_ratio: float = float(os.getenv("OF_MIN_FOREIGN_RATIO", "-1"))
+    # Stream realtime có giám sát: stall (0 = tự chọn theo khung nến), backoff có jitter, giới hạn backfill
+    stream_stall_seconds: float   = float(os.getenv("STREAM_STALL_SECONDS", "0"))
+    stream_backoff_base: float    = float(os.getenv("STREAM_BACKOFF_BASE", "0.5"))
+    stream_backoff_max: float     = float(os.getenv("STREAM_BACKOFF_MAX", "30"))
+    stream_backfill_max_bars: int = int(os.getenv("STREAM_BACKFILL_MAX_BARS", "200"))
+    # Feed giả lập thay FiinQuantX (app/feed_sim.py): "" = vendor thật, "synthetic" hoặc file csv/parquet ("{by}")
+    feed_sim: str         = os.getenv("FEED_SIM", "").strip()
+    feed_sim_speed: float = float(os.getenv("FEED_SIM_SPEED", "1"))
+    feed_sim_ticks: int   = int(os.getenv("FEED_SIM_TICKS", "4"))
+    # Profiling theo yêu cầu (app/profiling.py): PROFILE=eod,stream-1d|all; trống = tắt
+    profile: str           = os.getenv("PROFILE", "").strip()
+    profile_mode: str      = os.getenv("PROFILE_MODE", "cprofile").strip() or "cprofile"
+    profile_dir: str       = os.getenv("PROFILE_DIR", "profiles")
+    profile_every: int     = int(os.getenv("PROFILE_EVERY", "50"))
+    profile_sample_ms: float = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+    # Coalescer nến ngày đang chạy: giữ bản mới nhất mỗi mã, đánh giá theo nhịp hoặc khi đổi đáng kể
+    use_coalescer: bool        = bool(int(os.getenv("USE_COALESCER", "1")))
+    coalesce_interval: float   = float(os.getenv("COALESCE_INTERVAL", "5"))
+    coalesce_min_gap: float    = float(os.getenv("COALESCE_MIN_GAP", "1"))
+    coalesce_min_change: float = float(os.getenv("COALESCE_MIN_CHANGE", "0.005"))
+    coalesce_max_pending: int  = int(os.getenv("COALESCE_MAX_PENDING", "5000"))
     open_hour: int   = int(os.getenv("OPEN_HOUR", "9"))
     close_hour: int  = int(os.getenv("CLOSE_HOUR", "15"))
+    # Universe mode: EOD quét toàn thị trường (HOSE/HNX/UPCoM) thay vì TICKERS
+    universe_mode: bool = bool(int(os.getenv("UNIVERSE_MODE", "0")))
+    universe_file: str  = os.getenv("UNIVERSE_FILE", "universe.txt")
+    universe_max_age_days: int = int(os.getenv("UNIVERSE_MAX_AGE_DAYS", "7"))
+    fetch_chunk_size: int  = int(os.getenv("FETCH_CHUNK_SIZE", "200"))
+    fetch_concurrency: int = int(os.getenv("FETCH_CONCURRENCY", "4"))
+    fetch_retries: int     = int(os.getenv("FETCH_RETRIES", "3"))
+    # Liquidity index: bỏ qua mã không thể qua cổng thanh khoản trước khi fetch/tính feature
+    liquidity_index_file: str = os.getenv("LIQUIDITY_INDEX_FILE", "liquidity_index.parquet")
+    use_liquidity_prefilter: bool = bool(int(os.getenv("USE_LIQUIDITY_PREFILTER", "1")))
+    liq_min_volume_ma20: float = float(os.getenv("LIQ_MIN_VOLUME_MA20", "100000"))
+    liq_margin: float        = float(os.getenv("LIQ_MARGIN", "0.5"))
+    liq_min_turnover: float  = float(os.getenv("LIQ_MIN_TURNOVER", "0"))
+    liq_max_age_days: int    = int(os.getenv("LIQ_MAX_AGE_DAYS", "7"))
+    liq_refresh_hour: int    = int(os.getenv("LIQ_REFRESH_HOUR", "18"))
+    # Feature cache theo nội dung nến (ticker, ngày cuối, hash OHLCV) — EOD/replay chạy lại gần như miễn phí
+    use_feature_cache: bool  = bool(int(os.getenv("USE_FEATURE_CACHE", "1")))
+    feature_cache_dir: str   = os.getenv("FEATURE_CACHE_DIR", "feature_cache")
+    feature_cache_max_mb: int = int(os.getenv("FEATURE_CACHE_MAX_MB", "256"))
+    # Bar store: lưu nến gốc + timeline hệ số điều chỉnh, EOD chỉ tải vài phiên gần nhất
+    use_bar_store: bool       = bool(int(os.getenv("USE_BAR_STORE", "0")))
+    bar_store_dir: str        = os.getenv("BAR_STORE_DIR", "bar_store")
+    bar_history_sessions: int = int(os.getenv("BAR_HISTORY_SESSIONS", "260"))
+    bar_refresh_sessions: int = int(os.getenv("BAR_REFRESH_SESSIONS", "5"))
+    bar_max_sessions: int     = int(os.getenv("BAR_MAX_SESSIONS", "400"))
+    bar_adj_tol: float        = float(os.getenv("BAR_ADJ_TOL", "0.005"))
+    # Fan-out cảnh báo: danh sách subscriber (JSON) + số luồng/kết nối gửi Telegram song song
+    subscribers_file: str = os.getenv("SUBSCRIBERS_FILE", "subscribers.json")
+    send_pool_size: int   = int(os.getenv("SEND_POOL_SIZE", "4"))
+    # Alert ledger: cảnh báo đã gửi (job, mã, nến, chiều) — rerun/restart không gửi lại
+    alert_ledger_file: str       = os.getenv("ALERT_LEDGER_FILE", "alert_ledger.sqlite")
+    alert_ledger_ttl_days: float = float(os.getenv("ALERT_LEDGER_TTL_DAYS", "7"))
+    # Screener: primary gửi cảnh báo; shadow chỉ chạy trên cùng feature frame và ghi log để so sánh
+    screener_primary: str = os.getenv("SCREENER_PRIMARY", "v12").strip() or "v12"
+    screener_shadows: tuple = tuple(s.strip() for s in os.getenv("SCREENER_SHADOWS", "").split(",") if s.strip())
+    shadow_log_file: str  = os.getenv("SHADOW_LOG_FILE", "shadow_picks.jsonl")
+    # Hot snapshot: feature/picks mới nhất giữ trong process, tra qua HTTP nội bộ hoặc Unix socket
+    use_snapshot_server: bool = bool(int(os.getenv("USE_SNAPSHOT_SERVER", "1")))
+    snapshot_port: int    = int(os.getenv("SNAPSHOT_PORT", "8765"))
+    snapshot_socket: str  = os.getenv("SNAPSHOT_SOCKET", "")
+    snapshot_ipc_dir: str = os.getenv("SNAPSHOT_IPC_DIR", "")
 
     def __post_init__(self):
         # Luôn thêm VNINDEX để tính market features (MA/RSI/ADX/BB width) cho V12
@@ -0,0 +1,339 @@
+# app/feed_sim.py
+"""
+Feed simulator — thay FiinQuantX cho stream 15m/1d khi không có phiên vendor (FEED_SIM).
+
+- SimClient.Fetch_Trading_Data(...) cùng chữ ký với client vendor mà repo dùng:
+    * realtime=False → .get_data() trả `period` nến đã đóng gần nhất mỗi mã tới vị trí phát lại hiện tại;
+    * realtime=True  → SimEvent: .get_data() chạy thread phát lại, callback(SimBarData) có .to_dataFrame(),
+      .stop() / cờ _stop như event vendor. Reconnect (SupervisedStream) phát tiếp từ vị trí hiện tại.
+- Nguồn nến: "synthetic" (random walk, VNINDEX + các mã yêu cầu) hoặc file csv/parquet — đường dẫn có thể
+  chứa "{by}" (vd. data/bars_{by}.parquet). `warmup` nến đầu là lịch sử, `replay_bars` nến sau được phát lại.
+- Mỗi frame gồm tối đa `window` nến gần nhất mỗi mã, nến cuối là nến đang chạy:
+    * wait_for_full_timeFrame=True: một frame khi nến mới mở (nến áp chót vừa đóng — như _on_bar_15m giả định);
+    * False: `ticks_per_bar` frame mỗi nến, giá/khối lượng nến cuối tiến dần tới giá trị thật;
+      `update_fraction` < 1 → mỗi tick chỉ gồm một phần mã (VNINDEX luôn có), như vendor đẩy mã vừa khớp lệnh.
+- Tốc độ: khoảng giữa hai frame = độ dài nến (1d: phiên 270') / số tick mỗi nến / speed; speed=0 → nhanh nhất có thể.
+  Callback chạy đồng bộ trên thread phát lại như vendor → callback chậm làm các frame sau trễ lịch.
+  FeedStats ghi thời gian trong callback, độ trễ so với lịch và backlog (số frame đã tới hạn mà chưa phát).
+
+Chạy thử nhanh (in số liệu callback rỗng):
+    python -m app.feed_sim --by 15m --tickers 200 --speed 0
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .stream_supervisor import FIELDS, SESSIONS
+
+_BAR_MINUTES = {"1m": 1, "5m": 5, "15m": 15, "30m": 30, "1h": 60, "1d": 270}
+_FLOWS = ["volume", "bu", "sd", "fb", "fs", "fn"]
+
+
+def session_stamps(by: str, n_bars: int, end=None) -> pd.DatetimeIndex:
+    """`n_bars` mốc nến liên tiếp theo giờ khớp lệnh (ngày làm việc, nghỉ trưa), kết thúc tại `end`."""
+    end = pd.Timestamp(end if end is not None else pd.Timestamp.today()).normalize()
+    if by == "1d":
+        return pd.bdate_range(end=end, periods=n_bars)
+    step = pd.Timedelta(minutes=_BAR_MINUTES[by])
+    slots = []
+    for a, b in SESSIONS:
+        t, stop = pd.Timedelta(hours=a.hour, minutes=a.minute), pd.Timedelta(hours=b.hour, minutes=b.minute)
+        while t < stop:
+            slots.append(t)
+            t += step
+    days = pd.bdate_range(end=end, periods=-(-n_bars // len(slots)))
+    return pd.DatetimeIndex([d + s for d in days for s in slots])[-n_bars:]
+
+
+def synthetic_bars(tickers: Iterable[str], by: str = "1d", n_bars: int = 300, seed: int = 0) -> pd.DataFrame:
+    """Nến random walk cho VNINDEX + tickers, đủ cột FIELDS (bu/sd/fb/fs/fn theo tỉ lệ khối lượng)."""
+    names = list(dict.fromkeys(["VNINDEX", *(str(t).strip().upper() for t in tickers)]))
+    rng = np.random.default_rng(seed)
+    ts = session_stamps(by, n_bars)
+    k, n = len(names), len(ts)
+    scale = 1.0 if by == "1d" else (_BAR_MINUTES[by] / 270) ** 0.5  # biến động theo độ dài nến
+    base = np.where(np.array(names) == "VNINDEX", 1250.0, rng.uniform(8, 80, k))[:, None]
+    ret = rng.normal(0, 0.018 * scale, (k, n)) + rng.normal(0.0005, 0.001, (k, 1)) * scale
+    close = base * np.cumprod(1 + ret, axis=1)
+    open_ = np.concatenate([base, close[:, :-1]], axis=1) * (1 + rng.normal(0, 0.003 * scale, (k, n)))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01 * scale, (k, n)))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01 * scale, (k, n)))
+    volume = np.round(rng.lognormal(13, 0.6, (k, n)) * (_BAR_MINUTES[by] / 270))
+    bu = np.round(volume * rng.uniform(0.3, 0.7, (k, n)))
+    fb = np.round(volume * rng.uniform(0, 0.1, (k, n)))
+    fs = np.round(volume * rng.uniform(0, 0.1, (k, n)))
+    cols = {"open": open_, "high": high, "low": low, "close": close, "volume": volume,
+            "bu": bu, "sd": volume - bu, "fb": fb, "fs": fs, "fn": fb - fs}
+    df = pd.DataFrame({"ticker": np.repeat(names, n), "timestamp": np.tile(ts, k)})
+    for c, v in cols.items():
+        df[c] = v.ravel()
+    return df
+
+
+def load_bars(path: str, by: str) -> pd.DataFrame:
+    """Nến từ file csv/parquet (cột ticker, timestamp|time|date, OHLCV, bu/sd/fb/fs/fn nếu có)."""
+    p = Path(str(path).format(by=by))
+    df = pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_csv(p)
+    for alt in ("time", "date"):
+        if "timestamp" not in df.columns and alt in df.columns:
+            df = df.rename(columns={alt: "timestamp"})
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df["ticker"] = df["ticker"].astype(str).str.upper()
+    return df.sort_values(["ticker", "timestamp"], kind="stable", ignore_index=True)
+
+
+class SimBarData:
+    """Payload callback giống BarDataUpdate của vendor."""
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+
+    def to_dataFrame(self) -> pd.DataFrame:
+        return self._df
+
+
+class _SimRequest:
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+
+    def get_data(self) -> pd.DataFrame:
+        return self._df
+
+
+class _Replay:
+    """Nến của một khung `by` + vị trí phát lại (dùng chung giữa các lần subscribe/fetch lịch sử)."""
+
+    def __init__(self, bars: pd.DataFrame, warmup: int, replay_bars: Optional[int], window: int, seed: int):
+        bars = bars.sort_values(["ticker", "timestamp"], kind="stable", ignore_index=True)
+        self.stamps = pd.DatetimeIndex(np.sort(bars["timestamp"].unique()))
+        self.bars = bars
+        self.pos = self.stamps.searchsorted(bars["timestamp"].to_numpy())  # chỉ số nến của từng dòng
+        self.codes, self.names = pd.factorize(bars["ticker"])  # mã → số nguyên, lọc bằng bảng tra
+        self.window = window
+        self.bar = min(warmup, len(self.stamps) - 1)  # nến đang chạy
+        self.end = len(self.stamps) if replay_bars is None else min(len(self.stamps), self.bar + replay_bars)
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+    def history(self, tickers: Sequence[str], period: int) -> pd.DataFrame:
+        """Nến đã đóng (trước nến đang chạy), tối đa `period` nến mỗi mã."""
+        with self.lock:
+            hi = self.bar - 1
+        mask = (self.pos <= hi) & (self.pos > hi - period) & self._select(tickers)[self.codes]
+        return self.bars[mask].reset_index(drop=True)
+
+    def _select(self, tickers: Sequence[str]) -> np.ndarray:
+        sel = np.zeros(len(self.names) + 1, dtype=bool)
+        idx = self.names.get_indexer(list(tickers))
+        sel[idx[idx >= 0]] = True
+        return sel[:-1]
+
+    def frame(self, tickers: Sequence[str], frac: float, fraction: float = 1.0) -> pd.DataFrame:
+        """Frame callback tại nến đang chạy, nến cuối đã đi được `frac` (0 = vừa mở, 1 = đủ nến)."""
+        i = self.bar
+        names = np.asarray(list(tickers))
+        if fraction < 1.0 and len(names):
+            keep = self.rng.random(len(names)) < fraction
+            names = names[keep | (names == "VNINDEX")]
+        mask = (self.pos <= i) & (self.pos > i - self.window) & self._select(names)[self.codes]
+        df = self.bars[mask].reset_index(drop=True)
+        last = (self.pos[mask] == i)
+        if frac < 1.0 and last.any():
+            run = df.loc[last]
+            o, c = run["open"].to_numpy(), run["close"].to_numpy()
+            lo, hi = run["low"].to_numpy(), run["high"].to_numpy()
+            noise = self.rng.normal(0, 0.3, len(run)) * (hi - lo) * (1 - frac)
+            px = np.clip(o + (c - o) * frac + noise, lo, hi) if frac > 0 else o
+            df.loc[last, "close"] = px
+            df.loc[last, "high"] = np.maximum(o, px)
+            df.loc[last, "low"] = np.minimum(o, px)
+            for col in _FLOWS:
+                if col in df.columns:
+                    df.loc[last, col] = np.round(run[col].to_numpy() * frac)
+        return df
+
+
+@dataclass
+class FeedStats:
+    frames: int = 0
+    rows: int = 0
+    callback_errors: int = 0
+    latency_s: List[float] = field(default_factory=list)          # thời gian trong callback mỗi frame
+    lag_s: List[float] = field(default_factory=list)              # trễ so với lịch phát
+    backlog: List[Tuple[float, int]] = field(default_factory=list)  # (giây từ lúc bắt đầu, frame tới hạn chưa phát)
+
+    def summary(self) -> dict:
+        lat = np.asarray(self.latency_s) * 1e3
+        pct = lambda q: round(float(np.percentile(lat, q)), 2) if len(lat) else 0.0
+        backlog = [b for _, b in self.backlog]
+        return {
+            "frames": self.frames,
+            "rows": self.rows,
+            "callback_errors": self.callback_errors,
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "max_ms": round(float(lat.max()), 2) if len(lat) else 0.0,
+            "max_lag_ms": round(max(self.lag_s, default=0.0) * 1e3, 2),
+            "backlog_end": backlog[-1] if backlog else 0,
+            "max_backlog": max(backlog, default=0),
+        }
+
+
+class SimEvent:
+    """Subscription realtime giả lập: phát lại trên thread riêng, gọi callback đồng bộ như vendor."""
+
+    def __init__(self, client: "SimClient", replay: _Replay, by: str, tickers: Sequence[str],
+                 callback: Callable, wait_for_full_timeFrame: bool):
+        self.client = client
+        self.replay = replay
+        self.by = by
+        self.tickers = list(dict.fromkeys(str(t).upper() for t in tickers))
+        self.callback = callback
+        self.full = wait_for_full_timeFrame
+        self.stats = FeedStats()
+        self.done = threading.Event()  # hết dữ liệu phát lại (event vẫn "sống", không bật _stop)
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def get_data(self) -> "SimEvent":
+        self._thread = threading.Thread(target=self._run, name=f"feed-sim-{self.by}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop = True
+
+    def _run(self) -> None:
+        rp, speed = self.replay, self.client.speed
+        ticks = 1 if self.full else max(1, self.client.ticks_per_bar)
+        gap = _BAR_MINUTES.get(self.by, 1) * 60.0 / ticks / speed if speed else 0.0
+        tick = 0
+        t0 = time.perf_counter()
+        step = 0
+        while not self._stop and rp.bar < rp.end:
+            due = t0 + step * gap
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            now = time.perf_counter()
+            lag = max(0.0, now - due)
+            # nến đủ khung: nến cuối vừa mở (frac 0); nến đang chạy: tick thứ k/ticks
+            frac = 0.0 if self.full else (tick + 1) / ticks
+            df = rp.frame(self.tickers, frac, 1.0 if self.full else self.client.update_fraction)
+            start = time.perf_counter()
+            try:
+                self.callback(SimBarData(df))
+            except Exception as exc:
+                self.stats.callback_errors += 1
+                print(f"[feed-sim] callback lỗi: {exc}")
+            s = self.stats
+            s.latency_s.append(time.perf_counter() - start)
+            s.lag_s.append(lag)
+            s.backlog.append((now - t0, int(lag / gap) if gap else 0))
+            s.frames += 1
+            s.rows += len(df)
+            step += 1
+            tick += 1
+            if tick >= ticks:
+                tick = 0
+                with rp.lock:
+                    rp.bar += 1
+        self.done.set()
+
+
+class SimClient:
+    """
+    Client giả lập cho Fetch_Trading_Data. source: "synthetic", đường dẫn file (có thể chứa "{by}")
+    hoặc dict {by: DataFrame}.
+    """
+
+    def __init__(
+        self,
+        source="synthetic",
+        speed: float = 1.0,
+        ticks_per_bar: int = 4,
+        update_fraction: float = 1.0,
+        warmup: int = 250,
+        replay_bars: Optional[int] = 30,
+        window: int = 250,
+        seed: int = 0,
+    ):
+        self.source = source
+        self.speed = float(speed)
+        self.ticks_per_bar = int(ticks_per_bar)
+        self.update_fraction = float(update_fraction)
+        self.warmup = int(warmup)
+        self.replay_bars = replay_bars
+        self.window = int(window)
+        self.seed = seed
+        self.events: List[SimEvent] = []
+        self._replays: Dict[str, _Replay] = {}
+        self._lock = threading.Lock()
+        self._subscribed = threading.Event()
+
+    def replay(self, by: str, tickers: Sequence[str]) -> _Replay:
+        with self._lock:
+            rp = self._replays.get(by)
+            if rp is None:
+                if isinstance(self.source, dict):
+                    bars = self.source[by]
+                elif self.source == "synthetic":
+                    bars = synthetic_bars(tickers, by, self.warmup + (self.replay_bars or 30), self.seed)
+                else:
+                    bars = load_bars(self.source, by)
+                rp = self._replays[by] = _Replay(bars, self.warmup, self.replay_bars, self.window, self.seed)
+            return rp
+
+    def Fetch_Trading_Data(self, realtime, tickers, fields=FIELDS, adjusted=True, by="1d", period=None,
+                           callback=None, wait_for_full_timeFrame=True, **_):
+        tickers = [str(t).upper() for t in tickers]
+        rp = self.replay(by, tickers)
+        if not realtime:
+            return _SimRequest(rp.history(tickers, int(period or self.window)))
+        ev = SimEvent(self, rp, by, tickers, callback, wait_for_full_timeFrame)
+        self.events.append(ev)
+        self._subscribed.set()
+        return ev
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Chờ có subscription rồi chờ mọi subscription phát hết dữ liệu."""
+        end = None if timeout is None else time.monotonic() + timeout
+        if not self._subscribed.wait(timeout):
+            return False
+        for ev in list(self.events):
+            left = None if end is None else max(0.0, end - time.monotonic())
+            if not ev.done.wait(left):
+                return False
+        return True
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Phát lại feed giả lập với callback rỗng")
+    parser.add_argument("--by", default="15m")
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--speed", type=float, default=0, help="1 = thời gian thực, 0 = nhanh nhất có thể")
+    parser.add_argument("--bars", type=int, default=10)
+    parser.add_argument("--running", action="store_true", help="nến đang chạy (wait_for_full_timeFrame=False)")
+    args = parser.parse_args()
+    client = SimClient(speed=args.speed, replay_bars=args.bars)
+    names = [f"T{i:04d}" for i in range(args.tickers)]
+    ev = client.Fetch_Trading_Data(realtime=True, tickers=names, by=args.by, callback=lambda data: data.to_dataFrame(),
+                                   wait_for_full_timeFrame=not args.running)
+    ev.get_data()
+    client.wait()
+    print(json.dumps(ev.stats.summary(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
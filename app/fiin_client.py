@@ -1,6 +1,10 @@
-from FiinQuantX import FiinSession
 from .config import CFG
 
 def get_client():
+    if CFG.feed_sim:
+        # feed giả lập: chạy stream/load test không cần phiên vendor
+        from .feed_sim import SimClient
+        return SimClient(CFG.feed_sim, speed=CFG.feed_sim_speed, ticks_per_bar=CFG.feed_sim_ticks)
+    from FiinQuantX import FiinSession
     assert CFG.fiin_user and CFG.fiin_pass, "Missing FIIN_USER/FIIN_PASS"
     return FiinSession(username=CFG.fiin_user, password=CFG.fiin_pass).login()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+en_alerts.py — English Telegram alert formatters (HTML parse_mode)
+- Cùng chữ ký với vi_alerts: build_buy_alert_en(), build_eod_header_en(), build_no_pick_en()
+- Dùng cho subscriber có language='en' (xem app/subscriptions.py).
+"""
+from __future__ import annotations
+
+from html import escape
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional, Dict, Any
+
+from .vi_alerts import _safe_decimal, _regime_badge
+
+
+# ---------- Utils: formatting (1,234.56) ----------
+
+def fmt_money(v: Any, digits: int = 2) -> str:
+    dv = _safe_decimal(v)
+    if dv is None:
+        return "—"
+    return f"{dv.quantize(Decimal(10) ** -digits):,.{digits}f}"
+
+def fmt_num(v: Any, digits: int = 2) -> str:
+    dv = _safe_decimal(v)
+    if dv is None:
+        return "—"
+    return f"{dv.quantize(Decimal(10) ** -digits):.{digits}f}"
+
+def fmt_pct(v: Any, digits: int = 2) -> str:
+    dv = _safe_decimal(v)
+    if dv is None:
+        return "—"
+    return f"{(dv * Decimal('100')).quantize(Decimal(10) ** -digits):.{digits}f}%"
+
+
+# ---------- Public API ----------
+
+def build_buy_alert_en(
+    ticker: str,
+    entry: float,
+    tp: float,
+    sl: float,
+    regime: str = "bull",
+    *,
+    note: Optional[str] = None,
+    score: Optional[float] = None,
+    atr: Optional[float] = None,
+    extras: Optional[Dict[str, Any]] = None,
+    ts: Optional[str] = None,
+) -> str:
+    t = escape(str(ticker))
+    badge = _regime_badge(regime)
+    ts = ts or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    entry_d = _safe_decimal(entry) or Decimal("0")
+    tp_d    = _safe_decimal(tp)    or Decimal("0")
+    sl_d    = _safe_decimal(sl)    or Decimal("0")
+
+    up_pct = ((tp_d - entry_d) / entry_d) if entry_d != 0 else None
+    dn_pct = ((entry_d - sl_d) / entry_d) if entry_d != 0 else None
+    rr     = ((tp_d - entry_d) / (entry_d - sl_d)) if (entry_d - sl_d) != 0 else None
+
+    lines = [
+        "🟢",
+        f"<b>[{ts}] BUY alert: {t}</b>",
+        f"• Market regime: <b>{escape(badge)}</b>",
+        f"• Entry (reference): <b>{fmt_money(entry)} VND</b>",
+        f"• Take profit (TP): {fmt_money(tp)} VND  (≈ {fmt_pct(up_pct) if up_pct is not None else '—'})",
+        f"• Stop loss (SL): {fmt_money(sl)} VND  (≈ {fmt_pct(dn_pct) if dn_pct is not None else '—'})",
+        f"• Risk/Reward: <b>{fmt_num(rr, 2) if rr is not None else '—'}</b>",
+    ]
+    if atr is not None:
+        lines.append(f"• ATR(14): {fmt_money(atr)}")
+    if score is not None:
+        lines.append(f"• Signal score: {fmt_num(score, 2)}")
+    if extras:
+        for k, v in extras.items():
+            k_s = escape(str(k)).strip()
+            v_s = escape(str(v)).strip()
+            if k_s and v_s:
+                lines.append(f"• {k_s}: {v_s}")
+    if note:
+        lines.append(f"📝 {escape(note)}")
+    lines += [
+        "",
+        "⚠️ <i>For reference only — not investment advice.</i>",
+    ]
+    return "\n".join(lines)
+
+
+def build_eod_header_en(
+    *,
+    market: Optional[Dict[str, Any]] = None,
+    date_str: Optional[str] = None,
+) -> str:
+    ts = date_str or datetime.now().strftime("%Y-%m-%d")
+    header = [f"<b>📊 [EOD {ts}] V12 Picks</b>"]
+    if market:
+        mk = []
+        for label, key in (("Close", "market_close"), ("RSI", "market_rsi"),
+                           ("ADX", "market_adx"), ("BW", "market_boll_width")):
+            val = market.get(key)
+            if val is not None:
+                mk.append(f"{label}: {fmt_num(val, 2)}")
+        if mk:
+            header.append("• " + " | ".join(mk))
+    return "\n".join(header)
+
+
+def build_no_pick_en(scope: str = "EOD") -> str:
+    tag = "EOD" if (scope or "").upper() == "EOD" else "Realtime"
+    ts = datetime.now().strftime("%Y-%m-%d")
+    return f"<b>📈 [{tag} {ts}]</b> No ticker passed the filter in this session."
@@ -0,0 +1,69 @@
+# app/formatters/render.py
+"""
+Rendering layer cho cảnh báo Telegram — memo block đã render theo (cảnh báo, ngôn ngữ).
+
+- Block MUA phụ thuộc (ticker, entry, tp, sl, regime, ts) → cùng khoá = cùng chuỗi,
+  nên cache LRU dùng chung giữa các lượt dispatch/subscriber (ts truyền vào từ ngoài,
+  thường tính 1 lần cho cả lượt gửi).
+- Header EOD / "không có mã" chỉ phụ thuộc ngày → cũng cache.
+- Template + formatter nhanh nằm ở vi_alerts (float fast path, giống hệt bản Decimal).
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+from . import en_alerts, vi_alerts
+
+# language → (buy_alert, eod_header, no_pick)
+RENDERERS: Dict[str, Tuple[Callable[..., str], Callable[..., str], Callable[..., str]]] = {
+    "vi": (vi_alerts.build_buy_alert_vi, vi_alerts.build_eod_header_vi, vi_alerts.build_no_pick_vi),
+    "en": (en_alerts.build_buy_alert_en, en_alerts.build_eod_header_en, en_alerts.build_no_pick_en),
+}
+
+
+def now_ts() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+@lru_cache(maxsize=4096)
+def _render_buy_alert(language: str, ticker: str, entry: float, tp: float, sl: float,
+                      regime: str, ts: str) -> str:
+    return RENDERERS[language][0](ticker, entry, tp, sl, regime, ts=ts)
+
+
+def render_buy_alert(
+    language: str,
+    ticker: str,
+    entry: float,
+    tp: float,
+    sl: float,
+    regime: str = "bull",
+    ts: Optional[str] = None,
+) -> str:
+    """Block MUA đã render (memo theo toàn bộ tham số). ts=None → thời điểm hiện tại."""
+    return _render_buy_alert(language, ticker, entry, tp, sl, regime, ts or now_ts())
+
+
+@lru_cache(maxsize=64)
+def render_eod_header(language: str, date_str: str) -> str:
+    return RENDERERS[language][1](date_str=date_str)
+
+
+@lru_cache(maxsize=64)
+def _render_no_pick(language: str, scope: str, day: str) -> str:
+    return RENDERERS[language][2](scope)
+
+
+def render_no_pick(language: str, scope: str = "EOD") -> str:
+    # builder tự lấy ngày hiện tại → ngày nằm trong khoá để cache không bị cũ qua đêm
+    return _render_no_pick(language, scope, datetime.now().strftime("%Y-%m-%d"))
+
+
+def cache_info() -> Dict[str, object]:
+    return {
+        "buy": _render_buy_alert.cache_info(),
+        "header": render_eod_header.cache_info(),
+        "no_pick": _render_no_pick.cache_info(),
+    }
@@ -27,11 +27,8 @@ def _safe_decimal(x: Any) -> Optional[Decimal]:
     except (InvalidOperation, ValueError, TypeError):
         return None
 
-def fmt_money(v: Any, digits: int = 2) -> str:
-    """
-    Format số theo style VN: dùng '.' cho nghìn và ',' cho phần thập phân.
-    Hỗ trợ None → '—'
-    """
+# Bản Decimal (tham chiếu): chuẩn đầu ra, dùng khi fast path không chắc chắn cho kết quả giống hệt
+def _fmt_money_decimal(v: Any, digits: int = 2) -> str:
     dv = _safe_decimal(v)
     if dv is None:
         return "—"
@@ -40,7 +37,7 @@ def fmt_money(v: Any, digits: int = 2) -> str:
     s = f"{dv:,.{digits}f}"
     return s.replace(",", "_").replace(".", ",").replace("_", ".")
 
-def fmt_num(v: Any, digits: int = 2) -> str:
+def _fmt_num_decimal(v: Any, digits: int = 2) -> str:
     dv = _safe_decimal(v)
     if dv is None:
         return "—"
@@ -49,7 +46,7 @@ def fmt_num(v: Any, digits: int = 2) -> str:
     s = f"{dv:.{digits}f}"
     return s.replace(".", ",")
 
-def fmt_pct(v: Any, digits: int = 2) -> str:
+def _fmt_pct_decimal(v: Any, digits: int = 2) -> str:
     dv = _safe_decimal(v)
     if dv is None:
         return "—"
@@ -60,6 +57,103 @@ def fmt_pct(v: Any, digits: int = 2) -> str:
     return s.replace(".", ",")
 
 
+# Fast path (float): format trực tiếp khi giá trị không nằm sát ranh giới làm tròn (…5),
+# nơi Decimal(str(x)) (ROUND_HALF_EVEN) và float có thể khác nhau → khi đó quay về bản Decimal.
+_VN_SEPARATORS = str.maketrans({",": ".", ".": ","})
+_POW10 = tuple(10.0 ** i for i in range(9))
+_FAST_LIMIT = 1e8     # |x| * 10^digits — dưới ngưỡng này sai số float << _GUARD
+_GUARD = 1e-6
+_EPS = 1e-15          # cận sai số tương đối của vài phép toán float
+
+
+def _is_fast_number(v: Any) -> bool:
+    return isinstance(v, float) or (isinstance(v, int) and not isinstance(v, bool))
+
+
+def _rounds_safely(y: float, digits: int, err: float = 0.0) -> bool:
+    """y làm tròn `digits` chữ số bằng float cho cùng kết quả với phép làm tròn chính xác."""
+    if digits >= len(_POW10) or digits < 0:
+        return False
+    t = abs(y) * _POW10[digits]
+    if not t < _FAST_LIMIT:          # cũng loại NaN/inf
+        return False
+    frac = t - int(t)
+    return abs(frac - 0.5) > _GUARD + err * _POW10[digits]
+
+
+def fmt_money(v: Any, digits: int = 2) -> str:
+    """
+    Format số theo style VN: dùng '.' cho nghìn và ',' cho phần thập phân.
+    Hỗ trợ None → '—'
+    """
+    if isinstance(v, (float, int)) and not isinstance(v, bool) and 0 <= digits < 9:
+        t = abs(v) * _POW10[digits]
+        if t < _FAST_LIMIT and abs(t - int(t) - 0.5) > _GUARD:
+            return f"{v:,.{digits}f}".translate(_VN_SEPARATORS)
+    return _fmt_money_decimal(v, digits)
+
+def fmt_num(v: Any, digits: int = 2) -> str:
+    if isinstance(v, (float, int)) and not isinstance(v, bool) and 0 <= digits < 9:
+        t = abs(v) * _POW10[digits]
+        if t < _FAST_LIMIT and abs(t - int(t) - 0.5) > _GUARD:
+            return f"{v:.{digits}f}".replace(".", ",")
+    return _fmt_num_decimal(v, digits)
+
+def fmt_pct(v: Any, digits: int = 2) -> str:
+    if isinstance(v, (float, int)) and not isinstance(v, bool) and 0 <= digits < 9:
+        y = v * 100.0
+        t = abs(y) * _POW10[digits]
+        if t < _FAST_LIMIT and abs(t - int(t) - 0.5) > _GUARD + t * _EPS:
+            return f"{y:.{digits}f}%".replace(".", ",")
+    return _fmt_pct_decimal(v, digits)
+
+
+def _buy_ratios_decimal(entry: Any, tp: Any, sl: Any):
+    entry_d = _safe_decimal(entry) or Decimal("0")
+    tp_d    = _safe_decimal(tp)    or Decimal("0")
+    sl_d    = _safe_decimal(sl)    or Decimal("0")
+
+    up_pct = ((tp_d - entry_d) / entry_d) if entry_d != 0 else None
+    dn_pct = ((entry_d - sl_d) / entry_d) if entry_d != 0 else None
+    rr     = ((tp_d - entry_d) / (entry_d - sl_d)) if (entry_d - sl_d) != 0 else None
+
+    up_pct_s = _fmt_pct_decimal(up_pct) if up_pct is not None else "—"
+    dn_pct_s = _fmt_pct_decimal(dn_pct) if dn_pct is not None else "—"
+    rr_s     = _fmt_num_decimal(rr, 2)   if rr     is not None else "—"
+    return up_pct_s, dn_pct_s, rr_s
+
+
+def _cond(a: float, b: float) -> float:
+    """Hệ số khuếch đại sai số của (a - b)."""
+    d = abs(a - b)
+    return (abs(a) + abs(b)) / d if d else 0.0
+
+
+def _buy_ratios(entry: Any, tp: Any, sl: Any):
+    """(% TP, % SL, R/R) đã format — float khi chắc chắn trùng kết quả Decimal, ngược lại tính bằng Decimal."""
+    if not (_is_fast_number(entry) and _is_fast_number(tp) and _is_fast_number(sl)):
+        return _buy_ratios_decimal(entry, tp, sl)
+    entry, tp, sl = float(entry), float(tp), float(sl)
+    if not (abs(entry) < _FAST_LIMIT and abs(tp) < _FAST_LIMIT and abs(sl) < _FAST_LIMIT):
+        return _buy_ratios_decimal(entry, tp, sl)
+    up = dn = rr = None
+    if entry != 0:
+        up = (tp - entry) / entry
+        dn = (entry - sl) / entry
+        if not (_rounds_safely(up * 100, 2, abs(up * 100) * 4 * _EPS * (1 + _cond(tp, entry)))
+                and _rounds_safely(dn * 100, 2, abs(dn * 100) * 4 * _EPS * (1 + _cond(entry, sl)))):
+            return _buy_ratios_decimal(entry, tp, sl)
+    if entry - sl != 0:
+        rr = (tp - entry) / (entry - sl)
+        if not _rounds_safely(rr, 2, abs(rr) * 4 * _EPS * (1 + _cond(tp, entry) + _cond(entry, sl))):
+            return _buy_ratios_decimal(entry, tp, sl)
+    return (
+        f"{up * 100:.2f}%".replace(".", ",") if up is not None else "—",
+        f"{dn * 100:.2f}%".replace(".", ",") if dn is not None else "—",
+        f"{rr:.2f}".replace(".", ",") if rr is not None else "—",
+    )
+
+
 # ---------- Regime badges ----------
 
 _REGIME_BADGE = {
@@ -73,6 +167,19 @@ def _regime_badge(regime: str) -> str:
 
 # ---------- Public API (backward compatible) ----------
 
+# Template biên dịch sẵn (str.format đã bind) — phần cố định của block MUA
+_BUY_HEAD_VI = (
+    "🟢\n"
+    "<b>[{ts}] Cảnh báo MUA: {t}</b>\n"
+    "• Regime thị trường: <b>{badge}</b>\n"
+    "• Giá vào lệnh (tham khảo): <b>{entry} VNĐ</b>\n"
+    "• Chốt lời (TP): {tp} VNĐ  (≈ {up})\n"
+    "• Cắt lỗ (SL): {sl} VNĐ  (≈ {dn})\n"
+    "• Tỷ lệ R/R: <b>{rr}</b>"
+).format
+_BUY_FOOTER_VI = "\n\n⚠️ <i>Lưu ý: Đây là cảnh báo tham khảo, không phải lời khuyên đầu tư.</i>"
+
+
 def build_buy_alert_vi(
     ticker: str,
     entry: float,
@@ -85,38 +192,26 @@ def build_buy_alert_vi(
     score: Optional[float] = None,       # điểm tín hiệu (nếu bạn có)
     atr: Optional[float] = None,         # ATR hiện hành (nếu muốn show)
     extras: Optional[Dict[str, Any]] = None,  # key/value bổ sung
+    ts: Optional[str] = None,            # thời điểm hiển thị (mặc định: bây giờ)
 ) -> str:
     """
     Block cảnh báo MUA (HTML). Giữ nguyên 4 tham số đầu để tương thích.
     Bổ sung: note/score/atr/extras (optional).
     """
-    t = escape(str(ticker))
-    badge = _regime_badge(regime)
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # Tính % so với entry + RR
-    entry_d = _safe_decimal(entry) or Decimal("0")
-    tp_d    = _safe_decimal(tp)    or Decimal("0")
-    sl_d    = _safe_decimal(sl)    or Decimal("0")
-
-    up_pct = ((tp_d - entry_d) / entry_d) if entry_d != 0 else None
-    dn_pct = ((entry_d - sl_d) / entry_d) if entry_d != 0 else None
-    rr     = ((tp_d - entry_d) / (entry_d - sl_d)) if (entry_d - sl_d) != 0 else None
-
-    up_pct_s = fmt_pct(up_pct) if up_pct is not None else "—"
-    dn_pct_s = fmt_pct(dn_pct) if dn_pct is not None else "—"
-    rr_s     = fmt_num(rr, 2)   if rr     is not None else "—"
-
-    lines = [
-        "🟢",
-        f"<b>[{ts}] Cảnh báo MUA: {t}</b>",
-        f"• Regime thị trường: <b>{escape(badge)}</b>",
-        f"• Giá vào lệnh (tham khảo): <b>{fmt_money(entry)} VNĐ</b>",
-        f"• Chốt lời (TP): {fmt_money(tp)} VNĐ  (≈ {up_pct_s})",
-        f"• Cắt lỗ (SL): {fmt_money(sl)} VNĐ  (≈ {dn_pct_s})",
-        f"• Tỷ lệ R/R: <b>{rr_s}</b>",
-    ]
+    up_pct_s, dn_pct_s, rr_s = _buy_ratios(entry, tp, sl)
+    text = _BUY_HEAD_VI(
+        ts=ts or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        t=escape(str(ticker)),
+        badge=escape(_regime_badge(regime)),
+        entry=fmt_money(entry),
+        tp=fmt_money(tp),
+        up=up_pct_s,
+        sl=fmt_money(sl),
+        dn=dn_pct_s,
+        rr=rr_s,
+    )
 
+    lines = []
     if atr is not None:
         lines.append(f"• ATR(14): {fmt_money(atr)}")
 
@@ -134,11 +229,9 @@ def build_buy_alert_vi(
     if note:
         lines.append(f"📝 {escape(note)}")
 
-    lines += [
-        "",
-        "⚠️ <i>Lưu ý: Đây là cảnh báo tham khảo, không phải lời khuyên đầu tư.</i>",
-    ]
-    return "\n".join(lines)
+    if lines:
+        text += "\n" + "\n".join(lines)
+    return text + _BUY_FOOTER_VI
 
 
 def build_eod_header_vi(
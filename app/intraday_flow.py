@@ -0,0 +1,185 @@
+# app/intraday_flow.py
+"""
+Accumulator intraday theo mã — VWAP phiên, dòng tiền khối ngoại và tỉ lệ áp lực mua/bán, giữ trong mảng NumPy.
+
+- Mỗi mã một dòng trong các mảng tổng của phiên: Σ giá×khối lượng, Σ khối lượng, Σ bu / sd, Σ fb / fs.
+  Đổi ngày → tổng của mã đó về 0. Mỗi cập nhật O(1) mỗi mã, không quét lại các nến đã qua của phiên.
+- Hai kiểu nạp:
+    * add(...): nến đã đóng (15') — cộng thẳng, giá của nến = giá điển hình (high + low + close) / 3;
+    * observe(...): nến ngày đang chạy (giá trị luỹ kế của phiên) — cộng phần chênh so với lần trước, phần khối
+      lượng mới tính theo close hiện tại. Lần đầu thấy mã trong phiên (bot khởi động giữa phiên) hoặc vendor
+      sửa số (luỹ kế giảm) → lấy lại toàn bộ luỹ kế theo giá điển hình.
+  Nến ngày đang chạy qua coalescer chỉ được quan sát ở mỗi lượt đánh giá → VWAP là xấp xỉ theo nhịp đánh giá.
+- Feature (FEATURES): vwap, vwap_dev = close / vwap - 1, foreign_net = Σfb - Σfs, foreign_ratio = foreign_net /
+  Σ khối lượng, foreign_pressure = Σfb / (Σfb + Σfs), buy_pressure = Σbu / (Σbu + Σsd).
+- TickerArrays: chỉ mục mã → dòng + các mảng tự nới, dùng chung với OrderFlowEngine (app/orderflow.py).
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+_DAY_NS = 86_400 * 10**9
+_CUM = ("volume", "bu", "sd", "fb", "fs")  # cột luỹ kế của nến ngày đang chạy
+
+FEATURES = ["vwap", "vwap_dev", "foreign_net", "foreign_ratio", "foreign_pressure", "buy_pressure"]
+
+
+def _ts_col(df: pd.DataFrame) -> str:
+    return "timestamp" if "timestamp" in df.columns else "time"
+
+
+def _ns(col: pd.Series) -> np.ndarray:
+    if not pd.api.types.is_datetime64_dtype(col):
+        col = pd.to_datetime(col)
+    return col.to_numpy("datetime64[ns]").view(np.int64)
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+
+def _columns(df: pd.DataFrame, cols) -> np.ndarray:
+    """Các cột số → mảng (n, len(cols)); thiếu cột → 0."""
+    n = len(df)
+    return np.column_stack([
+        pd.to_numeric(df[c], errors="coerce").to_numpy(np.float64) if c in df.columns else np.zeros(n)
+        for c in cols
+    ])
+
+
+class TickerArrays:
+    """Mã → chỉ số dòng; các mảng state khai báo trong _spec() và nới gấp đôi khi thêm mã."""
+
+    def __init__(self, capacity: int = 256):
+        self._index: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._cap = 0
+        self._alloc(max(1, capacity))
+
+    def _spec(self) -> dict:
+        """{tên mảng: (shape mỗi mã, dtype, giá trị đầu)}."""
+        return {}
+
+    def _alloc(self, n: int) -> None:
+        for name, (shape, dtype, fill) in self._spec().items():
+            arr = np.full((n, *shape), fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                arr[:len(old)] = old
+            setattr(self, name, arr)
+        self._cap = n
+
+    def _ids(self, tickers: np.ndarray) -> np.ndarray:
+        codes, uniques = pd.factorize(tickers)
+        lookup = np.empty(len(uniques), dtype=np.int64)
+        for j, t in enumerate(uniques):
+            i = self._index.get(t)
+            if i is None:
+                i = self._index[t] = len(self._names)
+                self._names.append(t)
+            lookup[j] = i
+        if len(self._names) > self._cap:
+            self._alloc(max(len(self._names), 2 * self._cap))
+        return lookup[codes]
+
+    @property
+    def tickers(self) -> List[str]:
+        return list(self._names)
+
+
+class FlowAccumulator(TickerArrays):
+    """Tổng của phiên theo mã: VWAP, khối ngoại, bu/sd."""
+
+    def _spec(self) -> dict:
+        return {
+            **super()._spec(),
+            "_day": ((), np.int64, -1),
+            "_sum": ((6,), np.float64, 0.0),         # Σ giá×KL, Σ KL, Σ bu, Σ sd, Σ fb, Σ fs của phiên
+            "_seen": ((len(_CUM),), np.float64, np.nan),  # luỹ kế lần observe trước (nến ngày đang chạy)
+            "_px": ((), np.float64, np.nan),         # close gần nhất
+        }
+
+    def _roll(self, i: np.ndarray, day: np.ndarray) -> np.ndarray:
+        """Sang phiên mới → tổng của mã về 0. Trả mask các mã vừa sang phiên."""
+        fresh = day != self._day[i]
+        if fresh.any():
+            j = i[fresh]
+            self._day[j] = day[fresh]
+            self._sum[j] = 0.0
+            self._seen[j] = np.nan
+        return fresh
+
+    def add(self, i: np.ndarray, day: np.ndarray, price: np.ndarray, close: np.ndarray, flow: np.ndarray) -> None:
+        """Cộng nến đã đóng (mỗi mã một dòng): flow = (n, 5) theo _CUM, price = giá điển hình của nến."""
+        self._roll(i, day)
+        self._sum[i, 0] += price * flow[:, 0]
+        self._sum[i, 1:] += flow
+        self._px[i] = close
+
+    def observe(self, i: np.ndarray, day: np.ndarray, typical: np.ndarray, close: np.ndarray,
+                cum: np.ndarray) -> None:
+        """Nến ngày đang chạy (mỗi mã một dòng): cum = (n, 5) luỹ kế của phiên theo _CUM."""
+        self._roll(i, day)
+        prev = self._seen[i]
+        diff = cum - prev
+        reset = np.isnan(prev[:, 0]) | (diff < 0).any(axis=1)
+        if reset.any():
+            r = i[reset]
+            self._sum[r, 0] = typical[reset] * cum[reset, 0]
+            self._sum[r, 1:] = cum[reset]
+        step = ~reset
+        if step.any():
+            s = i[step]
+            self._sum[s, 0] += close[step] * diff[step, 0]
+            self._sum[s, 1:] += diff[step]
+        self._seen[i] = cum
+        self._px[i] = close
+
+    def features(self, i: np.ndarray) -> Dict[str, np.ndarray]:
+        """FEATURES của các mã `i` (close = close gần nhất đã nạp)."""
+        pv, vol, bu, sd, fb, fs = self._sum[i].T
+        vwap = np.full(len(i), np.nan)
+        np.divide(pv, vol, out=vwap, where=vol > 0)
+        return {
+            "vwap": vwap,
+            "vwap_dev": self._px[i] / vwap - 1,
+            "foreign_net": fb - fs,
+            "foreign_ratio": _ratio(fb - fs, vol),
+            "foreign_pressure": _ratio(fb, fb + fs),
+            "buy_pressure": _ratio(bu, bu + sd),
+        }
+
+    # ---- frame nến ngày đang chạy ----
+    def observe_frame(self, df: pd.DataFrame) -> None:
+        """Nạp nến cuối của từng mã trong frame 1d (lịch sử + nến đang chạy, hoặc chỉ delta)."""
+        if df is None or df.empty:
+            return
+        ts = _ns(df[_ts_col(df)])
+        i = self._ids(df["ticker"].astype(str).to_numpy())
+        order = np.lexsort((ts, i))
+        last = order[np.r_[i[order][1:] != i[order][:-1], True]]
+        rows = df.iloc[last]
+        hlc = _columns(rows, ("high", "low", "close"))
+        self.observe(i[last], ts[last] // _DAY_NS, hlc.mean(axis=1), hlc[:, 2],
+                     np.nan_to_num(_columns(rows, _CUM)))
+
+    def attach(self, feat: pd.DataFrame) -> pd.DataFrame:
+        """Thêm cột FEATURES vào các dòng của phiên đang tích luỹ (dòng khác / mã chưa nạp → NaN)."""
+        if feat is None or feat.empty or "ticker" not in feat.columns:
+            return feat
+        ts_col = next((c for c in ("timestamp", "time", "date") if c in feat.columns), None)
+        if ts_col is None:
+            return feat
+        i = feat["ticker"].astype(str).map(self._index).fillna(-1).to_numpy(np.int64)
+        day = _ns(feat[ts_col]) // _DAY_NS
+        rows = np.flatnonzero((i >= 0) & (day == self._day[np.maximum(i, 0)]))
+        out = {c: np.full(len(feat), np.nan) for c in FEATURES}
+        for c, v in self.features(i[rows]).items():
+            out[c][rows] = v
+        return feat.assign(**out)
+
+    def metrics(self) -> dict:
+        return {"tickers": len(self._names), "sessions": int((self._day[:len(self._names)] >= 0).sum())}
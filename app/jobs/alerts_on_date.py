@@ -6,7 +6,7 @@ Chức năng:
 - Nhận --date (YYYY-MM-DD) từ CLI; nếu không có thì dùng DEFAULT_DATE.
 - Lấy dữ liệu EOD, tính feature V12 đến hết DATE, chạy screener để ra "cảnh báo MUA" cho DATE.
 - Đọc positions (mua trước DATE) từ state.json -> áp logic thoát lệnh V12 trên nến DATE để tạo "cảnh báo BÁN".
-- Gửi tất cả cảnh báo qua Telegram (HTML).
+- Gửi tất cả cảnh báo qua Telegram (HTML); cảnh báo đã có trong alert ledger (cùng DATE) không gửi lại.
 
 Yêu cầu ENV (đã có sẵn trong repo):
 - FIIN_USER, FIIN_PASS (nếu dùng FiinQuantX)
@@ -18,6 +18,8 @@ Chạy:
     python -m app.jobs.alerts_on_date --date 2025-07-30
     # hoặc:
     python app/jobs/alerts_on_date.py --date 2025-07-30
+    # gửi lại cả cảnh báo đã gửi:
+    python -m app.jobs.alerts_on_date --date 2025-07-30 --force
 """
 
 from __future__ import annotations
@@ -39,10 +41,19 @@ import numpy as np
 # ---- Import từ repo sẵn có ----
 from app.config import CFG
 from app.fiin_client import get_client
-from app.strategy_adapter import compute_features_v12, apply_v12_on_last_day
+from app.strategy_adapter import (
+    compute_features_v12,
+    apply_v12_on_last_day,
+    evaluate_exits_v12,
+    apply_partial_exit,
+    market_phase_v12,
+)
 from app.formatters.vi_alerts import build_eod_header_vi, build_buy_alert_vi, fmt_money, fmt_pct, fmt_num
 from app.notifier import TelegramNotifier
 from app.state import load_state, save_state
+from app.alert_ledger import get_ledger, make_key
+from app.utils.trading_calendar import is_trading_day
+from app.profiling import profiled
 
 # ---- Tham số mặc định (KHỚP VỚI BACKTEST V12) ----
 DEFAULT_DATE = "2025-07-30"  # khi không truyền --date
@@ -136,13 +147,15 @@ def pick_buys_on_date(feat: pd.DataFrame, target_date: pd.Timestamp) -> Tuple[Li
     else:
         return [], pd.DataFrame(), {}
 
-    feat_trunc = feat[ts <= target_date].copy()
+    # Các bước sau chỉ đọc feat → không copy; chỉ cắt khi thật sự có dữ liệu sau target_date
+    in_range = ts <= target_date
+    feat_trunc = feat if in_range.all() else feat.loc[in_range]
     if feat_trunc.empty:
         return [], pd.DataFrame(), {}
 
     # Lấy hàng của đúng ngày target
     last_ts = pd.to_datetime(target_date)
-    feat_last = feat_trunc[(pd.to_datetime(feat_trunc.get('date', feat_trunc.get('time', feat_trunc.get('timestamp')))) == last_ts)].copy()
+    feat_last = feat.loc[ts == last_ts]
 
     picks = apply_v12_on_last_day(feat_trunc)  # "last day" = target_date
     # Loại trừ nếu có exclude_tickers
@@ -207,6 +220,7 @@ class Position:
     partial_taken: bool    # đã chốt lời 1 phần (lần 1) hay chưa
     trailing_sl: float     # trailing = highest * (1 - TRAILING_STOP_PCT)
     shares: int            # tuỳ ý; không cần chính xác để gửi alert
+    pyramid_count: int = 0 # số lần nhồi lệnh (ảnh hưởng exit_type như backtest)
 
     @staticmethod
     def from_dict(d: Dict[str, Any]) -> "Position":
@@ -219,7 +233,8 @@ class Position:
             highest=float(d.get("highest", d["entry_price"])),
             partial_taken=bool(d.get("partial_taken", False)),
             trailing_sl=float(d.get("trailing_sl", d["entry_price"] * (1 - TRAILING_STOP_PCT))),
-            shares=int(d.get("shares", 0))
+            shares=int(d.get("shares", 0)),
+            pyramid_count=int(d.get("pyramid_count", 0)),
         )
 
     def to_dict(self) -> Dict[str, Any]:
@@ -233,69 +248,129 @@ class Position:
             "partial_taken": self.partial_taken,
             "trailing_sl": self.trailing_sl,
             "shares": self.shares,
+            "pyramid_count": self.pyramid_count,
         }
 
 
-def _check_intraday_tp_sl(high_val: float, low_val: float, tp_val: float, sl_val: float) -> Tuple[bool, bool]:
-    # Bám theo logic kiểm tra nội phiên: vượt TP hoặc thủng SL (đơn giản hoá chuẩn với V12)
-    trigger_tp = high_val >= tp_val
-    trigger_sl = low_val <= sl_val
-    return trigger_tp, trigger_sl
+_SELL_REASON = {
+    "TP_PARTIAL": "BÁN CHỐT LỜI (MỘT PHẦN)",
+    "SL": "BÁN CẮT LỖ / TRAILING",
+    "END": "BÁN HẾT HẠN NẮM GIỮ / THỊ TRƯỜNG XẤU",
+    "MOMENTUM": "BÁN DO MẤT MOMENTUM",
+}
 
 
-def evaluate_sell_signal_for_bar(pos: Position, bar: pd.Series, date_str: str) -> Optional[Dict[str, Any]]:
+# Cột feature V12 mà exit engine đọc (momentum SMA, suy yếu RSI/MFI/OBV, kẹp Bollinger khi sideway)
+_EXIT_COLS = ("sma_5", "sma_50", "rsi_14", "mfi_14", "obv", "boll_upper", "boll_lower")
+
+
+def exit_features_for_day(feat: pd.DataFrame, target_date: pd.Timestamp) -> pd.DataFrame:
     """
-    Sinh sell-signal cho 1 position trên cây nến DATE, áp cơ bản:
-      1) Gap qua TP/SL tại open -> thoát tại open (ưu tiên).
-      2) Nội phiên chạm TP/SL:
-           - Nếu chưa partial: BÁN MỘT PHẦN tại TP; cập nhật vị thế (partial_taken=True, nâng trailing).
-           - Nếu đã partial: BÁN HẾT khi chạm TP lần 2 (đơn giản hoá hợp lý).
-      3) Trailing stop: nếu Close < trailing_sl -> BÁN HẾT tại Close.
-    Trả về dict {type, price, reason, realized_pct} hoặc None.
+    Feature cho exit engine tại DATE, index = ticker: _EXIT_COLS của nến DATE + prev_obv (OBV phiên trước,
+    như backtest đọc pivot ở dòng i-1). Thiếu cột / thiếu phiên → NaN.
     """
-    o = float(bar["open"]); h = float(bar["high"]); l = float(bar["low"]); c = float(bar["close"])
-
-    # Cập nhật highest/trailing trước (để trailing nhạy hơn)
-    if h > pos.highest:
-        pos.highest = h
-        pos.trailing_sl = pos.highest * (1 - TRAILING_STOP_PCT)
-
-    # 1) Gap qua mức tại open
-    if o >= pos.tp:
-        ret = (o - pos.entry_price) / pos.entry_price
-        action = "BÁN CHỐT LỜI" if pos.partial_taken else "BÁN CHỐT LỜI (LẦN 1)"
-        return {"type": "TP_GAP", "price": o, "reason": action, "realized_pct": ret}
-    if o <= pos.sl:
-        ret = (o - pos.entry_price) / pos.entry_price
-        return {"type": "SL_GAP", "price": o, "reason": "BÁN CẮT LỖ", "realized_pct": ret}
-
-    # 2) Nội phiên TP/SL
-    hit_tp, hit_sl = _check_intraday_tp_sl(h, l, pos.tp, pos.sl)
-    if hit_sl:
-        ret = (pos.sl - pos.entry_price) / pos.entry_price
-        return {"type": "SL", "price": pos.sl, "reason": "BÁN CẮT LỖ", "realized_pct": ret}
-
-    if hit_tp:
-        if not pos.partial_taken:
-            # Bán một phần lần 1 theo partial_profit_pct
-            ret = (pos.tp - pos.entry_price) / pos.entry_price
-            # Sau chốt 1 phần -> nâng mục tiêu (mô phỏng “profit staircase” đơn giản)
-            next_tp = pos.tp * (1.0 + 0.15)  # xấp xỉ tăng mục tiêu ~15% từ mức TP hiện tại
-            pos.partial_taken = True
-            pos.tp = next_tp
-            pos.sl = max(pos.sl, pos.entry_price)  # bảo toàn vốn tối thiểu
-            return {"type": "TP_PARTIAL", "price": pos.tp / 1.15, "reason": "BÁN CHỐT LỜI (MỘT PHẦN)", "realized_pct": ret}
-        else:
-            ret = (pos.tp - pos.entry_price) / pos.entry_price
-            return {"type": "TP_FULL", "price": pos.tp, "reason": "BÁN CHỐT LỜI (PHẦN CÒN LẠI)", "realized_pct": ret}
-
-    # 3) Trailing stop (đánh giá cuối phiên)
-    if c <= pos.trailing_sl:
-        ret = (c - pos.entry_price) / pos.entry_price
-        return {"type": "TRAIL", "price": c, "reason": "BÁN THEO TRAILING", "realized_pct": ret}
+    if feat is None or feat.empty or "ticker" not in feat.columns:
+        return pd.DataFrame()
+    ts_col = next((c for c in ("date", "time", "timestamp") if c in feat.columns), None)
+    if ts_col is None:
+        return pd.DataFrame()
+    ts = pd.to_datetime(feat[ts_col]).to_numpy()
+    cols = [c for c in _EXIT_COLS if c in feat.columns]
+    day = feat.loc[ts == np.datetime64(target_date), ["ticker"] + cols].set_index("ticker")
+    if "obv" in feat.columns:
+        # feature đã sort theo (ticker, date) → dòng cuối trước DATE của mỗi mã là phiên liền trước
+        prev = feat.loc[ts < np.datetime64(target_date), ["ticker", "obv"]].groupby("ticker").tail(1)
+        day["prev_obv"] = prev.set_index("ticker")["obv"].reindex(day.index)
+    return day
+
+
+def evaluate_sell_signals_for_day(
+    positions: Dict[str, Position],
+    day_bars: pd.DataFrame,
+    target_date: pd.Timestamp,
+    market: Dict[str, Any],
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Sinh sell-signal cho toàn bộ positions trên nến DATE bằng MỘT lần gọi exit engine
+    (cùng logic với backtest_engine_v12: gap/nội phiên TP-SL, trailing, hết hạn nắm giữ,
+    lỗ theo pha thị trường, mất momentum sideway).
+    day_bars: index = ticker, cột open/high/low/close (+ cột của exit_features_for_day nếu có).
+    Cập nhật tại chỗ highest/trailing (và TP/SL khi chốt lời một phần) cho các Position.
+    Trả về {ticker: {type, price, reason, realized_pct}}.
+    """
+    tickers = [t for t in positions if t in day_bars.index]
+    if not tickers:
+        return {}
+    pos_list = [positions[t] for t in tickers]
+    bars = day_bars.reindex(tickers)
+
+    def _col(name):
+        return bars[name].to_numpy(dtype=float) if name in bars.columns else None
+
+    def _mk(key):
+        v = market.get(key)
+        return float("nan") if v is None else v
+
+    phase = market_phase_v12(
+        _mk("market_close"), _mk("market_MA50"), _mk("market_MA200"),
+        _mk("market_rsi"), _mk("market_adx"), _mk("market_boll_width"),
+    )
+    batch = evaluate_exits_v12(
+        entry_price=[p.entry_price for p in pos_list],
+        tp=[p.tp for p in pos_list],
+        sl=[p.sl for p in pos_list],
+        trailing_sl=[p.trailing_sl for p in pos_list],
+        highest=[p.highest for p in pos_list],
+        holding_days=[(target_date - pd.to_datetime(p.entry_date)).days for p in pos_list],
+        pyramid_count=[p.pyramid_count for p in pos_list],
+        shares=[p.shares for p in pos_list],
+        open_=_col("open"), high=_col("high"), low=_col("low"), close=_col("close"),
+        market_phase=phase.market_phase,
+        max_hold_days=phase.max_hold_days,
+        loss_exit_threshold=phase.loss_exit_threshold,
+        pyramid_limit_phase=phase.pyramid_limit_phase,
+        trailing_stop_pct=TRAILING_STOP_PCT,
+        partial_profit_pct=PARTIAL_PROFIT_PCT,
+        min_holding_days=MIN_HOLDING_DAYS,
+        sma5=_col("sma_5"),
+        sma50=_col("sma_50"),
+        rsi=_col("rsi_14"),
+        mfi=_col("mfi_14"),
+        obv=_col("obv"),
+        prev_obv=_col("prev_obv"),
+        boll_upper=_col("boll_upper"),
+        boll_lower=_col("boll_lower"),
+    )
 
-    # Không có tín hiệu bán
-    return None
+    signals: Dict[str, Dict[str, Any]] = {}
+    for k, (t, pos) in enumerate(zip(tickers, pos_list)):
+        if batch.valid[k]:
+            pos.highest = float(batch.highest[k])
+            pos.trailing_sl = float(batch.trailing_sl[k])
+        if not batch.exit[k]:
+            continue
+        price = float(batch.exit_price[k])
+        if batch.partial[k]:
+            sig_type = "TP_PARTIAL"
+        elif batch.trigger_sl[k]:
+            sig_type = "SL"
+        elif batch.momentum_loss[k]:  # exit_type của END luôn là Normal/Pyramid (như backtest)
+            sig_type = "MOMENTUM"
+        else:
+            sig_type = "END"
+        signals[t] = {
+            "type": sig_type,
+            "price": price,
+            "reason": _SELL_REASON[sig_type],
+            "realized_pct": (price - pos.entry_price) / pos.entry_price,
+        }
+        if batch.partial[k]:
+            new_tp, new_sl = apply_partial_exit(pos.tp, pos.sl, price, TRAILING_STOP_PCT)
+            pos.partial_taken = True
+            pos.shares = max(0, pos.shares - int(batch.shares_to_sell[k]))
+            pos.tp = float(new_tp)
+            pos.sl = float(new_sl)
+    return signals
 
 
 def build_sell_alert_vi(date_str: str, pos: Position, signal: Dict[str, Any]) -> str:
@@ -328,13 +403,18 @@ def build_sell_alert_vi(date_str: str, pos: Position, signal: Dict[str, Any]) ->
 # Main flow
 # =======================
 
+@profiled("alerts_on_date")
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--date", "-d", type=str, default=None, help="Ngày định dạng YYYY-MM-DD")
+    parser.add_argument("--force", action="store_true", help="Bỏ qua alert ledger, gửi lại cả cảnh báo đã gửi")
     args = parser.parse_args()
 
     date_str = args.date or DEFAULT_DATE
     target_date = pd.to_datetime(date_str).normalize()
+    if not is_trading_day(target_date.date()):
+        print(f"[SKIP] {date_str} không phải phiên giao dịch (cuối tuần/nghỉ lễ).")
+        return
 
     # 1) Load dữ liệu đến hết DATE
     data = _load_eod_data_until_date(target_date)
@@ -343,19 +423,34 @@ def main():
     feat = compute_features_v12(data)
 
     # 3) Picks MUA đúng ngày DATE
+    #    Alert ledger: chạy lại cùng DATE chỉ gửi cảnh báo chưa gửi (--force: gửi lại tất cả)
     picks, feat_last, market = pick_buys_on_date(feat, target_date)
-    header_text = build_eod_header_vi(date_str=date_str, market=market)
-    TelegramNotifier.send(header_text, parse_mode="HTML")
+    ledger = get_ledger()
+
+    def _fresh(key) -> bool:
+        return args.force or not ledger.seen(key)
+
+    def _send(key, text: str) -> None:
+        TelegramNotifier.send(text, parse_mode="HTML")
+        ledger.record([key])
+
+    buy_keys = {t: make_key("eod", t, target_date, "BUY") for t in picks}
+    new_picks = [t for t in picks if _fresh(buy_keys[t])]
+    no_pick_key = make_key("eod", "*", target_date, "NO_PICK")
+    if new_picks or (not picks and _fresh(no_pick_key)):
+        header_text = build_eod_header_vi(date_str=date_str, market=market)
+        TelegramNotifier.send(header_text, parse_mode="HTML")
 
     if not picks:
-        from app.formatters.vi_alerts import build_no_pick_vi
-        TelegramNotifier.send(build_no_pick_vi("EOD"), parse_mode="HTML")
+        if _fresh(no_pick_key):
+            from app.formatters.vi_alerts import build_no_pick_vi
+            _send(no_pick_key, build_no_pick_vi("EOD"))
     else:
         # Render buy-alert cho từng mã
         badge = infer_regime_badge(market)
         # Map để lấy ATR và close cho từng ticker ở DATE
         df_day = feat_last.set_index("ticker") if "ticker" in feat_last.columns else pd.DataFrame()
-        for t in picks:
+        for t in new_picks:
             row = df_day.loc[t] if not df_day.empty and t in df_day.index else None
             if row is None or row.empty:
                 # fallback tìm trong data gốc
@@ -364,21 +459,18 @@ def main():
                     row = row.iloc[0]
             entry, tp, sl = compute_entry_tp_sl(row)
             atr_val = float(row.get("atr_14", np.nan)) if row is not None else None
-            # RR
-            rr = (tp - entry) / max(1e-9, entry - sl)
-            # Gửi BUY alert
+            # Gửi BUY alert (R/R do builder tự tính)
             msg = build_buy_alert_vi(
-                ts=date_str,       # timestamp string
-                t=t,               # ticker
-                badge=badge,       # bull/sideway/bear
-                entry=entry,
-                tp=tp,
-                sl=sl,
+                t,                 # ticker
+                entry,
+                tp,
+                sl,
+                badge,             # bull/sideway/bear
                 atr=atr_val,
-                rr=rr,
-                score=float(row.get("score", np.nan)) if row is not None and "score" in row else None
+                score=float(row.get("score", np.nan)) if row is not None and "score" in row else None,
+                ts=date_str,       # timestamp string
             )
-            TelegramNotifier.send(msg, parse_mode="HTML")
+            _send(buy_keys[t], msg)
 
     # 4) SELL alerts cho các vị thế mở trước DATE
     state = load_state()
@@ -394,32 +486,36 @@ def main():
             continue
 
     # Build OHLC map của DATE để check nhanh
-    day_bars = (
-        data[data["time"] == target_date]
-        .set_index("ticker")[["open","high","low","close"]]
-        .to_dict(orient="index")
-    )
+    day_df = data[data["time"] == target_date].set_index("ticker")
+    day_bars = day_df[["open","high","low","close"]].to_dict(orient="index")
+    # SMA / RSI / MFI / OBV / Bollinger cho exit engine (cùng luật với backtest)
+    exit_feat = exit_features_for_day(feat, target_date)
+    if not exit_feat.empty:
+        day_df = day_df.join(exit_feat, how="left")
+
+    # Một lần gọi exit engine cho toàn bộ vị thế
+    signals = evaluate_sell_signals_for_day(positions, day_df, target_date, market)
 
     to_remove = []
     to_update = {}
     for t, pos in positions.items():
-        bar = day_bars.get(t)
-        if not bar:
-            continue
-        bar_s = pd.Series(bar)
-        signal = evaluate_sell_signal_for_bar(pos, bar_s, date_str)
+        signal = signals.get(t)
         if signal:
             # Gửi SELL alert
-            sell_msg = build_sell_alert_vi(date_str, pos, signal)
-            TelegramNotifier.send(sell_msg, parse_mode="HTML")
+            sell_key = make_key("eod", t, target_date, f"SELL_{signal['type']}")
+            if _fresh(sell_key):
+                _send(sell_key, build_sell_alert_vi(date_str, pos, signal))
 
             # Cập nhật/đóng vị thế
-            if signal["type"] in ("SL_GAP", "SL", "TP_FULL", "TRAIL"):
-                # đóng toàn bộ
-                to_remove.append(t)
-            elif signal["type"] in ("TP_GAP", "TP_PARTIAL"):
+            if signal["type"] == "TP_PARTIAL":
                 # giữ lại vị thế đã cập nhật (đánh dấu partial, nâng TP/SL/trailing)
                 to_update[t] = pos.to_dict()
+            else:
+                # đóng toàn bộ
+                to_remove.append(t)
+        elif t in day_bars:
+            # lưu highest/trailing mới để ngày sau đánh giá đúng như backtest
+            to_update[t] = pos.to_dict()
 
     # 5) MUA mới trong ngày: lưu thêm vào state để ngày sau có thể đánh giá SELL
     #    (chỉ thêm nếu chưa có trong positions)
@@ -1,25 +1,129 @@
 # app/jobs/eod_scan.py
+from datetime import date
+
 from ..fiin_client import get_client
 from ..config import CFG
-from ..notifier import TelegramNotifier
-from ..strategy_adapter import compute_features_v12, apply_v12_on_last_day
-from ..formatters.vi_alerts import build_eod_header_vi, build_buy_alert_vi, build_no_pick_vi
+from ..strategy_adapter import compute_features_v12, compute_market_features_v12, screen_last_day
+from ..subscriptions import BuyAlert, dispatch_buy_alerts, dispatch_no_pick
+from ..universe import resolve_universe, iter_daily_chunks
+from ..liquidity import prefilter_liquid, build_liquidity_index, update_liquidity_index
+from ..bar_store import get_bar_store
+from ..alert_ledger import get_ledger, make_key
+from ..utils.trading_calendar import is_trading_day
+from ..snapshot import publish
+from ..profiling import profiled
 
 import pandas as pd
 
 
+def _last_bar_per_ticker(feat: pd.DataFrame) -> pd.DataFrame:
+    # compute_features_v12 trả về đã sort theo (ticker, date) → không cần sort lại
+    if feat is None or feat.empty:
+        return feat
+    return feat.groupby('ticker', sort=False).tail(1)
+
+
+def _no_pick(bar_ts=None) -> None:
+    """Thông báo "không có mã" — mỗi phiên một lần (alert ledger)."""
+    bar_ts = pd.Timestamp.today().normalize() if bar_ts is None else bar_ts
+    key = make_key('eod', '*', bar_ts, 'NO_PICK')
+    if get_ledger().seen(key):
+        return
+    dispatch_no_pick('EOD', ledger_keys=[key])
+
+
+def _save_liquidity(rows) -> None:
+    try:
+        rows = [r for r in rows if r is not None and not r.empty]
+        if rows:
+            update_liquidity_index(pd.concat(rows, ignore_index=True))
+    except Exception as exc:
+        print(f"[eod_scan] Không cập nhật được liquidity index: {exc}")
+
+
+def _store_chunks(client, tickers):
+    """Bar store: đồng bộ tăng dần với vendor rồi đọc lịch sử đã điều chỉnh theo chunk."""
+    store = get_bar_store()
+    store.sync(client, tickers)
+    size = max(1, CFG.fetch_chunk_size)
+    for i in range(0, len(tickers), size):
+        chunk = store.read_adjusted(tickers[i:i + size], sessions=CFG.bar_history_sessions)
+        if not chunk.empty:
+            yield chunk
+
+
+def _history_chunks(client, tickers):
+    if CFG.use_bar_store:
+        return _store_chunks(client, list(tickers))
+    return iter_daily_chunks(client, tickers)
+
+
+def scan_tickers(client) -> list:
+    """Danh sách mã của lượt EOD (universe hoặc TICKERS), đã qua liquidity prefilter."""
+    if getattr(CFG, "universe_mode", False):
+        tickers = resolve_universe(client)
+    else:
+        tickers = list(CFG.tickers)
+    if CFG.use_liquidity_prefilter:
+        tickers = prefilter_liquid(tickers)
+    return tickers
+
+
+def _compute_universe_features(client) -> pd.DataFrame:
+    """
+    Universe mode: market features từ VNINDEX một lần, sau đó mỗi chunk mã
+    được tính feature ngay khi tải xong và chỉ giữ lại nến cuối của từng mã.
+    """
+    tickers = scan_tickers(client)
+    vn = next(iter(_history_chunks(client, ["VNINDEX"])), None)
+    if vn is None or vn.empty:
+        raise RuntimeError("[eod_scan] Không tải được VNINDEX để tính market features.")
+    market = compute_market_features_v12(vn)
+
+    parts, liq_rows = [], []
+    for chunk in _history_chunks(client, tickers):
+        liq_rows.append(build_liquidity_index(chunk))
+        feat = compute_features_v12(chunk, market=market)
+        if feat is not None and not feat.empty:
+            parts.append(_last_bar_per_ticker(feat))
+    _save_liquidity(liq_rows)
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
+
+
+@profiled("eod")
 def run_eod_scan():
+    if not is_trading_day(date.today()):
+        print(f"[eod_scan] {date.today()} không phải phiên giao dịch — bỏ qua.")
+        return
     client = get_client()
-    data = client.Fetch_Trading_Data(
-        realtime=False,
-        tickers=list(CFG.tickers),
-        fields=['open','high','low','close','volume','bu','sd','fb','fs','fn'],
-        adjusted=True,
-        by='1d',
-        period=260
-    ).get_data()
-    
-    feat = compute_features_v12(data)
+    if getattr(CFG, "universe_mode", False):
+        feat = _compute_universe_features(client)
+    else:
+        tickers = scan_tickers(client)
+        if CFG.use_bar_store:
+            parts = list(_store_chunks(client, tickers))
+            data = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        else:
+            data = client.Fetch_Trading_Data(
+                realtime=False,
+                tickers=tickers,
+                fields=['open','high','low','close','volume','bu','sd','fb','fs','fn'],
+                adjusted=True,
+                by='1d',
+                period=260
+            ).get_data()
+        _save_liquidity([build_liquidity_index(data)])
+        feat = compute_features_v12(data)
+    send_eod_alerts(feat)
+
+
+def send_eod_alerts(feat: pd.DataFrame) -> None:
+    """Screener trên nến cuối + gửi cảnh báo EOD (dùng chung cho cron và eod_watcher)."""
+    if feat is None or feat.empty:
+        _no_pick()
+        return
 
     # Ưu tiên 'date' (adapter đã chuẩn hoá). Fallback sang 'time'/'timestamp' nếu cần.
     if 'date' in feat.columns:
@@ -29,19 +133,32 @@ def run_eod_scan():
     elif 'timestamp' in feat.columns:
         ts_series = pd.to_datetime(feat['timestamp'])
     else:
-        TelegramNotifier.send(build_no_pick_vi('EOD'), parse_mode="HTML")
+        _no_pick()
         return
     last_ts = ts_series.max()
-    feat_last = feat[ts_series == last_ts].copy()
+    feat_last = feat.loc[ts_series == last_ts]  # chỉ đọc
 
-    picks = apply_v12_on_last_day(feat)
+    # Cảnh báo tính MỘT lần cho mọi subscriber; score của screener dùng cho lọc min_score
+    # (screener primary; các screener shadow chạy cùng lượt và chỉ ghi log)
+    scores = screen_last_day(feat, job='eod', bar_ts=last_ts)
+    publish('eod', feat, scores, last_ts)
+    picks = list(scores)
     if getattr(CFG, "exclude_tickers", None):
         exclude = {t.strip().upper() for t in CFG.exclude_tickers if isinstance(t, str)}
         picks = [p for p in picks if p.upper() not in exclude]
 
     if not picks:
-        TelegramNotifier.send(build_no_pick_vi('EOD'), parse_mode="HTML")
+        _no_pick(last_ts)
+        return
+
+    # Alert ledger: chạy lại cùng phiên chỉ gửi các mã chưa gửi
+    ledger = get_ledger()
+    keys = {t: make_key('eod', t, last_ts, 'BUY') for t in picks}
+    fresh = [t for t in picks if not ledger.seen(keys[t])]
+    if not fresh:
+        print(f"[eod_scan] {len(picks)} mã của phiên {last_ts:%Y-%m-%d} đã gửi trước đó — bỏ qua.")
         return
+    picks = fresh
 
     metrics_row = feat_last.iloc[0] if not feat_last.empty else {}
 
@@ -72,7 +189,7 @@ def run_eod_scan():
 
     ticker_col = 'ticker' if 'ticker' in feat_last.columns else None
 
-    blocks = [build_eod_header_vi()]
+    alerts = []
     for ticker in picks:
         entry = 0.0
         tp = 0.0
@@ -98,7 +215,7 @@ def run_eod_scan():
                 else:
                     tp = entry
                     sl = entry
-        blocks.append(build_buy_alert_vi(ticker, entry, tp, sl, regime_label))
+        alerts.append(BuyAlert(ticker, entry, tp, sl, regime_label, score=scores.get(ticker)))
 
-    # Gửi theo từng đoạn để an toàn giới hạn 4096 ký tự của Telegram
-    TelegramNotifier().send_chunks("\n\n".join(blocks), parse_mode="HTML")
+    # Lọc + render theo từng subscriber; gửi theo chunk (giới hạn 4096 ký tự của Telegram) qua pool
+    dispatch_buy_alerts(alerts, scope='EOD', regime=regime_label, ledger_keys=[keys[t] for t in picks])
@@ -0,0 +1,159 @@
+# app/jobs/eod_watcher.py
+"""
+EOD theo sự kiện "dữ liệu đã chốt" thay vì cron cố định (USE_EOD_WATCHER=1).
+
+- Bắt đầu lúc EOD_WATCH_START, cứ EOD_POLL_SECONDS giây thăm dò rẻ nến ngày cuối
+  (period=1, chỉ close/volume) của các mã CHƯA chốt.
+- Một mã "chốt" khi nến cuối thuộc phiên hôm nay và (timestamp, close, volume) không đổi
+  qua EOD_STABLE_POLLS lần thăm dò liên tiếp.
+- VNINDEX chốt → tính market features. Khi tỷ lệ mã đã chốt >= EOD_MIN_COVERAGE thì bắt đầu
+  tải lịch sử + tính feature cho các mã đã chốt, các mã chốt sau được xử lý dần ở vòng sau.
+- Đủ 100% hoặc quá EOD_DEADLINE → chạy screener trên các nến đã chốt và gửi một lượt cảnh báo
+  (send_eod_alerts, có alert ledger). Mã chưa chốt tới deadline bị bỏ khỏi lượt này (in log).
+"""
+from __future__ import annotations
+
+import time
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from ..config import CFG
+from ..fiin_client import get_client
+from ..strategy_adapter import compute_features_v12, compute_market_features_v12
+from ..universe import iter_daily_chunks
+from ..liquidity import build_liquidity_index
+from ..utils.trading_calendar import is_trading_day
+from .eod_scan import (
+    scan_tickers, send_eod_alerts, _history_chunks, _last_bar_per_ticker, _save_liquidity,
+)
+
+MARKET = "VNINDEX"
+
+
+class FinalBarTracker:
+    """Theo dõi mã nào đã có nến ngày chốt cho `session` (so sánh qua các lần thăm dò)."""
+
+    def __init__(self, tickers: Iterable[str], session: date, stable_polls: int = 2):
+        self.session = pd.Timestamp(session).normalize()
+        self.stable_polls = max(1, int(stable_polls))
+        self._seen: Dict[str, tuple] = {}
+        self._streak: Dict[str, int] = {}
+        self.final: set = set()
+        self.tickers: List[str] = list(dict.fromkeys(tickers))
+
+    @property
+    def pending(self) -> List[str]:
+        return [t for t in self.tickers if t not in self.final]
+
+    def coverage(self, exclude: Iterable[str] = (MARKET,)) -> float:
+        universe = [t for t in self.tickers if t not in set(exclude)]
+        if not universe:
+            return 1.0
+        return sum(t in self.final for t in universe) / len(universe)
+
+    def update(self, probe: Optional[pd.DataFrame]) -> List[str]:
+        """Nhận kết quả thăm dò (ticker, timestamp, close, volume) → danh sách mã vừa chốt."""
+        if probe is None or probe.empty:
+            return []
+        ts_col = "timestamp" if "timestamp" in probe.columns else "time"
+        last = probe.assign(_ts=pd.to_datetime(probe[ts_col])).sort_values("_ts").groupby("ticker").tail(1)
+        newly = []
+        for t, ts, close, vol in zip(last["ticker"], last["_ts"], last["close"], last["volume"]):
+            if t in self.final:
+                continue
+            if ts.normalize() != self.session:
+                self._streak[t] = 0  # vẫn là nến phiên trước → dữ liệu chưa về
+                continue
+            sig = (ts, float(close), float(vol))
+            self._streak[t] = self._streak.get(t, 0) + 1 if self._seen.get(t) == sig else 1
+            self._seen[t] = sig
+            if self._streak[t] >= self.stable_polls:
+                self.final.add(t)
+                newly.append(t)
+        return newly
+
+
+def _probe(client, tickers: List[str]) -> pd.DataFrame:
+    """Thăm dò rẻ: nến ngày cuối, chỉ close/volume."""
+    parts = list(iter_daily_chunks(client, tickers, period=1, fields=["close", "volume"], retries=1))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def _at(today: date, hhmm: str) -> datetime:
+    h, m = (int(x) for x in hhmm.split(":"))
+    return datetime.combine(today, datetime.min.time()).replace(hour=h, minute=m)
+
+
+def run_eod_watcher(
+    now: Callable[[], datetime] = datetime.now,
+    sleep: Callable[[float], None] = time.sleep,
+    client=None,
+) -> Optional[dict]:
+    today = now().date()
+    if not is_trading_day(today):
+        print(f"[eod_watcher] {today} không phải phiên giao dịch — bỏ qua.")
+        return None
+    client = client or get_client()
+    tickers = [t for t in scan_tickers(client) if t != MARKET]
+    tracker = FinalBarTracker([MARKET] + tickers, today, CFG.eod_stable_polls)
+    deadline = _at(today, CFG.eod_deadline)
+
+    market = None
+    queued: List[str] = []
+    parts, liq_rows = [], []
+    t0 = now()
+
+    def _process(batch: List[str]) -> None:
+        for chunk in _history_chunks(client, batch):
+            liq_rows.append(build_liquidity_index(chunk))
+            feat = compute_features_v12(chunk, market=market)
+            if feat is not None and not feat.empty:
+                parts.append(_last_bar_per_ticker(feat))
+
+    while True:
+        pending = tracker.pending
+        if pending:
+            queued += tracker.update(_probe(client, pending))
+        if market is None and MARKET in tracker.final:
+            vn = next(iter(_history_chunks(client, [MARKET])), None)
+            if vn is not None and not vn.empty:
+                market = compute_market_features_v12(vn)
+        cov = tracker.coverage()
+        batch = [t for t in queued if t != MARKET]
+        if market is not None and batch and cov >= CFG.eod_min_coverage:
+            queued = []
+            _process(batch)
+        if not tracker.pending or now() >= deadline:
+            break
+        sleep(CFG.eod_poll_seconds)
+
+    if market is None:
+        # VNINDEX chưa chốt tới deadline → dùng nến hiện có để vẫn có lượt cảnh báo
+        vn = next(iter(_history_chunks(client, [MARKET])), None)
+        if vn is None or vn.empty:
+            raise RuntimeError("[eod_watcher] Không tải được VNINDEX để tính market features.")
+        market = compute_market_features_v12(vn)
+    batch = [t for t in queued if t != MARKET]
+    if batch:
+        _process(batch)
+    _save_liquidity(liq_rows)
+
+    missing = [t for t in tracker.pending if t != MARKET]
+    stats = {
+        "tickers": len(tickers),
+        "final": len(tickers) - len(missing),
+        "coverage": tracker.coverage(),
+        "waited_s": (now() - t0).total_seconds(),
+        "deadline_hit": bool(missing),
+    }
+    print(
+        f"[eod_watcher] {stats['final']}/{stats['tickers']} mã đã chốt "
+        f"({stats['coverage']:.0%}) sau {stats['waited_s']:.0f}s"
+        + (f"; bỏ {len(missing)} mã chưa có nến chốt: {', '.join(missing[:10])}"
+           + ("…" if len(missing) > 10 else "") if missing else "")
+    )
+    feat = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    send_eod_alerts(feat)
+    return stats
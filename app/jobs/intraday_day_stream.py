@@ -1,73 +1,120 @@
-import time
-import threading
 from datetime import date
-from FiinQuantX import BarDataUpdate
 from ..fiin_client import get_client
 from ..config import CFG
-from ..notifier import TelegramNotifier
-from ..strategy_adapter import compute_features_v12, apply_v12_on_last_day
+from ..subscriptions import dispatch_tickers
+from ..strategy_adapter import compute_features_v12, screen_last_day
 from ..utils.trading_calendar import is_trading_day
-from ..state import load_state, save_state
+from ..liquidity import prefilter_liquid
+from ..alert_ledger import get_ledger, make_key
+from ..snapshot import publish, register_metrics
+from ..realtime_shards import ShardPool, DayFeatures, upsert_bars
+from ..coalescer import BarCoalescer
+from ..intraday_flow import FlowAccumulator
+from ..stream_supervisor import SupervisedStream
+from ..profiling import profiled
 
-_event_day = None
-_state = load_state()
-_last_ts_day = _state.get("last_ts_day", None)
+import pandas as pd
 
+_stream = None
+_pool = None
+_coalescer = None
+_bars = None  # nến đã nhận (coalescer gửi mỗi lượt chỉ các mã đã đổi)
+_shard_rows = {}  # shard → nến cuối (feature) của các mã trong shard
+_flow = None  # VWAP / khối ngoại / áp lực mua của phiên theo mã (tính tại chỗ; shard tự giữ accumulator)
 
-def _on_bar_1d(data: BarDataUpdate):
-    global _last_ts_day
-    df = data.to_dataFrame().sort_values(["ticker", "timestamp"])  # includes historical + running day
-    feat = compute_features_v12(df)
-    if "timestamp" not in feat.columns or feat.empty:
+
+def _on_bar_1d(df):
+    df = df.sort_values(["ticker", "timestamp"])  # includes historical + running day
+    _flow.observe_frame(df)
+    _scan_day(_flow.attach(compute_features_v12(df, use_cache=False)))  # nến đang chạy: không qua FeatureCache
+
+
+@profiled("eval-1d", callback=True)
+def _evaluate_1d(df) -> None:
+    # thread flush của coalescer: ghép các mã đã đổi vào state nến rồi quét như _on_bar_1d
+    global _bars
+    _flow.observe_frame(df)
+    _bars = upsert_bars(_bars, df)
+    _scan_day(_flow.attach(compute_features_v12(_bars, use_cache=False)))
+
+
+def _on_shard_rows(shard: int, rows) -> None:
+    # thread tổng hợp của ShardPool: screener là xếp hạng toàn thị trường → chờ đủ mọi shard rồi gộp
+    _shard_rows[shard] = rows
+    if _pool is not None and len(_shard_rows) == _pool.n_shards:
+        feat = pd.concat(list(_shard_rows.values()), ignore_index=True)
+        _scan_day(feat.sort_values("ticker", kind="stable", ignore_index=True))  # cùng thứ tự như tính tại chỗ
+
+
+def _scan_day(feat) -> None:
+    if feat is None or "timestamp" not in feat.columns or feat.empty:
         return
     last_ts = feat["timestamp"].max()
-    if _last_ts_day == last_ts:
+    ledger = get_ledger()
+    # '*' = lượt quét của cả nến ngày (hành vi cũ: mỗi nến ngày chỉ gửi một lần)
+    run_key = make_key("day", "*", last_ts, "SCAN")
+    if ledger.seen(run_key):
         return
 
-    picks = apply_v12_on_last_day(feat)  # apply on running day bar
-    if picks:
-        TelegramNotifier.send("<b>[Day-Running V12]</b> " + ", ".join(picks), parse_mode="HTML")
-    _last_ts_day = last_ts
-    _state["last_ts_day"] = _last_ts_day
-    save_state(_state)
+    scores = screen_last_day(feat, job="day", bar_ts=last_ts)  # apply on running day bar
+    publish("day", feat, scores, last_ts)
+    picks = list(scores)
+    keys = {t: make_key("day", t, last_ts, "BUY") for t in picks}
+    picks = [t for t in picks if not ledger.seen(keys[t])]
+    # gửi lỗi → không ghi ledger, lần cập nhật sau thử lại
+    dispatch_tickers("<b>[Day-Running V12]</b> ", picks, ledger_keys=[keys[t] for t in picks] + [run_key])
+
+
+def _handler():
+    """
+    Xử lý frame nến. Nến ngày đang chạy bắn mỗi tick → USE_COALESCER: chỉ ghi bản mới nhất mỗi mã,
+    thread của coalescer đánh giá theo nhịp. Đánh giá: tại chỗ, hoặc sang worker khi REALTIME_SHARDS > 0.
+    Mỗi lượt đánh giá cộng phần luỹ kế mới vào FlowAccumulator và gắn VWAP / khối ngoại vào nến đang chạy.
+    """
+    global _pool, _coalescer, _bars, _flow
+    if CFG.realtime_shards <= 0 and _flow is None:
+        _flow = FlowAccumulator()
+        register_metrics("flow-1d", _flow.metrics)
+    if CFG.realtime_shards > 0:
+        if _pool is None:
+            _shard_rows.clear()
+            _pool = ShardPool(DayFeatures, _on_shard_rows, name="shards-1d").start()
+        evaluate = _pool.submit
+    elif CFG.use_coalescer:
+        _bars = None
+        evaluate = _evaluate_1d
+    else:
+        evaluate = _on_bar_1d
+    if CFG.use_coalescer:
+        if _coalescer is None:
+            _coalescer = BarCoalescer(evaluate, name="coalescer-1d").start()
+        evaluate = _coalescer.offer
+    return profiled("stream-1d", callback=True)(evaluate)
 
 
 def start_intraday_day_stream(block: bool = False):
+    global _stream
     if not is_trading_day(date.today()):
         return
     client = get_client()
-
-    def _runner():
-        global _event_day
-        backoff = 1
-        while True:
-            try:
-                _event_day = client.Fetch_Trading_Data(
-                    realtime=True,
-                    tickers=list(CFG.tickers),
-                    fields=['open','high','low','close','volume','bu','sd','fb','fs','fn'],
-                    adjusted=True,
-                    by='1d',
-                    callback=_on_bar_1d,
-                    wait_for_full_timeFrame=False  # running day bar updates
-                )
-                _event_day.get_data()
-                while not _event_day._stop:
-                    time.sleep(1)
-                backoff = 1
-            except Exception:
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 60)
-                continue
-
-    if block:
-        _runner()
-    else:
-        threading.Thread(target=_runner, daemon=True).start()
+    tickers = list(CFG.tickers)
+    if CFG.use_liquidity_prefilter:
+        tickers = prefilter_liquid(tickers)
+    # giám sát kết nối: heartbeat, reconnect có jitter, backfill nến hụt (state handler giữ nguyên)
+    _stream = SupervisedStream("stream-1d", client, tickers, by="1d", on_frame=_handler(),
+                               wait_for_full_timeFrame=False)  # running day bar updates
+    _stream.start(block=block)
 
 
 def stop_intraday_day_stream():
-    try:
-        _event_day.stop()
-    except Exception:
-        pass
+    global _pool, _coalescer, _bars, _stream, _flow
+    if _stream is not None:
+        _stream.stop()
+        _stream = None
+    if _coalescer is not None:
+        _coalescer.stop()
+        _coalescer, _bars = None, None
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+    _flow = None
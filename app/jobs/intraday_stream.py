@@ -1,78 +1,85 @@
-import time
-import threading
 from datetime import date
-from FiinQuantX import BarDataUpdate
 from ..fiin_client import get_client
 from ..config import CFG
-from ..notifier import TelegramNotifier
-from ..strategy_adapter import early_signal_from_15m_bar
 from ..utils.trading_calendar import is_trading_day
-from ..state import load_state, save_state
-from ..formatters.vi_alerts import build_buy_alert_vi
+from ..liquidity import prefilter_liquid
+from ..subscriptions import BuyAlert, dispatch_buy_alerts
+from ..alert_ledger import get_ledger, make_key
+from ..realtime_shards import ShardPool, Signals15m
+from ..orderflow import DailyLevels, OrderFlowEngine, load_daily_levels
+from ..snapshot import register_metrics
+from ..stream_supervisor import SupervisedStream
+from ..profiling import profiled
 
-_event = None
-_state = load_state()
-_last_alert = _state.get("last_alert_15m", {})  # ticker -> last_bar_ts
+_stream = None
+_pool = None
+_engine = None
+_levels = DailyLevels()  # ATR ngày + pha thị trường, nạp lại mỗi lần start
 
 
-def _on_bar_15m(data: BarDataUpdate):
-    df = data.to_dataFrame().sort_values(["ticker", "timestamp"])
-    for tk, g in df.groupby("ticker"):
-        if len(g) < 2:
+def _send_15m(signals) -> None:
+    """Cảnh báo sớm cho các nến 15' đã đóng có tín hiệu (DataFrame của OrderFlowEngine) — bỏ qua nến đã gửi."""
+    ledger = get_ledger()
+    alerts, keys = [], []
+    exclude = {t.strip().upper() for t in CFG.exclude_tickers if isinstance(t, str)}
+    for row in _levels.apply(signals).to_dict("records"):
+        if str(row["ticker"]).strip().upper() in exclude:
             continue
-        prev = g.iloc[-2]  # closed 15' candle
-        if _last_alert.get(tk) == prev["timestamp"]:
+        key = make_key("15m", row["ticker"], row["timestamp"], "BUY")
+        if ledger.seen(key):
             continue
-        if early_signal_from_15m_bar(prev):
-            entry = float(prev.get("entry") or prev.get("close") or 0.0)
-            tp = float(prev.get("tp") or entry)
-            sl = float(prev.get("sl") or entry)
-            regime = prev.get("regime", "bull")
-            TelegramNotifier.send(
-                build_buy_alert_vi(tk, entry, tp, sl, regime),
-                parse_mode="HTML"
-            )
-            _last_alert[tk] = prev["timestamp"]
-            _state["last_alert_15m"] = _last_alert
-            save_state(_state)
+        alerts.append(BuyAlert(row["ticker"], row["entry"], row["tp"], row["sl"], row["regime"]))
+        keys.append(key)
+    if alerts:
+        dispatch_buy_alerts(alerts, scope='15m', header=False, no_pick=False, ledger_keys=keys)
+
+
+def _on_bar_15m(df):
+    signals = _engine.update(df)
+    if signals is not None:
+        _send_15m(signals)
+
+
+def _on_signals_15m(shard: int, signals) -> None:
+    # thread tổng hợp của ShardPool: worker đã chạy order-flow, ở đây chỉ TP/SL + ledger + gửi
+    _send_15m(signals)
+
+
+def _handler():
+    """Xử lý frame nến: order-flow tại chỗ, hoặc chỉ chuyển delta sang worker khi REALTIME_SHARDS > 0."""
+    global _pool, _engine
+    if CFG.realtime_shards <= 0:
+        if _engine is None:
+            _engine = OrderFlowEngine()
+            register_metrics("orderflow-15m", _engine.metrics)
+        return profiled("stream-15m", callback=True)(_on_bar_15m)
+    if _pool is None:
+        _pool = ShardPool(Signals15m, _on_signals_15m, name="shards-15m").start()
+    return profiled("stream-15m", callback=True)(_pool.submit)
 
 
 def start_intraday_stream(block: bool = False):
+    global _stream, _levels
     if not is_trading_day(date.today()):
         return
     client = get_client()
-
-    def _runner():
-        global _event
-        backoff = 1
-        while True:
-            try:
-                _event = client.Fetch_Trading_Data(
-                    realtime=True,
-                    tickers=list(CFG.tickers),
-                    fields=['open','high','low','close','volume','bu','sd','fb','fs','fn'],
-                    adjusted=True,
-                    by='15m',
-                    callback=_on_bar_15m,
-                    wait_for_full_timeFrame=True
-                )
-                _event.get_data()
-                while not _event._stop:
-                    time.sleep(1)
-                backoff = 1  # reset after a clean stop
-            except Exception:
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 60)
-                continue
-
-    if block:
-        _runner()
-    else:
-        threading.Thread(target=_runner, daemon=True).start()
+    tickers = list(CFG.tickers)
+    if CFG.use_liquidity_prefilter:
+        tickers = prefilter_liquid(tickers)
+    _levels = load_daily_levels(client, tickers)  # TP/SL theo ATR ngày (snapshot nóng hoặc fetch)
+    print(f"[stream-15m] ATR ngày: {len(_levels.atr)} mã ({_levels.source}), pha {_levels.regime} × {_levels.atr_mult}")
+    # giám sát kết nối: heartbeat, reconnect có jitter, backfill nến hụt (state handler giữ nguyên)
+    _stream = SupervisedStream("stream-15m", client, tickers, by="15m", on_frame=_handler(),
+                               wait_for_full_timeFrame=True)
+    _stream.start(block=block)
 
 
 def stop_intraday_stream():
-    try:
-        _event.stop()
-    except Exception:
-        pass
+    global _pool, _stream, _engine
+    if _stream is not None:
+        _stream.stop()
+        _stream = None
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+    _engine = None  # profile khối lượng dựng lại từ lịch sử vendor ở phiên sau
@@ -0,0 +1,141 @@
+# app/liquidity.py
+"""
+Liquidity index — lọc trước các mã không thể qua cổng thanh khoản của screener V12.
+
+- File LIQUIDITY_INDEX_FILE (parquet, 1 dòng/mã): date, volume_ma20, turnover_ma20, last_volume.
+- refresh_liquidity_index(): job tối (sau EOD) — chỉ tải close/volume 20 phiên cho toàn universe.
+- update_liquidity_index(): upsert từ dữ liệu '1d' đã có sẵn (EOD scan tự gọi).
+- prefilter_liquid(): bỏ các mã có volume_ma20 < LIQ_MIN_VOLUME_MA20 * LIQ_MARGIN.
+  Mã chưa có trong index hoặc dòng index quá cũ được giữ lại (an toàn, không bỏ sót).
+
+Chạy tay (bootstrap):
+    python -m app.liquidity
+"""
+from __future__ import annotations
+
+import os
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+from .config import CFG
+
+INDEX_COLUMNS = ['ticker', 'date', 'volume_ma20', 'turnover_ma20', 'last_volume']
+
+_cache = {"mtime": None, "df": None}
+
+
+def _index_path() -> Path:
+    return Path(CFG.liquidity_index_file).resolve()
+
+
+def build_liquidity_index(df_hist: pd.DataFrame, window: int = 20) -> pd.DataFrame:
+    """Tính 1 dòng/mã từ dữ liệu '1d' (cần ticker, close, volume và timestamp/time/date)."""
+    if df_hist is None or df_hist.empty:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    ts_col = next((c for c in ['date', 'timestamp', 'time'] if c in df_hist.columns), None)
+    if ts_col is None:
+        raise KeyError("[liquidity] Thiếu cột thời gian ('date'/'timestamp'/'time').")
+    df = pd.DataFrame({
+        'ticker': df_hist['ticker'].astype(str).str.upper(),
+        'date': pd.to_datetime(df_hist[ts_col]).dt.date,
+        'volume': pd.to_numeric(df_hist['volume'], errors='coerce'),
+        'turnover': pd.to_numeric(df_hist['close'], errors='coerce') * pd.to_numeric(df_hist['volume'], errors='coerce'),
+    }).sort_values(['ticker', 'date'])
+    tail = df.groupby('ticker', sort=False).tail(window)
+    g = tail.groupby('ticker', sort=False)
+    out = pd.DataFrame({
+        'date': g['date'].last(),
+        'volume_ma20': g['volume'].mean(),
+        'turnover_ma20': g['turnover'].mean(),
+        'last_volume': g['volume'].last(),
+    })
+    # Chưa đủ `window` phiên → để NaN (prefilter sẽ giữ lại)
+    short = g.size() < window
+    out.loc[short, ['volume_ma20', 'turnover_ma20']] = float('nan')
+    return out.reset_index()[INDEX_COLUMNS]
+
+
+def load_liquidity_index() -> pd.DataFrame:
+    """Đọc index (cache theo mtime). Không có file → DataFrame rỗng."""
+    path = _index_path()
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    if _cache["mtime"] != mtime:
+        _cache["df"] = pd.read_parquet(path)
+        _cache["mtime"] = mtime
+    return _cache["df"]
+
+
+def update_liquidity_index(rows: pd.DataFrame) -> None:
+    """Upsert các dòng mới (theo ticker) vào file index."""
+    if rows is None or rows.empty:
+        return
+    path = _index_path()
+    cur = load_liquidity_index()
+    merged = pd.concat([cur[~cur['ticker'].isin(rows['ticker'])], rows], ignore_index=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    merged.sort_values('ticker').to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def prefilter_liquid(
+    tickers: Iterable[str],
+    min_volume_ma20: Optional[float] = None,
+    margin: Optional[float] = None,
+    max_age_days: Optional[int] = None,
+) -> List[str]:
+    """
+    Giữ thứ tự `tickers`, bỏ mã chắc chắn không qua cổng volume_ma20 của screener.
+    Luôn giữ VNINDEX (market features).
+    """
+    tickers = list(tickers)
+    idx = load_liquidity_index()
+    if idx.empty:
+        return tickers
+    min_volume_ma20 = CFG.liq_min_volume_ma20 if min_volume_ma20 is None else min_volume_ma20
+    margin = CFG.liq_margin if margin is None else margin
+    max_age_days = CFG.liq_max_age_days if max_age_days is None else max_age_days
+
+    fresh_since = date.today() - timedelta(days=max_age_days)
+    fresh = idx[pd.to_datetime(idx['date']).dt.date >= fresh_since]
+    floor = min_volume_ma20 * margin
+    illiquid = fresh.loc[fresh['volume_ma20'] < floor, 'ticker']
+    if CFG.liq_min_turnover > 0:
+        illiquid = pd.concat([illiquid, fresh.loc[fresh['turnover_ma20'] < CFG.liq_min_turnover, 'ticker']])
+    skip = set(illiquid) - {"VNINDEX"}
+    kept = [t for t in tickers if t not in skip]
+    if skip:
+        print(f"[liquidity] Prefilter: giữ {len(kept)}/{len(tickers)} mã.")
+    return kept
+
+
+def refresh_liquidity_index(client=None) -> int:
+    """Job tối: tải close/volume 20 phiên cho toàn universe và ghi lại index."""
+    from .fiin_client import get_client
+    from .universe import resolve_universe, iter_daily_chunks
+    from .utils.trading_calendar import is_trading_day
+
+    if client is None and not is_trading_day(date.today()):
+        return 0  # ngày nghỉ: không có phiên mới, giữ index cũ
+    client = client or get_client()
+    tickers = resolve_universe(client) if getattr(CFG, "universe_mode", False) else list(CFG.tickers)
+    parts = [
+        build_liquidity_index(chunk)
+        for chunk in iter_daily_chunks(client, tickers, period=20, fields=['close', 'volume'])
+    ]
+    if not parts:
+        return 0
+    rows = pd.concat(parts, ignore_index=True)
+    update_liquidity_index(rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    n = refresh_liquidity_index()
+    print(f"[liquidity] Đã cập nhật {n} mã vào {_index_path()}")
@@ -1,20 +1,51 @@
 import asyncio
+import importlib.util
+import sys
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from zoneinfo import ZoneInfo
 from .config import CFG
-from .jobs.eod_scan import run_eod_scan
-try:
-    from .jobs.intraday_stream import start_intraday_stream, stop_intraday_stream
-    from .jobs.intraday_day_stream import start_intraday_day_stream, stop_intraday_day_stream
-except Exception:
-    start_intraday_stream = stop_intraday_stream = lambda *a, **k: None
-    start_intraday_day_stream = stop_intraday_day_stream = lambda *a, **k: None
 from .notifier import TelegramNotifier
+from .snapshot import start_snapshot_server, stop_snapshot_server
 from .fiin_client import get_client
+from .profiling import install_signal
+
+
+def _job(ref: str, loaded_only: bool = False):
+    """
+    ".module:hàm" (tương đối với package app) → hàm chỉ import module khi job chạy lần đầu.
+    Bot khởi động / chờ lịch không nạp pandas, V12, numba (xem test/bench_startup.py).
+    loaded_only: module chưa được nạp → bỏ qua (vd. dừng stream chưa từng chạy).
+    """
+    mod_name, _, attr = ref.partition(":")
+
+    def run(*args, **kwargs):
+        full = importlib.util.resolve_name(mod_name, __package__)
+        if loaded_only and full not in sys.modules:
+            return None
+        return getattr(importlib.import_module(full), attr)(*args, **kwargs)
+
+    run.__name__ = attr
+    return run
+
+
+run_eod_scan = _job(".jobs.eod_scan:run_eod_scan")
+run_eod_watcher = _job(".jobs.eod_watcher:run_eod_watcher")
+refresh_liquidity_index = _job(".liquidity:refresh_liquidity_index")
+start_intraday_stream = _job(".jobs.intraday_stream:start_intraday_stream")
+stop_intraday_stream = _job(".jobs.intraday_stream:stop_intraday_stream", loaded_only=True)
+start_intraday_day_stream = _job(".jobs.intraday_day_stream:start_intraday_day_stream")
+stop_intraday_day_stream = _job(".jobs.intraday_day_stream:stop_intraday_day_stream", loaded_only=True)
 
 async def main():
     sch = AsyncIOScheduler(timezone=ZoneInfo(CFG.tz))
+    # Profiling theo yêu cầu: kill -USR1 <pid> bật/tắt đo các hook (PROFILE_MODE, PROFILE_DIR)
+    install_signal()
+    # Snapshot feature/picks mới nhất cho replay / script (không đăng nhập vendor)
+    try:
+        start_snapshot_server()
+    except OSError as e:
+        print(f"[snapshot] Không mở được server: {e}")
     # Boot sanity check & ping
     try:
         _ = get_client()
@@ -29,10 +60,25 @@ async def main():
             pass
         
     # EOD daily (confirm-on-close)
-    sch.add_job(
-        run_eod_scan,
-        CronTrigger(day_of_week="mon-fri", hour=CFG.eod_hour, minute=CFG.eod_minute)
-    )
+    if CFG.use_eod_watcher:
+        # chạy khi dữ liệu đóng cửa đã chốt (thăm dò từ EOD_WATCH_START tới EOD_DEADLINE)
+        watch_h, watch_m = (int(x) for x in CFG.eod_watch_start.split(":"))
+        sch.add_job(
+            run_eod_watcher,
+            CronTrigger(day_of_week="mon-fri", hour=watch_h, minute=watch_m),
+            misfire_grace_time=600,
+        )
+    else:
+        sch.add_job(
+            run_eod_scan,
+            CronTrigger(day_of_week="mon-fri", hour=CFG.eod_hour, minute=CFG.eod_minute)
+        )
+    # Liquidity index (tối, sau EOD) — phục vụ prefilter của phiên kế tiếp
+    if CFG.use_liquidity_prefilter:
+        sch.add_job(
+            refresh_liquidity_index,
+            CronTrigger(day_of_week="mon-fri", hour=CFG.liq_refresh_hour, minute=0)
+        )
     # Intraday streams (disabled by default)
     if getattr(CFG, "use_intraday", False):
         # 15m early flow: open at OPEN_HOUR, stop at CLOSE_HOUR
@@ -63,6 +109,7 @@ async def main():
         if getattr(CFG, "use_intraday", False):
             stop_intraday_stream()
             stop_intraday_day_stream()
+        stop_snapshot_server()
 
 
 if __name__ == "__main__":
@@ -2,6 +2,27 @@ import time
 import requests
 from .config import CFG
 import os, time, requests, json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Tuple
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Session dùng chung (keep-alive, pool kết nối) cho mọi lần gửi."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                size = max(1, CFG.send_pool_size)
+                adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
 
 class TelegramNotifier:
     def __init__(self, token: str | None = None, chat_id: str | None = None, thread_id: int | None = None):
@@ -18,7 +39,7 @@ class TelegramNotifier:
         last_err = None
         for attempt in range(retries):
             try:
-                r = requests.post(url, data=payload, timeout=10)
+                r = _get_session().post(url, data=payload, timeout=10)
                 if r.status_code == 429:
                     retry_after = 1
                     try:
@@ -53,6 +74,37 @@ class TelegramNotifier:
         for part in self._split_text(text):
             self._send(part, parse_mode=parse_mode)
             
+    @staticmethod
+    def send_each(jobs: Iterable[Tuple["TelegramNotifier", str]], parse_mode: str = "HTML") -> List[bool]:
+        """
+        Gửi song song nhiều (notifier, text) qua pool SEND_POOL_SIZE luồng.
+        Mỗi text gửi tuần tự theo chunk (giữ thứ tự trong một chat); lỗi một chat không chặn chat khác.
+        Trả về kết quả từng job theo đúng thứ tự (text rỗng = không có gì để gửi → True).
+        """
+        jobs = list(jobs)
+
+        def _one(job):
+            notifier, text = job
+            if not text:
+                return True
+            try:
+                notifier.send_chunks(text, parse_mode=parse_mode)
+                return True
+            except Exception as exc:
+                print(f"[notifier] Gửi tới {notifier.chat_id}/{notifier.thread_id} lỗi: {exc}")
+                return False
+
+        if len(jobs) <= 1:
+            return [_one(j) for j in jobs]
+        with ThreadPoolExecutor(max_workers=max(1, CFG.send_pool_size), thread_name_prefix="send") as pool:
+            return list(pool.map(_one, jobs))
+
+    @staticmethod
+    def send_many(jobs: Iterable[Tuple["TelegramNotifier", str]], parse_mode: str = "HTML") -> int:
+        """Như send_each, trả về số job (text khác rỗng) gửi thành công."""
+        jobs = [(n, t) for n, t in jobs if t]
+        return sum(TelegramNotifier.send_each(jobs, parse_mode=parse_mode))
+
     @classmethod
     def send(cls, text: str, parse_mode: str = "HTML"):
         """
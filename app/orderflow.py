@@ -0,0 +1,261 @@
+# app/orderflow.py
+"""
+Order-flow intraday cho nến 15' — state dạng mảng NumPy theo mã, mỗi lượt đánh giá mọi mã có nến vừa đóng.
+
+- Mỗi mã một dòng trong các mảng (n_mã, ...): nến chờ (nến cuối của frame, chưa đóng), cửa sổ OF_WINDOW nến
+  đã đóng (bu/sd, tổng cộng dồn O(1)), profile khối lượng theo khung giờ (mỗi mã × mỗi nến trong ngày: trung bình
+  OF_PROFILE_DAYS phiên gần nhất), cùng các tổng của phiên từ FlowAccumulator (app/intraday_flow.py):
+  cumulative delta (bu - sd), VWAP, dòng tiền khối ngoại, áp lực mua.
+- update(frame): frame vendor (cả lịch sử) hoặc chỉ delta (ShardPool) đều được — nến cuối mỗi mã là nến chờ,
+  các nến trước đó mới hơn nến đã xét là nến đã đóng. Nến đã đóng được nạp theo thứ tự thời gian, mỗi bước
+  một nến của mọi mã (thường chỉ một bước: nến vừa đóng của cả thị trường).
+- Như _on_bar_15m cũ: mã mới chỉ xét tín hiệu ở nến vừa đóng (lịch sử chỉ để khởi tạo state), mã đã biết
+  xét mọi nến đã đóng chưa xét (backfill sau mất kết nối).
+- Tín hiệu mua: nến có khối lượng, bu > sd, imbalance cửa sổ ≥ OF_MIN_IMBALANCE, cumulative delta phiên > 0,
+  khối lượng tương đối (so với profile cùng khung giờ, cần ≥ OF_PROFILE_MIN_DAYS phiên) ≥ OF_MIN_RVOL,
+  close / VWAP phiên - 1 ≥ OF_MIN_VWAP_DEV, khối ngoại ròng / khối lượng phiên ≥ OF_MIN_FOREIGN_RATIO
+  (hai ngưỡng dòng tiền mặc định -1 = tắt: không lọc, kể cả khi VWAP / khối ngoại chưa có → NaN).
+- DailyLevels: ATR ngày (atr_14) + pha thị trường (market_phase_v12) → entry/TP/SL như cảnh báo EOD.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import CFG
+from .intraday_flow import FEATURES, FlowAccumulator, _columns, _ns, _ratio, _ts_col
+
+_DAY_NS = 86_400 * 10**9
+_NAT = np.iinfo(np.int64).min
+_FLOW = ("high", "low", "close", "volume", "bu", "sd", "fb", "fs")  # cột nạp vào state (thiếu cột → 0)
+
+SIGNAL_COLUMNS = ["ticker", "timestamp", "close", "volume", "bu", "sd", "imbalance", "window_imbalance",
+                  "cum_delta", "session_volume", "rvol", *FEATURES]
+
+
+def _gate(values: np.ndarray, minimum: float):
+    """Ngưỡng dòng tiền: ≤ -1 là tắt (tỷ lệ luôn > -1) → không lọc, NaN cũng qua."""
+    if minimum <= -1:
+        return True
+    with np.errstate(invalid="ignore"):
+        return values >= minimum
+
+
+class OrderFlowEngine(FlowAccumulator):
+    """State order-flow của các mã (một instance cho một stream hoặc một shard); tổng phiên từ FlowAccumulator."""
+
+    def __init__(self, window: Optional[int] = None, min_imbalance: Optional[float] = None,
+                 min_rvol: Optional[float] = None, profile_days: Optional[int] = None,
+                 profile_min_days: Optional[int] = None, min_vwap_dev: Optional[float] = None,
+                 min_foreign_ratio: Optional[float] = None, bar_minutes: int = 15, capacity: int = 256):
+        self.window = max(1, int(window or CFG.of_window))
+        self.min_imbalance = CFG.of_min_imbalance if min_imbalance is None else float(min_imbalance)
+        self.min_rvol = CFG.of_min_rvol if min_rvol is None else float(min_rvol)
+        self.profile_days = max(1, int(profile_days or CFG.of_profile_days))
+        self.profile_min_days = max(1, int(profile_min_days or CFG.of_profile_min_days))
+        self.min_vwap_dev = CFG.of_min_vwap_dev if min_vwap_dev is None else float(min_vwap_dev)
+        self.min_foreign_ratio = CFG.of_min_foreign_ratio if min_foreign_ratio is None else float(min_foreign_ratio)
+        self._bar_ns = bar_minutes * 60 * 10**9
+        self.n_slots = _DAY_NS // self._bar_ns
+        super().__init__(capacity)
+        self.stats = {"updates": 0, "bars": 0, "evaluated": 0, "signals": 0}
+
+    # ---- state dạng mảng ----
+    def _spec(self) -> dict:
+        W, S = self.window, self.n_slots
+        return {
+            **super()._spec(),
+            "_done": ((), np.int64, _NAT),       # nến đã đóng mới nhất đã nạp
+            "_pend_ts": ((), np.int64, _NAT),    # nến chờ (nến cuối của frame gần nhất)
+            "_pend": ((len(_FLOW),), np.float64, np.nan),
+            "_ring": ((2, W), np.float64, 0.0),  # bu / sd của W nến đã đóng gần nhất
+            "_rsum": ((2,), np.float64, 0.0),
+            "_rpos": ((), np.int64, 0),
+            "_prof": ((S,), np.float64, np.nan),  # khối lượng trung bình theo khung giờ
+            "_prof_n": ((S,), np.int32, 0),
+        }
+
+    def metrics(self) -> dict:
+        return {"tickers": len(self._names), **self.stats}
+
+    # ---- cập nhật ----
+    def update(self, df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """Nạp frame nến 15' → DataFrame tín hiệu (SIGNAL_COLUMNS) của các nến vừa đóng, None nếu không có."""
+        if df is None or df.empty:
+            return None
+        self.stats["updates"] += 1
+        n = len(df)
+        ts = _ns(df[_ts_col(df)])
+        idx = self._ids(df["ticker"].astype(str).to_numpy())
+        # vendor gửi lại cả lịch sử mỗi frame → bỏ các nến đã nạp trước khi sort
+        fresh = np.flatnonzero(ts > self._done[idx])
+        if len(fresh) < n:
+            if not len(fresh):
+                return None
+            df, ts, idx, n = df.iloc[fresh], ts[fresh], idx[fresh], len(fresh)
+        vals = _columns(df, _FLOW)
+
+        # nến chờ của các mã có mặt: đứng trước các dòng mới cùng nến (bản mới thắng khi trùng)
+        seen = np.unique(idx)
+        held = seen[self._pend_ts[seen] != _NAT]
+        src = np.r_[np.zeros(len(held), np.int8), np.ones(n, np.int8)]
+        ts = np.r_[self._pend_ts[held], ts]
+        idx = np.r_[held, idx]
+        vals = np.concatenate([self._pend[held], vals])
+        order = np.lexsort((src, ts, idx))
+        idx, ts, vals = idx[order], ts[order], vals[order]
+        keep = np.r_[(idx[1:] != idx[:-1]) | (ts[1:] != ts[:-1]), True]
+        idx, ts, vals = idx[keep], ts[keep], vals[keep]
+
+        last = np.r_[idx[1:] != idx[:-1], True]
+        self._pend_ts[idx[last]] = ts[last]
+        self._pend[idx[last]] = vals[last]
+        closed = ~last & (ts > self._done[idx])
+        if not closed.any():
+            return None
+        idx, ts, vals = idx[closed], ts[closed], vals[closed]
+
+        # thứ tự của nến trong từng mã; mã mới: chỉ nến vừa đóng được xét tín hiệu
+        starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+        rank = np.arange(len(idx)) - np.repeat(starts, np.diff(np.r_[starts, len(idx)]))
+        tail = np.r_[idx[1:] != idx[:-1], True]
+        eligible = tail | (self._done[idx] != _NAT)
+        self._done[idx[tail]] = ts[tail]
+        self.stats["bars"] += len(idx)
+
+        by_rank = np.argsort(rank, kind="stable")
+        bounds = np.searchsorted(rank[by_rank], np.arange(rank.max() + 2))
+        parts = []
+        for r in range(len(bounds) - 1):
+            m = by_rank[bounds[r]:bounds[r + 1]]
+            feats = self._step(idx[m], ts[m], vals[m])
+            sel = eligible[m]
+            self.stats["evaluated"] += int(sel.sum())
+            sel &= feats.pop("signal")
+            if sel.any():
+                parts.append(pd.DataFrame({
+                    "ticker": np.asarray(self._names, dtype=object)[idx[m][sel]],
+                    "timestamp": pd.to_datetime(ts[m][sel]),
+                    **{k: v[sel] for k, v in feats.items()},
+                }))
+        if not parts:
+            return None
+        out = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        self.stats["signals"] += len(out)
+        return out[SIGNAL_COLUMNS]
+
+    def _step(self, i: np.ndarray, t: np.ndarray, v: np.ndarray) -> Dict[str, np.ndarray]:
+        """Nạp một nến đã đóng cho mỗi mã trong `i` (không trùng mã) và tính feature của nến đó."""
+        high, low, close = v[:, 0], v[:, 1], v[:, 2]
+        flow = np.nan_to_num(v[:, 3:])  # volume, bu, sd, fb, fs
+        vol, bu, sd = flow[:, 0], flow[:, 1], flow[:, 2]
+        day, slot = np.divmod(t, _DAY_NS)
+        slot //= self._bar_ns
+
+        # tổng của phiên (VWAP, khối ngoại, bu/sd) — giá nến = giá điển hình, thiếu high/low → close
+        typical = np.where(np.isnan(high) | np.isnan(low), close, (high + low + close) / 3)
+        self.add(i, day, typical, close, flow)
+        cum = self._sum[i, 2] - self._sum[i, 3]
+        svol = self._sum[i, 1]
+        flows = self.features(i)
+
+        # khối lượng tương đối: so với profile cùng khung giờ trước khi cộng nến này vào
+        cnt = self._prof_n[i, slot]
+        base = self._prof[i, slot]
+        ready = (cnt >= self.profile_min_days) & (base > 0)
+        rvol = np.full(len(i), np.nan)
+        rvol[ready] = vol[ready] / base[ready]
+        alpha = 1.0 / np.minimum(cnt + 1, self.profile_days)
+        self._prof[i, slot] = np.where(cnt == 0, vol, base + alpha * (vol - base))
+        self._prof_n[i, slot] = cnt + 1
+
+        p = self._rpos[i]
+        self._rsum[i, 0] += bu - self._ring[i, 0, p]
+        self._rsum[i, 1] += sd - self._ring[i, 1, p]
+        self._ring[i, 0, p] = bu
+        self._ring[i, 1, p] = sd
+        self._rpos[i] = (p + 1) % self.window
+
+        imb = _ratio(bu - sd, bu + sd)
+        wbu, wsd = self._rsum[i, 0], self._rsum[i, 1]
+        wimb = _ratio(wbu - wsd, wbu + wsd)
+        signal = ((vol > 0) & (imb > 0) & (wimb >= self.min_imbalance) & (cum > 0) & (rvol >= self.min_rvol)
+                  & _gate(flows["vwap_dev"], self.min_vwap_dev) & _gate(flows["foreign_ratio"], self.min_foreign_ratio))
+        return {"close": close, "volume": vol, "bu": bu, "sd": sd, "imbalance": imb, "window_imbalance": wimb,
+                "cum_delta": cum, "session_volume": svol, "rvol": rvol, **flows, "signal": signal}
+
+
+# ---- TP/SL theo ATR ngày ----
+def atr_last(daily: pd.DataFrame, n: int = 14) -> pd.Series:
+    """ATR n phiên (trung bình true range, như atr_14 của feature V12) ở phiên cuối của từng mã."""
+    ts = next(c for c in ("timestamp", "time", "date") if c in daily.columns)
+    df = daily.sort_values(["ticker", ts], kind="stable", ignore_index=True)
+    prev = df.groupby("ticker", sort=False)["close"].shift(1)
+    tr = np.fmax.reduce([(df["high"] - df["low"]).abs(), (df["high"] - prev).abs(), (df["low"] - prev).abs()])
+    tr[prev.isna().to_numpy()] = np.nan  # như _atr của V12: nến đầu không có true range
+    atr = pd.Series(tr, index=df.index).groupby(df["ticker"], sort=False).rolling(n, min_periods=n).mean()
+    return atr.groupby(level=0).last().dropna()
+
+
+@dataclass
+class DailyLevels:
+    """
+    atr_14 theo mã + pha thị trường → entry/TP/SL cho cảnh báo intraday:
+    TP/SL = entry ± atr_mult × ATR (atr_mult của market_phase_v12); thiếu ATR → TP = SL = entry.
+    """
+    atr: pd.Series = field(default_factory=lambda: pd.Series(dtype=float))
+    regime: str = "bull"
+    atr_mult: float = 2.0
+    source: str = "none"
+
+    def apply(self, signals: pd.DataFrame) -> pd.DataFrame:
+        entry = signals["close"].to_numpy(np.float64)
+        atr = signals["ticker"].map(self.atr).to_numpy(np.float64)
+        band = np.where((entry > 0) & (atr > 0), self.atr_mult * atr, 0.0)
+        return signals.assign(entry=entry, tp=entry + band, sl=np.maximum(0.0, entry - band), regime=self.regime)
+
+    @classmethod
+    def from_snapshot(cls, snap) -> "DailyLevels":
+        atr = pd.Series(snap.latest("atr_14"), dtype=float).dropna()
+        phase = (snap.market or {}).get("phase") or {}
+        return cls(atr=atr[atr > 0], regime=phase.get("market_phase", "bull"),
+                   atr_mult=float(phase.get("atr_mult", 2.0)), source=f"snapshot:{snap.job}")
+
+    @classmethod
+    def fetch(cls, client, tickers: Iterable[str]) -> "DailyLevels":
+        from .strategy_adapter import compute_market_features_v12, market_phase_v12
+        from .universe import iter_daily_chunks
+
+        ohlc = ["open", "high", "low", "close"]
+        names = [t for t in tickers if t != "VNINDEX"]
+        parts = list(iter_daily_chunks(client, names, period=CFG.of_atr_period + 6, fields=ohlc))
+        atr = atr_last(pd.concat(parts, ignore_index=True), CFG.of_atr_period) if parts else pd.Series(dtype=float)
+        levels = cls(atr=atr[atr > 0], source="fetch")
+        mkt = list(iter_daily_chunks(client, ["VNINDEX"], period=260, fields=ohlc))
+        if mkt:
+            last = compute_market_features_v12(pd.concat(mkt, ignore_index=True)).iloc[-1]
+            keys = ("market_close", "market_MA50", "market_MA200", "market_rsi", "market_adx", "market_boll_width")
+            if last[list(keys)].notna().all():
+                phase = market_phase_v12(*(float(last[k]) for k in keys))
+                levels.regime, levels.atr_mult = phase.market_phase, float(phase.atr_mult)
+        return levels
+
+
+def load_daily_levels(client=None, tickers: Iterable[str] = ()) -> DailyLevels:
+    """Ưu tiên snapshot nóng (day → eod) có atr_14; không có thì fetch nến ngày. Lỗi → không có ATR."""
+    from .snapshot import get_snapshot
+
+    for job in ("day", "eod"):
+        snap = get_snapshot(job)
+        if snap is not None and "atr_14" in snap.columns:
+            return DailyLevels.from_snapshot(snap)
+    if client is None:
+        return DailyLevels()
+    try:
+        return DailyLevels.fetch(client, tickers)
+    except Exception as exc:
+        print(f"[orderflow] Không lấy được ATR ngày ({exc}) — TP/SL = entry.")
+        return DailyLevels()
@@ -0,0 +1,274 @@
+# app/profiling.py
+"""
+Profiling theo yêu cầu cho job và callback — bật bằng env hoặc signal, không cần sửa code.
+
+- Hook đặt sẵn bằng @profiled(name): "eod" (run_eod_scan), "alerts_on_date" (alerts_on_date.main),
+  "stream-15m" / "stream-1d" (callback vendor), "eval-1d" (lượt đánh giá của coalescer).
+  Hàm ngoài app (vd. backtest_engine_v12 trong round_2/v12.py) bọc lúc chạy bằng patch("module:hàm", name)
+  hoặc CLI bên dưới.
+- PROFILE: danh sách hook cần đo, phân tách bằng dấu phẩy, hoặc "all"; trống = tắt.
+  Khi tắt, wrapper chỉ kiểm tra một cờ rồi gọi thẳng hàm gốc.
+- PROFILE_MODE: "cprofile" → <PROFILE_DIR>/<hook>-<thời điểm>-<pid>-<n>.pstats (xem bằng pstats / snakeviz);
+  "sample" → lấy mẫu stack của thread đang chạy mỗi PROFILE_SAMPLE_MS ms → .speedscope.json (speedscope.app).
+- Callback: chỉ đo 1/PROFILE_EVERY lượt gọi (mỗi lượt đo ghi một file).
+- SIGUSR1 (process app.main): bật/tắt đo mọi hook mà không cần khởi động lại.
+
+CLI — đo cả một script/module, hoặc chỉ các hàm được patch trong lúc chạy:
+    python -m app.profiling -m app.jobs.alerts_on_date --date 2025-09-19
+    python -m app.profiling --mode sample --patch round_2.v12:backtest_engine_v12 my_backtest.py
+"""
+from __future__ import annotations
+
+import cProfile
+import functools
+import importlib
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import CFG
+
+_local = threading.local()  # đang đo trên thread này → hook lồng bên trong chạy thẳng
+_seq = itertools.count(1)
+
+
+class _State:
+    def __init__(self):
+        self.configure(CFG.profile, CFG.profile_mode, CFG.profile_dir, CFG.profile_every, CFG.profile_sample_ms)
+        self.forced = False  # SIGUSR1
+
+    def configure(self, targets, mode=None, out_dir=None, every=None, sample_ms=None) -> None:
+        if isinstance(targets, str):
+            targets = [t.strip() for t in targets.split(",")]
+        self.targets = frozenset(t for t in (targets or ()) if t)
+        self.all = "all" in self.targets
+        self.mode = (mode or getattr(self, "mode", "cprofile")).lower()
+        self.out_dir = out_dir or getattr(self, "out_dir", "profiles")
+        self.every = max(1, int(every or getattr(self, "every", 1)))
+        self.sample_ms = float(sample_ms or getattr(self, "sample_ms", 5.0))
+        self._refresh()
+
+    def _refresh(self) -> None:
+        self.on = bool(self.targets) or getattr(self, "forced", False)
+
+    def active(self, name: str) -> bool:
+        return self.forced or self.all or name in self.targets
+
+
+_state = _State()
+
+
+def configure(targets, mode: Optional[str] = None, out_dir: Optional[str] = None,
+              every: Optional[int] = None, sample_ms: Optional[float] = None) -> None:
+    """Đổi cấu hình lúc chạy (mặc định lấy từ PROFILE_* trong env)."""
+    _state.configure(targets, mode, out_dir, every, sample_ms)
+
+
+def toggle() -> bool:
+    _state.forced = not _state.forced
+    _state._refresh()
+    return _state.forced
+
+
+def install_signal() -> bool:
+    """SIGUSR1 bật/tắt đo mọi hook (chỉ gọi từ main thread; không có trên Windows)."""
+    if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def _handler(signum, frame):
+        print(f"[profiling] {'BẬT' if toggle() else 'TẮT'} đo mọi hook (mode={_state.mode}, dir={_state.out_dir})")
+
+    signal.signal(signal.SIGUSR1, _handler)
+    return True
+
+
+# ---- lấy mẫu stack (speedscope) ----
+class _Sampler:
+    def __init__(self, thread_id: int, interval_ms: float):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1e3
+        self.frames: Dict[Tuple[str, str, int], int] = {}
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        fid = self.frames.get(key)
+        if fid is None:
+            fid = self.frames[key] = len(self.frames)
+        return fid
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            self.samples.append(stack[::-1])  # gốc → lá
+            self.weights.append((now - last) * 1e3)
+            last = now
+
+    def start(self) -> "_Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def speedscope(self, name: str) -> dict:
+        frames = [{"name": n, "file": f, "line": line} for (n, f, line) in self.frames]
+        total = sum(self.weights)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{"type": "sampled", "name": name, "unit": "milliseconds", "startValue": 0,
+                          "endValue": total, "samples": self.samples, "weights": self.weights}],
+            "name": name,
+            "activeProfileIndex": 0,
+            "exporter": "app.profiling",
+        }
+
+
+def _out_path(name: str, suffix: str) -> Path:
+    out = Path(_state.out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return out / f"{name.replace('/', '_')}-{stamp}-{os.getpid()}-{next(_seq)}{suffix}"
+
+
+class profile_block:
+    """Đo một khối code: with profile_block("eod"): ... (luôn đo, không xét PROFILE)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path: Optional[Path] = None
+        self._prof = None
+        self._nested = False
+
+    def __enter__(self) -> "profile_block":
+        self._nested = getattr(_local, "busy", False)
+        if self._nested:
+            return self
+        _local.busy = True
+        self._t0 = time.perf_counter()
+        if _state.mode == "sample":
+            self._prof = _Sampler(threading.get_ident(), _state.sample_ms).start()
+        else:
+            self._prof = cProfile.Profile()
+            self._prof.enable()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._nested:
+            return
+        _local.busy = False
+        elapsed = time.perf_counter() - self._t0
+        try:
+            if isinstance(self._prof, _Sampler):
+                self._prof.stop()
+                self.path = _out_path(self.name, ".speedscope.json")
+                self.path.write_text(json.dumps(self._prof.speedscope(self.name)), encoding="utf-8")
+            else:
+                self._prof.disable()
+                self.path = _out_path(self.name, ".pstats")
+                self._prof.dump_stats(str(self.path))
+            print(f"[profiling] {self.name}: {elapsed:.3f}s → {self.path}")
+        except OSError as e:
+            print(f"[profiling] Không ghi được profile {self.name}: {e}")
+
+
+def profiled(name: str, callback: bool = False) -> Callable:
+    """
+    Decorator hook profiling. callback=True: chỉ đo 1/PROFILE_EVERY lượt gọi.
+    Tắt (PROFILE trống, chưa SIGUSR1) → một phép kiểm tra cờ rồi gọi thẳng hàm gốc.
+    """
+    def deco(fn: Callable) -> Callable:
+        calls = itertools.count()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state.on or not _state.active(name):
+                return fn(*args, **kwargs)
+            if callback and next(calls) % _state.every:
+                return fn(*args, **kwargs)
+            with profile_block(name):
+                return fn(*args, **kwargs)
+
+        wrapper.__wrapped_profile__ = name
+        return wrapper
+
+    return deco
+
+
+def patch(target: str, name: Optional[str] = None, callback: bool = False) -> Callable:
+    """Bọc hàm "module:thuộc_tính" bằng hook `name` (mặc định tên hàm) ngay trong module gốc."""
+    mod_name, _, attr = target.partition(":")
+    mod = importlib.import_module(mod_name)
+    fn = getattr(mod, attr)
+    if getattr(fn, "__wrapped_profile__", None):
+        return fn
+    wrapped = profiled(name or attr, callback=callback)(fn)
+    setattr(mod, attr, wrapped)
+    return wrapped
+
+
+def main():
+    import argparse
+    import runpy
+
+    parser = argparse.ArgumentParser(description="Chạy script/module với profiling (app.profiling)")
+    parser.add_argument("--mode", choices=["cprofile", "sample"], default=None)
+    parser.add_argument("--dir", default=None, help="thư mục ghi profile (mặc định PROFILE_DIR)")
+    parser.add_argument("--sample-ms", type=float, default=None)
+    parser.add_argument("--patch", action="append", default=[],
+                        help="module:hàm[=tên hook] — chỉ đo các lần gọi hàm này (lặp lại được)")
+    parser.add_argument("-m", dest="module", default=None, help="chạy module như python -m")
+    parser.add_argument("target", nargs=argparse.REMAINDER, help="script.py [args...] hoặc args của -m")
+    args = parser.parse_args()
+
+    names = []
+    for spec in args.patch:
+        target, _, hook = spec.partition("=")
+        names.append(hook or target.partition(":")[2])
+    configure(names or "all", args.mode, args.dir, None, args.sample_ms)
+    for spec in args.patch:
+        target, _, hook = spec.partition("=")
+        patch(target, hook or None)
+
+    if args.module:
+        sys.argv = [args.module, *args.target]
+        run = lambda: runpy.run_module(args.module, run_name="__main__", alter_sys=True)
+    elif args.target:
+        sys.argv = list(args.target)
+        run = lambda: runpy.run_path(args.target[0], run_name="__main__")
+    else:
+        parser.error("cần script hoặc -m module")
+    label = Path(args.module or args.target[0]).stem
+    try:
+        if names:
+            run()
+        else:
+            with profile_block(label):
+                run()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise
+
+
+if __name__ == "__main__":
+    # chạy qua module "app.profiling" (không phải __main__) → cấu hình/patch dùng chung state với các hook
+    importlib.import_module(__spec__.name).main()
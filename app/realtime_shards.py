@@ -0,0 +1,243 @@
+# app/realtime_shards.py
+"""
+Sharded realtime — tách phần tính toán của callback 15m / 1d sang N process worker.
+
+- Mã được chia shard theo hash ổn định (crc32) → mỗi mã luôn về cùng một worker; VNINDEX
+  (market features) được gửi tới mọi shard.
+- Thread callback của vendor chỉ lọc delta (nến mới / nến đang chạy, bỏ lịch sử đã gửi),
+  chia theo shard và đẩy dict mảng NumPy vào queue của worker — không tính pandas/feature.
+- Worker (spawn) giữ state nến của shard trong evaluator (Signals15m / DayFeatures), gom các
+  delta đang chờ thành một lần tính, gửi kết quả về một queue chung.
+- Một thread tổng hợp trong process chính nhận kết quả và gọi on_result (gửi cảnh báo, ledger,
+  snapshot) → chỉ một nơi gửi Telegram.
+
+REALTIME_SHARDS=0 (mặc định) giữ hành vi cũ: tính ngay trên thread callback.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Type
+
+import pandas as pd
+
+from .config import CFG
+from .snapshot import register_metrics
+
+BROADCAST = frozenset({"VNINDEX"})
+
+
+def shard_of(ticker: str, n_shards: int) -> int:
+    return zlib.crc32(str(ticker).upper().encode("utf-8")) % n_shards
+
+
+def _ts_col(df: pd.DataFrame) -> str:
+    return "timestamp" if "timestamp" in df.columns else "time"
+
+
+def upsert_bars(bars: Optional[pd.DataFrame], delta: pd.DataFrame) -> pd.DataFrame:
+    """Ghép delta vào state nến (cùng (ticker, nến) → giữ bản mới nhất), sort theo (ticker, nến)."""
+    ts = _ts_col(delta)
+    merged = delta if bars is None else pd.concat([bars, delta], ignore_index=True)
+    merged = merged.drop_duplicates(["ticker", ts], keep="last")
+    return merged.sort_values(["ticker", ts], kind="stable", ignore_index=True)
+
+
+class BarEvaluator:
+    """State của một shard trong worker. update(delta) → kết quả gửi về process chính (None = bỏ qua)."""
+
+    coalesce = True  # gom các delta đang chờ thành một lần update
+
+    def __init__(self, shard: int, n_shards: int):
+        self.shard = shard
+        self.n_shards = n_shards
+
+    def update(self, delta: pd.DataFrame):
+        raise NotImplementedError
+
+
+class Signals15m(BarEvaluator):
+    """
+    Nến 15' của shard → OrderFlowEngine (app/orderflow.py): mỗi nến đã đóng được nạp và xét tín hiệu
+    đúng một lần, mã mới chỉ xét nến vừa đóng. Trả DataFrame tín hiệu; TP/SL gắn ở process chính.
+    Mỗi callback 15' là một nến đã đóng → không gom (gom sẽ làm mất nến áp chót của lần đầu).
+    """
+
+    coalesce = False
+
+    def __init__(self, shard: int, n_shards: int):
+        super().__init__(shard, n_shards)
+        from .orderflow import OrderFlowEngine
+
+        self._engine = OrderFlowEngine()
+
+    def update(self, delta: pd.DataFrame):
+        sig = self._engine.update(delta)
+        if sig is None:
+            return None
+        # VNINDEX tới mọi shard → chỉ shard sở hữu theo hash trả tín hiệu của nó
+        own = [not (t in BROADCAST and shard_of(t, self.n_shards) != self.shard) for t in sig["ticker"]]
+        sig = sig[own]
+        return None if sig.empty else sig
+
+
+class DayFeatures(BarEvaluator):
+    """
+    Nến ngày của shard (+ VNINDEX) → feature V12 → nến cuối của từng mã (+ VWAP / khối ngoại của phiên).
+    Screener chạy ở process chính trên các dòng gộp từ mọi shard (top-N là xếp hạng toàn thị trường).
+    Không dùng FeatureCache: nến đang chạy đổi liên tục và nhiều process cùng ghi một thư mục cache.
+    """
+
+    def __init__(self, shard: int, n_shards: int):
+        super().__init__(shard, n_shards)
+        from .intraday_flow import FlowAccumulator
+
+        self._bars: Optional[pd.DataFrame] = None
+        self._flow = FlowAccumulator()
+
+    def update(self, delta: pd.DataFrame):
+        from strategies.v12_adapter import compute_features_v12, compute_market_features_v12
+
+        self._flow.observe_frame(delta)
+        self._bars = upsert_bars(self._bars, delta)
+        is_mkt = self._bars["ticker"].isin(BROADCAST)
+        if not is_mkt.any():
+            return None
+        market = compute_market_features_v12(self._bars[is_mkt])
+        # shard chỉ nhận mã của mình + VNINDEX; VNINDEX thuộc đúng một shard theo hash
+        own = ~is_mkt | (is_mkt & self._bars["ticker"].map(lambda t: shard_of(t, self.n_shards) == self.shard))
+        feat = compute_features_v12(self._bars[own.to_numpy()], market=market)
+        if feat is None or feat.empty:
+            return pd.DataFrame()
+        return self._flow.attach(feat.groupby("ticker", sort=False).tail(1).reset_index(drop=True))
+
+
+def _pack(df: pd.DataFrame) -> dict:
+    return {c: df[c].to_numpy() for c in df.columns}
+
+
+def _worker_main(evaluator: Type[BarEvaluator], shard: int, n_shards: int, in_q, out_q) -> None:
+    ev = evaluator(shard, n_shards)
+    stop = False
+    while not stop:
+        msg = in_q.get()
+        if msg is None:
+            break
+        batch = [msg]
+        # gom các delta đang chờ → một lần tính cho cả loạt
+        while evaluator.coalesce:
+            try:
+                m = in_q.get_nowait()
+            except queue.Empty:
+                break
+            if m is None:
+                stop = True
+                break
+            batch.append(m)
+        try:
+            res = ev.update(pd.concat([pd.DataFrame(b) for b in batch], ignore_index=True))
+            if res is not None:
+                out_q.put((shard, res, None))
+        except Exception as exc:
+            out_q.put((shard, None, f"{type(exc).__name__}: {exc}"))
+
+
+class ShardPool:
+    """
+    N worker process + một thread tổng hợp.
+    on_result(shard, result) chạy trên thread tổng hợp (tuần tự) → không cần khoá khi gửi cảnh báo.
+    """
+
+    def __init__(self, evaluator: Type[BarEvaluator], on_result: Callable[[int, object], None],
+                 n_shards: Optional[int] = None, queue_size: Optional[int] = None, name: str = "shards"):
+        self.evaluator = evaluator
+        self.on_result = on_result
+        self.n_shards = max(1, n_shards or CFG.realtime_shards or os.cpu_count() or 1)
+        self.queue_size = queue_size or CFG.shard_queue_size
+        self.name = name
+        self._procs: List[mp.Process] = []
+        self._in: list = []
+        self._out = None
+        self._thread: Optional[threading.Thread] = None
+        self._sent: Optional[pd.Series] = None  # ticker → nến mới nhất đã gửi
+        self._shard: Dict[str, int] = {}
+
+    def start(self) -> "ShardPool":
+        ctx = mp.get_context("spawn")  # không fork process đang có thread của vendor
+        self._out = ctx.Queue()
+        for i in range(self.n_shards):
+            q = ctx.Queue(maxsize=self.queue_size)
+            p = ctx.Process(target=_worker_main, args=(self.evaluator, i, self.n_shards, q, self._out),
+                            name=f"{self.name}-{i}", daemon=True)
+            p.start()
+            self._in.append(q)
+            self._procs.append(p)
+        self._thread = threading.Thread(target=self._collect, name=f"{self.name}-collect", daemon=True)
+        self._thread.start()
+        register_metrics(self.name, self.metrics)
+        return self
+
+    def metrics(self) -> dict:
+        return {"shards": self.n_shards, "alive": sum(p.is_alive() for p in self._procs),
+                "queued": [q.qsize() for q in self._in]}
+
+    def _collect(self) -> None:
+        while True:
+            item = self._out.get()
+            if item is None:
+                return
+            shard, res, err = item
+            if err:
+                print(f"[{self.name}] shard {shard}: {err}")
+                continue
+            try:
+                self.on_result(shard, res)
+            except Exception as exc:
+                print(f"[{self.name}] on_result lỗi (shard {shard}): {exc}")
+
+    def _delta(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Bỏ các nến cũ hơn nến mới nhất đã gửi của từng mã (vendor trả cả lịch sử mỗi lần)."""
+        ts = _ts_col(df)
+        if self._sent is not None:
+            last = df["ticker"].map(self._sent)
+            df = df[last.isna().to_numpy() | (df[ts] >= last).to_numpy()]
+        if not df.empty:
+            latest = df.groupby("ticker", sort=False)[ts].max()
+            self._sent = latest if self._sent is None else latest.combine_first(self._sent)
+        return df
+
+    def submit(self, df: pd.DataFrame) -> None:
+        """Gọi trên thread callback: lọc delta, chia shard, đẩy vào queue (chặn khi worker tụt lại)."""
+        if df is None or df.empty:
+            return
+        df = self._delta(df)
+        if df.empty:
+            return
+        tickers = df["ticker"].astype(str).to_numpy()
+        for t in set(tickers) - self._shard.keys():
+            self._shard[t] = -1 if t in BROADCAST else shard_of(t, self.n_shards)
+        sid = pd.Series(tickers).map(self._shard).to_numpy()
+        shared = sid == -1
+        for i, q in enumerate(self._in):
+            part = df[(sid == i) | shared]
+            if not part.empty:
+                q.put(_pack(part))
+
+    def stop(self, timeout: float = 10.0) -> None:
+        for q in self._in:
+            try:
+                q.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        for p in self._procs:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+        if self._out is not None:
+            self._out.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._procs, self._in, self._thread = [], [], None
@@ -0,0 +1,358 @@
+# app/snapshot.py
+"""
+Hot snapshot — feature frame, market context và picks mới nhất của process scheduler.
+
+- Job EOD / day-running gọi publish() sau khi screen: snapshot (bất biến) được dựng một lần
+  với chỉ mục ticker → dòng, ngày → dòng, (ticker, ngày) → dòng rồi thay tham chiếu (không khoá đọc).
+  Tra cứu chỉ là lookup dict + đọc mảng NumPy theo cột → vài µs, không đụng vendor.
+- SNAPSHOT_IPC_DIR (tuỳ chọn): ghi thêm <job>.arrow (Arrow IPC, không nén; ghi tmp rồi rename)
+  → script khác memory-map bằng load_ipc() mà không cần hỏi server.
+- Server HTTP nội bộ (stdlib, keep-alive) trên 127.0.0.1:SNAPSHOT_PORT hoặc Unix socket SNAPSHOT_SOCKET:
+    GET /health                          job đã publish + thời điểm
+    GET /picks?job=eod                   picks + score + nến + market context
+    GET /market?job=eod                  market context (cột market_* + pha V12)
+    GET /ticker/FPT?job=eod[&date=YYYY-MM-DD|all]
+    GET /date/2025-09-19?job=eod
+    GET /metrics                         số liệu runtime đã đăng ký (coalescer, shard pool, ...)
+  job mặc định: job publish gần nhất.
+
+Tra cứu từ script / shell:
+    python -m app.snapshot /picks
+    python -m app.snapshot /ticker/FPT date=all
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import math
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from dataclasses import asdict
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .config import CFG
+
+_TS_COLUMNS = ("date", "time", "timestamp")
+# numpy/pandas nạp khi dựng snapshot đầu tiên: process chỉ mở server (/health, /metrics) hay
+# client `query` không phải trả chi phí import pandas
+np = pd = None
+
+
+def _deps() -> None:
+    global np, pd
+    if pd is None:
+        import numpy as np
+        import pandas as pd
+
+
+def _py(v):
+    """Giá trị NumPy/pandas → kiểu JSON (NaN/NaT → None)."""
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float):
+        return None if math.isnan(v) or math.isinf(v) else v
+    if isinstance(v, (pd.Timestamp, datetime, date)):
+        return None if pd.isna(v) else v.isoformat()
+    if v is None or v is pd.NaT:
+        return None
+    if isinstance(v, (int, bool, str)):
+        return v
+    try:
+        return None if pd.isna(v) else str(v)
+    except (TypeError, ValueError):
+        return str(v)
+
+
+def _day(v) -> str:
+    return pd.Timestamp(v).strftime("%Y-%m-%d")
+
+
+def _group_positions(keys: np.ndarray) -> Dict[str, np.ndarray]:
+    order = np.argsort(keys, kind="stable")
+    uniq, starts = np.unique(keys[order], return_index=True)
+    return dict(zip(uniq.tolist(), np.split(order, starts[1:])))
+
+
+class FeatureSnapshot:
+    """Ảnh chụp bất biến của một lượt job (feature frame + picks + market context)."""
+
+    def __init__(self, job: str, feat: pd.DataFrame, scores: Optional[dict] = None, bar_ts=None):
+        ts_col = next((c for c in _TS_COLUMNS if c in feat.columns), None)
+        if ts_col is None or "ticker" not in feat.columns:
+            raise KeyError("[snapshot] Cần cột 'ticker' và 'date'/'time'/'timestamp'.")
+        _deps()
+        self.job = job
+        self.published_at = time.time()
+        self.columns: List[str] = [str(c) for c in feat.columns]
+        self._cols = {str(c): feat[c].to_numpy() for c in feat.columns}
+        self._frame = feat
+
+        tickers = feat["ticker"].astype(str).str.upper().to_numpy()
+        days = pd.to_datetime(feat[ts_col]).dt.strftime("%Y-%m-%d").to_numpy()
+        self._by_ticker = _group_positions(tickers)
+        self._by_date = _group_positions(days)
+        # (ticker, ngày) → dòng cuối của cặp đó
+        self._at = dict(zip(zip(tickers.tolist(), days.tolist()), range(len(feat))))
+        self.last_day = max(self._by_date) if self._by_date else None
+        self.bar_ts = _py(pd.Timestamp(bar_ts)) if bar_ts is not None else self.last_day
+
+        self.scores = {str(t): _py(s) for t, s in (scores or {}).items()}
+        self.market = self._market_context()
+
+    # ---- dựng ----
+    def _market_context(self) -> dict:
+        rows = self._by_date.get(self.last_day)
+        if rows is None or not len(rows):
+            return {}
+        i = int(rows[0])
+        out = {c: _py(self._cols[c][i]) for c in self.columns if c.startswith("market_")}
+        keys = ("market_close", "market_MA50", "market_MA200", "market_rsi", "market_adx", "market_boll_width")
+        if all(out.get(k) is not None for k in keys):
+            from .strategy_adapter import market_phase_v12
+            out["phase"] = asdict(market_phase_v12(*(out[k] for k in keys)))
+        return out
+
+    # ---- tra cứu ----
+    def row(self, i: int) -> dict:
+        return {c: _py(self._cols[c][i]) for c in self.columns}
+
+    def rows(self, positions) -> List[dict]:
+        return [self.row(int(i)) for i in positions]
+
+    def ticker(self, ticker: str, day: Optional[str] = None) -> List[dict]:
+        """Dòng của mã tại ngày `day` (mặc định ngày cuối; 'all' = toàn bộ lịch sử trong frame)."""
+        ticker = ticker.upper()
+        if day == "all":
+            return self.rows(self._by_ticker.get(ticker, ()))
+        i = self._at.get((ticker, _day(day) if day else self.last_day))
+        return [] if i is None else [self.row(i)]
+
+    def on_date(self, day: str) -> List[dict]:
+        return self.rows(self._by_date.get(_day(day), ()))
+
+    def latest(self, column: str) -> dict:
+        """{mã: giá trị `column` ở dòng cuối của mã} (vd. atr_14 cho TP/SL intraday)."""
+        col = self._cols[column]
+        return {t: _py(col[pos[-1]]) for t, pos in self._by_ticker.items()}
+
+    def picks(self) -> dict:
+        return {
+            "job": self.job,
+            "bar_ts": self.bar_ts,
+            "published_at": self.published_at,
+            "picks": list(self.scores),
+            "scores": self.scores,
+            "market": self.market,
+        }
+
+    def summary(self) -> dict:
+        return {
+            "published_at": self.published_at,
+            "bar_ts": self.bar_ts,
+            "rows": len(self._frame),
+            "tickers": len(self._by_ticker),
+            "dates": [min(self._by_date), self.last_day] if self._by_date else [],
+            "picks": len(self.scores),
+        }
+
+    # ---- Arrow IPC ----
+    def write_ipc(self, directory: Path) -> Path:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        directory.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(self._frame, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[b"snapshot"] = json.dumps(self.picks(), ensure_ascii=False).encode("utf-8")
+        table = table.replace_schema_metadata(meta)
+        path = directory / f"{self.job}.arrow"
+        tmp = path.with_suffix(f".arrow.tmp{os.getpid()}")
+        feather.write_feather(table, str(tmp), compression="uncompressed")
+        os.replace(tmp, path)
+        return path
+
+
+_snapshots: Dict[str, FeatureSnapshot] = {}
+_latest: Optional[str] = None
+_metrics: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, fn: Callable[[], dict]) -> None:
+    """Đăng ký nguồn số liệu runtime (gọi mỗi lần GET /metrics)."""
+    _metrics[name] = fn
+
+
+def all_metrics() -> dict:
+    return {name: fn() for name, fn in list(_metrics.items())}
+
+
+def publish(job: str, feat: pd.DataFrame, scores: Optional[dict] = None, bar_ts=None) -> Optional[FeatureSnapshot]:
+    """Thay snapshot của `job` (không bao giờ làm hỏng job gọi: lỗi chỉ được log)."""
+    global _latest
+    if feat is None or feat.empty:
+        return None
+    try:
+        snap = FeatureSnapshot(job, feat, scores, bar_ts)
+    except Exception as exc:
+        print(f"[snapshot] Không dựng được snapshot '{job}': {exc}")
+        return None
+    _snapshots[job] = snap  # gán tham chiếu: reader đang đọc bản cũ vẫn an toàn
+    _latest = job
+    if CFG.snapshot_ipc_dir:
+        try:
+            snap.write_ipc(Path(CFG.snapshot_ipc_dir).resolve())
+        except Exception as exc:
+            print(f"[snapshot] Không ghi được Arrow IPC '{job}': {exc}")
+    return snap
+
+
+def get_snapshot(job: Optional[str] = None) -> Optional[FeatureSnapshot]:
+    return _snapshots.get(job or _latest) if (job or _latest) else None
+
+
+def load_ipc(job: str, directory: Optional[str] = None):
+    """Đọc <job>.arrow qua memory-map → (pyarrow.Table, picks/market dict)."""
+    import pyarrow as pa
+
+    path = Path(directory or CFG.snapshot_ipc_dir).resolve() / f"{job}.arrow"
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    meta = (table.schema.metadata or {}).get(b"snapshot")
+    return table, (json.loads(meta) if meta else {})
+
+
+# ---- HTTP server ----
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: client tra nhiều lần trên một kết nối
+    disable_nagle_algorithm = True  # header và body ghi riêng → tránh chờ delayed-ACK (~40ms)
+
+    def log_message(self, format, *args):  # noqa: A002 - chữ ký của BaseHTTPRequestHandler
+        pass
+
+    def _send(self, status: int, body) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        try:
+            status, body = _route(parts, q)
+        except (ValueError, KeyError) as exc:
+            status, body = 400, {"error": str(exc)}
+        self._send(status, body)
+
+
+class _UnixHandler(_Handler):
+    disable_nagle_algorithm = False  # TCP_NODELAY không áp dụng cho AF_UNIX
+
+
+def _route(parts: List[str], q: dict):
+    if not parts or parts[0] == "health":
+        return 200, {"latest": _latest, "jobs": {j: s.summary() for j, s in _snapshots.items()}}
+    if parts[0] == "metrics":
+        return 200, all_metrics()
+    snap = get_snapshot(q.get("job"))
+    if snap is None:
+        return 404, {"error": f"Chưa có snapshot cho job '{q.get('job') or _latest}'"}
+    head, arg = parts[0], (parts[1] if len(parts) > 1 else None)
+    if head == "picks":
+        return 200, snap.picks()
+    if head == "market":
+        return 200, {"job": snap.job, "bar_ts": snap.bar_ts, "market": snap.market}
+    if head == "ticker" and arg:
+        rows = snap.ticker(arg, q.get("date"))
+        if not rows:
+            return 404, {"error": f"Không có dữ liệu {arg.upper()} ({q.get('date') or snap.last_day})"}
+        return 200, {"job": snap.job, "ticker": arg.upper(), "rows": rows}
+    if head == "date" and arg:
+        rows = snap.on_date(arg)
+        if not rows:
+            return 404, {"error": f"Không có dữ liệu ngày {_day(arg)}"}
+        return 200, {"job": snap.job, "date": _day(arg), "rows": rows}
+    return 404, {"error": f"Không có endpoint /{'/'.join(parts)}"}
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+_server = None
+
+
+def start_snapshot_server():
+    """Chạy server trong thread nền (idempotent). SNAPSHOT_SOCKET ưu tiên hơn SNAPSHOT_PORT."""
+    global _server
+    if _server is not None or not CFG.use_snapshot_server:
+        return _server
+    if CFG.snapshot_socket:
+        path = Path(CFG.snapshot_socket)
+        path.unlink(missing_ok=True)  # socket cũ của lần chạy trước
+        _server = _UnixHTTPServer(str(path), _UnixHandler)
+        where = f"unix:{path}"
+    else:
+        _server = ThreadingHTTPServer(("127.0.0.1", CFG.snapshot_port), _Handler)
+        _server.daemon_threads = True
+        where = f"http://127.0.0.1:{_server.server_address[1]}"
+    threading.Thread(target=_server.serve_forever, name="snapshot-server", daemon=True).start()
+    print(f"[snapshot] Phục vụ tại {where}")
+    return _server
+
+
+def stop_snapshot_server() -> None:
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+
+
+# ---- client ----
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 5.0):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def connect(timeout: float = 5.0) -> http.client.HTTPConnection:
+    """Kết nối tới server snapshot theo cấu hình (tái sử dụng cho nhiều lần query)."""
+    if CFG.snapshot_socket:
+        return _UnixConnection(CFG.snapshot_socket, timeout=timeout)
+    return http.client.HTTPConnection("127.0.0.1", CFG.snapshot_port, timeout=timeout)
+
+
+def query(path: str, conn: Optional[http.client.HTTPConnection] = None, **params) -> dict:
+    """GET path (+ query params) → dict. Truyền `conn` để giữ kết nối giữa các lần gọi."""
+    own = conn is None
+    conn = conn or connect()
+    qs = "&".join(f"{k}={v}" for k, v in params.items() if v is not None)
+    try:
+        conn.request("GET", path + (f"?{qs}" if qs else ""))
+        resp = conn.getresponse()
+        return json.loads(resp.read().decode("utf-8"))
+    finally:
+        if own:
+            conn.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:] or ["/health"]
+    params = dict(a.split("=", 1) for a in args[1:] if "=" in a)
+    print(json.dumps(query(args[0], **params), ensure_ascii=False, indent=2))
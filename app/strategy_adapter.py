@@ -1,14 +1,111 @@
 # app/strategy_adapter.py
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
 from strategies.v12_adapter import (
-    compute_features_v12,
+    compute_features_v12 as _compute_features_v12,
+    compute_market_features_v12,
     apply_v12_on_last_day,
-    compute_picks_from_history,
+    apply_screeners_on_last_day,
     early_signal_from_15m_bar,
+    evaluate_exits_v12,
+    apply_partial_exit,
+    market_phase_v12,
 )
+from strategies.feature_cache import FeatureCache
+from strategies.screener_registry import register_screener, registered
+
+from .config import CFG
+
+_feature_cache = None
+
+
+def get_feature_cache():
+    """FeatureCache dùng chung cho các job (None nếu USE_FEATURE_CACHE=0)."""
+    global _feature_cache
+    if not CFG.use_feature_cache:
+        return None
+    if _feature_cache is None:
+        _feature_cache = FeatureCache(
+            Path(CFG.feature_cache_dir).resolve(),
+            max_bytes=CFG.feature_cache_max_mb * 2**20,
+        )
+    return _feature_cache
+
+
+def compute_features_v12(df_hist, market=None, use_cache: bool = True):
+    """
+    compute_features_v12 của adapter + feature cache theo cấu hình.
+    use_cache=False cho nến ngày đang chạy: OHLCV đổi mỗi lượt đánh giá → mỗi mã một khoá mới không bao giờ
+    đọc lại, chỉ đẩy entry EOD ra khỏi cache.
+    """
+    return _compute_features_v12(df_hist, market=market, cache=get_feature_cache() if use_cache else None)
+
+
+def compute_picks_from_history(df_hist):
+    return apply_v12_on_last_day(compute_features_v12(df_hist))
+
+
+_shadow_lock = threading.Lock()
+
+
+def _log_shadow(job: str, bar_ts, results: dict, primary: str) -> None:
+    """Mỗi screener một dòng JSON (SHADOW_LOG_FILE): picks, score, số mã trùng với primary, thời gian."""
+    base = set(results[primary].picks)
+    now = datetime.now().isoformat(timespec="seconds")
+    lines = []
+    for name, res in results.items():
+        lines.append(json.dumps({
+            "logged_at": now,
+            "job": job,
+            "bar_ts": str(bar_ts),
+            "screener": name,
+            "role": "primary" if name == primary else "shadow",
+            "picks": res.picks,
+            "scores": {t: (None if s is None else round(float(s), 6)) for t, s in res.scores.items()},
+            "overlap": len(base & set(res.picks)),
+            "elapsed_ms": round(res.elapsed_ms, 3),
+            "error": res.error,
+        }, ensure_ascii=False))
+    try:
+        with _shadow_lock, open(Path(CFG.shadow_log_file), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    except OSError as exc:
+        print(f"[shadow] Không ghi được {CFG.shadow_log_file}: {exc}")
+
+
+def screen_last_day(feat, job: str, bar_ts=None) -> dict:
+    """
+    Screener primary (SCREENER_PRIMARY) trên nến cuối → {ticker: score} dùng để cảnh báo.
+    SCREENER_SHADOWS chạy cùng lượt trên cùng feature frame (không fetch / tính feature thêm),
+    chỉ ghi log để so sánh A/B — không bao giờ gửi cảnh báo.
+    """
+    primary = CFG.screener_primary
+    shadows = [n for n in CFG.screener_shadows if n != primary]
+    results = apply_screeners_on_last_day(feat, [primary] + shadows)
+    if results[primary].error:
+        raise RuntimeError(f"[screener] Primary '{primary}' lỗi: {results[primary].error}")
+    if shadows:
+        for name in shadows:
+            if results[name].error:
+                print(f"[shadow] {name}: {results[name].error}")
+        _log_shadow(job, bar_ts, results, primary)
+    return results[primary].scores
+
 
 __all__ = [
     "compute_features_v12",
+    "compute_market_features_v12",
     "apply_v12_on_last_day",
     "compute_picks_from_history",
+    "screen_last_day",
+    "register_screener",
+    "registered",
     "early_signal_from_15m_bar",
+    "evaluate_exits_v12",
+    "apply_partial_exit",
+    "market_phase_v12",
+    "get_feature_cache",
 ]
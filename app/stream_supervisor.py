@@ -0,0 +1,265 @@
+# app/stream_supervisor.py
+"""
+Supervised realtime stream — thay vòng _runner "sleep(1) chờ _stop, lỗi thì chờ tới 60s rồi subscribe lại".
+
+- Callback vendor → on_frame(df) (DataFrame), ghi heartbeat + nến mới nhất đã thấy của từng mã.
+- Thread giám sát chờ trên Event (stop) theo nhịp kiểm tra; phát hiện:
+    * vendor tự dừng (_event._stop),
+    * stall: trong giờ khớp lệnh (SESSIONS) mà quá STREAM_STALL_SECONDS không có cập nhật.
+- Reconnect ngay lần đầu, các lần sau backoff luỹ thừa có jitter (full jitter, tối đa STREAM_BACKOFF_MAX).
+- Sau reconnect: backfill đúng khoảng hụt từ endpoint lịch sử (period = số nến của khoảng hụt), chỉ giữ nến
+  mới hơn nến đã thấy của từng mã, rồi phát lại theo từng nến (frame lịch sử tới nến đó) như vendor đã gửi.
+  Mốc "đã thấy" là ảnh chụp lúc mất kết nối, giữ tới khi backfill thành công; frame live tới trong lúc
+  kết nối lại + backfill được giữ lại và phát SAU phần backfill → không frame live nào đẩy mốc qua khoảng hụt.
+- State chỉ báo nằm ở handler (coalescer / shard pool / ledger) và không bị tạo lại khi reconnect.
+"""
+from __future__ import annotations
+
+import math
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, time as dtime
+from typing import Callable, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from .config import CFG
+from .snapshot import register_metrics
+from .utils.trading_calendar import get_calendar
+
+# Giờ khớp lệnh HOSE/HNX (nghỉ trưa 11:30–13:00) — ngoài giờ này im lặng không phải là stall
+SESSIONS = ((dtime(9, 0), dtime(11, 30)), (dtime(13, 0), dtime(15, 0)))
+_SESSION_MINUTES = 270
+_BAR_MINUTES = {"1m": 1, "5m": 5, "15m": 15, "30m": 30, "1h": 60}
+FIELDS = ['open', 'high', 'low', 'close', 'volume', 'bu', 'sd', 'fb', 'fs', 'fn']
+
+
+def now_local() -> datetime:
+    return datetime.now(ZoneInfo(CFG.tz)).replace(tzinfo=None)
+
+
+def in_session(now: datetime) -> bool:
+    t = now.time()
+    return any(a <= t < b for a, b in SESSIONS)
+
+
+def gap_bars(by: str, since: pd.Timestamp, now: datetime) -> int:
+    """Số nến `by` đủ phủ khoảng (since, now] + biên an toàn — dùng làm period của lần backfill."""
+    try:
+        sessions = get_calendar().sessions_between(since.normalize(), pd.Timestamp(now).normalize()) + 1
+    except ValueError:
+        sessions = max(1, (pd.Timestamp(now) - since).days + 1)
+    if by == "1d":
+        return sessions + 1
+    per_session = math.ceil(_SESSION_MINUTES / _BAR_MINUTES.get(by, 1)) + 1
+    return sessions * per_session + 2
+
+
+@dataclass
+class StreamStats:
+    connects: int = 0
+    reconnects: int = 0
+    stalls: int = 0
+    errors: int = 0
+    handler_errors: int = 0
+    backfills: int = 0
+    backfilled_bars: int = 0
+    last_error: Optional[str] = None
+
+
+class SupervisedStream:
+    def __init__(
+        self,
+        name: str,
+        client,
+        tickers: Sequence[str],
+        by: str,
+        on_frame: Callable[[pd.DataFrame], None],
+        wait_for_full_timeFrame: bool = True,
+        stall_seconds: Optional[float] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        check_seconds: float = 5.0,
+    ):
+        self.name = name
+        self.client = client
+        self.tickers = list(tickers)
+        self.by = by
+        self.on_frame = on_frame
+        self.wait_for_full_timeFrame = wait_for_full_timeFrame
+        if stall_seconds is None:
+            # nến đủ khung: im lặng tối đa một nến; nến đang chạy: vài phút không tick là bất thường
+            stall_seconds = CFG.stream_stall_seconds or (
+                60.0 * _BAR_MINUTES.get(by, 15) * 1.5 if wait_for_full_timeFrame else 180.0)
+        self.stall_seconds = stall_seconds
+        self.backoff_base = CFG.stream_backoff_base if backoff_base is None else backoff_base
+        self.backoff_max = CFG.stream_backoff_max if backoff_max is None else backoff_max
+        self.check_seconds = check_seconds
+        self.stats = StreamStats()
+        self._event = None
+        self._stopping = threading.Event()
+        self._frame_lock = threading.Lock()  # callback vendor và backfill không chạy handler song song
+        self._last_msg = time.monotonic()
+        self._last_ts: Optional[pd.Series] = None  # ticker → nến mới nhất đã chuyển cho handler
+        self._resume: Optional[pd.Series] = None   # _last_ts lúc mất kết nối — mốc backfill tới khi thành công
+        self._held: Optional[list] = None          # frame live giữ lại trong lúc backfill
+        self._held_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- dữ liệu ----
+    def _deliver(self, df: pd.DataFrame) -> None:
+        if df is None or df.empty:
+            return
+        with self._frame_lock:
+            latest = df.groupby("ticker", sort=False)["timestamp"].max()
+            if self._last_ts is not None:
+                latest = pd.concat([self._last_ts, latest]).groupby(level=0).max()
+            self._last_ts = latest
+            try:
+                self.on_frame(df)
+            except Exception as exc:
+                self.stats.handler_errors += 1
+                print(f"[{self.name}] handler lỗi: {exc}")
+
+    def _on_update(self, data) -> None:
+        self._last_msg = time.monotonic()
+        df = data.to_dataFrame()
+        with self._held_lock:
+            if self._held is not None:
+                self._held.append(df)
+                return
+        self._deliver(df)
+
+    def _hold(self) -> None:
+        """Có khoảng hụt chờ backfill → giữ frame live tới khi phát lại xong."""
+        if self._resume is None and self._last_ts is not None and not self._last_ts.empty:
+            self._resume = self._last_ts.copy()
+        with self._held_lock:
+            self._held = [] if self._resume is not None else None
+
+    def _release(self, deliver: bool = True) -> None:
+        """Phát các frame live đã giữ theo thứ tự nhận (deliver=False: bỏ — lần backfill sau phủ lại)."""
+        while True:
+            with self._held_lock:
+                if not deliver or not self._held:
+                    self._held = None
+                    return
+                batch, self._held = self._held, []
+            for df in batch:
+                self._deliver(df)
+
+    def _backfill(self) -> None:
+        """Nến bị hụt trong lúc mất kết nối (so với mốc _resume), phát lại theo thứ tự thời gian."""
+        resume = self._resume
+        if resume is None:
+            return  # lần kết nối đầu: vendor tự gửi lịch sử
+        since = pd.Timestamp(resume.min())
+        hist = self.client.Fetch_Trading_Data(
+            realtime=False,
+            tickers=self.tickers,
+            fields=FIELDS,
+            adjusted=True,
+            by=self.by,
+            period=min(gap_bars(self.by, since, now_local()), CFG.stream_backfill_max_bars),
+        ).get_data()
+        self._resume = None
+        if hist is None or hist.empty:
+            return
+        hist = hist.sort_values(["ticker", "timestamp"], kind="stable")
+        seen = hist["ticker"].map(resume)
+        missed = hist[seen.isna().to_numpy() | (hist["timestamp"] > seen).to_numpy()]
+        if missed.empty:
+            return
+        self.stats.backfills += 1
+        self.stats.backfilled_bars += len(missed)
+        for ts in sorted(missed["timestamp"].unique()):
+            self._deliver(hist[hist["timestamp"] <= ts])
+
+    # ---- kết nối ----
+    def _connect(self) -> None:
+        self._last_msg = time.monotonic()
+        self._event = self.client.Fetch_Trading_Data(
+            realtime=True,
+            tickers=self.tickers,
+            fields=FIELDS,
+            adjusted=True,
+            by=self.by,
+            callback=self._on_update,
+            wait_for_full_timeFrame=self.wait_for_full_timeFrame,
+        )
+        self._event.get_data()
+        self.stats.connects += 1
+
+    def _close(self) -> None:
+        try:
+            if self._event is not None:
+                self._event.stop()
+        except Exception:
+            pass
+        self._event = None
+
+    def _watch(self) -> str:
+        """Chờ tới khi có lý do kết nối lại (hoặc stop)."""
+        while not self._stopping.wait(self.check_seconds):
+            if getattr(self._event, "_stop", False):
+                return "vendor stopped"
+            idle = time.monotonic() - self._last_msg
+            if self.stall_seconds and idle > self.stall_seconds and in_session(now_local()):
+                self.stats.stalls += 1
+                return f"stall {idle:.0f}s"
+        return "stop"
+
+    def _delay(self, attempt: int) -> float:
+        if attempt == 0:
+            return 0.0
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def run(self) -> None:
+        attempt = 0
+        while not self._stopping.is_set():
+            try:
+                self._hold()
+                self._connect()
+                self._backfill()
+                self._release()
+                attempt = 0
+                reason = self._watch()
+            except Exception as exc:
+                self._release(deliver=False)
+                self.stats.errors += 1
+                self.stats.last_error = f"{type(exc).__name__}: {exc}"
+                reason = self.stats.last_error
+            self._close()
+            if self._stopping.is_set():
+                break
+            self.stats.reconnects += 1
+            delay = self._delay(attempt)
+            attempt += 1
+            print(f"[{self.name}] kết nối lại sau {delay:.1f}s ({reason})")
+            self._stopping.wait(delay)
+
+    def start(self, block: bool = False) -> "SupervisedStream":
+        self._stopping.clear()
+        register_metrics(self.name, self.metrics)
+        if block:
+            self.run()
+        else:
+            self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping.set()
+        self._close()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def metrics(self) -> dict:
+        out = asdict(self.stats)
+        out["last_update_age_s"] = round(time.monotonic() - self._last_msg, 3)
+        out["connected"] = self._event is not None
+        return out
@@ -0,0 +1,222 @@
+# app/subscriptions.py
+"""
+Subscription registry — fan-out cảnh báo tới nhiều chat/topic với bộ lọc riêng.
+
+- SUBSCRIBERS_FILE (JSON, list object):
+    [{"name": "vip", "chat_id": "-100...", "thread_id": 2,
+      "tickers": ["FPT", "VCB"], "min_score": 0.5, "regimes": ["bull"], "language": "vi"}, ...]
+  tickers/min_score/regimes bỏ trống = không lọc. language: 'vi' | 'en'.
+  Không có file → 1 subscriber mặc định từ CHAT_ID/THREAD_ID (hành vi cũ).
+- Job tính cảnh báo MỘT lần (BuyAlert), dispatch_* lọc theo subscriber, render mỗi
+  (ngôn ngữ, cảnh báo) một lần (memo ở formatters/render.py) rồi gửi song song qua TelegramNotifier.send_each (pool).
+- Alert ledger: job tự lọc khoá đã gửi trước khi gọi dispatch_*, truyền ledger_keys để ghi sau khi gửi.
+  ledger_keys = một khoá mỗi cảnh báo/mã (cùng thứ tự), phần dư (vd. khoá "không có mã", khoá lượt quét) đi kèm
+  mọi tin. Chat gửi xong → ghi khoá theo chat (subscriber_key); khoá gốc chỉ ghi khi mọi chat đã nhận.
+  Một chat lỗi (timeout, 429...) → lần chạy sau chỉ gửi lại cho chat đó, phần chat khác đã nhận bị bỏ qua.
+- min_score: cảnh báo không có score (vd. 15m) không qua được subscriber có min_score.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+from .config import CFG
+from .notifier import TelegramNotifier
+from .alert_ledger import Key, get_ledger, subscriber_key
+from .formatters import render
+from .formatters.render import RENDERERS as _RENDERERS
+
+
+@dataclass(frozen=True)
+class Subscriber:
+    name: str
+    chat_id: str
+    thread_id: Optional[int] = None
+    tickers: Optional[FrozenSet[str]] = None
+    min_score: Optional[float] = None
+    regimes: Optional[FrozenSet[str]] = None
+    language: str = "vi"
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Subscriber":
+        def _set(key, upper=True):
+            vals = d.get(key)
+            if not vals:
+                return None
+            return frozenset(str(v).strip().upper() if upper else str(v).strip().lower() for v in vals)
+        lang = str(d.get("language") or "vi").lower()
+        return cls(
+            name=str(d.get("name") or d["chat_id"]),
+            chat_id=str(d["chat_id"]),
+            thread_id=int(d["thread_id"]) if d.get("thread_id") else None,
+            tickers=_set("tickers"),
+            min_score=float(d["min_score"]) if d.get("min_score") is not None else None,
+            regimes=_set("regimes", upper=False),
+            language=lang if lang in _RENDERERS else "vi",
+        )
+
+    def wants_regime(self, regime: Optional[str]) -> bool:
+        return self.regimes is None or regime is None or str(regime).lower() in self.regimes
+
+    def accepts(self, alert: "BuyAlert") -> bool:
+        if self.tickers is not None and alert.ticker.upper() not in self.tickers:
+            return False
+        if self.min_score is not None and (alert.score is None or alert.score < self.min_score):
+            return False
+        return self.wants_regime(alert.regime)
+
+    def notifier(self) -> TelegramNotifier:
+        return TelegramNotifier(chat_id=self.chat_id, thread_id=self.thread_id or 0)
+
+    def key(self, key: Key) -> Key:
+        """Khoá ledger của cảnh báo `key` cho riêng chat/topic này."""
+        return subscriber_key(key, self.chat_id, self.thread_id)
+
+
+@dataclass(frozen=True)
+class BuyAlert:
+    ticker: str
+    entry: float
+    tp: float
+    sl: float
+    regime: str = "bull"
+    score: Optional[float] = None
+
+
+_cache = {"mtime": None, "subs": None}
+
+
+def load_subscribers() -> List[Subscriber]:
+    """Danh sách subscriber (cache theo mtime của SUBSCRIBERS_FILE)."""
+    path = Path(CFG.subscribers_file).resolve()
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return [Subscriber(name="default", chat_id=CFG.chat_id, thread_id=CFG.thread_id or None)]
+    if _cache["mtime"] != mtime:
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+            _cache["subs"] = [Subscriber.from_dict(d) for d in raw if d.get("chat_id")]
+        except Exception as exc:
+            print(f"[subscriptions] Không đọc được {path}: {exc}")
+            if _cache["subs"] is None:
+                return [Subscriber(name="default", chat_id=CFG.chat_id, thread_id=CFG.thread_id or None)]
+        _cache["mtime"] = mtime
+    return _cache["subs"]
+
+
+def _rendered(fn: Callable[..., str]):
+    """Memo một lượt dispatch: cùng tham số → render đúng một lần."""
+    memo: Dict[tuple, str] = {}
+
+    def get(*key):
+        if key not in memo:
+            memo[key] = fn(*key)
+        return memo[key]
+    return get
+
+
+def dispatch_buy_alerts(
+    alerts: Sequence[BuyAlert],
+    *,
+    scope: str = "EOD",
+    regime: Optional[str] = None,
+    header: bool = True,
+    no_pick: bool = True,
+    subscribers: Optional[Sequence[Subscriber]] = None,
+    ledger_keys: Sequence[Key] = (),
+) -> int:
+    """
+    Gửi cảnh báo MUA đã tính sẵn tới từng subscriber (lọc mã/score/regime, đúng ngôn ngữ).
+    header: chèn header EOD; no_pick: subscriber không còn mã nào → gửi thông báo "không có mã".
+    ledger_keys: một khoá mỗi cảnh báo (cùng thứ tự) + khoá đi kèm mọi tin (vd. "không có mã"); ghi khi đã gửi được
+    (hoặc không có gì để gửi), theo từng chat.
+    """
+    subs = list(subscribers if subscribers is not None else load_subscribers())
+    ts = render.now_ts()
+    block = lambda lang, i: render.render_buy_alert(
+        lang, alerts[i].ticker, alerts[i].entry, alerts[i].tp, alerts[i].sl, alerts[i].regime, ts
+    )
+    head = lambda lang: render.render_eod_header(lang, ts[:10])
+    empty = lambda lang: render.render_no_pick(lang, scope)
+    text = _rendered(lambda lang, idx: "\n\n".join(
+        ([head(lang)] if header else []) + [block(lang, i) for i in idx]
+    ))
+
+    keys = _Keys(ledger_keys, len(alerts))
+    jobs = []
+    for sub in subs:
+        if not sub.wants_regime(regime):
+            continue
+        idx = tuple(i for i, a in enumerate(alerts) if sub.accepts(a))
+        if idx:
+            idx = keys.pending(sub, idx)
+            if idx:
+                jobs.append((sub, text(sub.language, idx), keys.of(idx)))
+        elif no_pick and not keys.delivered(sub):
+            jobs.append((sub, empty(sub.language), keys.of(())))
+    return _send_and_record(jobs, ledger_keys)
+
+
+class _Keys:
+    """ledger_keys của một lượt: n khoá đầu theo từng mục (cảnh báo/mã), phần dư đi kèm mọi tin."""
+
+    def __init__(self, ledger_keys: Sequence[Key], n: int):
+        ledger_keys = list(ledger_keys)
+        self.items = ledger_keys[:n] if len(ledger_keys) >= n else []
+        self.extra = ledger_keys[len(self.items):]
+        self._ledger = get_ledger() if ledger_keys else None
+
+    def of(self, idx: Sequence[int]) -> List[Key]:
+        return [self.items[i] for i in idx if self.items] + self.extra
+
+    def pending(self, sub: Subscriber, idx: Sequence[int]) -> tuple:
+        """Bỏ các mục chat này đã nhận ở lượt trước."""
+        if not self.items:
+            return tuple(idx)
+        return tuple(i for i in idx if not self._ledger.seen(sub.key(self.items[i])))
+
+    def delivered(self, sub: Subscriber) -> bool:
+        """Tin không theo mục (vd. "không có mã") chat này đã nhận?"""
+        return bool(self.extra) and all(self._ledger.seen(sub.key(k)) for k in self.extra)
+
+
+def _send_and_record(jobs, ledger_keys: Sequence[Key]) -> int:
+    """
+    Gửi song song (sub, text, khoá của tin); mỗi chat gửi xong → ghi khoá theo chat.
+    Mọi chat đều nhận (hoặc không còn gì phải gửi) → ghi ledger_keys gốc.
+    """
+    ok = TelegramNotifier.send_each([(sub.notifier(), t) for sub, t, _ in jobs], parse_mode="HTML") if jobs else []
+    if ledger_keys:
+        ledger = get_ledger()
+        ledger.record([sub.key(k) for (sub, _, keys), good in zip(jobs, ok) if good for k in keys])
+        if all(ok):
+            ledger.record(ledger_keys)
+    return sum(ok)
+
+
+def dispatch_no_pick(
+    scope: str = "EOD",
+    subscribers: Optional[Sequence[Subscriber]] = None,
+    ledger_keys: Sequence[Key] = (),
+) -> int:
+    return dispatch_buy_alerts([], scope=scope, subscribers=subscribers, ledger_keys=ledger_keys)
+
+
+def dispatch_tickers(
+    prefix: str,
+    tickers: Sequence[str],
+    subscribers: Optional[Sequence[Subscriber]] = None,
+    ledger_keys: Sequence[Key] = (),
+) -> int:
+    """Danh sách mã dạng 1 dòng (vd. Day-Running V12), chỉ lọc theo whitelist mã của subscriber."""
+    subs = list(subscribers if subscribers is not None else load_subscribers())
+    keys = _Keys(ledger_keys, len(tickers))
+    jobs = []
+    for sub in subs:
+        idx = keys.pending(sub, [i for i, t in enumerate(tickers) if sub.tickers is None or t.upper() in sub.tickers])
+        if idx:
+            jobs.append((sub, prefix + ", ".join(tickers[i] for i in idx), keys.of(idx)))
+    return _send_and_record(jobs, ledger_keys)
@@ -0,0 +1,129 @@
+# app/universe.py
+"""
+Universe mode — quét toàn thị trường (HOSE/HNX/UPCoM) cho EOD scan.
+
+- resolve_universe(): danh sách mã từ file cache (UNIVERSE_FILE) nếu còn mới,
+  ngược lại hỏi vendor (TickerList theo từng chỉ số sàn) rồi ghi lại cache.
+- iter_daily_chunks(): chia mã thành chunk, fetch song song có giới hạn
+  (FETCH_CONCURRENCY), retry từng chunk; trả từng DataFrame ngay khi chunk xong
+  để phía gọi tính feature trong lúc các chunk khác còn đang tải.
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterator, List, Sequence
+
+import pandas as pd
+
+from .config import CFG
+
+DAILY_FIELDS = ['open','high','low','close','volume','bu','sd','fb','fs','fn']
+
+# Chỉ số đại diện từng sàn để lấy danh sách mã từ vendor
+_EXCHANGE_INDEXES = ("VNINDEX", "HNXINDEX", "UPCOMINDEX")
+
+
+def _read_cache(path: Path, max_age_days: int) -> List[str]:
+    try:
+        if not path.exists():
+            return []
+        if max_age_days > 0 and time.time() - path.stat().st_mtime > max_age_days * 86400:
+            return []
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except Exception:
+        return []
+    return [s.strip().upper() for s in lines if s.strip() and not s.startswith("#")]
+
+
+def _write_cache(path: Path, tickers: Sequence[str]) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(tickers) + "\n", encoding="utf-8")
+    except Exception as exc:
+        print(f"[universe] Không ghi được cache {path}: {exc}")
+
+
+def _fetch_from_vendor(client) -> List[str]:
+    tickers = set()
+    for idx in _EXCHANGE_INDEXES:
+        try:
+            members = client.TickerList(ticker=idx)
+        except Exception as exc:
+            print(f"[universe] TickerList({idx}) lỗi: {exc}")
+            continue
+        tickers.update(str(t).strip().upper() for t in (members or []) if str(t).strip())
+    return sorted(tickers)
+
+
+def resolve_universe(client=None, refresh: bool = False) -> List[str]:
+    """
+    Danh sách mã cần quét (không gồm VNINDEX — market features lấy riêng).
+    Thứ tự ưu tiên: cache còn hạn → vendor → cache cũ → CFG.tickers.
+    """
+    path = Path(CFG.universe_file).resolve()
+    tickers = [] if refresh else _read_cache(path, CFG.universe_max_age_days)
+    if not tickers and client is not None:
+        tickers = _fetch_from_vendor(client)
+        if tickers:
+            _write_cache(path, tickers)
+    if not tickers:
+        tickers = _read_cache(path, 0) or list(CFG.tickers)
+    return [t for t in tickers if t != "VNINDEX"]
+
+
+def _fetch_chunk(
+    client, tickers: Sequence[str], period: int, retries: int,
+    fields: Sequence[str] = DAILY_FIELDS, backoff: float = 1.0, adjusted: bool = True,
+) -> pd.DataFrame:
+    last_err = None
+    for attempt in range(retries):
+        try:
+            data = client.Fetch_Trading_Data(
+                realtime=False,
+                tickers=list(tickers),
+                fields=list(fields),
+                adjusted=adjusted,
+                by='1d',
+                period=period
+            ).get_data()
+            return data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        except Exception as exc:
+            last_err = exc
+            time.sleep(backoff * (2 ** attempt))
+    raise last_err
+
+
+def iter_daily_chunks(
+    client,
+    tickers: Sequence[str],
+    *,
+    period: int = 260,
+    fields: Sequence[str] = DAILY_FIELDS,
+    chunk_size: int | None = None,
+    concurrency: int | None = None,
+    retries: int | None = None,
+    adjusted: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """
+    Fetch '1d' theo chunk với tối đa `concurrency` request đồng thời.
+    Chunk lỗi sau `retries` lần bị bỏ qua (in cảnh báo) để không chặn cả phiên quét.
+    adjusted=False: giá gốc (bar store tự áp hệ số điều chỉnh).
+    """
+    chunk_size = max(1, chunk_size or CFG.fetch_chunk_size)
+    concurrency = max(1, concurrency or CFG.fetch_concurrency)
+    retries = max(1, retries or CFG.fetch_retries)
+    chunks = [list(tickers[i:i + chunk_size]) for i in range(0, len(tickers), chunk_size)]
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fetch") as pool:
+        futures = {pool.submit(_fetch_chunk, client, c, period, retries, fields, 1.0, adjusted): c for c in chunks}
+        for fut in as_completed(futures):
+            chunk = futures[fut]
+            try:
+                df = fut.result()
+            except Exception as exc:
+                print(f"[universe] Bỏ chunk {chunk[0]}..{chunk[-1]} ({len(chunk)} mã): {exc}")
+                continue
+            if df is not None and not df.empty:
+                yield df
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
-"""Utilities package exports for FTU-DSTC Fiin Alerts."""
+"""Utilities package exports for FTU-DSTC Fiin Alerts (trading_calendar nạp ở lần truy cập đầu — kéo theo pandas)."""
 
-from .trading_calendar import is_trading_day
+__all__ = ["is_trading_day", "get_calendar", "TradingCalendar", "VN_HOLIDAYS"]
 
-__all__ = ["is_trading_day"]
+
+def __getattr__(name):
+    if name in __all__:
+        from . import trading_calendar
+        return getattr(trading_calendar, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
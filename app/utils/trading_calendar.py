@@ -1,9 +1,150 @@
+# app/utils/trading_calendar.py
+"""
+Lịch giao dịch HOSE/HNX/UPCoM — ngày nghỉ lễ + số học theo phiên.
+
+- VN_HOLIDAYS: các ngày thường (T2–T6) sàn đóng cửa (Tết Dương lịch, Tết Nguyên đán, Giỗ Tổ,
+  30/4–1/5, Quốc khánh, kể cả ngày nghỉ bù/hoán đổi). Bảng cập nhật tay theo thông báo của
+  sở GDCK; bổ sung thêm bằng HOLIDAYS_FILE (mỗi dòng một ngày YYYY-MM-DD) mà không cần sửa code.
+- TradingCalendar tính sẵn mảng phiên (datetime64[D]) và bảng tra "chỉ số phiên đầu tiên >= ngày"
+  cho mọi ngày lịch trong khoảng → next_session / add_sessions / sessions_between là O(1).
+- is_trading_day(): API cũ, giờ tính cả ngày lễ (job gọi trước khi login/fetch vendor).
+"""
+from __future__ import annotations
+
 from datetime import date
-from ..fiin_client import get_client
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
 import pandas as pd
-from datetime import date
+
+_H = {
+    2020: ["01-01", "01-23", "01-24", "01-27", "01-28", "01-29", "04-02", "04-30", "05-01", "09-02"],
+    2021: ["01-01", "02-10", "02-11", "02-12", "02-15", "02-16", "04-21", "04-30", "05-03",
+           "09-02", "09-03"],
+    2022: ["01-03", "01-31", "02-01", "02-02", "02-03", "02-04", "04-11", "05-02", "05-03",
+           "09-01", "09-02"],
+    2023: ["01-02", "01-20", "01-23", "01-24", "01-25", "01-26", "05-01", "05-02", "05-03",
+           "09-01", "09-04"],
+    2024: ["01-01", "02-08", "02-09", "02-12", "02-13", "02-14", "04-18", "04-29", "04-30",
+           "05-01", "09-02", "09-03"],
+    2025: ["01-01", "01-27", "01-28", "01-29", "01-30", "01-31", "04-07", "04-30", "05-01",
+           "05-02", "09-01", "09-02"],
+    2026: ["01-01", "02-16", "02-17", "02-18", "02-19", "02-20", "04-27", "04-30", "05-01",
+           "09-01", "09-02"],
+}
+VN_HOLIDAYS = frozenset(date.fromisoformat(f"{y}-{md}") for y, mds in _H.items() for md in mds)
+
+_START = "2000-01-01"
+_END = "2035-12-31"
+
+
+def _day(d) -> int:
+    """Ngày bất kỳ (date/datetime/Timestamp/datetime64/str) → số ngày kể từ epoch."""
+    if isinstance(d, date):  # nhanh nhất cho date/datetime (datetime là lớp con của date)
+        return d.toordinal() - 719163
+    return int(pd.Timestamp(d).to_datetime64().astype("datetime64[D]").astype(np.int64))
+
+
+class TradingCalendar:
+    def __init__(self, holidays: Iterable = VN_HOLIDAYS, start: str = _START, end: str = _END):
+        days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+        weekday = (days.astype(np.int64) + 3) % 7          # 1970-01-01 là thứ Năm → 0 = thứ Hai
+        hol = np.array(sorted({np.datetime64(pd.Timestamp(h).date(), "D") for h in holidays}),
+                       dtype="datetime64[D]")
+        is_session = (weekday < 5) & ~np.isin(days, hol)
+        self.sessions: np.ndarray = days[is_session]
+        self._first_day = int(days[0].astype(np.int64))
+        self._is_session = is_session
+        # chỉ số phiên đầu tiên >= ngày (len(sessions) nếu vượt cuối)
+        self._first_ge = np.searchsorted(self.sessions, days, side="left").astype(np.int32)
+
+    # ---- tra cứu cơ bản ----
+    def _offset(self, d) -> int:
+        off = _day(d) - self._first_day
+        if not 0 <= off < len(self._first_ge):
+            raise ValueError(f"Ngày {d} nằm ngoài lịch giao dịch ({_START} → {_END}).")
+        return off
+
+    def is_session(self, d) -> bool:
+        return bool(self._is_session[self._offset(d)])
+
+    def session_index(self, d) -> int:
+        """Chỉ số (trong self.sessions) của phiên đầu tiên >= d."""
+        return int(self._first_ge[self._offset(d)])
+
+    def session(self, i: int) -> pd.Timestamp:
+        if not 0 <= i < len(self.sessions):
+            raise ValueError("Vượt ra ngoài khoảng lịch giao dịch.")
+        return pd.Timestamp(self.sessions[i])
+
+    # ---- số học theo phiên ----
+    def add_sessions(self, d, n: int) -> pd.Timestamp:
+        """Phiên thứ n sau d (n < 0: trước d). d không phải phiên → tính từ phiên liền sau/trước."""
+        i = self.session_index(d)
+        if n > 0 and self.is_session(d):
+            return self.session(i + n)
+        if n > 0:
+            return self.session(i + n - 1)
+        return self.session(i + n)
+
+    def next_session(self, d) -> pd.Timestamp:
+        return self.add_sessions(d, 1)
+
+    def prev_session(self, d) -> pd.Timestamp:
+        return self.add_sessions(d, -1)
+
+    def sessions_between(self, start, end) -> int:
+        """Số phiên trong [start, end)."""
+        return self.session_index(end) - self.session_index(start)
+
+    def sessions_in_range(self, start, end) -> pd.DatetimeIndex:
+        """Các phiên trong [start, end] (2 đầu mút tính cả)."""
+        i = self.session_index(start)
+        j = self.session_index(self._shift_day(end, 1))
+        return pd.DatetimeIndex(self.sessions[i:j])
+
+    def add_sessions_array(self, days, n: int) -> np.ndarray:
+        """Bản vector của add_sessions cho mảng ngày là phiên (datetime64[D])."""
+        off = np.asarray(days, dtype="datetime64[D]").astype(np.int64) - self._first_day
+        idx = self._first_ge[off] + n
+        return self.sessions[idx]
+
+    @staticmethod
+    def _shift_day(d, k: int) -> np.datetime64:
+        return np.datetime64(pd.Timestamp(d).date(), "D") + k
+
+
+def load_holidays_file(path: Optional[str]) -> set:
+    if not path:
+        return set()
+    p = Path(path)
+    if not p.exists():
+        return set()
+    out = set()
+    for line in p.read_text(encoding="utf-8").replace(",", "\n").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            out.add(date.fromisoformat(line))
+    return out
+
+
+_calendar: Optional[TradingCalendar] = None
+
+
+def get_calendar() -> TradingCalendar:
+    """Lịch dùng chung: VN_HOLIDAYS + HOLIDAYS_FILE (nếu có)."""
+    global _calendar
+    if _calendar is None:
+        from ..config import CFG
+        extra = load_holidays_file(CFG.holidays_file)
+        _calendar = TradingCalendar(VN_HOLIDAYS | extra)
+    return _calendar
 
 
 def is_trading_day(today: date) -> bool:
-    """Simple VN trading calendar: Mon–Fri."""
-    return today.weekday() < 5
\ No newline at end of file
+    """VN trading calendar: T2–T6, trừ ngày nghỉ lễ của sở."""
+    try:
+        return get_calendar().is_session(today)
+    except ValueError:
+        return today.weekday() < 5
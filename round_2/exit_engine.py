@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+exit_engine.py — Logic thoát lệnh V12 dạng vector (dùng chung backtest + cảnh báo BÁN live)
+
+- Đầu vào: mảng NumPy theo vị thế (entry/TP/SL/trailing/highest/holding_days/...) và
+  mảng nến của cùng ngày (open/high/low/close + chỉ báo tuỳ chọn), đã căn theo thứ tự vị thế.
+- Đầu ra: ExitBatch gồm trailing/highest đã cập nhật, cờ TP/SL/END, giá thoát, loại thoát,
+  số cổ phiếu bán và cờ ứng viên pyramiding.
+- Phần phụ thuộc tuần tự (vốn cho pyramiding, thanh khoản hoãn bán, thanh toán T+2)
+  vẫn do vòng lặp gọi xử lý — nhưng chỉ trên các vị thế có tín hiệu.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+# Nhãn exit_type giữ nguyên chuỗi của backtest_engine_v12 (trades log)
+EXIT_TYPE_LABELS = ("Normal", "Pyramid", "Momentum Loss")
+EXIT_TYPE_NORMAL, EXIT_TYPE_PYRAMID, EXIT_TYPE_MOMENTUM = 0, 1, 2
+
+
+@dataclass
+class PhaseParams:
+    """Tham số động theo pha thị trường (khớp mục 2 trong backtest_engine_v12)."""
+    market_phase: str
+    position_multiplier: float
+    max_hold_days: int
+    loss_exit_threshold: float
+    atr_mult: float
+    pyramid_limit_phase: int
+
+
+def market_phase_v12(market_close, market_ma50, market_ma200, market_rsi, market_adx, market_boll_width) -> PhaseParams:
+    """Xác định pha bull/sideway/bear + tham số quản trị lệnh đi kèm."""
+    is_bull = (market_close > market_ma50) and (market_close > market_ma200) and (market_rsi > 50)
+    is_sideway = (market_adx < 20) and (market_boll_width < 0.4) and (40 <= market_rsi <= 60)
+    return PhaseParams(
+        market_phase='bull' if is_bull else 'sideway' if is_sideway else 'bear',
+        position_multiplier=1.2 if is_bull else 0.5 if is_sideway else 0.0,
+        max_hold_days=45 if is_bull else 20 if is_sideway else 15,
+        loss_exit_threshold=-0.10 if is_bull else -0.03 if is_sideway else -0.12,
+        atr_mult=2.0 if is_bull else 1.2 if is_sideway else 2.2,
+        pyramid_limit_phase=2 if is_bull else 1,
+    )
+
+
+@dataclass
+class ExitBatch:
+    """Kết quả đánh giá thoát lệnh cho N vị thế (mọi mảng dài N)."""
+    valid: np.ndarray          # có nến hợp lệ (close != NaN) trong ngày
+    highest: np.ndarray        # highest sau khi cập nhật
+    trailing_sl: np.ndarray    # trailing SL sau khi cập nhật
+    trigger_tp: np.ndarray
+    trigger_sl: np.ndarray
+    trigger_end: np.ndarray
+    momentum_loss: np.ndarray  # END do mất momentum (sideway: SMA5 < SMA50, lãi < 1%) — exit_type vẫn Normal/Pyramid
+    exit: np.ndarray           # đủ điều kiện thoát hôm nay (đã xét min_holding_days, pyramiding)
+    exit_price: np.ndarray     # NaN nếu không thoát
+    exit_type: np.ndarray      # mã trong EXIT_TYPE_LABELS
+    partial: np.ndarray        # thoát một phần (TP)
+    shares_to_sell: np.ndarray
+    pyramid: np.ndarray        # ứng viên pyramiding (vòng lặp gọi kiểm tra vốn)
+    profit_pct: np.ndarray     # close / entry - 1
+
+    def exit_type_label(self, k: int) -> str:
+        return EXIT_TYPE_LABELS[int(self.exit_type[k])]
+
+
+def _as_array(x, n: int, default: Optional[np.ndarray] = None) -> np.ndarray:
+    if x is None:
+        return default if default is not None else np.full(n, np.nan)
+    return np.asarray(x, dtype=float).reshape(n)
+
+
+def evaluate_exits_v12(
+    entry_price,
+    tp,
+    sl,
+    trailing_sl,
+    highest,
+    holding_days,
+    pyramid_count,
+    shares,
+    open_,
+    high,
+    low,
+    close,
+    *,
+    market_phase: str,
+    max_hold_days: int,
+    loss_exit_threshold: float,
+    pyramid_limit_phase: int = 1,
+    trailing_stop_pct: float = 0.05,
+    partial_profit_pct: float = 0.4,
+    min_holding_days: int = 2,
+    lot_size: int = 100,
+    sma5=None,
+    sma50=None,
+    rsi=None,
+    mfi=None,
+    obv=None,
+    prev_obv=None,
+    boll_upper=None,
+    boll_lower=None,
+) -> ExitBatch:
+    """
+    Áp toàn bộ luật thoát V12 cho mọi vị thế trong một lượt:
+      1) Cập nhật highest/trailing theo high.
+      2) Sideway: kẹp TP/SL theo Bollinger (nếu có).
+      3) Gap tại open qua TP / dưới min(SL, trailing) → thoát tại open.
+      4) Nội phiên chạm TP / thủng min(SL, trailing) → thoát tại close.
+      5) END: quá max_hold_days, suy yếu (RSI/MFI/OBV), lỗ vượt ngưỡng theo pha;
+         bull giữ tiếp nếu ≥50 ngày và lãi > 8%; sideway mất momentum (SMA5 < SMA50).
+      6) Pyramiding (bull, 2–10 ngày, lãi 5–10%) loại trừ thoát.
+    Chỉ báo tuỳ chọn = None tương đương pivot không tồn tại trong backtest.
+    """
+    close = np.asarray(close, dtype=float)
+    n = close.shape[0]
+    entry_price = _as_array(entry_price, n)
+    tp = _as_array(tp, n)
+    sl = _as_array(sl, n)
+    trailing_sl = _as_array(trailing_sl, n).copy()
+    highest = _as_array(highest, n).copy()
+    holding_days = np.asarray(holding_days, dtype=np.int64).reshape(n)
+    pyramid_count = np.asarray(pyramid_count, dtype=np.int64).reshape(n)
+    shares = np.asarray(shares, dtype=np.int64).reshape(n)
+    open_ = _as_array(open_, n)
+    high = _as_array(high, n)
+    low = _as_array(low, n)
+    sma5 = _as_array(sma5, n, close)
+    sma50 = _as_array(sma50, n, close)
+
+    valid = ~np.isnan(close)
+    with np.errstate(invalid='ignore'):
+        # 1) Trailing stop
+        raise_hi = valid & (high > highest)
+        highest = np.where(raise_hi, high, highest)
+        trailing_sl = np.where(raise_hi, highest * (1 - trailing_stop_pct), trailing_sl)
+
+        # 2) Sideway: kẹp TP/SL theo Bollinger
+        if market_phase == 'sideway' and boll_upper is not None and boll_lower is not None:
+            bu = _as_array(boll_upper, n)
+            bl = _as_array(boll_lower, n)
+            tp = np.where(np.isnan(bu), tp, np.minimum(tp, bu))
+            sl = np.where(np.isnan(bl), sl, np.maximum(sl, bl))
+
+        eligible = valid & (holding_days >= min_holding_days)
+        stop = np.minimum(sl, trailing_sl)
+        has_pyramid = pyramid_count > 0
+
+        # 3) Gap tại open
+        open_ok = eligible & ~np.isnan(open_)
+        gap_tp = open_ok & (open_ >= tp)
+        gap_sl = open_ok & ~gap_tp & (open_ <= stop)
+        gapped = gap_tp | gap_sl
+
+        # 4) Nội phiên
+        intra_tp = eligible & ~gapped & (high >= tp)
+        intra_sl = eligible & ~gapped & ~intra_tp & (low <= stop)
+
+        trigger_tp = gap_tp | intra_tp
+        trigger_sl = gap_sl | intra_sl
+        exit_price = np.where(gapped, open_, np.where(intra_tp | intra_sl, close, np.nan))
+        exit_type = np.where(trigger_tp & has_pyramid, EXIT_TYPE_PYRAMID, EXIT_TYPE_NORMAL).astype(np.int8)
+
+        # 5) END: thời gian nắm giữ / suy yếu / pha thị trường
+        profit_pct = close / entry_price - 1
+        if rsi is not None and mfi is not None and obv is not None:
+            obv_a = _as_array(obv, n)
+            prev = _as_array(prev_obv, n, obv_a)
+            is_weak = (_as_array(rsi, n) < 30) & (_as_array(mfi, n) < 20) & (obv_a < prev)
+        else:
+            is_weak = np.zeros(n, dtype=bool)
+        trigger_end = (
+            (holding_days >= max_hold_days) | is_weak
+            | ((market_phase == 'bear') & (profit_pct < loss_exit_threshold))
+            | ((market_phase == 'sideway') & (profit_pct < -0.03))
+        )
+        if market_phase == 'bull':
+            trigger_end &= ~((holding_days >= 50) & (profit_pct > 0.08))
+        momentum_loss = np.zeros(n, dtype=bool)
+        if market_phase == 'sideway':
+            momentum_loss = (sma5 < sma50) & (profit_pct < 0.01)
+            trigger_end |= momentum_loss
+            exit_type = np.where(momentum_loss, EXIT_TYPE_MOMENTUM, exit_type).astype(np.int8)
+        trigger_end &= valid
+        momentum_loss &= valid
+
+        # 6) Pyramiding (loại trừ thoát)
+        pyramid = (
+            valid & ~trigger_tp & ~trigger_sl & ~trigger_end
+            & (market_phase == 'bull')
+            & (holding_days >= 2) & (holding_days <= 10)
+            & (profit_pct > 0.05) & (profit_pct < 0.10)
+            & (pyramid_count < pyramid_limit_phase)
+        )
+
+    exit_ = (trigger_tp | trigger_sl | trigger_end) & eligible
+    # END không có giá thoát từ TP/SL → thoát tại close, exit_type theo pyramid_count
+    end_only = exit_ & np.isnan(exit_price)
+    exit_price = np.where(end_only, close, exit_price)
+    exit_type = np.where(
+        end_only, np.where(has_pyramid, EXIT_TYPE_PYRAMID, EXIT_TYPE_NORMAL), exit_type
+    ).astype(np.int8)
+    exit_price = np.where(exit_, exit_price, np.nan)
+
+    partial = exit_ & trigger_tp
+    shares_to_sell = np.where(
+        partial, (shares * partial_profit_pct / lot_size).astype(np.int64) * lot_size, shares
+    ).astype(np.int64)
+
+    return ExitBatch(
+        valid=valid,
+        highest=highest,
+        trailing_sl=trailing_sl,
+        trigger_tp=trigger_tp,
+        trigger_sl=trigger_sl,
+        trigger_end=trigger_end,
+        momentum_loss=momentum_loss,
+        exit=exit_,
+        exit_price=exit_price,
+        exit_type=exit_type,
+        partial=partial,
+        shares_to_sell=shares_to_sell,
+        pyramid=pyramid,
+        profit_pct=profit_pct,
+    )
+
+
+def apply_partial_exit(tp, sl, exit_price, trailing_stop_pct: float = 0.05):
+    """Sau khi chốt lời một phần: nâng TP lên exit*1.15 và kéo SL (giống backtest)."""
+    new_tp = exit_price * 1.15
+    new_sl = np.maximum(sl, exit_price * (1 - trailing_stop_pct * 1.2))
+    return new_tp, new_sl
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+ingest.py — Chuẩn bị feature store cho backtest nhiều năm theo từng batch
+
+- Đọc DATA_FILE_PATH theo row-group (parquet) hoặc chunk (csv), chuẩn hoá kiểu dữ liệu từng batch
+  ('time' datetime, 'ticker' upper, số → float64, bổ sung cột dòng tiền thiếu).
+- Pass 1 (chỉ vài cột, lọc VNINDEX) → bảng market_* theo 'time' (nhỏ, giữ trong RAM).
+- Pass 2: tính volume_ma20 / highest_in_5d / sma_5 theo từng mã, mang theo đuôi lịch sử
+  (carry) giữa các batch để rolling window liền mạch, gắn market_* rồi ghi ra parquet một lần.
+- load_feature_store(): đọc lại parquet bằng memory-map (lọc theo khoảng ngày nếu cần),
+  index = 'time' — dùng trực tiếp cho backtest_engine_v12 mà không cần precompute lại.
+
+Yêu cầu: trong file nguồn, các dòng của cùng một mã xuất hiện theo thứ tự thời gian tăng dần
+(file sort theo 'time' hoặc theo ('ticker','time') đều được).
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+FLOW_COLUMNS = ["bu", "sd", "fb", "fs", "fn"]
+BASE_REQUIRED = ["ticker", "open", "high", "low", "close", "volume"]
+# Cửa sổ dài nhất của feature theo mã (volume_ma20) → số dòng carry mỗi mã
+CARRY_ROWS = 20
+MARKET_ALIASES = ("VNINDEX",)
+
+
+def _is_parquet(path: Path) -> bool:
+    return path.suffix.lower() == ".parquet"
+
+
+def _iter_raw(path: Path, batch_rows: int, columns: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        cols = None
+        if columns is not None:
+            names = set(pf.schema_arrow.names)
+            cols = [c for c in columns if c in names]
+        for rb in pf.iter_batches(batch_size=batch_rows, columns=cols):
+            yield rb.to_pandas()
+    else:
+        usecols = (lambda c: c in set(columns)) if columns is not None else None
+        for chunk in pd.read_csv(path, chunksize=batch_rows, usecols=usecols):
+            yield chunk
+
+
+def normalize_batch(df: pd.DataFrame) -> pd.DataFrame:
+    """Chuẩn hoá 1 batch: 'time' datetime64, 'ticker' upper, cột số → float64."""
+    if "time" not in df.columns:
+        if "timestamp" in df.columns:
+            df = df.rename(columns={"timestamp": "time"})
+        else:
+            raise KeyError("Thiếu cột thời gian: cần 'time' hoặc 'timestamp'.")
+    df["time"] = pd.to_datetime(df["time"])
+    if "ticker" in df.columns:
+        df["ticker"] = df["ticker"].astype(str).str.upper()
+    for c in df.columns:
+        if c in ("time", "ticker"):
+            continue
+        if pd.api.types.is_numeric_dtype(df[c]) or pd.api.types.is_bool_dtype(df[c]):
+            df[c] = df[c].astype("float64")
+        else:
+            df[c] = df[c].astype(str)
+    return df
+
+
+def read_market_rows(path: Path, batch_rows: int = 500_000) -> pd.DataFrame:
+    """Pass 1: chỉ đọc time/ticker/high/low/close và giữ lại dòng VNINDEX."""
+    parts = []
+    for raw in _iter_raw(path, batch_rows, columns=["time", "timestamp", "ticker", "high", "low", "close"]):
+        raw = normalize_batch(raw)
+        parts.append(raw[raw["ticker"].isin(MARKET_ALIASES)])
+    vn = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    if vn.empty:
+        raise ValueError("Dataset không có VNINDEX để suy ra biến 'market_*'.")
+    return vn.sort_values("time").drop_duplicates("time", keep="last")
+
+
+def _rolling_features(work: pd.DataFrame, todo: List[str]) -> pd.DataFrame:
+    grouped = work.groupby("ticker", group_keys=False, sort=False)
+    if "volume_ma20" in todo:
+        work["volume_ma20"] = grouped["volume"].transform(lambda x: x.rolling(20, min_periods=20).mean()).fillna(0)
+    if "highest_in_5d" in todo:
+        work["highest_in_5d"] = grouped["high"].transform(lambda x: x.rolling(5, min_periods=5).max().shift(1))
+    if "sma_5" in todo:
+        work["sma_5"] = grouped["close"].transform(lambda x: x.rolling(5, min_periods=5).mean())
+    return work
+
+
+def prepare_feature_store(
+    src: str | Path,
+    dst: str | Path,
+    market_builder: Callable[[pd.DataFrame], pd.DataFrame],
+    batch_rows: int = 500_000,
+) -> Path:
+    """
+    Chạy toàn bộ pipeline và ghi parquet đã chuẩn bị tại `dst`.
+    market_builder(vn) nhận dòng VNINDEX (time/high/low/close) → DataFrame index 'time' với cột market_*.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    src, dst = Path(src), Path(dst)
+    market = market_builder(read_market_rows(src, batch_rows)).reset_index()
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_suffix(dst.suffix + ".tmp")
+    writer = None
+    carry: Optional[pd.DataFrame] = None
+    last_seen: dict = {}
+    todo: List[str] = []
+    n_rows = 0
+    try:
+        for raw in _iter_raw(src, batch_rows):
+            batch = normalize_batch(raw)
+            miss = [c for c in BASE_REQUIRED if c not in batch.columns]
+            if miss:
+                raise KeyError(f"Thiếu cột bắt buộc: {miss}")
+            for c in FLOW_COLUMNS:
+                if c not in batch.columns:
+                    batch[c] = 0.0
+            if writer is None:
+                todo = [c for c in ("volume_ma20", "highest_in_5d", "sma_5") if c not in batch.columns]
+
+            # Kiểm tra thứ tự thời gian theo mã (điều kiện để carry đúng)
+            first = batch.groupby("ticker", sort=False)["time"].min()
+            for t, t0 in first.items():
+                if t in last_seen and t0 < last_seen[t]:
+                    raise ValueError(
+                        f"Dữ liệu của {t} không theo thứ tự thời gian giữa các batch; "
+                        "hãy sort file theo 'time' hoặc ('ticker','time')."
+                    )
+            last_seen.update(batch.groupby("ticker", sort=False)["time"].max().to_dict())
+
+            if todo:
+                keys = ["time", "ticker", "high", "close", "volume"]
+                cur = batch[keys].assign(_row=np.arange(len(batch)))
+                work = cur if carry is None else pd.concat([carry.assign(_row=-1), cur], ignore_index=True)
+                work = work.sort_values(["ticker", "time"], kind="stable")
+                work = _rolling_features(work, todo)
+                out = work[work["_row"] >= 0].sort_values("_row")
+                for c in todo:
+                    batch[c] = out[c].to_numpy()
+                carry = work.groupby("ticker", sort=False).tail(CARRY_ROWS)[keys]
+
+            mcols = [c for c in market.columns if c == "time" or c not in batch.columns]
+            batch = batch.merge(market[mcols], on="time", how="left")
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            else:
+                table = table.select(writer.schema.names).cast(writer.schema)
+            writer.write_table(table)
+            n_rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"File dữ liệu rỗng: {src}")
+    tmp.replace(dst)
+    print(f"[ingest] Đã ghi {n_rows:,} dòng feature → {dst}")
+    return dst
+
+
+def is_fresh(src: str | Path, dst: str | Path) -> bool:
+    """Feature store còn dùng được nếu mới hơn file nguồn."""
+    src, dst = Path(src), Path(dst)
+    return dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime
+
+
+def load_feature_store(
+    path: str | Path,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Đọc feature store (memory-map, lọc khoảng ngày tại tầng parquet), index = 'time'."""
+    import pyarrow.parquet as pq
+
+    filters = []
+    if start:
+        filters.append(("time", ">=", pd.Timestamp(start)))
+    if end:
+        filters.append(("time", "<=", pd.Timestamp(end)))
+    cols = None if columns is None else list(dict.fromkeys(["time", *columns]))
+    table = pq.read_table(path, columns=cols, filters=filters or None, memory_map=True)
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    return df.set_index("time")
@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+"""
+portfolio_kernel.py — Vòng lặp ngày của backtest V12 biên dịch bằng numba (engine tuỳ chọn)
+
+- Toàn bộ sổ sách theo ngày của backtest_engine_v12 chạy trong một hàm @njit trên mảng cấp phát
+  trước: vị thế (mảng theo slot, giữ thứ tự mở như dict cũ), hàng đợi tiền bán chờ T+2
+  (ring buffer FIFO, cùng ngữ nghĩa deque: chỉ giải phóng từ đầu hàng), sổ lệnh (mảng tăng gấp đôi).
+- Luật thoát là bản vô hướng của evaluate_exits_v12 (cùng thứ tự so sánh, cùng cách NaN lan truyền);
+  pyramiding, chốt lời một phần, hoãn bán do thanh khoản và mua mới giữ đúng thứ tự phép tính float
+  của engine Python → lệnh khớp từng bit.
+- Screener KHÔNG chạy trong kernel: đầu vào là ma trận tín hiệu signal_rank (ngày × mã, -1 = không
+  chọn, 0..k = thứ tự ứng viên trong ngày) tính trước ở Python (screener_signal_matrix trong v12.py).
+- Ngày truyền dạng int64 ns; số ngày nắm giữ = floor((d1 - d0) / 1 ngày) như Timedelta.days.
+- KernelInputs gom mọi mảng đầu vào (dựng một lần bằng prepare_kernel_inputs trong v12.py) →
+  chạy lại nhiều lần với tham số / nhiễu khác nhau (round_2/robustness.py) không phải tính lại.
+- Nhiễu tuỳ chọn (mặc định tắt, kết quả khớp engine Python): slippage_rate ở phiên volume thấp,
+  order_seed xáo thứ tự ứng viên mua trong ngày.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+import numpy as np
+from numba import njit
+
+try:
+    from round_2.exit_engine import EXIT_TYPE_LABELS
+    from round_2.trade_buffer import TradeBuffer
+except ImportError:  # chạy trực tiếp trong round_2/
+    from exit_engine import EXIT_TYPE_LABELS
+    from trade_buffer import TradeBuffer
+
+PHASE_BULL, PHASE_SIDEWAY, PHASE_BEAR = 0, 1, 2
+PHASE_CODES = {"bull": PHASE_BULL, "sideway": PHASE_SIDEWAY, "bear": PHASE_BEAR}
+
+# cột của sổ lệnh trả về
+TI_TICKER, TI_ENTRY_DATE, TI_EXIT_DATE, TI_SHARES, TI_HOLDING_DAYS, TI_EXIT_TYPE = range(6)
+TF_ENTRY_PRICE, TF_EXIT_PRICE, TF_PROFIT = range(3)
+
+# cùng mã với round_2/exit_engine.py (EXIT_TYPE_LABELS)
+_NORMAL, _PYRAMID, _MOMENTUM = 0, 1, 2
+_DAY_NS = 86_400_000_000_000
+
+
+@njit(cache=True)
+def _min_nan(a, b):
+    """np.minimum cho 2 số: NaN lan truyền."""
+    if a != a or b != b:
+        return np.nan
+    return a if a < b else b
+
+
+@njit(cache=True)
+def _max_nan(a, b):
+    if a != a or b != b:
+        return np.nan
+    return a if a > b else b
+
+
+@njit(cache=True)
+def _py_min(a, b):
+    """min() của Python: trả a trừ khi b < a (NaN ở b → a)."""
+    return b if b < a else a
+
+
+@njit(cache=True)
+def _days(d1, d0):
+    return (d1 - d0) // _DAY_NS
+
+
+@njit(cache=True)
+def _slip(vol, has_volume, rate, min_volume):
+    """Trượt giá bất lợi (tỷ lệ) ở phiên thanh khoản thấp — như calculate_transaction_costs."""
+    if rate != 0.0 and has_volume and vol < min_volume:
+        return rate
+    return 0.0
+
+
+@njit(cache=True)
+def _grow_rows(a, n):
+    out = np.empty((2 * a.shape[0], a.shape[1]), dtype=a.dtype)
+    out[:n] = a[:n]
+    return out
+
+
+@njit(cache=True)
+def run_portfolio_v12(
+    dates_ns, settle_ns,
+    close, open_, high, low, volume, has_volume,
+    sma5, sma50,
+    rsi, mfi, obv, has_weak,
+    boll_upper, boll_lower, has_boll,
+    volume_ma20, atr14, signal_rank,
+    phase, position_multiplier, max_hold_days, loss_exit_threshold, atr_mult, pyramid_limit_phase,
+    initial_capital, commission_buy, commission_sell_base, tax_sell, trade_limit_pct,
+    max_investment_per_trade_pct, max_open_positions, lot_size, liquidity_threshold, entry_on_close,
+    trailing_stop_pct, partial_profit_pct, min_holding_days,
+    slippage_rate=0.0, slippage_volume=1e6, order_seed=-1,
+):
+    n_dates, n_cols = close.shape
+    if order_seed >= 0:
+        np.random.seed(order_seed)
+
+    # ---- vị thế: slot 0..n_pos-1 theo thứ tự mở; slot_of[col] = slot hoặc -1 ----
+    p_col = np.empty(n_cols, np.int64)
+    p_shares = np.empty(n_cols, np.int64)
+    p_entry = np.empty(n_cols, np.float64)
+    p_avg = np.empty(n_cols, np.float64)
+    p_tp = np.empty(n_cols, np.float64)
+    p_sl = np.empty(n_cols, np.float64)
+    p_trail = np.empty(n_cols, np.float64)
+    p_high = np.empty(n_cols, np.float64)
+    p_entry_ns = np.empty(n_cols, np.int64)
+    p_pyr = np.empty(n_cols, np.int64)
+    slot_of = np.full(n_cols, -1, np.int64)
+    remove = np.zeros(n_cols, np.bool_)
+    n_pos = 0
+
+    # ---- tiền bán chờ thanh toán: ring buffer FIFO ----
+    s_cap = 64
+    s_date = np.empty(s_cap, np.int64)
+    s_amt = np.empty(s_cap, np.float64)
+    s_head = 0
+    s_len = 0
+
+    # ---- sổ lệnh ----
+    t_int = np.empty((256, 6), np.int64)
+    t_flt = np.empty((256, 3), np.float64)
+    n_trades = 0
+
+    working_capital = initial_capital
+    portfolio_values = np.zeros(n_dates)
+    sell_cost = commission_sell_base + tax_sell
+
+    for i in range(n_dates):
+        date = dates_ns[i]
+
+        # 1. Giải phóng tiền bán đã tới hạn (dừng ở phần tử đầu chưa tới hạn — như deque)
+        while s_len > 0 and s_date[s_head] <= date:
+            working_capital += s_amt[s_head]
+            s_head = (s_head + 1) & (s_cap - 1)
+            s_len -= 1
+
+        ph = phase[i]
+        max_hold = max_hold_days[i]
+        loss_thr = loss_exit_threshold[i]
+        pyr_limit = pyramid_limit_phase[i]
+
+        # 3. Quản trị vị thế (luật thoát vô hướng + phần tuần tự)
+        for k in range(n_pos):
+            col = p_col[k]
+            c = close[i, col]
+            valid = c == c
+            hd = _days(date, p_entry_ns[k])
+            entry_price = p_entry[k]
+            tp = p_tp[k]
+            sl = p_sl[k]
+            trailing = p_trail[k]
+            highest = p_high[k]
+            has_pyr = p_pyr[k] > 0
+            h = high[i, col]
+            lo = low[i, col]
+            o = open_[i, col]
+
+            if valid and h > highest:
+                highest = h
+                trailing = highest * (1 - trailing_stop_pct)
+            if ph == PHASE_SIDEWAY and has_boll:
+                bu = boll_upper[i, col]
+                bl = boll_lower[i, col]
+                if bu == bu:
+                    tp = _min_nan(tp, bu)
+                if bl == bl:
+                    sl = _max_nan(sl, bl)
+
+            eligible = valid and hd >= min_holding_days
+            stop = _min_nan(sl, trailing)
+            open_ok = eligible and o == o
+            gap_tp = open_ok and o >= tp
+            gap_sl = open_ok and not gap_tp and o <= stop
+            gapped = gap_tp or gap_sl
+            intra_tp = eligible and not gapped and h >= tp
+            intra_sl = eligible and not gapped and not intra_tp and lo <= stop
+            trigger_tp = gap_tp or intra_tp
+            trigger_sl = gap_sl or intra_sl
+            if gapped:
+                exit_price = o
+            elif intra_tp or intra_sl:
+                exit_price = c
+            else:
+                exit_price = np.nan
+            exit_type = _PYRAMID if (trigger_tp and has_pyr) else _NORMAL
+
+            profit_pct = c / entry_price - 1
+            is_weak = False
+            if has_weak:
+                prev = obv[i - 1 if i > 0 else 0, col]
+                is_weak = rsi[i, col] < 30 and mfi[i, col] < 20 and obv[i, col] < prev
+            trigger_end = (
+                hd >= max_hold or is_weak
+                or (ph == PHASE_BEAR and profit_pct < loss_thr)
+                or (ph == PHASE_SIDEWAY and profit_pct < -0.03)
+            )
+            if ph == PHASE_BULL:
+                trigger_end = trigger_end and not (hd >= 50 and profit_pct > 0.08)
+            if ph == PHASE_SIDEWAY:
+                momentum_loss = sma5[i, col] < sma50[i, col] and profit_pct < 0.01
+                trigger_end = trigger_end or momentum_loss
+                if momentum_loss:
+                    exit_type = _MOMENTUM
+            trigger_end = trigger_end and valid
+
+            pyramid = (
+                valid and not trigger_tp and not trigger_sl and not trigger_end
+                and ph == PHASE_BULL
+                and hd >= 2 and hd <= 10
+                and profit_pct > 0.05 and profit_pct < 0.10
+                and p_pyr[k] < pyr_limit
+            )
+            do_exit = (trigger_tp or trigger_sl or trigger_end) and eligible
+            if do_exit and exit_price != exit_price:
+                exit_price = c
+                exit_type = _PYRAMID if has_pyr else _NORMAL
+            partial = do_exit and trigger_tp
+
+            if valid:
+                p_high[k] = highest
+                p_trail[k] = trailing
+
+            if pyramid:
+                add_px = c * (1 + _slip(volume[i, col], has_volume, slippage_rate, slippage_volume))
+                add_shares = np.int64(p_shares[k] * 0.2 / lot_size) * lot_size
+                add_cost = add_shares * add_px * (1 + commission_buy)
+                if working_capital >= add_cost:
+                    p_avg[k] = (p_shares[k] * p_avg[k] + add_shares * add_px) / (p_shares[k] + add_shares)
+                    p_shares[k] += add_shares
+                    p_pyr[k] += 1
+                    p_tp[k] = c * 1.12
+                    p_trail[k] = c * (1 - trailing_stop_pct * 0.7)
+                    working_capital -= add_cost
+                continue
+            if not do_exit:
+                continue
+
+            if partial:
+                shares_to_sell = np.int64(p_shares[k] * partial_profit_pct / lot_size) * lot_size
+            else:
+                shares_to_sell = p_shares[k]
+            vol = volume[i, col] if has_volume else 0.0
+            can_sell_today = vol == vol and vol > 0 and shares_to_sell <= vol * liquidity_threshold
+
+            use_exit_price = exit_price
+            exit_idx = i
+            if not can_sell_today:
+                found = False
+                j = i
+                while j < n_dates - 1:
+                    j += 1
+                    if _days(dates_ns[j], p_entry_ns[k]) >= min_holding_days:
+                        nxt = open_[j, col]
+                        if nxt == nxt:
+                            use_exit_price = nxt
+                            exit_idx = j
+                            found = True
+                            break
+                if not found:
+                    use_exit_price = c
+                    exit_idx = i
+
+            use_exit_price = use_exit_price * (1 - _slip(volume[exit_idx, col], has_volume, slippage_rate, slippage_volume))
+            gross = use_exit_price * shares_to_sell
+            net = gross - (gross * sell_cost)
+            if net <= 0:
+                continue
+            if s_len == s_cap:  # đầy → gấp đôi, trải phẳng theo thứ tự FIFO
+                nd = np.empty(2 * s_cap, np.int64)
+                na = np.empty(2 * s_cap, np.float64)
+                for q in range(s_len):
+                    nd[q] = s_date[(s_head + q) & (s_cap - 1)]
+                    na[q] = s_amt[(s_head + q) & (s_cap - 1)]
+                s_date, s_amt, s_head, s_cap = nd, na, 0, 2 * s_cap
+            tail = (s_head + s_len) & (s_cap - 1)
+            s_date[tail] = settle_ns[exit_idx]
+            s_amt[tail] = net
+            s_len += 1
+
+            holding_exit = _days(dates_ns[exit_idx], p_entry_ns[k])
+            if holding_exit < min_holding_days:
+                continue
+
+            if n_trades == t_int.shape[0]:
+                t_int = _grow_rows(t_int, n_trades)
+                t_flt = _grow_rows(t_flt, n_trades)
+            t_int[n_trades, TI_TICKER] = col
+            t_int[n_trades, TI_ENTRY_DATE] = p_entry_ns[k]
+            t_int[n_trades, TI_EXIT_DATE] = dates_ns[exit_idx]
+            t_int[n_trades, TI_SHARES] = shares_to_sell
+            t_int[n_trades, TI_HOLDING_DAYS] = holding_exit
+            t_int[n_trades, TI_EXIT_TYPE] = exit_type
+            t_flt[n_trades, TF_ENTRY_PRICE] = entry_price
+            t_flt[n_trades, TF_EXIT_PRICE] = use_exit_price
+            t_flt[n_trades, TF_PROFIT] = net - (shares_to_sell * p_avg[k] * (1 + commission_buy))
+            n_trades += 1
+
+            if partial:
+                p_shares[k] -= shares_to_sell
+                p_tp[k] = use_exit_price * 1.15
+                p_sl[k] = _max_nan(p_sl[k], use_exit_price * (1 - trailing_stop_pct * 1.2))
+            else:
+                remove[k] = True
+
+        # xoá vị thế đã thoát hết, dồn slot giữ nguyên thứ tự
+        w = 0
+        for k in range(n_pos):
+            if remove[k]:
+                slot_of[p_col[k]] = -1
+                remove[k] = False
+                continue
+            if w != k:
+                p_col[w] = p_col[k]
+                p_shares[w] = p_shares[k]
+                p_entry[w] = p_entry[k]
+                p_avg[w] = p_avg[k]
+                p_tp[w] = p_tp[k]
+                p_sl[w] = p_sl[k]
+                p_trail[w] = p_trail[k]
+                p_high[w] = p_high[k]
+                p_entry_ns[w] = p_entry_ns[k]
+                p_pyr[w] = p_pyr[k]
+                slot_of[p_col[w]] = w
+            w += 1
+        n_pos = w
+
+        # 6. Mua mới theo thứ tự ứng viên của screener
+        if entry_on_close and n_pos < max_open_positions and working_capital > 0:
+            row = signal_rank[i]
+            cand = np.flatnonzero(row >= 0)
+            if cand.size > 0:
+                cand = cand[np.argsort(row[cand], kind="mergesort")]
+                if order_seed >= 0:
+                    np.random.shuffle(cand)
+                slots = np.int64((max_open_positions - n_pos) * position_multiplier[i])
+                if ph == PHASE_BEAR:
+                    slots = max(1, slots // 2)
+                alloc_mult = 1.1 if slots > 2 else 1.0
+                max_investment = working_capital * max_investment_per_trade_pct
+                executed = 0
+                for r in range(min(slots, cand.size)):
+                    col = cand[r]
+                    if slot_of[col] >= 0:
+                        continue
+                    entry_price = close[i, col] * (1 + _slip(volume[i, col], has_volume, slippage_rate, slippage_volume))
+                    if not (entry_price > 0):
+                        continue
+                    invest = _py_min((working_capital / slots) * position_multiplier[i] * alloc_mult, max_investment)
+                    intended = (invest / (1 + commission_buy)) / entry_price
+                    shares_f = _py_min(intended, volume_ma20[i, col] * trade_limit_pct)
+                    if shares_f != shares_f:
+                        continue
+                    shares = np.int64(shares_f / lot_size) * lot_size
+                    if shares < lot_size:
+                        continue
+                    cost = shares * entry_price * (1 + commission_buy)
+                    if shares * entry_price > volume[i, col] * close[i, col] * liquidity_threshold:
+                        continue
+                    if working_capital - cost < 0 or working_capital == 0:
+                        continue
+                    working_capital -= cost
+                    a = atr14[i, col]
+                    p_col[n_pos] = col
+                    p_shares[n_pos] = shares
+                    p_entry[n_pos] = entry_price
+                    p_avg[n_pos] = entry_price
+                    p_tp[n_pos] = entry_price + (atr_mult[i] * a)
+                    p_sl[n_pos] = entry_price - (atr_mult[i] * a)
+                    p_trail[n_pos] = entry_price * (1 - trailing_stop_pct)
+                    p_high[n_pos] = entry_price
+                    p_entry_ns[n_pos] = date
+                    p_pyr[n_pos] = 0
+                    slot_of[col] = n_pos
+                    n_pos += 1
+                    executed += 1
+                    if executed >= slots:
+                        break
+
+        # 8. Giá trị danh mục
+        stocks_value = 0.0
+        for k in range(n_pos):
+            px = close[i, p_col[k]]
+            if px != px:
+                px = p_entry[k]
+            stocks_value += p_shares[k] * px
+        pending = 0.0
+        for q in range(s_len):
+            pending += s_amt[(s_head + q) & (s_cap - 1)]
+        total = working_capital + stocks_value + pending
+        portfolio_values[i] = total if not (0 > total) else 0.0
+
+    # trạng thái cuối (để in danh mục / kiểm tra)
+    s_out_date = np.empty(s_len, np.int64)
+    s_out_amt = np.empty(s_len, np.float64)
+    for q in range(s_len):
+        s_out_date[q] = s_date[(s_head + q) & (s_cap - 1)]
+        s_out_amt[q] = s_amt[(s_head + q) & (s_cap - 1)]
+    positions = (
+        p_col[:n_pos].copy(), p_shares[:n_pos].copy(), p_entry[:n_pos].copy(), p_avg[:n_pos].copy(),
+        p_entry_ns[:n_pos].copy(), p_tp[:n_pos].copy(), p_sl[:n_pos].copy(), p_pyr[:n_pos].copy(),
+    )
+    return (portfolio_values, t_int[:n_trades].copy(), t_flt[:n_trades].copy(),
+            working_capital, positions, s_out_date, s_out_amt)
+
+
+def kernel_trades(t_int: np.ndarray, t_flt: np.ndarray, tickers) -> TradeBuffer:
+    """Sổ lệnh của kernel → TradeBuffer (ticker = chỉ số cột trong `tickers`)."""
+    return TradeBuffer.from_columns(
+        {"ticker": [str(t) for t in tickers], "exit_type": EXIT_TYPE_LABELS},
+        ticker=t_int[:, TI_TICKER],
+        entry_date=t_int[:, TI_ENTRY_DATE],
+        exit_date=t_int[:, TI_EXIT_DATE],
+        entry_price=t_flt[:, TF_ENTRY_PRICE],
+        exit_price=t_flt[:, TF_EXIT_PRICE],
+        shares=t_int[:, TI_SHARES],
+        profit=t_flt[:, TF_PROFIT],
+        holding_days=t_int[:, TI_HOLDING_DAYS],
+        exit_type=t_int[:, TI_EXIT_TYPE],
+    )
+
+
+@dataclass
+class KernelInputs:
+    """Đầu vào đã căn (ngày × mã) cho run_portfolio_v12; None = pivot không tồn tại trong dữ liệu."""
+    tickers: List[str]
+    dates_ns: np.ndarray
+    settle_ns: np.ndarray
+    close: np.ndarray
+    open_: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    volume: Optional[np.ndarray]
+    volume_ma20: np.ndarray
+    atr14: np.ndarray
+    signal_rank: np.ndarray
+    phase: np.ndarray
+    position_multiplier: np.ndarray
+    max_hold_days: np.ndarray
+    loss_exit_threshold: np.ndarray
+    atr_mult: np.ndarray
+    pyramid_limit_phase: np.ndarray
+    sma5: Optional[np.ndarray] = None
+    sma50: Optional[np.ndarray] = None
+    rsi: Optional[np.ndarray] = None
+    mfi: Optional[np.ndarray] = None
+    obv: Optional[np.ndarray] = None
+    boll_upper: Optional[np.ndarray] = None
+    boll_lower: Optional[np.ndarray] = None
+
+    def take_sessions(self, keep: np.ndarray) -> "KernelInputs":
+        """Chỉ giữ các phiên keep (mask/chỉ số) — như dữ liệu bị thiếu các phiên còn lại.
+        T+2 tính lại trên các phiên còn lại (phiên cuối: nối tiếp lịch như settlement_dates)."""
+        idx = np.flatnonzero(keep) if np.asarray(keep).dtype == bool else np.asarray(keep)
+        ext = np.concatenate([self.dates_ns[idx], self.settle_ns[-2:]])
+        changes = {"dates_ns": self.dates_ns[idx], "settle_ns": ext[2:2 + len(idx)]}
+        for name in ("close", "open_", "high", "low", "volume", "volume_ma20", "atr14", "signal_rank",
+                     "phase", "position_multiplier", "max_hold_days", "loss_exit_threshold", "atr_mult",
+                     "pyramid_limit_phase", "sma5", "sma50", "rsi", "mfi", "obv", "boll_upper", "boll_lower"):
+            arr = getattr(self, name)
+            if arr is not None:
+                changes[name] = arr[idx]
+        return replace(self, **changes)
+
+
+def run_kernel(
+    inputs: KernelInputs,
+    initial_capital: float,
+    commission_buy: float = 0.001,
+    commission_sell_base: float = 0.001,
+    tax_sell: float = 0.001,
+    trade_limit_pct: float = 0.01,
+    max_investment_per_trade_pct: float = 0.10,
+    max_open_positions: int = 8,
+    lot_size: int = 100,
+    liquidity_threshold: float = 0.1,
+    entry_mode: str = "close",
+    trailing_stop_pct: float = 0.05,
+    partial_profit_pct: float = 0.4,
+    min_holding_days: int = 2,
+    slippage_rate: float = 0.0,
+    slippage_volume: float = 1e6,
+    order_seed: int = -1,
+):
+    """Gọi run_portfolio_v12 với các tham số cùng tên/mặc định như backtest_engine_v12."""
+    x = inputs
+    has_weak = x.rsi is not None and x.mfi is not None and x.obv is not None
+    has_boll = x.boll_upper is not None and x.boll_lower is not None
+    close = x.close
+    return run_portfolio_v12(
+        x.dates_ns, x.settle_ns,
+        close, x.open_, x.high, x.low,
+        x.volume if x.volume is not None else close, x.volume is not None,
+        x.sma5 if x.sma5 is not None else close,
+        x.sma50 if x.sma50 is not None else close,
+        x.rsi if has_weak else close, x.mfi if has_weak else close, x.obv if has_weak else close, has_weak,
+        x.boll_upper if has_boll else close, x.boll_lower if has_boll else close, has_boll,
+        x.volume_ma20, x.atr14, x.signal_rank,
+        x.phase, x.position_multiplier, x.max_hold_days, x.loss_exit_threshold, x.atr_mult,
+        x.pyramid_limit_phase,
+        float(initial_capital), float(commission_buy), float(commission_sell_base), float(tax_sell),
+        float(trade_limit_pct), float(max_investment_per_trade_pct), int(max_open_positions), int(lot_size),
+        float(liquidity_threshold), entry_mode == "close",
+        float(trailing_stop_pct), float(partial_profit_pct), int(min_holding_days),
+        float(slippage_rate), float(slippage_volume), int(order_seed),
+    )
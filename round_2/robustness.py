@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+robustness.py — Đánh giá độ nhạy của V12 (Monte Carlo / bootstrap) trên kernel numba
+
+- Dữ liệu chỉ chuẩn bị MỘT lần: KernelInputs (feature đã pivot + signal_rank của screener, dựng bằng
+  prepare_kernel_inputs trong v12.py). Mỗi mô phỏng chỉ chạy lại run_portfolio_v12 (~0.1s).
+- run_monte_carlo(): mỗi mô phỏng rút ngẫu nhiên
+    * thứ tự ứng viên mua trong ngày (order_seed → kernel xáo danh sách ứng viên),
+    * mức trượt giá ~ U(0, slippage_max) ở phiên volume < slippage_volume (như calculate_transaction_costs),
+    * bỏ ngẫu nhiên drop_sessions phiên (dữ liệu thiếu; giữ phiên đầu/cuối, T+2 tính lại),
+  chạy song song trên ProcessPoolExecutor (inputs gửi cho mỗi worker một lần qua initializer).
+- bootstrap_returns(): block bootstrap lợi suất ngày của một lần chạy (vector hoá, không chạy lại engine).
+- summarize(): phân vị của các chỉ số (CAGR, Max Drawdown, Sharpe, ...) qua các mô phỏng.
+"""
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    from round_2.portfolio_kernel import KernelInputs, run_kernel, TF_PROFIT, TI_HOLDING_DAYS
+    from round_2.trade_buffer import trade_metrics
+except ImportError:  # chạy trực tiếp trong round_2/
+    from portfolio_kernel import KernelInputs, run_kernel, TF_PROFIT, TI_HOLDING_DAYS
+    from trade_buffer import trade_metrics
+
+_DAY_NS = 86_400_000_000_000
+
+
+@dataclass
+class Perturbation:
+    """Mức nhiễu cho mỗi mô phỏng (0/False = tắt yếu tố đó)."""
+    shuffle_entries: bool = True
+    slippage_max: float = 0.002      # trượt giá tối đa (tỷ lệ giá khớp)
+    slippage_volume: float = 1e6     # chỉ trượt ở phiên volume thấp hơn ngưỡng này
+    drop_sessions: float = 0.02      # tỷ lệ phiên bị bỏ
+
+
+def path_metrics(values: np.ndarray, years: float) -> Dict[str, np.ndarray]:
+    """
+    Chỉ số theo đường giá trị danh mục (mỗi dòng một mô phỏng) — cùng công thức với
+    calculate_enhanced_metrics: Total Return, CAGR, Sharpe (252 phiên), Max Drawdown, Calmar.
+    """
+    v = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = v[:, -1] / v[:, 0] - 1
+        r = v[:, 1:] / v[:, :-1] - 1
+        std = np.nanstd(r, axis=1, ddof=1) if r.shape[1] > 1 else np.zeros(len(v))
+        sharpe = np.where(std != 0, (np.nanmean(r, axis=1) * 252) / (std * np.sqrt(252)), 0.0)
+        peak = np.maximum.accumulate(v, axis=1)
+        max_dd = -((v - peak) / peak).min(axis=1)
+        cagr = (v[:, -1] / v[:, 0]) ** (1 / years) - 1 if years > 0 else np.zeros(len(v))
+        calmar = np.where(max_dd > 0, cagr / max_dd, np.inf)
+    return {"Total Return": total, "CAGR": cagr, "Sharpe Ratio": sharpe,
+            "Max Drawdown": max_dd, "Calmar Ratio": calmar}
+
+
+def _years(dates_ns: np.ndarray) -> float:
+    return float((dates_ns[-1] - dates_ns[0]) // _DAY_NS) / 365.25 if len(dates_ns) else 0.0
+
+
+# ---- Monte Carlo trên kernel ----
+_INPUTS: Optional[KernelInputs] = None
+
+
+def _init_worker(inputs: KernelInputs) -> None:
+    global _INPUTS
+    _INPUTS = inputs
+
+
+def _draw(sim_id: int, seed: int, pert: Perturbation, n_dates: int) -> dict:
+    rng = np.random.default_rng([seed, sim_id])
+    keep = None
+    if pert.drop_sessions > 0 and n_dates > 2:
+        keep = rng.random(n_dates) >= pert.drop_sessions
+        keep[0] = keep[-1] = True
+    return {
+        "order_seed": int(rng.integers(0, 2**31 - 1)) if pert.shuffle_entries else -1,
+        "slippage_rate": float(rng.uniform(0, pert.slippage_max)) if pert.slippage_max > 0 else 0.0,
+        "keep": keep,
+    }
+
+
+def _simulate(sim_ids: Sequence[int], seed: int, pert: Perturbation, params: dict) -> List[dict]:
+    base = _INPUTS
+    rows = []
+    for sim_id in sim_ids:
+        d = _draw(sim_id, seed, pert, len(base.dates_ns))
+        inputs = base if d["keep"] is None else base.take_sessions(d["keep"])
+        pv, t_int, t_flt, *_ = run_kernel(
+            inputs, order_seed=d["order_seed"], slippage_rate=d["slippage_rate"],
+            slippage_volume=pert.slippage_volume, **params,
+        )
+        row = {k: float(v[0]) for k, v in path_metrics(pv, _years(inputs.dates_ns)).items()}
+        tm = trade_metrics(t_flt[:, TF_PROFIT], t_int[:, TI_HOLDING_DAYS])
+        row.update({k: tm[k] for k in ("Num Trades", "Win Rate", "Profit Factor")})
+        row.update(sim=sim_id, order_seed=d["order_seed"], slippage_rate=d["slippage_rate"],
+                   dropped_sessions=0 if d["keep"] is None else int((~d["keep"]).sum()))
+        rows.append(row)
+    return rows
+
+
+def run_monte_carlo(
+    inputs: KernelInputs,
+    n_sims: int = 1000,
+    params: Optional[dict] = None,
+    perturbation: Optional[Perturbation] = None,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    chunk_size: int = 25,
+) -> pd.DataFrame:
+    """
+    n_sims lần chạy kernel có nhiễu → DataFrame (mỗi dòng một mô phỏng: chỉ số + nhiễu đã rút).
+    params: tham số của backtest_engine_v12 (initial_capital bắt buộc, còn lại tuỳ chọn).
+    workers=None → os.cpu_count(); workers<=1 → chạy ngay trong tiến trình hiện tại.
+    Kết quả chỉ phụ thuộc (seed, sim), không phụ thuộc số worker.
+    """
+    params = dict(params or {})
+    if "initial_capital" not in params:
+        raise ValueError("params['initial_capital'] là bắt buộc")
+    pert = perturbation or Perturbation()
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    chunks = [list(range(i, min(i + chunk_size, n_sims))) for i in range(0, n_sims, chunk_size)]
+
+    t0 = time.time()
+    rows: List[dict] = []
+    if workers <= 1:
+        _init_worker(inputs)
+        for c in chunks:
+            rows += _simulate(c, seed, pert, params)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(inputs,)) as pool:
+            futures = [pool.submit(_simulate, c, seed, pert, params) for c in chunks]
+            for f in futures:
+                rows += f.result()
+    print(f"[robustness] {n_sims} mô phỏng, {workers} worker: {time.time() - t0:.1f}s "
+          f"({asdict(pert)})")
+    return pd.DataFrame(rows).set_index("sim").sort_index()
+
+
+# ---- Bootstrap lợi suất ngày ----
+def bootstrap_returns(
+    values: np.ndarray,
+    dates_ns: np.ndarray,
+    n_sims: int = 10000,
+    block: int = 20,
+    seed: int = 0,
+    batch: int = 1000,
+) -> pd.DataFrame:
+    """
+    Block bootstrap (vòng tròn, khối `block` phiên) lợi suất ngày của một đường giá trị danh mục
+    → phân phối Total Return / CAGR / Sharpe / Max Drawdown / Calmar cùng độ dài và số năm.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = v[1:] / v[:-1] - 1
+    r = np.where(np.isfinite(r), r, 0.0)
+    m = len(r)
+    if m == 0:
+        raise ValueError("Cần ít nhất 2 phiên để bootstrap")
+    block = max(1, min(int(block), m))
+    n_blocks = -(-m // block)
+    years = _years(np.asarray(dates_ns))
+    rng = np.random.default_rng(seed)
+    offsets = np.arange(block)
+    out: Dict[str, List[np.ndarray]] = {}
+    for start in range(0, n_sims, batch):
+        n = min(batch, n_sims - start)
+        starts = rng.integers(0, m, size=(n, n_blocks))
+        idx = ((starts[:, :, None] + offsets) % m).reshape(n, -1)[:, :m]
+        paths = np.empty((n, m + 1))
+        paths[:, 0] = v[0]
+        paths[:, 1:] = v[0] * np.cumprod(1 + r[idx], axis=1)
+        for k, arr in path_metrics(paths, years).items():
+            out.setdefault(k, []).append(arr)
+    return pd.DataFrame({k: np.concatenate(a) for k, a in out.items()})
+
+
+def summarize(df: pd.DataFrame, quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95)) -> pd.DataFrame:
+    """Phân vị + trung bình của các chỉ số (cột) qua các mô phỏng."""
+    cols = [c for c in ("CAGR", "Total Return", "Max Drawdown", "Sharpe Ratio", "Calmar Ratio",
+                        "Num Trades", "Win Rate", "Profit Factor") if c in df.columns]
+    q = df[cols].replace([np.inf, -np.inf], np.nan).quantile(list(quantiles)).T
+    q.columns = [f"p{int(round(x * 100))}" for x in quantiles]
+    q["mean"] = df[cols].replace([np.inf, -np.inf], np.nan).mean()
+    return q
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+trade_buffer.py — Sổ lệnh dạng cột (NumPy structured array) cho backtest V12
+
+- TradeBuffer cấp phát trước và tăng gấp đôi khi đầy, mỗi lệnh là một dòng cố định kích thước:
+  ticker / exit_type lưu dạng mã số (bảng tra chuỗi đi kèm), ngày lưu int64 ns.
+- append() chỉ nối từng trường vào list chờ theo cột (rẻ hơn dựng dict như sổ lệnh cũ); lần đọc kế tiếp
+  ghi cả lô vào mảng (mã hoá chuỗi, đổi ngày, ép kiểu theo cột) — không chuyển đổi từng lệnh.
+- Vẫn dùng được như list[dict] cũ (len, bool, trades[i], vòng for, pd.DataFrame(trades)).
+- trade_metrics(): win rate, profit factor, chuỗi lỗ dài nhất… bằng phép rút gọn vector
+  trên các cột — không lặp Python theo lệnh.
+- to_parquet(): ghi thẳng các cột qua pyarrow (không dựng DataFrame trung gian).
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+TRADE_DTYPE = np.dtype([
+    ("ticker", np.int32),
+    ("entry_date", np.int64),
+    ("exit_date", np.int64),
+    ("entry_price", np.float64),
+    ("exit_price", np.float64),
+    ("shares", np.int64),
+    ("profit", np.float64),
+    ("holding_days", np.int64),
+    ("exit_type", np.int16),
+])
+COLUMNS = TRADE_DTYPE.names
+
+
+def _ns(values: Sequence, count: int) -> np.ndarray:
+    """Ngày → int64 ns; đường nhanh: engine truyền Timestamp (.value)."""
+    try:
+        return np.fromiter((ts.value for ts in values), dtype=np.int64, count=count)
+    except AttributeError:
+        return pd.DatetimeIndex(pd.to_datetime(list(values))).asi8
+
+
+class TradeBuffer:
+    def __init__(self, capacity: int = 1024):
+        self._data = np.empty(max(1, int(capacity)), dtype=TRADE_DTYPE)
+        self._n = 0
+        self._pending = tuple([] for _ in COLUMNS)  # lệnh đã append, chưa ghi vào _data (mỗi cột một list)
+        self._labels: Dict[str, List[str]] = {"ticker": [], "exit_type": []}
+        self._codes: Dict[str, Dict[str, int]] = {"ticker": {}, "exit_type": {}}
+
+    # ---- ghi ----
+    def _encode(self, field: str, values: Sequence[str]) -> np.ndarray:
+        """Chuỗi → mã số (thêm nhãn mới vào bảng tra theo thứ tự xuất hiện)."""
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        table = self._codes[field]
+        for value in uniques:
+            if value not in table:
+                table[value] = len(self._labels[field])
+                self._labels[field].append(value)
+        return np.fromiter((table[v] for v in uniques), dtype=np.int64, count=len(uniques))[codes]
+
+    def append(self, ticker, entry_date, exit_date, entry_price, exit_price,
+               shares, profit, holding_days, exit_type) -> None:
+        cols = self._pending
+        cols[0].append(ticker)
+        cols[1].append(entry_date)
+        cols[2].append(exit_date)
+        cols[3].append(entry_price)
+        cols[4].append(exit_price)
+        cols[5].append(shares)
+        cols[6].append(profit)
+        cols[7].append(holding_days)
+        cols[8].append(exit_type)
+
+    def _flush(self) -> None:
+        """Ghi cả lô lệnh chờ vào mảng theo cột."""
+        pending = self._pending
+        m = len(pending[0])
+        if not m:
+            return
+        self._pending = tuple([] for _ in COLUMNS)
+        n = self._n
+        if n + m > len(self._data):
+            grown = np.empty(max(n + m, 2 * len(self._data)), dtype=TRADE_DTYPE)
+            grown[:n] = self._data[:n]
+            self._data = grown
+        cols = dict(zip(COLUMNS, pending))
+        out = self._data[n:n + m]
+        for name in COLUMNS:
+            if name in ("ticker", "exit_type"):
+                out[name] = self._encode(name, cols[name])
+            elif name.endswith("_date"):
+                out[name] = _ns(cols[name], m)
+            else:
+                out[name] = np.fromiter(cols[name], dtype=TRADE_DTYPE[name], count=m)
+        self._n = n + m
+
+    @classmethod
+    def from_columns(cls, labels: Dict[str, Sequence[str]], **columns) -> "TradeBuffer":
+        """Dựng sẵn từ các cột (vd. đầu ra kernel numba); ticker/exit_type là mã số tra trong labels."""
+        n = len(columns["profit"])
+        buf = cls(n)
+        for name in COLUMNS:
+            buf._data[name][:n] = columns[name]
+        buf._n = n
+        for field in ("ticker", "exit_type"):
+            buf._labels[field] = list(labels[field])
+            buf._codes[field] = {v: i for i, v in enumerate(buf._labels[field])}
+        return buf
+
+    # ---- đọc ----
+    @property
+    def array(self) -> np.ndarray:
+        """View (không copy) các lệnh đã ghi."""
+        self._flush()
+        return self._data[:self._n]
+
+    def column(self, name: str) -> np.ndarray:
+        self._flush()
+        return self._data[name][:self._n]
+
+    def labels(self, field: str) -> List[str]:
+        return list(self._labels[field])
+
+    def __len__(self) -> int:
+        return self._n + len(self._pending[0])
+
+    def _row(self, i: int) -> dict:
+        r = self._data[i]
+        return {
+            "ticker": self._labels["ticker"][r["ticker"]],
+            "entry_date": pd.Timestamp(int(r["entry_date"])),
+            "exit_date": pd.Timestamp(int(r["exit_date"])),
+            "entry_price": float(r["entry_price"]),
+            "exit_price": float(r["exit_price"]),
+            "shares": int(r["shares"]),
+            "profit": float(r["profit"]),
+            "holding_days": int(r["holding_days"]),
+            "exit_type": self._labels["exit_type"][r["exit_type"]],
+        }
+
+    def __getitem__(self, i: int) -> dict:
+        self._flush()
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self._row(i)
+
+    def __iter__(self) -> Iterator[dict]:
+        self._flush()
+        for i in range(self._n):
+            yield self._row(i)
+
+    def _decoded(self) -> Dict[str, np.ndarray]:
+        a = self.array
+        out = {}
+        for name in COLUMNS:
+            col = a[name]
+            if name in ("ticker", "exit_type"):
+                col = np.asarray(self._labels[name], dtype=object)[col] if len(col) else np.array([], dtype=object)
+            elif name.endswith("_date"):
+                col = col.view("datetime64[ns]")
+            out[name] = col
+        return out
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self._decoded(), columns=list(COLUMNS))
+
+    def to_parquet(self, path) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        a = self.array
+        cols = {}
+        for name in COLUMNS:
+            if name in ("ticker", "exit_type"):
+                # dictionary-encoded: mã số + bảng chuỗi, không giải mã từng dòng
+                cols[name] = pa.DictionaryArray.from_arrays(
+                    pa.array(a[name], type=pa.int32()), pa.array(self._labels[name], type=pa.string())
+                )
+            elif name.endswith("_date"):
+                cols[name] = pa.array(a[name].view("datetime64[ns]"))
+            else:
+                cols[name] = pa.array(a[name])
+        pq.write_table(pa.table(cols), path)
+
+
+def trade_metrics(profit: np.ndarray, holding_days: np.ndarray) -> dict:
+    """Chỉ số theo lệnh (vector hoá) — cùng định nghĩa với calculate_enhanced_metrics."""
+    profit = np.ascontiguousarray(profit, dtype=np.float64)  # cột của structured array là view có stride
+    num_trades = len(profit)
+    win = profit > 0
+    loss = profit < 0
+    # max/min với 0 thay cho lọc theo mask: không rẽ nhánh, không cấp phát mảng con
+    total_profit = np.maximum(profit, 0.0).sum()
+    total_loss = -np.minimum(profit, 0.0).sum()
+    max_consec_losses = 0
+    if loss.any():
+        # vị trí các lệnh không lỗ (thêm 2 đầu) → khoảng cách - 1 = độ dài chuỗi lỗ
+        breaks = np.flatnonzero(~np.concatenate(([False], loss, [False])))
+        max_consec_losses = int(np.diff(breaks).max() - 1)
+    return {
+        "Num Trades": num_trades,
+        "Win Rate": np.count_nonzero(win) / num_trades if num_trades > 0 else 0,
+        "Avg Holding Days": np.mean(holding_days) if num_trades > 0 else 0,
+        "Profit Factor": total_profit / total_loss if total_loss > 0 else np.inf,
+        "Max Consec Losses": max_consec_losses,
+    }
@@ -8,7 +8,6 @@
 # ===================================================================
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import warnings
 from collections import deque
 from typing import List
@@ -16,6 +15,26 @@ import os
 import csv
 import time
 from numba import njit, prange
+try:
+    from round_2.exit_engine import evaluate_exits_v12, apply_partial_exit, market_phase_v12
+except ImportError:  # chạy trực tiếp: python round_2/v12.py
+    from exit_engine import evaluate_exits_v12, apply_partial_exit, market_phase_v12
+try:
+    from round_2.ingest import prepare_feature_store, load_feature_store, is_fresh
+except ImportError:
+    from ingest import prepare_feature_store, load_feature_store, is_fresh
+try:
+    from round_2.trade_buffer import TradeBuffer, trade_metrics
+except ImportError:
+    from trade_buffer import TradeBuffer, trade_metrics
+try:
+    from round_2.portfolio_kernel import KernelInputs, run_kernel, kernel_trades, PHASE_CODES
+except ImportError:
+    from portfolio_kernel import KernelInputs, run_kernel, kernel_trades, PHASE_CODES
+try:
+    from app.utils.trading_calendar import get_calendar
+except ImportError:  # chạy ngoài repo root → chỉ bỏ T7/CN khi cần ngày sau phiên cuối
+    get_calendar = None
 
 # Tắt các cảnh báo không cần thiết
 warnings.filterwarnings('ignore', category=FutureWarning)
@@ -210,15 +229,40 @@ def is_business_day(date):
     """Kiểm tra ngày làm việc (Thứ 2-6)."""
     return date.weekday() < 5
 
+def _sessions_after(last_date, n):
+    """n phiên giao dịch ngay sau last_date (lịch sở nếu có, không thì T2–T6)."""
+    if n <= 0:
+        return []
+    if get_calendar is not None:
+        try:
+            cal = get_calendar()
+            i = cal.session_index(last_date + pd.Timedelta(days=1))
+            return [cal.session(i + k) for k in range(n)]
+        except ValueError:
+            pass
+    return list(pd.bdate_range(last_date + pd.Timedelta(days=1), periods=n))
+
+def settlement_dates(all_dates, t_plus=2):
+    """
+    Ngày giải phóng vốn T+n cho từng phiên trong all_dates (các phiên có dữ liệu, đã sort):
+    settle[i] = phiên thứ i + t_plus → tra theo chỉ số mảng, O(1) mỗi lệnh.
+    Sau phiên cuối của dữ liệu thì lấy tiếp từ lịch giao dịch.
+    """
+    all_dates = list(all_dates)
+    if not all_dates:
+        return []
+    ext = all_dates + _sessions_after(all_dates[-1], t_plus)
+    return ext[t_plus:t_plus + len(all_dates)]
+
 def get_settlement_date(current_date, all_dates, t_plus=2):
-    """Tính ngày giải phóng vốn T+2 (chỉ tính ngày làm việc)."""
-    business_days = 0
-    idx = all_dates.index(current_date)
-    while business_days < t_plus and idx < len(all_dates) - 1:
-        idx += 1
-        if is_business_day(all_dates[idx]):
-            business_days += 1
-    return all_dates[idx]
+    """Tính ngày giải phóng vốn T+2 (theo phiên giao dịch)."""
+    if get_calendar is not None:
+        try:
+            return get_calendar().add_sessions(current_date, t_plus)
+        except ValueError:
+            pass
+    idx = int(np.searchsorted(np.asarray(all_dates, dtype="datetime64[ns]"), np.datetime64(current_date, "ns")))
+    return settlement_dates(all_dates, t_plus)[min(idx, len(all_dates) - 1)]
 
 def calculate_market_volatility(data, window=20):
     """Tính volatility thị trường."""
@@ -233,6 +277,17 @@ def log_portfolio_to_csv(portfolio_history, filename='portfolio_log.csv'):
     df_log.to_csv(filename, index=False)
     print(f"Portfolio log saved to {filename}")
 
+def log_trades_to_parquet(trades, filename='trades_log.parquet'):
+    """Ghi sổ lệnh thẳng ra parquet (TradeBuffer: từ các cột, không dựng DataFrame)."""
+    if isinstance(trades, TradeBuffer):
+        n_viol = int((trades.column('holding_days') < 2).sum())
+        if n_viol:
+            print(f"Warning: {n_viol} trades violate T+2 rule")
+        trades.to_parquet(filename)
+    else:
+        pd.DataFrame(trades).to_parquet(filename, index=False)
+    print(f"Trades log saved to {filename}")
+
 def log_trades_to_csv(trades, filename='trades_log.csv'):
     df_trades = pd.DataFrame(trades)
     if not df_trades.empty:
@@ -275,8 +330,16 @@ def calculate_metrics(performance_series):
         "Calmar Ratio": calmar_ratio
     }
 
+def _trade_columns(trades, *names):
+    """Cột của sổ lệnh: TradeBuffer (view, không copy), DataFrame hoặc list dict cũ."""
+    if isinstance(trades, TradeBuffer):
+        return tuple(trades.column(n) for n in names)
+    if isinstance(trades, pd.DataFrame):
+        return tuple(trades[n].to_numpy() for n in names)
+    return tuple(np.array([t[n] for t in trades]) for n in names)
+
 def calculate_enhanced_metrics(df_history, trades):
-    if df_history.empty or not trades:
+    if df_history.empty or len(trades) == 0:
         return {}
 
     total_return = (df_history.iloc[-1]['Portfolio Value'] / df_history.iloc[0]['Portfolio Value'] - 1)
@@ -286,23 +349,8 @@ def calculate_enhanced_metrics(df_history, trades):
     drawdown = (df_history['Portfolio Value'] - cumulative_max) / cumulative_max
     max_drawdown = -drawdown.min()
 
-    num_trades = len(trades)
-    winning_trades = [t for t in trades if t['profit'] > 0]
-    win_rate = len(winning_trades) / num_trades if num_trades > 0 else 0
-    avg_holding_days = np.mean([t['holding_days'] for t in trades]) if trades else 0
-    total_profit = sum(t['profit'] for t in winning_trades)
-    total_loss = sum(abs(t['profit']) for t in trades if t['profit'] < 0)
-    profit_factor = total_profit / total_loss if total_loss > 0 else np.inf
-
-    losses = [1 if t['profit'] < 0 else 0 for t in trades]
-    max_consec_losses = 0
-    current_streak = 0
-    for loss in losses:
-        if loss == 1:
-            current_streak += 1
-            max_consec_losses = max(max_consec_losses, current_streak)
-        else:
-            current_streak = 0
+    # Chỉ số theo lệnh: rút gọn vector trên cột profit/holding_days của sổ lệnh
+    tm = trade_metrics(*_trade_columns(trades, 'profit', 'holding_days'))
 
     years = (df_history.index[-1] - df_history.index[0]).days / 365.25
     cagr = ((df_history.iloc[-1]['Portfolio Value'] / df_history.iloc[0]['Portfolio Value']) ** (1 / years) - 1) if years > 0 else 0
@@ -313,11 +361,11 @@ def calculate_enhanced_metrics(df_history, trades):
         'CAGR': cagr,
         'Sharpe Ratio': sharpe_ratio,
         'Max Drawdown': max_drawdown,
-        'Num Trades': num_trades,
-        'Win Rate': win_rate,
-        'Avg Holding Days': avg_holding_days,
-        'Profit Factor': profit_factor,
-        'Max Consec Losses': max_consec_losses,
+        'Num Trades': tm['Num Trades'],
+        'Win Rate': tm['Win Rate'],
+        'Avg Holding Days': tm['Avg Holding Days'],
+        'Profit Factor': tm['Profit Factor'],
+        'Max Consec Losses': tm['Max Consec Losses'],
         'Calmar Ratio': calmar_ratio
     }
 
@@ -449,23 +497,61 @@ def create_pivot_tables_batch(backtest_data):
 
     return pivot_tables
 
+def _align_pivot(pivot, ref):
+    """Pivot → ndarray float căn theo index/columns của ref (None nếu pivot không tồn tại)."""
+    if pivot is None:
+        return None
+    return pivot.reindex(index=ref.index, columns=ref.columns).to_numpy(dtype=float)
+
+def _take_row(arr, i, cols):
+    return None if arr is None else arr[i, cols]
+
 """## 2.1. Bộ lọc"""
 
-def apply_enhanced_screener_v12_sideway_soft(df_day: pd.DataFrame, min_volume_ma20: int = 100000, max_candidates: int = 20) -> List[str]:
-    """Screener nâng cao v12: Tối ưu cho biến động và sideway từ 2023-2025."""
-    if df_day.empty:
-        return []
+def _liquid_frame(df_day: pd.DataFrame, columns: List[str], min_volume_ma20: int) -> pd.DataFrame:
+    """Frame con (chỉ các cột cần dùng) của mã qua cổng thanh khoản; df_day không bị sửa."""
+    cols = columns + [c for c in ('adj_factor',) if c in df_day.columns]
+    liquid = (df_day['volume_ma20'] > min_volume_ma20) & (df_day['volume'] > 300000)
+    df_filtered = df_day.loc[liquid, cols]
+    df_filtered.loc[:, 'close_adj'] = df_filtered['close'] * df_filtered.get('adj_factor', 1)
+    return df_filtered
 
-    required_columns = ['market_close', 'market_MA50', 'market_MA200', 'market_rsi', 'market_adx', 'market_boll_width',
-                       'close', 'volume', 'volume_ma20', 'sma_50', 'sma_200', 'rsi_14', 'volume_spike', 'ticker',
-                       'macd', 'macd_signal', 'boll_width', 'sma_5', 'atr_14']
-    missing = [col for col in required_columns if col not in df_day.columns]
+def _top_tickers(df_filtered: pd.DataFrame, score: pd.Series, mask: pd.Series, max_candidates: int, with_scores: bool = False):
+    """
+    Tương đương df_filtered[mask].nlargest(max_candidates, 'score')['ticker'].unique() (theo vị trí dòng).
+    with_scores=True → dict {ticker: score} theo cùng thứ tự.
+    """
+    m = mask.to_numpy(dtype=bool)
+    top = pd.Series(score.to_numpy()[m]).nlargest(max_candidates)
+    tickers = df_filtered['ticker'].to_numpy()[m][top.index.to_numpy()]
+    if with_scores:
+        out = {}
+        for t, sc in zip(tickers, top.to_numpy()):
+            out.setdefault(t, float(sc))
+        return out
+    return pd.unique(tickers).tolist()
+
+_SCREENER_COLUMNS = [
+    'market_close', 'market_MA50', 'market_MA200', 'market_rsi', 'market_adx', 'market_boll_width',
+    'close', 'volume', 'volume_ma20', 'sma_50', 'sma_200', 'rsi_14', 'volume_spike', 'ticker',
+    'macd', 'macd_signal', 'boll_width', 'sma_5', 'atr_14'
+]
+
+def screener_context(df_day: pd.DataFrame, min_volume_ma20: int = 100000) -> dict:
+    """
+    Phần dùng chung của các screener V12 trên một lát cắt ngày: kiểm tra cột, regime thị trường,
+    cổng thanh khoản và các cột phái sinh (relative_strength, short_momentum, macd_histogram).
+    Trả {} khi không thể chọn mã (rỗng / thiếu cột / bear). Tính một lần rồi truyền ctx= cho
+    nhiều screener → mỗi screener thêm chỉ còn phần mask + score của riêng nó.
+    """
+    if df_day.empty:
+        return {}
+    missing = [col for col in _SCREENER_COLUMNS if col not in df_day.columns]
     if missing:
         print(f"Thiếu cột: {missing}")
-        return []
-
-    df_day = df_day.copy()
+        return {}
 
+    # === Market context ===
     market_close = df_day['market_close'].iloc[0]
     market_ma50 = df_day['market_MA50'].iloc[0]
     market_ma200 = df_day['market_MA200'].iloc[0]
@@ -475,21 +561,32 @@ def apply_enhanced_screener_v12_sideway_soft(df_day: pd.DataFrame, min_volume_ma
 
     is_bull = (market_close > market_ma50) and (market_close > market_ma200) and (market_rsi > 55)
     is_sideway = (market_adx < 25) and (market_boll_width < 0.35) and (35 <= market_rsi <= 60)
-    is_bear = not is_bull and not is_sideway
-
-    if is_bear:
-        return []
+    if not is_bull and not is_sideway:
+        return {}
 
-    df_day.loc[:, 'close_adj'] = df_day['close'] * df_day.get('adj_factor', 1)
-    df_filtered = df_day[df_day['volume_ma20'] > min_volume_ma20].copy()
-    df_filtered = df_filtered[df_filtered['volume'] > 300000]
+    # === Chuẩn hóa dữ liệu ===
+    # df_day chỉ đọc: cột phái sinh gắn lên frame con của các mã đủ thanh khoản
+    df_filtered = _liquid_frame(df_day, _SCREENER_COLUMNS, min_volume_ma20)
 
-    df_filtered.loc[:, 'relative_strength'] = ((df_filtered['close_adj'] - df_filtered['sma_50']) / df_filtered['sma_50']) / ((market_close - market_ma50) / market_ma50 + 1e-6)
+    df_filtered.loc[:, 'relative_strength'] = (
+        ((df_filtered['close_adj'] - df_filtered['sma_50']) / df_filtered['sma_50']) /
+        ((market_close - market_ma50) / market_ma50 + 1e-6)
+    )
     df_filtered.loc[:, 'short_momentum'] = (df_filtered['close_adj'] - df_filtered['sma_5']) / df_filtered['sma_5']
     df_filtered.loc[:, 'macd_histogram'] = df_filtered['macd'] - df_filtered['macd_signal']
+    return {'is_bull': is_bull, 'is_sideway': is_sideway, 'df': df_filtered}
+
+def apply_enhanced_screener_v12_sideway_soft(df_day: pd.DataFrame, min_volume_ma20: int = 100000, max_candidates: int = 20, with_scores: bool = False, ctx: dict = None):
+    """Screener nâng cao v12: Tối ưu cho biến động và sideway từ 2023-2025.
+    ctx: screener_context(...) đã tính sẵn (bỏ qua min_volume_ma20)."""
+    if ctx is None:
+        ctx = screener_context(df_day, min_volume_ma20)
+    if not ctx:
+        return {} if with_scores else []
+    is_bull, is_sideway, df_filtered = ctx['is_bull'], ctx['is_sideway'], ctx['df']
 
     if is_bull:
-        df_filtered = df_filtered[
+        mask = (
             (df_filtered['close_adj'] > df_filtered['sma_200']) &
             (df_filtered['close_adj'] > df_filtered['sma_50']) &
             (df_filtered['sma_50'] > df_filtered['sma_200']) &
@@ -504,9 +601,9 @@ def apply_enhanced_screener_v12_sideway_soft(df_day: pd.DataFrame, min_volume_ma
             (df_filtered['relative_strength'] > 1.05) &                    # giảm ngưỡng strength
             (df_filtered['short_momentum'] > 0.01) &                       # chấp nhận entry sớm
             (df_filtered['close_adj'] > df_filtered['sma_5'])              # xác nhận giá trên SMA5
-        ]
+        )
     elif is_sideway:
-        df_filtered = df_filtered[
+        mask = (
             (df_filtered['rsi_14'] > 40) & (df_filtered['rsi_14'] < 55) &
             (df_filtered['boll_width'] < 0.3) &
             (df_filtered['macd_histogram'] > 0.0001) &  # Tín hiệu nhẹ để bắt breakout
@@ -515,15 +612,15 @@ def apply_enhanced_screener_v12_sideway_soft(df_day: pd.DataFrame, min_volume_ma
             (df_filtered['close_adj'] > (df_filtered['sma_50'] * 0.95)) &  # Không chọn quá yếu
             (df_filtered['close_adj'] > (df_filtered['sma_200'] * 0.95))   # Tránh cổ phiếu dưới trend dài hạn
 
-        ]
+        )
         max_candidates = int(max_candidates * 0.8)
 
-    if df_filtered.empty:
+    if not mask.any():
         print(f"Không có cổ phiếu nào được chọn vào ngày {df_day.index[0]}")
-        return []
+        return {} if with_scores else []
 
     if is_bull:
-        df_filtered.loc[:, 'score'] = (
+        score = (
             df_filtered['relative_strength'] * 0.35 +
             df_filtered['short_momentum'] * 0.25 +
             df_filtered['volume_spike'] * 0.25 +
@@ -531,63 +628,29 @@ def apply_enhanced_screener_v12_sideway_soft(df_day: pd.DataFrame, min_volume_ma
         )
 
     elif is_sideway:
-        df_filtered.loc[:, 'boll_proximity'] = (df_filtered['close_adj'] - df_filtered['sma_50']) / (df_filtered['sma_50'] * df_filtered['boll_width'])
-        df_filtered.loc[:, 'score'] = (
+        boll_proximity = (df_filtered['close_adj'] - df_filtered['sma_50']) / (df_filtered['sma_50'] * df_filtered['boll_width'])
+        score = (
             (50 - abs(df_filtered['rsi_14'] - 50)) * 0.3 +
             df_filtered['volume_spike'] * 0.25 +
             df_filtered['macd_histogram'] * 0.25 +
-            df_filtered['boll_proximity'] * 0.2
+            boll_proximity * 0.2
         )
 
-    df_filtered = df_filtered.nlargest(max_candidates, 'score')
-    return df_filtered['ticker'].unique().tolist()
+    return _top_tickers(df_filtered, score, mask, max_candidates, with_scores)
 
-def apply_enhanced_screener_v12(df_day: pd.DataFrame, min_volume_ma20: int = 100000, max_candidates: int = 20) -> List[str]:
-    """Screener nâng cao v12: Tối ưu cho biến động và sideway từ 2023-2025."""
-    if df_day.empty:
-        return []
-
-    required_columns = [
-        'market_close', 'market_MA50', 'market_MA200', 'market_rsi', 'market_adx', 'market_boll_width',
-        'close', 'volume', 'volume_ma20', 'sma_50', 'sma_200', 'rsi_14', 'volume_spike', 'ticker',
-        'macd', 'macd_signal', 'boll_width', 'sma_5', 'atr_14'
-    ]
-    missing = [col for col in required_columns if col not in df_day.columns]
-    if missing:
-        print(f"Thiếu cột: {missing}")
-        return []
-
-    df_day = df_day.copy()
-
-    # === Market context ===
-    market_close = df_day['market_close'].iloc[0]
-    market_ma50 = df_day['market_MA50'].iloc[0]
-    market_ma200 = df_day['market_MA200'].iloc[0]
-    market_rsi = df_day['market_rsi'].iloc[0]
-    market_adx = df_day['market_adx'].iloc[0]
-    market_boll_width = df_day['market_boll_width'].iloc[0]
-
-    is_bull = (market_close > market_ma50) and (market_close > market_ma200) and (market_rsi > 55)
-    is_sideway = (market_adx < 25) and (market_boll_width < 0.35) and (35 <= market_rsi <= 60)
-    is_bear = not is_bull and not is_sideway
-    if is_bear:
-        return []
-
-    # === Chuẩn hóa dữ liệu ===
-    df_day.loc[:, 'close_adj'] = df_day['close'] * df_day.get('adj_factor', 1)
-    df_filtered = df_day[df_day['volume_ma20'] > min_volume_ma20].copy()
-    df_filtered = df_filtered[df_filtered['volume'] > 300000]
-
-    df_filtered.loc[:, 'relative_strength'] = (
-        ((df_filtered['close_adj'] - df_filtered['sma_50']) / df_filtered['sma_50']) /
-        ((market_close - market_ma50) / market_ma50 + 1e-6)
-    )
-    df_filtered.loc[:, 'short_momentum'] = (df_filtered['close_adj'] - df_filtered['sma_5']) / df_filtered['sma_5']
-    df_filtered.loc[:, 'macd_histogram'] = df_filtered['macd'] - df_filtered['macd_signal']
+def apply_enhanced_screener_v12(df_day: pd.DataFrame, min_volume_ma20: int = 100000, max_candidates: int = 20, with_scores: bool = False, ctx: dict = None):
+    """Screener nâng cao v12: Tối ưu cho biến động và sideway từ 2023-2025.
+    with_scores=True → dict {ticker: score} (thứ tự giảm dần) thay vì list mã.
+    ctx: screener_context(...) đã tính sẵn (bỏ qua min_volume_ma20)."""
+    if ctx is None:
+        ctx = screener_context(df_day, min_volume_ma20)
+    if not ctx:
+        return {} if with_scores else []
+    is_bull, is_sideway, df_filtered = ctx['is_bull'], ctx['is_sideway'], ctx['df']
 
     # === Bull Market Strategy ===
     if is_bull:
-        df_filtered = df_filtered[
+        mask = (
             (df_filtered['close_adj'] > df_filtered['sma_200']) &
             (df_filtered['close_adj'] > df_filtered['sma_50']) &
             (df_filtered['sma_50'] > df_filtered['sma_200']) &
@@ -596,10 +659,10 @@ def apply_enhanced_screener_v12(df_day: pd.DataFrame, min_volume_ma20: int = 100
             (df_filtered['relative_strength'] > 1.05) &
             (df_filtered['short_momentum'] > 0.01) &
             (df_filtered['close_adj'] > df_filtered['sma_5'])
-        ]
-        if df_filtered.empty:
-            return []
-        df_filtered.loc[:, 'score'] = (
+        )
+        if not mask.any():
+            return {} if with_scores else []
+        score = (
             df_filtered['relative_strength'] * 0.35 +
             df_filtered['short_momentum'] * 0.25 +
             df_filtered['volume_spike'] * 0.25 +
@@ -608,7 +671,7 @@ def apply_enhanced_screener_v12(df_day: pd.DataFrame, min_volume_ma20: int = 100
 
     # === Sideway Market Strategy (Breakout-focused) ===
     elif is_sideway:
-        df_filtered = df_filtered[
+        mask = (
             (df_filtered['rsi_14'] > 48) & (df_filtered['rsi_14'] < 55) &
             (df_filtered['boll_width'] < 0.3) &
             (df_filtered['macd_histogram'] > 0) &
@@ -618,25 +681,24 @@ def apply_enhanced_screener_v12(df_day: pd.DataFrame, min_volume_ma20: int = 100
             (df_filtered['close_adj'] > df_filtered['sma_50'] * 0.95) &
             (df_filtered['close_adj'] > df_filtered['sma_200'] * 0.95) &
             (df_filtered['close_adj'] > df_filtered['sma_50'] + df_filtered['boll_width'] * df_filtered['sma_50'] * 0.75)
-        ]
-        if df_filtered.empty:
-            return []
+        )
+        if not mask.any():
+            return {} if with_scores else []
         max_candidates = max(5, int(max_candidates * 0.5))  # tập trung top picks
 
-        df_filtered.loc[:, 'boll_proximity'] = (
+        boll_proximity = (
             (df_filtered['close_adj'] - df_filtered['sma_50']) / (df_filtered['sma_50'] * df_filtered['boll_width'])
         )
 
-        df_filtered.loc[:, 'score'] = (
+        score = (
             df_filtered['volume_spike'] * 0.4 +
             df_filtered['macd_histogram'] * 0.3 +
             (55 - abs(df_filtered['rsi_14'] - 55)) * 0.2 +
-            df_filtered['boll_proximity'] * 0.1
+            boll_proximity * 0.1
         )
 
     # === Chọn top candidates ===
-    df_filtered = df_filtered.nlargest(max_candidates, 'score')
-    return df_filtered['ticker'].unique().tolist()
+    return _top_tickers(df_filtered, score, mask, max_candidates, with_scores)
 
 """## 2.2. Backtest"""
 
@@ -738,15 +800,14 @@ def backtest_engine_v12_profit_vault(
     print(f"Entry mode: {entry_mode}")
 
     # --- DATA PREPARATION ---
-    backtest_data = data.copy()
+    # Lọc khoảng backtest trước → chỉ một bản sao (thay vì copy toàn bộ rồi mới lọc)
+    backtest_data = data[
+        (data.index >= start_date_str) &
+        (data.index <= end_date_str)
+    ].copy()
     if 'adj_factor' in backtest_data.columns:
         backtest_data['close'] *= backtest_data['adj_factor']
 
-    backtest_data = backtest_data[
-        (backtest_data.index >= start_date_str) &
-        (backtest_data.index <= end_date_str)
-    ].copy()
-
     print(f"Data preparation completed in {time.time() - start_time:.2f}s")
 
     # Create pivot tables
@@ -771,6 +832,20 @@ def backtest_engine_v12_profit_vault(
     pivoted_sma_50 = pivot_tables.get('pivoted_sma_50')
     pivoted_macd = pivot_tables.get('pivoted_macd')
 
+    # Mảng (ngày × mã) căn theo trục pivoted_close — đầu vào cho exit engine
+    ticker_to_col = {t: j for j, t in enumerate(pivoted_close.columns)}
+    arr_close = _align_pivot(pivoted_close, pivoted_close)
+    arr_open = _align_pivot(pivoted_open, pivoted_close)
+    arr_high = _align_pivot(pivoted_high, pivoted_close)
+    arr_low = _align_pivot(pivoted_low, pivoted_close)
+    arr_volume = _align_pivot(pivoted_volume, pivoted_close)
+    arr_sma_5 = _align_pivot(pivoted_sma_5, pivoted_close)
+    arr_sma_50 = _align_pivot(pivoted_sma_50, pivoted_close)
+    arr_rsi = _align_pivot(pivoted_rsi, pivoted_close)
+    arr_mfi = _align_pivot(pivoted_mfi, pivoted_close)
+    arr_obv = _align_pivot(pivoted_obv, pivoted_close)
+    arr_boll_upper = _align_pivot(pivoted_boll_upper, pivoted_close)
+    arr_boll_lower = _align_pivot(pivoted_boll_lower, pivoted_close)
     # Pre-calculate market volatility
     vol_spike_series = calculate_market_volatility(backtest_data, vol_window)
 
@@ -780,11 +855,12 @@ def backtest_engine_v12_profit_vault(
     portfolio_history = []
     current_portfolio = {}
     pending_settlements = deque()  # Chỉ chứa tiền bán chờ thanh toán
-    trades = []
+    trades = TradeBuffer()  # sổ lệnh dạng cột (structured array)
 
     all_dates = pivoted_close.index.tolist()
     total_dates = len(all_dates)
     date_to_idx = {date: idx for idx, date in enumerate(all_dates)}
+    settle_dates = settlement_dates(all_dates, t_plus=2)  # T+2 theo phiên, tra theo chỉ số
     portfolio_values = np.zeros(total_dates)
     working_capital = base_capital  # Khởi tạo working_capital bằng base_capital
 
@@ -826,138 +902,84 @@ def backtest_engine_v12_profit_vault(
             market_adx = market_row['market_adx']
             market_boll_width = market_row['market_boll_width']
 
-        is_bull = (market_close > market_ma50) and (market_close > market_ma200) and (market_rsi > 50)
-        is_sideway = (market_adx < 20) and (market_boll_width < 0.4) and (40 <= market_rsi <= 60)
-        is_bear = (market_close < market_ma200) or (market_rsi < 30)
+        phase = market_phase_v12(market_close, market_ma50, market_ma200, market_rsi, market_adx, market_boll_width)
+        market_phase = phase.market_phase
+        position_multiplier = phase.position_multiplier  # Tăng trong bull, giảm trong sideway
+        max_hold_days = phase.max_hold_days  # Dynamic hold days
+        loss_exit_threshold = phase.loss_exit_threshold  # Nới lỏng trong bull, chặt trong sideway
+        atr_mult = phase.atr_mult  # Tăng ATR trong bull cho SL/TP rộng hơn
+        pyramid_limit_phase = phase.pyramid_limit_phase  # Tăng pyramid trong bull
 
-        market_phase = 'bull' if is_bull else 'sideway' if is_sideway else 'bear'
-        position_multiplier = 1.2 if is_bull else 0.5 if is_sideway else 0.0  # Tăng trong bull, giảm trong sideway
-        max_hold_days = 45 if is_bull else 20 if is_sideway else 15  # Dynamic hold days
-        loss_exit_threshold = -0.10 if is_bull else -0.03 if is_sideway else -0.12  # Nới lỏng trong bull, chặt trong sideway
-        atr_mult = 2.0 if is_bull else 1.2 if is_sideway else 2.2  # Tăng ATR trong bull cho SL/TP rộng hơn
-        pyramid_limit_phase = 2 if is_bull else 1  # Tăng pyramid trong bull
-
-        # 3. Portfolio management with enhanced exit logic
+        # 3. Portfolio management — exit engine dạng vector (round_2/exit_engine.py)
         positions_to_remove = []
-        for ticker, pos in current_portfolio.items():
-            if ticker not in pivoted_close.columns:
-                continue
-
-            open_val = pivoted_open.at[date, ticker]
-            high_val = pivoted_high.at[date, ticker]
-            low_val = pivoted_low.at[date, ticker]
-            close_val = pivoted_close.at[date, ticker]
-            rsi_val = pivoted_rsi.at[date, ticker] if pivoted_rsi is not None else None
-            mfi_val = pivoted_mfi.at[date, ticker] if pivoted_mfi is not None else None
-            obv_val = pivoted_obv.at[date, ticker] if pivoted_obv is not None else None
-            sma5_val = pivoted_sma_5.at[date, ticker] if pivoted_sma_5 is not None else close_val
-            sma50_val = pivoted_sma_50.at[date, ticker] if pivoted_sma_50 is not None else close_val
-
-            if pd.isna(close_val):
-                continue
-
-            holding_days = (date - pos['entry_date']).days
-            tp = pos['tp']
-            sl = pos['sl']
-            trailing_sl = pos.get('trailing_sl', pos['entry_price'] * (1 - trailing_stop_pct))
-            highest_price = pos.get('highest_price', pos['entry_price'])
-
-            # Update trailing stop
-            if high_val > highest_price:
-                highest_price = high_val
-                trailing_sl = highest_price * (1 - trailing_stop_pct)
-                pos['highest_price'] = highest_price
-                pos['trailing_sl'] = trailing_sl
-
-            # Adjust TP/SL for sideway
-            if market_phase == 'sideway' and pivoted_boll_upper is not None and pivoted_boll_lower is not None:
-                tp = min(tp, pivoted_boll_upper.at[date, ticker]) if not pd.isna(pivoted_boll_upper.at[date, ticker]) else tp
-                sl = max(sl, pivoted_boll_lower.at[date, ticker]) if not pd.isna(pivoted_boll_lower.at[date, ticker]) else sl
-
-            trigger_tp = False
-            trigger_sl = False
-            exit_price = None
-            partial_exit = False
-            exit_type = "Normal"
-
-            # Check gap at open
-            if not pd.isna(open_val) and holding_days >= min_holding_days:
-                if open_val >= tp:
-                    trigger_tp = True
-                    exit_price = open_val
-                    partial_exit = True
-                    exit_type = "Pyramid" if pos.get('pyramid_count', 0) > 0 else "Normal"
-                elif open_val <= min(sl, trailing_sl):
-                    trigger_sl = True
-                    exit_price = open_val
-                    exit_type = "Normal"
-
-            # Check intraday
-            if exit_price is None and holding_days >= min_holding_days:
-                if high_val >= tp:
-                    trigger_tp = True
-                    exit_price = close_val
-                    partial_exit = True
-                    exit_type = "Pyramid" if pos.get('pyramid_count', 0) > 0 else "Normal"
-                elif low_val <= min(sl, trailing_sl):
-                    trigger_sl = True
-                    exit_price = close_val
-                    exit_type = "Normal"
-
-            # Check weakness and market conditions
-            prev_obv = pivoted_obv.at[all_dates[max(0, i-1)], ticker] if i > 0 and pivoted_obv is not None else obv_val
-            is_weak = (
-                rsi_val is not None and rsi_val < 30 and
-                mfi_val is not None and mfi_val < 20 and
-                obv_val is not None and obv_val < prev_obv
+        held = [t for t in current_portfolio if t in ticker_to_col]
+        if held:
+            cols = np.fromiter((ticker_to_col[t] for t in held), dtype=np.int64, count=len(held))
+            held_pos = [current_portfolio[t] for t in held]
+            batch = evaluate_exits_v12(
+                entry_price=[p['entry_price'] for p in held_pos],
+                tp=[p['tp'] for p in held_pos],
+                sl=[p['sl'] for p in held_pos],
+                trailing_sl=[p.get('trailing_sl', p['entry_price'] * (1 - trailing_stop_pct)) for p in held_pos],
+                highest=[p.get('highest_price', p['entry_price']) for p in held_pos],
+                holding_days=[(date - p['entry_date']).days for p in held_pos],
+                pyramid_count=[p.get('pyramid_count', 0) for p in held_pos],
+                shares=[p['shares'] for p in held_pos],
+                open_=arr_open[i, cols],
+                high=arr_high[i, cols],
+                low=arr_low[i, cols],
+                close=arr_close[i, cols],
+                market_phase=market_phase,
+                max_hold_days=max_hold_days,
+                loss_exit_threshold=loss_exit_threshold,
+                pyramid_limit_phase=pyramid_limit_phase,
+                trailing_stop_pct=trailing_stop_pct,
+                partial_profit_pct=partial_profit_pct,
+                min_holding_days=min_holding_days,
+                lot_size=lot_size,
+                sma5=_take_row(arr_sma_5, i, cols),
+                sma50=_take_row(arr_sma_50, i, cols),
+                rsi=_take_row(arr_rsi, i, cols),
+                mfi=_take_row(arr_mfi, i, cols),
+                obv=_take_row(arr_obv, i, cols),
+                prev_obv=_take_row(arr_obv, max(0, i - 1), cols),
+                boll_upper=_take_row(arr_boll_upper, i, cols),
+                boll_lower=_take_row(arr_boll_lower, i, cols),
             )
-            current_profit_pct = (close_val / pos['entry_price'] - 1)
-            trigger_end = (holding_days >= max_hold_days or is_weak or
-                          (market_phase == 'bear' and current_profit_pct < loss_exit_threshold) or
-                          (market_phase == 'sideway' and current_profit_pct < -0.03))
-            extended_hold = holding_days >= 50 and current_profit_pct > 0.08 and market_phase == 'bull'
-            if extended_hold:
-                trigger_end = False
-
-            # Thêm check momentum cho early exit trong sideway
-            if market_phase == 'sideway' and sma5_val < sma50_val and current_profit_pct < 0.01:
-                trigger_end = True
-                exit_type = "Momentum Loss"
-
-            # Pyramiding Logic (chỉ áp dụng trong bull market)
-            pyramid_triggered = False
-            if (not trigger_tp and not trigger_sl and not trigger_end and
-                market_phase == 'bull' and
-                holding_days >= 2 and holding_days <= 10 and
-                current_profit_pct > 0.05 and current_profit_pct < 0.10 and
-                pos.get('pyramid_count', 0) < pyramid_limit_phase):  # Sử dụng pyramid_limit_phase
-
-                add_shares = int(pos['shares'] * 0.2 / lot_size) * lot_size
-                add_cost = add_shares * close_val * (1 + commission_buy)
-                if working_capital >= add_cost:
-                    new_avg_cost = (pos['shares'] * pos['avg_cost'] + add_shares * close_val) / (pos['shares'] + add_shares)
-                    pos['avg_cost'] = new_avg_cost
-                    pos['shares'] += add_shares
-                    pos['pyramid_count'] = pos.get('pyramid_count', 0) + 1
-                    pos['tp'] = close_val * 1.12
-                    pos['trailing_sl'] = close_val * (1 - trailing_stop_pct * 0.7)
-                    pyramid_triggered = True
-                    working_capital -= add_cost  # Trừ trực tiếp từ working_capital
-                    print(f"Pyramiding triggered for {ticker}: Added {add_shares} shares at {close_val}")
-
-            # Exit logic
-            if (trigger_tp or trigger_sl or trigger_end) and holding_days >= min_holding_days and not pyramid_triggered:
-                if trigger_end and exit_price is None:
-                    exit_price = close_val
-                    exit_type = "Pyramid" if pos.get('pyramid_count', 0) > 0 else "Normal"
-
-                volume_today = pivoted_volume.at[date, ticker] if ticker in pivoted_volume.columns else 0
-                shares = pos['shares']
-                shares_to_sell = int(shares * partial_profit_pct / lot_size) * lot_size if trigger_tp and partial_exit else shares
+            for k in np.flatnonzero(batch.valid):
+                held_pos[k]['highest_price'] = batch.highest[k]
+                held_pos[k]['trailing_sl'] = batch.trailing_sl[k]
+
+            # Chỉ các vị thế có tín hiệu mới đi qua phần tuần tự (vốn, thanh khoản, T+2)
+            for k in np.flatnonzero(batch.pyramid | batch.exit):
+                ticker = held[k]
+                pos = held_pos[k]
+                col = cols[k]
+                close_val = arr_close[i, col]
+
+                # Pyramiding Logic (chỉ áp dụng trong bull market)
+                if batch.pyramid[k]:
+                    add_shares = int(pos['shares'] * 0.2 / lot_size) * lot_size
+                    add_cost = add_shares * close_val * (1 + commission_buy)
+                    if working_capital >= add_cost:
+                        new_avg_cost = (pos['shares'] * pos['avg_cost'] + add_shares * close_val) / (pos['shares'] + add_shares)
+                        pos['avg_cost'] = new_avg_cost
+                        pos['shares'] += add_shares
+                        pos['pyramid_count'] = pos.get('pyramid_count', 0) + 1
+                        pos['tp'] = close_val * 1.12
+                        pos['trailing_sl'] = close_val * (1 - trailing_stop_pct * 0.7)
+                        working_capital -= add_cost  # Trừ trực tiếp từ working_capital
+                        print(f"Pyramiding triggered for {ticker}: Added {add_shares} shares at {close_val}")
+                    continue
+
+                # Exit logic
+                exit_type = batch.exit_type_label(k)
+                volume_today = arr_volume[i, col] if arr_volume is not None else 0
+                shares_to_sell = int(batch.shares_to_sell[k])
                 can_sell_today = (not pd.isna(volume_today) and volume_today > 0 and
                                 shares_to_sell <= volume_today * liquidity_threshold)
 
-                use_exit_price = exit_price
+                use_exit_price = batch.exit_price[k]
                 exit_date = date
                 if not can_sell_today:
                     next_idx = i
@@ -965,7 +987,7 @@ def backtest_engine_v12_profit_vault(
                         next_idx += 1
                         next_date = all_dates[next_idx]
                         if (next_date - pos['entry_date']).days >= min_holding_days:
-                            next_open_price = pivoted_open.at[next_date, ticker]
+                            next_open_price = arr_open[next_idx, col]
                             if not pd.isna(next_open_price):
                                 use_exit_price = next_open_price
                                 exit_date = next_date
@@ -979,8 +1001,7 @@ def backtest_engine_v12_profit_vault(
                 net_proceeds = gross_proceeds - (gross_proceeds * (commission_sell_base + tax_sell))
                 if net_proceeds <= 0:  # Không ghi nhận nếu âm
                     continue
-                settlement_idx = date_to_idx.get(exit_date, i) + 2
-                settlement_date = all_dates[min(settlement_idx, total_dates - 1)]
+                settlement_date = settle_dates[date_to_idx.get(exit_date, i)]
                 pending_settlements.append((settlement_date, net_proceeds))
 
                 holding_days_exit = (exit_date - pos['entry_date']).days
@@ -989,22 +1010,21 @@ def backtest_engine_v12_profit_vault(
 
                 # Record trade
                 profit = net_proceeds - (shares_to_sell * pos['avg_cost'] * (1 + commission_buy))
-                trades.append({
-                    'ticker': ticker,
-                    'entry_date': pos['entry_date'],
-                    'exit_date': exit_date,
-                    'entry_price': pos['entry_price'],
-                    'exit_price': use_exit_price,
-                    'shares': shares_to_sell,
-                    'profit': profit,
-                    'holding_days': holding_days_exit,
-                    'exit_type': exit_type
-                })
-
-                if partial_exit and trigger_tp:
+                trades.append(
+                    ticker=ticker,
+                    entry_date=pos['entry_date'],
+                    exit_date=exit_date,
+                    entry_price=pos['entry_price'],
+                    exit_price=use_exit_price,
+                    shares=shares_to_sell,
+                    profit=profit,
+                    holding_days=holding_days_exit,
+                    exit_type=exit_type,
+                )
+
+                if batch.partial[k]:
                     pos['shares'] -= shares_to_sell
-                    pos['tp'] = use_exit_price * 1.15
-                    pos['sl'] = max(pos['sl'], use_exit_price * (1 - trailing_stop_pct * 1.2))
+                    pos['tp'], pos['sl'] = apply_partial_exit(pos['tp'], pos['sl'], use_exit_price, trailing_stop_pct)
                 else:
                     positions_to_remove.append(ticker)
 
@@ -1082,7 +1102,7 @@ def backtest_engine_v12_profit_vault(
                         continue
 
                     working_capital -= actual_cost  # Trừ chi phí mua trực tiếp từ working_capital
-                    settlement_date = date + pd.Timedelta(days=2)  # Dùng để tính toán, nhưng không thêm vào pending_settlements
+                    settlement_date = settle_dates[i]  # Dùng để tính toán, nhưng không thêm vào pending_settlements
 
                     current_portfolio[ticker] = {
                         'shares': actual_shares_to_buy,
@@ -1126,7 +1146,7 @@ def backtest_engine_v12_profit_vault(
 
     try:
         log_portfolio_to_csv(portfolio_history)
-        log_trades_to_csv(trades)
+        log_trades_to_parquet(trades)
         log_drawdown_to_csv(df_history)
     except Exception as e:
         print(f"Warning: Logging failed - {e}")
@@ -1183,15 +1203,14 @@ def backtest_engine_v12(
     print(f"Entry mode: {entry_mode}")
 
     # --- DATA PREPARATION ---
-    backtest_data = data.copy()
+    # Lọc khoảng backtest trước → chỉ một bản sao (thay vì copy toàn bộ rồi mới lọc)
+    backtest_data = data[
+        (data.index >= start_date_str) &
+        (data.index <= end_date_str)
+    ].copy()
     if 'adj_factor' in backtest_data.columns:
         backtest_data['close'] *= backtest_data['adj_factor']
 
-    backtest_data = backtest_data[
-        (backtest_data.index >= start_date_str) &
-        (backtest_data.index <= end_date_str)
-    ].copy()
-
     print(f"Data preparation completed in {time.time() - start_time:.2f}s")
 
     # Create pivot tables
@@ -1216,6 +1235,20 @@ def backtest_engine_v12(
     pivoted_sma_50 = pivot_tables.get('pivoted_sma_50')
     pivoted_macd = pivot_tables.get('pivoted_macd')
 
+    # Mảng (ngày × mã) căn theo trục pivoted_close — đầu vào cho exit engine
+    ticker_to_col = {t: j for j, t in enumerate(pivoted_close.columns)}
+    arr_close = _align_pivot(pivoted_close, pivoted_close)
+    arr_open = _align_pivot(pivoted_open, pivoted_close)
+    arr_high = _align_pivot(pivoted_high, pivoted_close)
+    arr_low = _align_pivot(pivoted_low, pivoted_close)
+    arr_volume = _align_pivot(pivoted_volume, pivoted_close)
+    arr_sma_5 = _align_pivot(pivoted_sma_5, pivoted_close)
+    arr_sma_50 = _align_pivot(pivoted_sma_50, pivoted_close)
+    arr_rsi = _align_pivot(pivoted_rsi, pivoted_close)
+    arr_mfi = _align_pivot(pivoted_mfi, pivoted_close)
+    arr_obv = _align_pivot(pivoted_obv, pivoted_close)
+    arr_boll_upper = _align_pivot(pivoted_boll_upper, pivoted_close)
+    arr_boll_lower = _align_pivot(pivoted_boll_lower, pivoted_close)
     # Pre-calculate market volatility
     vol_spike_series = calculate_market_volatility(backtest_data, vol_window)
 
@@ -1226,11 +1259,12 @@ def backtest_engine_v12(
     portfolio_history = []
     current_portfolio = {}
     pending_settlements = deque()  # Chỉ chứa tiền bán chờ thanh toán
-    trades = []
+    trades = TradeBuffer()  # sổ lệnh dạng cột (structured array)
 
     all_dates = pivoted_close.index.tolist()
     total_dates = len(all_dates)
     date_to_idx = {date: idx for idx, date in enumerate(all_dates)}
+    settle_dates = settlement_dates(all_dates, t_plus=2)  # T+2 theo phiên, tra theo chỉ số
     portfolio_values = np.zeros(total_dates)
 
     print(f"Starting main backtest loop for {total_dates} dates...")
@@ -1263,138 +1297,84 @@ def backtest_engine_v12(
             market_adx = market_row['market_adx']
             market_boll_width = market_row['market_boll_width']
 
-        is_bull = (market_close > market_ma50) and (market_close > market_ma200) and (market_rsi > 50)
-        is_sideway = (market_adx < 20) and (market_boll_width < 0.4) and (40 <= market_rsi <= 60)
-        is_bear = (market_close < market_ma200) or (market_rsi < 30)
+        phase = market_phase_v12(market_close, market_ma50, market_ma200, market_rsi, market_adx, market_boll_width)
+        market_phase = phase.market_phase
+        position_multiplier = phase.position_multiplier  # Tăng trong bull, giảm trong sideway
+        max_hold_days = phase.max_hold_days  # Dynamic hold days
+        loss_exit_threshold = phase.loss_exit_threshold  # Nới lỏng trong bull, chặt trong sideway
+        atr_mult = phase.atr_mult  # Tăng ATR trong bull cho SL/TP rộng hơn
+        pyramid_limit_phase = phase.pyramid_limit_phase  # Tăng pyramid trong bull
 
-        market_phase = 'bull' if is_bull else 'sideway' if is_sideway else 'bear'
-        position_multiplier = 1.2 if is_bull else 0.5 if is_sideway else 0.0  # Tăng trong bull, giảm trong sideway
-        max_hold_days = 45 if is_bull else 20 if is_sideway else 15  # Dynamic hold days
-        loss_exit_threshold = -0.10 if is_bull else -0.03 if is_sideway else -0.12  # Nới lỏng trong bull, chặt trong sideway
-        atr_mult = 2.0 if is_bull else 1.2 if is_sideway else 2.2  # Tăng ATR trong bull cho SL/TP rộng hơn
-        pyramid_limit_phase = 2 if is_bull else 1  # Tăng pyramid trong bull
-
-        # 3. Portfolio management with enhanced exit logic
+        # 3. Portfolio management — exit engine dạng vector (round_2/exit_engine.py)
         positions_to_remove = []
-        for ticker, pos in current_portfolio.items():
-            if ticker not in pivoted_close.columns:
-                continue
-
-            open_val = pivoted_open.at[date, ticker]
-            high_val = pivoted_high.at[date, ticker]
-            low_val = pivoted_low.at[date, ticker]
-            close_val = pivoted_close.at[date, ticker]
-            rsi_val = pivoted_rsi.at[date, ticker] if pivoted_rsi is not None else None
-            mfi_val = pivoted_mfi.at[date, ticker] if pivoted_mfi is not None else None
-            obv_val = pivoted_obv.at[date, ticker] if pivoted_obv is not None else None
-            sma5_val = pivoted_sma_5.at[date, ticker] if pivoted_sma_5 is not None else close_val
-            sma50_val = pivoted_sma_50.at[date, ticker] if pivoted_sma_50 is not None else close_val
-
-            if pd.isna(close_val):
-                continue
-
-            holding_days = (date - pos['entry_date']).days
-            tp = pos['tp']
-            sl = pos['sl']
-            trailing_sl = pos.get('trailing_sl', pos['entry_price'] * (1 - trailing_stop_pct))
-            highest_price = pos.get('highest_price', pos['entry_price'])
-
-            # Update trailing stop
-            if high_val > highest_price:
-                highest_price = high_val
-                trailing_sl = highest_price * (1 - trailing_stop_pct)
-                pos['highest_price'] = highest_price
-                pos['trailing_sl'] = trailing_sl
-
-            # Adjust TP/SL for sideway
-            if market_phase == 'sideway' and pivoted_boll_upper is not None and pivoted_boll_lower is not None:
-                tp = min(tp, pivoted_boll_upper.at[date, ticker]) if not pd.isna(pivoted_boll_upper.at[date, ticker]) else tp
-                sl = max(sl, pivoted_boll_lower.at[date, ticker]) if not pd.isna(pivoted_boll_lower.at[date, ticker]) else sl
-
-            trigger_tp = False
-            trigger_sl = False
-            exit_price = None
-            partial_exit = False
-            exit_type = "Normal"
-
-            # Check gap at open
-            if not pd.isna(open_val) and holding_days >= min_holding_days:
-                if open_val >= tp:
-                    trigger_tp = True
-                    exit_price = open_val
-                    partial_exit = True
-                    exit_type = "Pyramid" if pos.get('pyramid_count', 0) > 0 else "Normal"
-                elif open_val <= min(sl, trailing_sl):
-                    trigger_sl = True
-                    exit_price = open_val
-                    exit_type = "Normal"
-
-            # Check intraday
-            if exit_price is None and holding_days >= min_holding_days:
-                if high_val >= tp:
-                    trigger_tp = True
-                    exit_price = close_val
-                    partial_exit = True
-                    exit_type = "Pyramid" if pos.get('pyramid_count', 0) > 0 else "Normal"
-                elif low_val <= min(sl, trailing_sl):
-                    trigger_sl = True
-                    exit_price = close_val
-                    exit_type = "Normal"
-
-            # Check weakness and market conditions
-            prev_obv = pivoted_obv.at[all_dates[max(0, i-1)], ticker] if i > 0 and pivoted_obv is not None else obv_val
-            is_weak = (
-                rsi_val is not None and rsi_val < 30 and
-                mfi_val is not None and mfi_val < 20 and
-                obv_val is not None and obv_val < prev_obv
+        held = [t for t in current_portfolio if t in ticker_to_col]
+        if held:
+            cols = np.fromiter((ticker_to_col[t] for t in held), dtype=np.int64, count=len(held))
+            held_pos = [current_portfolio[t] for t in held]
+            batch = evaluate_exits_v12(
+                entry_price=[p['entry_price'] for p in held_pos],
+                tp=[p['tp'] for p in held_pos],
+                sl=[p['sl'] for p in held_pos],
+                trailing_sl=[p.get('trailing_sl', p['entry_price'] * (1 - trailing_stop_pct)) for p in held_pos],
+                highest=[p.get('highest_price', p['entry_price']) for p in held_pos],
+                holding_days=[(date - p['entry_date']).days for p in held_pos],
+                pyramid_count=[p.get('pyramid_count', 0) for p in held_pos],
+                shares=[p['shares'] for p in held_pos],
+                open_=arr_open[i, cols],
+                high=arr_high[i, cols],
+                low=arr_low[i, cols],
+                close=arr_close[i, cols],
+                market_phase=market_phase,
+                max_hold_days=max_hold_days,
+                loss_exit_threshold=loss_exit_threshold,
+                pyramid_limit_phase=pyramid_limit_phase,
+                trailing_stop_pct=trailing_stop_pct,
+                partial_profit_pct=partial_profit_pct,
+                min_holding_days=min_holding_days,
+                lot_size=lot_size,
+                sma5=_take_row(arr_sma_5, i, cols),
+                sma50=_take_row(arr_sma_50, i, cols),
+                rsi=_take_row(arr_rsi, i, cols),
+                mfi=_take_row(arr_mfi, i, cols),
+                obv=_take_row(arr_obv, i, cols),
+                prev_obv=_take_row(arr_obv, max(0, i - 1), cols),
+                boll_upper=_take_row(arr_boll_upper, i, cols),
+                boll_lower=_take_row(arr_boll_lower, i, cols),
             )
-            current_profit_pct = (close_val / pos['entry_price'] - 1)
-            trigger_end = (holding_days >= max_hold_days or is_weak or
-                          (market_phase == 'bear' and current_profit_pct < loss_exit_threshold) or
-                          (market_phase == 'sideway' and current_profit_pct < -0.03))
-            extended_hold = holding_days >= 50 and current_profit_pct > 0.08 and market_phase == 'bull'
-            if extended_hold:
-                trigger_end = False
-
-            # Thêm check momentum cho early exit trong sideway
-            if market_phase == 'sideway' and sma5_val < sma50_val and current_profit_pct < 0.01:
-                trigger_end = True
-                exit_type = "Momentum Loss"
-
-            # Pyramiding Logic (chỉ áp dụng trong bull market)
-            pyramid_triggered = False
-            if (not trigger_tp and not trigger_sl and not trigger_end and
-                market_phase == 'bull' and
-                holding_days >= 2 and holding_days <= 10 and
-                current_profit_pct > 0.05 and current_profit_pct < 0.10 and
-                pos.get('pyramid_count', 0) < pyramid_limit_phase):  # Sử dụng pyramid_limit_phase
-
-                add_shares = int(pos['shares'] * 0.2 / lot_size) * lot_size
-                add_cost = add_shares * close_val * (1 + commission_buy)
-                if working_capital >= add_cost:
-                    new_avg_cost = (pos['shares'] * pos['avg_cost'] + add_shares * close_val) / (pos['shares'] + add_shares)
-                    pos['avg_cost'] = new_avg_cost
-                    pos['shares'] += add_shares
-                    pos['pyramid_count'] = pos.get('pyramid_count', 0) + 1
-                    pos['tp'] = close_val * 1.12
-                    pos['trailing_sl'] = close_val * (1 - trailing_stop_pct * 0.7)
-                    pyramid_triggered = True
-                    working_capital -= add_cost  # Trừ trực tiếp từ working_capital
-                    print(f"Pyramiding triggered for {ticker}: Added {add_shares} shares at {close_val}")
-
-            # Exit logic
-            if (trigger_tp or trigger_sl or trigger_end) and holding_days >= min_holding_days and not pyramid_triggered:
-                if trigger_end and exit_price is None:
-                    exit_price = close_val
-                    exit_type = "Pyramid" if pos.get('pyramid_count', 0) > 0 else "Normal"
-
-                volume_today = pivoted_volume.at[date, ticker] if ticker in pivoted_volume.columns else 0
-                shares = pos['shares']
-                shares_to_sell = int(shares * partial_profit_pct / lot_size) * lot_size if trigger_tp and partial_exit else shares
+            for k in np.flatnonzero(batch.valid):
+                held_pos[k]['highest_price'] = batch.highest[k]
+                held_pos[k]['trailing_sl'] = batch.trailing_sl[k]
+
+            # Chỉ các vị thế có tín hiệu mới đi qua phần tuần tự (vốn, thanh khoản, T+2)
+            for k in np.flatnonzero(batch.pyramid | batch.exit):
+                ticker = held[k]
+                pos = held_pos[k]
+                col = cols[k]
+                close_val = arr_close[i, col]
+
+                # Pyramiding Logic (chỉ áp dụng trong bull market)
+                if batch.pyramid[k]:
+                    add_shares = int(pos['shares'] * 0.2 / lot_size) * lot_size
+                    add_cost = add_shares * close_val * (1 + commission_buy)
+                    if working_capital >= add_cost:
+                        new_avg_cost = (pos['shares'] * pos['avg_cost'] + add_shares * close_val) / (pos['shares'] + add_shares)
+                        pos['avg_cost'] = new_avg_cost
+                        pos['shares'] += add_shares
+                        pos['pyramid_count'] = pos.get('pyramid_count', 0) + 1
+                        pos['tp'] = close_val * 1.12
+                        pos['trailing_sl'] = close_val * (1 - trailing_stop_pct * 0.7)
+                        working_capital -= add_cost  # Trừ trực tiếp từ working_capital
+                        print(f"Pyramiding triggered for {ticker}: Added {add_shares} shares at {close_val}")
+                    continue
+
+                # Exit logic
+                exit_type = batch.exit_type_label(k)
+                volume_today = arr_volume[i, col] if arr_volume is not None else 0
+                shares_to_sell = int(batch.shares_to_sell[k])
                 can_sell_today = (not pd.isna(volume_today) and volume_today > 0 and
                                 shares_to_sell <= volume_today * liquidity_threshold)
 
-                use_exit_price = exit_price
+                use_exit_price = batch.exit_price[k]
                 exit_date = date
                 if not can_sell_today:
                     next_idx = i
@@ -1402,7 +1382,7 @@ def backtest_engine_v12(
                         next_idx += 1
                         next_date = all_dates[next_idx]
                         if (next_date - pos['entry_date']).days >= min_holding_days:
-                            next_open_price = pivoted_open.at[next_date, ticker]
+                            next_open_price = arr_open[next_idx, col]
                             if not pd.isna(next_open_price):
                                 use_exit_price = next_open_price
                                 exit_date = next_date
@@ -1416,8 +1396,7 @@ def backtest_engine_v12(
                 net_proceeds = gross_proceeds - (gross_proceeds * (commission_sell_base + tax_sell))
                 if net_proceeds <= 0:  # Không ghi nhận nếu âm
                     continue
-                settlement_idx = date_to_idx.get(exit_date, i) + 2
-                settlement_date = all_dates[min(settlement_idx, total_dates - 1)]
+                settlement_date = settle_dates[date_to_idx.get(exit_date, i)]
                 pending_settlements.append((settlement_date, net_proceeds))
 
                 holding_days_exit = (exit_date - pos['entry_date']).days
@@ -1426,22 +1405,21 @@ def backtest_engine_v12(
 
                 # Record trade
                 profit = net_proceeds - (shares_to_sell * pos['avg_cost'] * (1 + commission_buy))
-                trades.append({
-                    'ticker': ticker,
-                    'entry_date': pos['entry_date'],
-                    'exit_date': exit_date,
-                    'entry_price': pos['entry_price'],
-                    'exit_price': use_exit_price,
-                    'shares': shares_to_sell,
-                    'profit': profit,
-                    'holding_days': holding_days_exit,
-                    'exit_type': exit_type
-                })
-
-                if partial_exit and trigger_tp:
+                trades.append(
+                    ticker=ticker,
+                    entry_date=pos['entry_date'],
+                    exit_date=exit_date,
+                    entry_price=pos['entry_price'],
+                    exit_price=use_exit_price,
+                    shares=shares_to_sell,
+                    profit=profit,
+                    holding_days=holding_days_exit,
+                    exit_type=exit_type,
+                )
+
+                if batch.partial[k]:
                     pos['shares'] -= shares_to_sell
-                    pos['tp'] = use_exit_price * 1.15
-                    pos['sl'] = max(pos['sl'], use_exit_price * (1 - trailing_stop_pct * 1.2))
+                    pos['tp'], pos['sl'] = apply_partial_exit(pos['tp'], pos['sl'], use_exit_price, trailing_stop_pct)
                 else:
                     positions_to_remove.append(ticker)
 
@@ -1508,7 +1486,7 @@ def backtest_engine_v12(
                         continue
 
                     working_capital -= actual_cost  # Trừ chi phí mua trực tiếp từ working_capital
-                    settlement_date = date + pd.Timedelta(days=2)  # Dùng để tính toán, nhưng không thêm vào pending_settlements
+                    settlement_date = settle_dates[i]  # Dùng để tính toán, nhưng không thêm vào pending_settlements
 
                     current_portfolio[ticker] = {
                         'shares': actual_shares_to_buy,
@@ -1552,7 +1530,7 @@ def backtest_engine_v12(
 
     try:
         log_portfolio_to_csv(portfolio_history)
-        log_trades_to_csv(trades)
+        log_trades_to_parquet(trades)
         log_drawdown_to_csv(df_history)
     except Exception as e:
         print(f"Warning: Logging failed - {e}")
@@ -1580,322 +1558,447 @@ def backtest_engine_v12(
 
     return df_history, enhanced_metrics, trades
 
-"""# 3. test"""
+def screener_signal_matrix(backtest_data, screener_func, min_volume_ma20, dates, tickers):
+    """
+    Chạy screener một lần cho mỗi phiên → signal_rank (len(dates) × len(tickers), int32):
+    thứ tự ứng viên như phần mua của backtest_engine_v12 (dòng dữ liệu trong ngày, hoặc theo cột
+    'score' giảm dần nếu có), -1 = không được chọn. Dùng lại được giữa các lần chạy cùng dữ liệu.
+    """
+    date_to_idx = {d: i for i, d in enumerate(dates)}
+    ticker_to_col = {t: j for j, t in enumerate(tickers)}
+    rank = np.full((len(dates), len(tickers)), -1, dtype=np.int32)
+    for date, day in backtest_data.groupby(level=0, sort=False):
+        i = date_to_idx.get(date)
+        if i is None:
+            continue
+        watchlist = screener_func(day, min_volume_ma20)
+        if not watchlist:
+            continue
+        candidates = day[day['ticker'].isin(watchlist)]
+        if len(watchlist) > 1 and 'score' in candidates.columns:
+            candidates = candidates.sort_values('score', ascending=False)
+        r = 0
+        for t in candidates['ticker']:
+            j = ticker_to_col.get(t)
+            if j is not None and rank[i, j] < 0:
+                rank[i, j] = r
+                r += 1
+    return rank
+
+def prepare_kernel_inputs(data, screener_func, start_date_str, end_date_str, min_volume_ma20=200000, signal_rank=None):
+    """
+    Dựng KernelInputs (round_2/portfolio_kernel.py) một lần: lọc khoảng backtest, pivot (ngày × mã),
+    pha thị trường theo ngày, T+2 và signal_rank của screener. Dùng chung cho backtest_engine_v12_numba
+    và các lần chạy lặp (round_2/robustness.py). Giả định mỗi (ngày, mã) một dòng — như các pivot.
+    """
+    backtest_data = data[
+        (data.index >= start_date_str) &
+        (data.index <= end_date_str)
+    ].copy()
+    if 'adj_factor' in backtest_data.columns:
+        backtest_data['close'] *= backtest_data['adj_factor']
 
-# ===================================================================
-# 3. TẢI DỮ LIỆU
-# ===================================================================
-if not os.path.exists(DATA_FILE_PATH):
-    print(f"Lỗi: Không tìm thấy file dữ liệu '{DATA_FILE_PATH}'.")
-else:
-    df = pd.read_parquet(DATA_FILE_PATH)
-    if 'time' in df.columns:
-        df['time'] = pd.to_datetime(df['time'])
-        df = df.set_index('time').sort_index()
+    pivot_tables = create_pivot_tables_batch(backtest_data)
+    pivoted_close = pivot_tables.get('pivoted_close')
+
+    def _arr(name):
+        return _align_pivot(pivot_tables.get(name), pivoted_close)
 
-    print(f"Tải dữ liệu thành công. Dữ liệu kéo dài từ {df.index.min().date()} đến {df.index.max().date()}.")
-    print(f"Tổng số bản ghi: {len(df):,}")
+    all_dates = pivoted_close.index.tolist()
+    tickers = pivoted_close.columns.tolist()
+
+    # Pha thị trường theo ngày (dòng đầu tiên của mỗi phiên, như backtest_data.loc[date].iloc[0])
+    market_rows = backtest_data[~backtest_data.index.duplicated(keep='first')].reindex(pivoted_close.index)
+    phases = [
+        market_phase_v12(*row) for row in market_rows[
+            ['market_close', 'market_MA50', 'market_MA200', 'market_rsi', 'market_adx', 'market_boll_width']
+        ].itertuples(index=False, name=None)
+    ]
 
-"""# 3.5. test"""
+    if signal_rank is None:
+        signal_start = time.time()
+        signal_rank = screener_signal_matrix(backtest_data, screener_func, min_volume_ma20, all_dates, tickers)
+        print(f"Screener signals computed in {time.time() - signal_start:.2f}s")
+    elif signal_rank.shape != pivoted_close.shape:
+        raise ValueError(f"signal_rank {signal_rank.shape} không khớp (ngày × mã) {pivoted_close.shape}")
+
+    return KernelInputs(
+        tickers=[str(t) for t in tickers],
+        dates_ns=pivoted_close.index.values.astype('datetime64[ns]').view(np.int64),
+        settle_ns=np.asarray(settlement_dates(all_dates, t_plus=2), dtype='datetime64[ns]').view(np.int64),
+        close=_arr('pivoted_close'),
+        open_=_arr('pivoted_open'),
+        high=_arr('pivoted_high'),
+        low=_arr('pivoted_low'),
+        volume=_arr('pivoted_volume'),
+        volume_ma20=_arr('pivoted_volume_ma20'),
+        atr14=_align_pivot(
+            backtest_data.pivot_table(index='time', columns='ticker', values='atr_14', fill_value=np.nan), pivoted_close
+        ),
+        signal_rank=np.ascontiguousarray(signal_rank, dtype=np.int32),
+        phase=np.array([PHASE_CODES[p.market_phase] for p in phases], dtype=np.int64),
+        position_multiplier=np.array([p.position_multiplier for p in phases], dtype=np.float64),
+        max_hold_days=np.array([p.max_hold_days for p in phases], dtype=np.int64),
+        loss_exit_threshold=np.array([p.loss_exit_threshold for p in phases], dtype=np.float64),
+        atr_mult=np.array([p.atr_mult for p in phases], dtype=np.float64),
+        pyramid_limit_phase=np.array([p.pyramid_limit_phase for p in phases], dtype=np.int64),
+        sma5=_arr('pivoted_sma_5'),
+        sma50=_arr('pivoted_sma_50'),
+        rsi=_arr('pivoted_rsi_14'),
+        mfi=_arr('pivoted_mfi_14'),
+        obv=_arr('pivoted_obv'),
+        boll_upper=_arr('pivoted_boll_upper'),
+        boll_lower=_arr('pivoted_boll_lower'),
+    )
 
-# ===================================================================
-# 4. THIẾT LẬP & THỰC THI BACKTEST
-# ===================================================================
-TEST_START_DATE = '2020-01-01'
-TEST_END_DATE = '2025-09-20'
-INITIAL_CAPITAL = 3_000_000_000
-BASE_CAPITAL = 3_000_000_000
-
-print(f"--- Bắt đầu chạy Backtest V9 từ {TEST_START_DATE} đến {TEST_END_DATE} ---")
-print("Đang tính toán Benchmark: VN-Index...")
-benchmark_performance = calculate_benchmark(df, TEST_START_DATE, TEST_END_DATE, INITIAL_CAPITAL)
-metrics_benchmark = calculate_metrics(benchmark_performance)
-
-print("Đang chạy Backtest V9...")
-# Tính toán trước các chỉ báo
-df = precompute_technical_indicators_vectorized(df)
-performance_v9, enhanced_metrics_v9, trades = backtest_engine_v12(
-    df,
-    apply_enhanced_screener_v12_sideway_soft,
-    TEST_START_DATE,
-    TEST_END_DATE,
-    INITIAL_CAPITAL,
-    BASE_CAPITAL,
+def backtest_engine_v12_numba(
+    data,
+    screener_func,
+    start_date_str,
+    end_date_str,
+    initial_capital,
+    base_capital,
     commission_buy=0.001,
     commission_sell_base=0.001,
     tax_sell=0.001,
-    trade_limit_pct=0.11,
-    max_investment_per_trade_pct=0.15,
+    trade_limit_pct=0.01,
+    max_investment_per_trade_pct=0.10,
     max_open_positions=8,
     min_volume_ma20=200000,
     lot_size=100,
     vol_window=20,
     liquidity_threshold=0.1,
     entry_mode='close',
-    atr_multiplier=1.5,
+    atr_multiplier=2.0,
     trailing_stop_pct=0.05,
     partial_profit_pct=0.4,
-    min_holding_days=3,
-    pyramid_limit=1
-)
+    min_holding_days=2,
+    pyramid_limit=1,
+    signal_rank=None,
+):
+    """
+    Cùng tham số và kết quả (history, metrics, trades) với backtest_engine_v12, nhưng vòng lặp ngày
+    chạy trong kernel numba (round_2/portfolio_kernel.py). Screener chỉ chạy ở bước tiền xử lý
+    (screener_signal_matrix); truyền sẵn signal_rank để bỏ qua bước đó khi quét tham số.
+    """
+    start_time = time.time()
+    print("Starting dynamic backtest V12 (numba kernel)...")
 
-"""# 4. Kết quả"""
+    inputs = prepare_kernel_inputs(data, screener_func, start_date_str, end_date_str, min_volume_ma20, signal_rank)
+    all_dates = pd.DatetimeIndex(inputs.dates_ns.view('datetime64[ns]')).tolist()
+    tickers = inputs.tickers
+    total_dates = len(all_dates)
 
-# ===================================================================
-# 5. PHÂN TÍCH KẾT QUẢ
-# ===================================================================
-if not enhanced_metrics_v9:
-    print("Không có giao dịch nào được thực hiện. Vui lòng kiểm tra dữ liệu hoặc điều kiện screener.")
-else:
-    metrics_df = pd.DataFrame({
-        'Strategy': ['VN-Index Benchmark', 'V9'],
-        'Total Return': [f"{metrics_benchmark['Total Return']:.2%}", f"{enhanced_metrics_v9['Total Return']:.2%}"],
-        'Sharpe Ratio': [f"{metrics_benchmark['Sharpe Ratio (Annualized)']:.2f}", f"{enhanced_metrics_v9['Sharpe Ratio']:.2f}"],
-        'Max Drawdown': [f"{metrics_benchmark['Max Drawdown']:.2%}", f"{enhanced_metrics_v9['Max Drawdown']:.2%}"],
-        'Calmar Ratio': [f"{metrics_benchmark['Calmar Ratio']:.2f}", f"{enhanced_metrics_v9['Calmar Ratio']:.2f}"],
-        'Win Rate': ['N/A', f"{enhanced_metrics_v9['Win Rate']:.2%}"],
-        'Avg Holding Days': ['N/A', f"{enhanced_metrics_v9['Avg Holding Days']:.1f}"],
-        'Profit Factor': ['N/A', f"{enhanced_metrics_v9['Profit Factor']:.2f}"],
-        'Max Consec Losses': ['N/A', enhanced_metrics_v9['Max Consec Losses']]
-    })
-    print("\n--- Bảng So sánh Metrics Mở Rộng ---")
-    print(metrics_df.to_string(index=False))
-
-    # Trực quan hóa
-    plt.style.use('seaborn-v0_8-whitegrid')
-    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(20, 15), height_ratios=[3, 1, 1])
-
-    # Equity curve
-    ax1.plot(benchmark_performance.index, benchmark_performance,
-             label=f"Benchmark: VN-Index ({metrics_benchmark['Total Return']:.2%})",
-             linestyle=':', color='black', alpha=0.7)
-    ax1.plot(performance_v9.index, performance_v9['Portfolio Value'],
-             label=f"V9 ({enhanced_metrics_v9['Total Return']:.2%})",
-             linewidth=3.5, color='lightblue', alpha=0.9)
-    ax1.set_title(f"So sánh Hiệu suất V9 vs Benchmark ({TEST_START_DATE} - {TEST_END_DATE})", fontsize=20)
-    ax1.set_ylabel("Giá trị Danh mục (VND)", fontsize=16)
-    ax1.legend(fontsize=14, loc='upper left')
-    ax1.grid(True, alpha=0.3)
-
-    # Drawdown
-    drawdown_v9 = (performance_v9['Portfolio Value'] - performance_v9['Portfolio Value'].cummax()) / performance_v9['Portfolio Value'].cummax()
-    drawdown_bench = (benchmark_performance - benchmark_performance.cummax()) / benchmark_performance.cummax()
-    ax2.fill_between(performance_v9.index, drawdown_v9, 0, color='lightblue', alpha=0.7, label='V9')
-    ax2.fill_between(benchmark_performance.index, drawdown_bench, 0, color='gray', alpha=0.7, label='Benchmark')
-    ax2.set_title('Drawdown So Sánh', fontsize=16)
-    ax2.set_ylabel('Drawdown (%)', fontsize=14)
-    ax2.legend(fontsize=12)
-    ax2.grid(True, alpha=0.3)
-
-    # Trade return distribution
-    trade_returns = [(t['exit_price'] - t['entry_price']) / t['entry_price'] * 100 for t in trades]
-    ax3.hist(trade_returns, bins=50, color='lightblue', edgecolor='black')
-    ax3.set_title('Phân phối Lợi nhuận Giao dịch (%)', fontsize=16)
-    ax3.set_xlabel('Lợi nhuận (%)', fontsize=14)
-    ax3.set_ylabel('Số lượng giao dịch', fontsize=14)
-    ax3.grid(True, alpha=0.3)
-
-    plt.tight_layout()
-    plt.show()
-
-    # Monte Carlo Simulation
-    daily_returns = performance_v9['Portfolio Value'].pct_change().dropna()
-    simulations = []
-    for _ in range(1000):
-        sim_returns = np.random.choice(daily_returns, size=252, replace=True)
-        sim_path = np.cumprod(1 + sim_returns)
-        simulations.append(sim_path)
-    sim_drawdowns = [max((np.max(sim) - sim) / np.max(sim)) for sim in simulations]
-    print(f"Monte Carlo: 95th Percentile Drawdown = {np.percentile(sim_drawdowns, 95):.2%}")
-
-print("Backtest V9 hoàn tất. Logs đã lưu!")
-
-"""V12 có profit vault"""
+    loop_start = time.time()
+    pv, t_int, t_flt, working_capital, positions, s_date, s_amt = run_kernel(
+        inputs,
+        initial_capital,
+        commission_buy=commission_buy,
+        commission_sell_base=commission_sell_base,
+        tax_sell=tax_sell,
+        trade_limit_pct=trade_limit_pct,
+        max_investment_per_trade_pct=max_investment_per_trade_pct,
+        max_open_positions=max_open_positions,
+        lot_size=lot_size,
+        liquidity_threshold=liquidity_threshold,
+        entry_mode=entry_mode,
+        trailing_stop_pct=trailing_stop_pct,
+        partial_profit_pct=partial_profit_pct,
+        min_holding_days=min_holding_days,
+    )
+    print(f"Main loop (numba) completed in {time.time() - loop_start:.2f}s")
 
-# ===================================================================
-# 4. THIẾT LẬP & THỰC THI BACKTEST
-# ===================================================================
-TEST_START_DATE = '2020-01-01'
-TEST_END_DATE = '2025-09-20'
-INITIAL_CAPITAL = 3_000_000_000
-BASE_CAPITAL = 3_000_000_000
-
-print(f"--- Bắt đầu chạy Backtest V9 từ {TEST_START_DATE} đến {TEST_END_DATE} ---")
-print("Đang tính toán Benchmark: VN-Index...")
-benchmark_performance = calculate_benchmark(df, TEST_START_DATE, TEST_END_DATE, INITIAL_CAPITAL)
-metrics_benchmark = calculate_metrics(benchmark_performance)
-
-print("Đang chạy Backtest V9...")
-# Tính toán trước các chỉ báo
-df = precompute_technical_indicators_vectorized(df)
-performance_v9, enhanced_metrics_v9, trades = backtest_engine_v12_profit_vault(
-    df,
-    apply_enhanced_screener_v12_sideway_soft,
-    TEST_START_DATE,
-    TEST_END_DATE,
-    INITIAL_CAPITAL,
-    BASE_CAPITAL,
-    commission_buy=0.001,
-    commission_sell_base=0.001,
-    tax_sell=0.001,
-    trade_limit_pct=0.11,
-    max_investment_per_trade_pct=0.15,
-    max_open_positions=8,
-    min_volume_ma20=200000,
-    lot_size=100,
-    vol_window=20,
-    liquidity_threshold=0.1,
-    entry_mode='close',
-    atr_multiplier=1.5,
-    trailing_stop_pct=0.05,
-    partial_profit_pct=0.4,
-    min_holding_days=3,
-    pyramid_limit=1
-)
+    trades = kernel_trades(t_int, t_flt, tickers)
+    portfolio_history = [
+        {'date': all_dates[i], 'Portfolio Value': pv[i]}
+        for i in range(total_dates) if i % 10 == 0 or i == total_dates - 1
+    ]
+    df_history = pd.DataFrame(portfolio_history).set_index('date')
+    if len(df_history) < len(all_dates):
+        df_history = pd.DataFrame(index=all_dates, data={'Portfolio Value': pv})
 
-# ===================================================================
-# 5. PHÂN TÍCH KẾT QUẢ
-# ===================================================================
-if not enhanced_metrics_v9:
-    print("Không có giao dịch nào được thực hiện. Vui lòng kiểm tra dữ liệu hoặc điều kiện screener.")
-else:
-    metrics_df = pd.DataFrame({
-        'Strategy': ['VN-Index Benchmark', 'V9'],
-        'Total Return': [f"{metrics_benchmark['Total Return']:.2%}", f"{enhanced_metrics_v9['Total Return']:.2%}"],
-        'Sharpe Ratio': [f"{metrics_benchmark['Sharpe Ratio (Annualized)']:.2f}", f"{enhanced_metrics_v9['Sharpe Ratio']:.2f}"],
-        'Max Drawdown': [f"{metrics_benchmark['Max Drawdown']:.2%}", f"{enhanced_metrics_v9['Max Drawdown']:.2%}"],
-        'Calmar Ratio': [f"{metrics_benchmark['Calmar Ratio']:.2f}", f"{enhanced_metrics_v9['Calmar Ratio']:.2f}"],
-        'Win Rate': ['N/A', f"{enhanced_metrics_v9['Win Rate']:.2%}"],
-        'Avg Holding Days': ['N/A', f"{enhanced_metrics_v9['Avg Holding Days']:.1f}"],
-        'Profit Factor': ['N/A', f"{enhanced_metrics_v9['Profit Factor']:.2f}"],
-        'Max Consec Losses': ['N/A', enhanced_metrics_v9['Max Consec Losses']]
-    })
-    print("\n--- Bảng So sánh Metrics Mở Rộng ---")
-    print(metrics_df.to_string(index=False))
-
-    # Trực quan hóa
-    plt.style.use('seaborn-v0_8-whitegrid')
-    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(20, 15), height_ratios=[3, 1, 1])
-
-    # Equity curve
-    ax1.plot(benchmark_performance.index, benchmark_performance,
-             label=f"Benchmark: VN-Index ({metrics_benchmark['Total Return']:.2%})",
-             linestyle=':', color='black', alpha=0.7)
-    ax1.plot(performance_v9.index, performance_v9['Portfolio Value'],
-             label=f"V9 ({enhanced_metrics_v9['Total Return']:.2%})",
-             linewidth=3.5, color='lightblue', alpha=0.9)
-    ax1.set_title(f"So sánh Hiệu suất V9 vs Benchmark ({TEST_START_DATE} - {TEST_END_DATE})", fontsize=20)
-    ax1.set_ylabel("Giá trị Danh mục (VND)", fontsize=16)
-    ax1.legend(fontsize=14, loc='upper left')
-    ax1.grid(True, alpha=0.3)
-
-    # Drawdown
-    drawdown_v9 = (performance_v9['Portfolio Value'] - performance_v9['Portfolio Value'].cummax()) / performance_v9['Portfolio Value'].cummax()
-    drawdown_bench = (benchmark_performance - benchmark_performance.cummax()) / benchmark_performance.cummax()
-    ax2.fill_between(performance_v9.index, drawdown_v9, 0, color='lightblue', alpha=0.7, label='V9')
-    ax2.fill_between(benchmark_performance.index, drawdown_bench, 0, color='gray', alpha=0.7, label='Benchmark')
-    ax2.set_title('Drawdown So Sánh', fontsize=16)
-    ax2.set_ylabel('Drawdown (%)', fontsize=14)
-    ax2.legend(fontsize=12)
-    ax2.grid(True, alpha=0.3)
-
-    # Trade return distribution
-    trade_returns = [(t['exit_price'] - t['entry_price']) / t['entry_price'] * 100 for t in trades]
-    ax3.hist(trade_returns, bins=50, color='lightblue', edgecolor='black')
-    ax3.set_title('Phân phối Lợi nhuận Giao dịch (%)', fontsize=16)
-    ax3.set_xlabel('Lợi nhuận (%)', fontsize=14)
-    ax3.set_ylabel('Số lượng giao dịch', fontsize=14)
-    ax3.grid(True, alpha=0.3)
-
-    plt.tight_layout()
-    plt.show()
-
-    # Monte Carlo Simulation
-    daily_returns = performance_v9['Portfolio Value'].pct_change().dropna()
-    simulations = []
-    for _ in range(1000):
-        sim_returns = np.random.choice(daily_returns, size=252, replace=True)
-        sim_path = np.cumprod(1 + sim_returns)
-        simulations.append(sim_path)
-    sim_drawdowns = [max((np.max(sim) - sim) / np.max(sim)) for sim in simulations]
-    print(f"Monte Carlo: 95th Percentile Drawdown = {np.percentile(sim_drawdowns, 95):.2%}")
-
-print("Backtest V9 hoàn tất. Logs đã lưu!")
+    try:
+        log_portfolio_to_csv(portfolio_history)
+        log_trades_to_parquet(trades)
+        log_drawdown_to_csv(df_history)
+    except Exception as e:
+        print(f"Warning: Logging failed - {e}")
 
-# ==== REAL backtest entrypoint (paste at bottom of round_2/v12.py) ====
-def _main_backtest():
-    """
-    Backtest thực tế cho chiến lược V12:
-    - Đọc DATA_FILE_PATH từ .env (csv hoặc parquet)
-    - Bảo đảm cột 'time' (datetime), 'ticker' (uppercase)
-    - Gắn các biến thị trường 'market_*' (close/MA50/MA200/RSI/ADX/Bollinger width) từ VNINDEX
-    - Tính toàn bộ feature qua precompute_technical_indicators_vectorized(...)
-    - Chạy backtest_engine_v12(...) với screener apply_enhanced_screener_v12
-    - Lưu kết quả (history, trades, metrics) vào OUTPUT_DIR
-    """
-    import os
-    from pathlib import Path
-    import pandas as pd
-    import numpy as np
+    try:
+        enhanced_metrics = calculate_enhanced_metrics(df_history, trades)
+    except Exception as e:
+        print(f"Warning: Metrics calculation failed - {e}")
+        enhanced_metrics = {}
 
-    # ---- 1) ENV ----
-    from dotenv import load_dotenv
-    load_dotenv()
-    DATA_FILE_PATH = os.getenv("DATA_FILE_PATH", "").strip()
-    assert DATA_FILE_PATH, "DATA_FILE_PATH chưa được set trong .env"
+    print(f"Total backtest time: {time.time() - start_time:.2f} seconds")
 
-    BACKTEST_START = os.getenv("BACKTEST_START", "").strip()
-    BACKTEST_END   = os.getenv("BACKTEST_END", "").strip()
-    INITIAL_CAPITAL = float(os.getenv("INITIAL_CAPITAL", "100000000"))
-    BASE_CAPITAL    = float(os.getenv("BASE_CAPITAL", "100000000"))
-    OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", "outputs")).resolve()
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    cols, shares, entry, avg_cost, entry_ns, _, _, _ = positions
+    current_portfolio = {
+        tickers[c]: {'shares': int(n), 'entry_price': e, 'avg_cost': a, 'entry_date': pd.Timestamp(int(d))}
+        for c, n, e, a, d in zip(cols, shares, entry, avg_cost, entry_ns)
+    }
+    pending_settlements = deque(zip(pd.to_datetime(s_date), s_amt))
+    pivoted_close = pd.DataFrame(inputs.close, index=pd.DatetimeIndex(all_dates), columns=tickers)
+    print_final_portfolio(current_portfolio, pivoted_close, all_dates[-1], working_capital, 0, 0, pending_settlements, trades)
 
-    # ---- 2) LOAD DATA ----
-    path = Path(DATA_FILE_PATH)
-    if not path.exists():
-        raise FileNotFoundError(f"Không thấy file dữ liệu: {path}")
+    return df_history, enhanced_metrics, trades
 
-    # tự đoán định dạng
-    ext = path.suffix.lower()
-    if ext == ".parquet":
-        df = pd.read_parquet(path)
-    elif ext == ".csv":
-        df = pd.read_csv(path)
-    else:
-        # thử parquet rồi csv
-        try:
-            df = pd.read_parquet(path)
-        except Exception:
-            df = pd.read_csv(path)
-
-    # Chuẩn hoá cột thời gian
-    if "time" not in df.columns:
-        if "timestamp" in df.columns:
-            df = df.rename(columns={"timestamp": "time"})
-        else:
-            raise KeyError("Thiếu cột thời gian: cần 'time' hoặc 'timestamp'.")
+"""# 3. test"""
 
-    df["time"] = pd.to_datetime(df["time"])
-    # Đảm bảo cột bắt buộc
-    base_required = ["ticker", "open", "high", "low", "close", "volume"]
-    miss = [c for c in base_required if c not in df.columns]
-    if miss:
-        raise KeyError(f"Thiếu cột bắt buộc: {miss}")
+def _notebook_demo():
+    """
+    Phần chạy thử kiểu notebook (tải DATA_FILE_PATH, backtest V9 / profit vault, bảng metrics, biểu đồ).
+    Chỉ chạy khi gọi trực tiếp file (python round_2/v12.py) — import v12 từ bot/adapter không chạy backtest
+    và không nạp matplotlib.
+    """
+    import matplotlib.pyplot as plt
 
-    # Một số cột dòng tiền (nếu không có thì tạo 0 để tránh lỗi downstream)
-    for c in ["bu", "sd", "fb", "fs", "fn"]:
-        if c not in df.columns:
-            df[c] = 0.0
+    # ===================================================================
+    # 3. TẢI DỮ LIỆU
+    # ===================================================================
+    if not os.path.exists(DATA_FILE_PATH):
+        print(f"Lỗi: Không tìm thấy file dữ liệu '{DATA_FILE_PATH}'.")
+    else:
+        df = pd.read_parquet(DATA_FILE_PATH)
+        if 'time' in df.columns:
+            df['time'] = pd.to_datetime(df['time'])
+            df = df.set_index('time').sort_index()
+
+        print(f"Tải dữ liệu thành công. Dữ liệu kéo dài từ {df.index.min().date()} đến {df.index.max().date()}.")
+        print(f"Tổng số bản ghi: {len(df):,}")
+
+    """# 3.5. test"""
+
+    # ===================================================================
+    # 4. THIẾT LẬP & THỰC THI BACKTEST
+    # ===================================================================
+    TEST_START_DATE = '2020-01-01'
+    TEST_END_DATE = '2025-09-20'
+    INITIAL_CAPITAL = 3_000_000_000
+    BASE_CAPITAL = 3_000_000_000
+
+    print(f"--- Bắt đầu chạy Backtest V9 từ {TEST_START_DATE} đến {TEST_END_DATE} ---")
+    print("Đang tính toán Benchmark: VN-Index...")
+    benchmark_performance = calculate_benchmark(df, TEST_START_DATE, TEST_END_DATE, INITIAL_CAPITAL)
+    metrics_benchmark = calculate_metrics(benchmark_performance)
+
+    print("Đang chạy Backtest V9...")
+    # Tính toán trước các chỉ báo
+    df = precompute_technical_indicators_vectorized(df)
+    performance_v9, enhanced_metrics_v9, trades = backtest_engine_v12(
+        df,
+        apply_enhanced_screener_v12_sideway_soft,
+        TEST_START_DATE,
+        TEST_END_DATE,
+        INITIAL_CAPITAL,
+        BASE_CAPITAL,
+        commission_buy=0.001,
+        commission_sell_base=0.001,
+        tax_sell=0.001,
+        trade_limit_pct=0.11,
+        max_investment_per_trade_pct=0.15,
+        max_open_positions=8,
+        min_volume_ma20=200000,
+        lot_size=100,
+        vol_window=20,
+        liquidity_threshold=0.1,
+        entry_mode='close',
+        atr_multiplier=1.5,
+        trailing_stop_pct=0.05,
+        partial_profit_pct=0.4,
+        min_holding_days=3,
+        pyramid_limit=1
+    )
 
-    df["ticker"] = df["ticker"].astype(str).str.upper()
-    df = df.sort_values(["time", "ticker"]).reset_index(drop=True)
+    """# 4. Kết quả"""
+
+    # ===================================================================
+    # 5. PHÂN TÍCH KẾT QUẢ
+    # ===================================================================
+    if not enhanced_metrics_v9:
+        print("Không có giao dịch nào được thực hiện. Vui lòng kiểm tra dữ liệu hoặc điều kiện screener.")
+    else:
+        metrics_df = pd.DataFrame({
+            'Strategy': ['VN-Index Benchmark', 'V9'],
+            'Total Return': [f"{metrics_benchmark['Total Return']:.2%}", f"{enhanced_metrics_v9['Total Return']:.2%}"],
+            'Sharpe Ratio': [f"{metrics_benchmark['Sharpe Ratio (Annualized)']:.2f}", f"{enhanced_metrics_v9['Sharpe Ratio']:.2f}"],
+            'Max Drawdown': [f"{metrics_benchmark['Max Drawdown']:.2%}", f"{enhanced_metrics_v9['Max Drawdown']:.2%}"],
+            'Calmar Ratio': [f"{metrics_benchmark['Calmar Ratio']:.2f}", f"{enhanced_metrics_v9['Calmar Ratio']:.2f}"],
+            'Win Rate': ['N/A', f"{enhanced_metrics_v9['Win Rate']:.2%}"],
+            'Avg Holding Days': ['N/A', f"{enhanced_metrics_v9['Avg Holding Days']:.1f}"],
+            'Profit Factor': ['N/A', f"{enhanced_metrics_v9['Profit Factor']:.2f}"],
+            'Max Consec Losses': ['N/A', enhanced_metrics_v9['Max Consec Losses']]
+        })
+        print("\n--- Bảng So sánh Metrics Mở Rộng ---")
+        print(metrics_df.to_string(index=False))
+
+        # Trực quan hóa
+        plt.style.use('seaborn-v0_8-whitegrid')
+        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(20, 15), height_ratios=[3, 1, 1])
+
+        # Equity curve
+        ax1.plot(benchmark_performance.index, benchmark_performance,
+                 label=f"Benchmark: VN-Index ({metrics_benchmark['Total Return']:.2%})",
+                 linestyle=':', color='black', alpha=0.7)
+        ax1.plot(performance_v9.index, performance_v9['Portfolio Value'],
+                 label=f"V9 ({enhanced_metrics_v9['Total Return']:.2%})",
+                 linewidth=3.5, color='lightblue', alpha=0.9)
+        ax1.set_title(f"So sánh Hiệu suất V9 vs Benchmark ({TEST_START_DATE} - {TEST_END_DATE})", fontsize=20)
+        ax1.set_ylabel("Giá trị Danh mục (VND)", fontsize=16)
+        ax1.legend(fontsize=14, loc='upper left')
+        ax1.grid(True, alpha=0.3)
+
+        # Drawdown
+        drawdown_v9 = (performance_v9['Portfolio Value'] - performance_v9['Portfolio Value'].cummax()) / performance_v9['Portfolio Value'].cummax()
+        drawdown_bench = (benchmark_performance - benchmark_performance.cummax()) / benchmark_performance.cummax()
+        ax2.fill_between(performance_v9.index, drawdown_v9, 0, color='lightblue', alpha=0.7, label='V9')
+        ax2.fill_between(benchmark_performance.index, drawdown_bench, 0, color='gray', alpha=0.7, label='Benchmark')
+        ax2.set_title('Drawdown So Sánh', fontsize=16)
+        ax2.set_ylabel('Drawdown (%)', fontsize=14)
+        ax2.legend(fontsize=12)
+        ax2.grid(True, alpha=0.3)
+
+        # Trade return distribution
+        trade_returns = [(t['exit_price'] - t['entry_price']) / t['entry_price'] * 100 for t in trades]
+        ax3.hist(trade_returns, bins=50, color='lightblue', edgecolor='black')
+        ax3.set_title('Phân phối Lợi nhuận Giao dịch (%)', fontsize=16)
+        ax3.set_xlabel('Lợi nhuận (%)', fontsize=14)
+        ax3.set_ylabel('Số lượng giao dịch', fontsize=14)
+        ax3.grid(True, alpha=0.3)
+
+        plt.tight_layout()
+        plt.show()
+
+        # Monte Carlo Simulation
+        daily_returns = performance_v9['Portfolio Value'].pct_change().dropna()
+        simulations = []
+        for _ in range(1000):
+            sim_returns = np.random.choice(daily_returns, size=252, replace=True)
+            sim_path = np.cumprod(1 + sim_returns)
+            simulations.append(sim_path)
+        sim_drawdowns = [max((np.max(sim) - sim) / np.max(sim)) for sim in simulations]
+        print(f"Monte Carlo: 95th Percentile Drawdown = {np.percentile(sim_drawdowns, 95):.2%}")
+
+    print("Backtest V9 hoàn tất. Logs đã lưu!")
+
+    """V12 có profit vault"""
+
+    # ===================================================================
+    # 4. THIẾT LẬP & THỰC THI BACKTEST
+    # ===================================================================
+    TEST_START_DATE = '2020-01-01'
+    TEST_END_DATE = '2025-09-20'
+    INITIAL_CAPITAL = 3_000_000_000
+    BASE_CAPITAL = 3_000_000_000
+
+    print(f"--- Bắt đầu chạy Backtest V9 từ {TEST_START_DATE} đến {TEST_END_DATE} ---")
+    print("Đang tính toán Benchmark: VN-Index...")
+    benchmark_performance = calculate_benchmark(df, TEST_START_DATE, TEST_END_DATE, INITIAL_CAPITAL)
+    metrics_benchmark = calculate_metrics(benchmark_performance)
+
+    print("Đang chạy Backtest V9...")
+    # Tính toán trước các chỉ báo
+    df = precompute_technical_indicators_vectorized(df)
+    performance_v9, enhanced_metrics_v9, trades = backtest_engine_v12_profit_vault(
+        df,
+        apply_enhanced_screener_v12_sideway_soft,
+        TEST_START_DATE,
+        TEST_END_DATE,
+        INITIAL_CAPITAL,
+        BASE_CAPITAL,
+        commission_buy=0.001,
+        commission_sell_base=0.001,
+        tax_sell=0.001,
+        trade_limit_pct=0.11,
+        max_investment_per_trade_pct=0.15,
+        max_open_positions=8,
+        min_volume_ma20=200000,
+        lot_size=100,
+        vol_window=20,
+        liquidity_threshold=0.1,
+        entry_mode='close',
+        atr_multiplier=1.5,
+        trailing_stop_pct=0.05,
+        partial_profit_pct=0.4,
+        min_holding_days=3,
+        pyramid_limit=1
+    )
 
-    # ---- 3) ATTACH MARKET FEATURES (market_*) từ VNINDEX ----
-    vn = df[df["ticker"] == "VNINDEX"].copy()
-    if vn.empty:
-        raise ValueError("Dataset không có VNINDEX để suy ra biến 'market_*'.")
+    # ===================================================================
+    # 5. PHÂN TÍCH KẾT QUẢ
+    # ===================================================================
+    if not enhanced_metrics_v9:
+        print("Không có giao dịch nào được thực hiện. Vui lòng kiểm tra dữ liệu hoặc điều kiện screener.")
+    else:
+        metrics_df = pd.DataFrame({
+            'Strategy': ['VN-Index Benchmark', 'V9'],
+            'Total Return': [f"{metrics_benchmark['Total Return']:.2%}", f"{enhanced_metrics_v9['Total Return']:.2%}"],
+            'Sharpe Ratio': [f"{metrics_benchmark['Sharpe Ratio (Annualized)']:.2f}", f"{enhanced_metrics_v9['Sharpe Ratio']:.2f}"],
+            'Max Drawdown': [f"{metrics_benchmark['Max Drawdown']:.2%}", f"{enhanced_metrics_v9['Max Drawdown']:.2%}"],
+            'Calmar Ratio': [f"{metrics_benchmark['Calmar Ratio']:.2f}", f"{enhanced_metrics_v9['Calmar Ratio']:.2f}"],
+            'Win Rate': ['N/A', f"{enhanced_metrics_v9['Win Rate']:.2%}"],
+            'Avg Holding Days': ['N/A', f"{enhanced_metrics_v9['Avg Holding Days']:.1f}"],
+            'Profit Factor': ['N/A', f"{enhanced_metrics_v9['Profit Factor']:.2f}"],
+            'Max Consec Losses': ['N/A', enhanced_metrics_v9['Max Consec Losses']]
+        })
+        print("\n--- Bảng So sánh Metrics Mở Rộng ---")
+        print(metrics_df.to_string(index=False))
+
+        # Trực quan hóa
+        plt.style.use('seaborn-v0_8-whitegrid')
+        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(20, 15), height_ratios=[3, 1, 1])
+
+        # Equity curve
+        ax1.plot(benchmark_performance.index, benchmark_performance,
+                 label=f"Benchmark: VN-Index ({metrics_benchmark['Total Return']:.2%})",
+                 linestyle=':', color='black', alpha=0.7)
+        ax1.plot(performance_v9.index, performance_v9['Portfolio Value'],
+                 label=f"V9 ({enhanced_metrics_v9['Total Return']:.2%})",
+                 linewidth=3.5, color='lightblue', alpha=0.9)
+        ax1.set_title(f"So sánh Hiệu suất V9 vs Benchmark ({TEST_START_DATE} - {TEST_END_DATE})", fontsize=20)
+        ax1.set_ylabel("Giá trị Danh mục (VND)", fontsize=16)
+        ax1.legend(fontsize=14, loc='upper left')
+        ax1.grid(True, alpha=0.3)
+
+        # Drawdown
+        drawdown_v9 = (performance_v9['Portfolio Value'] - performance_v9['Portfolio Value'].cummax()) / performance_v9['Portfolio Value'].cummax()
+        drawdown_bench = (benchmark_performance - benchmark_performance.cummax()) / benchmark_performance.cummax()
+        ax2.fill_between(performance_v9.index, drawdown_v9, 0, color='lightblue', alpha=0.7, label='V9')
+        ax2.fill_between(benchmark_performance.index, drawdown_bench, 0, color='gray', alpha=0.7, label='Benchmark')
+        ax2.set_title('Drawdown So Sánh', fontsize=16)
+        ax2.set_ylabel('Drawdown (%)', fontsize=14)
+        ax2.legend(fontsize=12)
+        ax2.grid(True, alpha=0.3)
+
+        # Trade return distribution
+        trade_returns = [(t['exit_price'] - t['entry_price']) / t['entry_price'] * 100 for t in trades]
+        ax3.hist(trade_returns, bins=50, color='lightblue', edgecolor='black')
+        ax3.set_title('Phân phối Lợi nhuận Giao dịch (%)', fontsize=16)
+        ax3.set_xlabel('Lợi nhuận (%)', fontsize=14)
+        ax3.set_ylabel('Số lượng giao dịch', fontsize=14)
+        ax3.grid(True, alpha=0.3)
+
+        plt.tight_layout()
+        plt.show()
+
+        # Monte Carlo Simulation
+        daily_returns = performance_v9['Portfolio Value'].pct_change().dropna()
+        simulations = []
+        for _ in range(1000):
+            sim_returns = np.random.choice(daily_returns, size=252, replace=True)
+            sim_path = np.cumprod(1 + sim_returns)
+            simulations.append(sim_path)
+        sim_drawdowns = [max((np.max(sim) - sim) / np.max(sim)) for sim in simulations]
+        print(f"Monte Carlo: 95th Percentile Drawdown = {np.percentile(sim_drawdowns, 95):.2%}")
+
+    print("Backtest V9 hoàn tất. Logs đã lưu!")
 
+# ==== REAL backtest entrypoint (paste at bottom of round_2/v12.py) ====
+def build_market_features_v12(vn):
+    """
+    Biến thị trường 'market_*' (close/MA50/MA200/RSI/ADX/Bollinger width) từ các dòng VNINDEX.
+    vn: DataFrame có 'time', 'close', 'high', 'low'. Trả về DataFrame index = 'time'.
+    """
     vn = vn.sort_values("time")
     # Close/High/Low của thị trường
     m_close = vn[["time", "close"]].rename(columns={"close": "market_close"})
@@ -1936,23 +2039,59 @@ def _main_backtest():
     except Exception:
         # nếu có vấn đề, fallback ADX ~ 25
         m["market_adx"] = 25.0
+    return m
 
-    market_feats = m.reset_index()
 
-    # Gắn vào toàn bộ khung dữ liệu theo 'time'
-    df = df.merge(market_feats, on="time", how="left")
+def _main_backtest():
+    """
+    Backtest thực tế cho chiến lược V12:
+    - Đọc DATA_FILE_PATH từ .env (csv hoặc parquet) theo batch qua round_2/ingest.py
+    - Chuẩn hoá 'time' (datetime), 'ticker' (uppercase), gắn 'market_*' từ VNINDEX,
+      tính volume_ma20/highest_in_5d/sma_5 → ghi feature store (PREPARED_FEATURE_PATH) một lần
+    - Các lần sau đọc lại feature store bằng memory-map (REBUILD_FEATURES=1 để tính lại)
+    - Chạy backtest_engine_v12(...) với screener apply_enhanced_screener_v12
+    - Lưu kết quả (history, trades, metrics) vào OUTPUT_DIR
+    """
+    import os
+    from pathlib import Path
+    import pandas as pd
+    import numpy as np
+
+    # ---- 1) ENV ----
+    from dotenv import load_dotenv
+    load_dotenv()
+    DATA_FILE_PATH = os.getenv("DATA_FILE_PATH", "").strip()
+    assert DATA_FILE_PATH, "DATA_FILE_PATH chưa được set trong .env"
+
+    BACKTEST_START = os.getenv("BACKTEST_START", "").strip()
+    BACKTEST_END   = os.getenv("BACKTEST_END", "").strip()
+    INITIAL_CAPITAL = float(os.getenv("INITIAL_CAPITAL", "100000000"))
+    BASE_CAPITAL    = float(os.getenv("BASE_CAPITAL", "100000000"))
+    OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", "outputs")).resolve()
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    PREPARED_PATH = Path(os.getenv("PREPARED_FEATURE_PATH", "").strip() or OUTPUT_DIR / "features_v12.parquet")
+    INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "500000"))
+
+    # ---- 2) FEATURE STORE (ingest theo batch, chỉ chạy khi nguồn thay đổi) ----
+    path = Path(DATA_FILE_PATH)
+    if not path.exists():
+        raise FileNotFoundError(f"Không thấy file dữ liệu: {path}")
+
+    if os.getenv("REBUILD_FEATURES", "0") == "1" or not is_fresh(path, PREPARED_PATH):
+        prepare_feature_store(path, PREPARED_PATH, build_market_features_v12, batch_rows=INGEST_BATCH_ROWS)
+    else:
+        print(f"[V12] Dùng feature store có sẵn: {PREPARED_PATH}")
 
-    # ---- 4) TÍNH FEATURE CHO TOÀN LỊCH SỬ (V12) ----
-    # LƯU Ý: đã có đầy đủ market_* nên precompute sẽ không chạy nhánh groupby(level=0)
-    feat = precompute_technical_indicators_vectorized(df)
+    # ---- 3) ĐỌC FEATURE (memory-map, chỉ khoảng backtest) ----
+    feat = load_feature_store(PREPARED_PATH, start=BACKTEST_START or None, end=BACKTEST_END or None)
 
-    # ---- 5) THỜI GIAN BACKTEST ----
-    tmin = pd.to_datetime(feat["time"].min()).date()
-    tmax = pd.to_datetime(feat["time"].max()).date()
+    # ---- 4) THỜI GIAN BACKTEST ----
+    tmin = pd.to_datetime(feat.index.min()).date()
+    tmax = pd.to_datetime(feat.index.max()).date()
     start_str = BACKTEST_START if BACKTEST_START else str(tmin)
     end_str   = BACKTEST_END   if BACKTEST_END   else str(tmax)
 
-    # ---- 6) CHẠY BACKTEST ----
+    # ---- 5) CHẠY BACKTEST ----
     print(f"[V12] Backtest từ {start_str} → {end_str} | vốn đầu: {INITIAL_CAPITAL:,.0f} | base: {BASE_CAPITAL:,.0f}")
     df_hist, metrics, trades = backtest_engine_v12(
         feat,
@@ -1964,9 +2103,9 @@ def _main_backtest():
         # giữ nguyên các tham số mặc định trong hàm (commission, lot_size, risk, v.v.)
     )
 
-    # ---- 7) LƯU KẾT QUẢ ----
+    # ---- 6) LƯU KẾT QUẢ ----
     hist_path   = OUTPUT_DIR / "backtest_history.parquet"
-    trades_path = OUTPUT_DIR / "trades.csv"
+    trades_path = OUTPUT_DIR / "trades.parquet"
     metrics_path= OUTPUT_DIR / "metrics.json"
 
     try:
@@ -1978,11 +2117,13 @@ def _main_backtest():
     with open(metrics_path, "w", encoding="utf-8") as f:
         json.dump(metrics, f, ensure_ascii=False, indent=2)
 
-    # trades có thể là list dict; chuẩn hoá rồi lưu
-    if isinstance(trades, list) and trades and isinstance(trades[0], dict):
-        pd.DataFrame(trades).to_csv(trades_path, index=False)
+    # trades: TradeBuffer (ghi thẳng parquet) hoặc list dict / DataFrame cũ
+    if isinstance(trades, TradeBuffer):
+        trades.to_parquet(trades_path)
+    elif isinstance(trades, list) and trades and isinstance(trades[0], dict):
+        pd.DataFrame(trades).to_parquet(trades_path, index=False)
     elif isinstance(trades, pd.DataFrame):
-        trades.to_csv(trades_path, index=False)
+        trades.to_parquet(trades_path, index=False)
 
     # In tóm tắt
     print("\n[V12] KẾT QUẢ BACKTEST (tóm tắt)")
@@ -1996,8 +2137,8 @@ def _main_backtest():
         pass
 
     # Gợi ý picks cho phiên cuối cùng (tiện kiểm tra logic screener)
-    last_day = feat["time"].max()
-    today_df = feat[feat["time"] == last_day].copy()
+    last_day = feat.index.max()
+    today_df = feat.loc[feat.index == last_day]
     picks = apply_enhanced_screener_v12(today_df) or []
     print(f"\n[V12] Picks phiên cuối cùng ({pd.to_datetime(last_day).date()}): {', '.join(picks) if picks else '—'}")
 
@@ -2005,5 +2146,7 @@ def _main_backtest():
 
 # Chạy khi gọi trực tiếp file v12.py
 if __name__ == "__main__":
+    if os.path.exists(DATA_FILE_PATH):
+        _notebook_demo()
     _main_backtest()
 
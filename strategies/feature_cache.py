@@ -0,0 +1,121 @@
+# strategies/feature_cache.py
+"""
+Feature cache theo nội dung nến đầu vào (content-addressed) cho compute_features_v12.
+
+- Khoá = (ticker, last_date, hash(date + OHLCV của cửa sổ lịch sử, phiên bản công thức)).
+  Nến thay đổi (thêm phiên mới, điều chỉnh giá do GDKHQ, ...) → hash khác → tự tính lại.
+- Giá trị = các cột feature theo mã (FEATURE_COLS của adapter), căn theo thứ tự dòng của
+  cửa sổ; không chứa market_* (tính lại mỗi lần từ VNINDEX, rẻ).
+- Lưu mỗi khoá một file feather trong thư mục cache; hit → chạm mtime.
+  Tổng dung lượng vượt max_bytes → xoá file có mtime cũ nhất (LRU).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+SUFFIX = ".feather"
+
+
+def _safe_name(ticker: str) -> str:
+    return "".join(ch if ch.isalnum() else "_" for ch in str(ticker))
+
+
+class FeatureCache:
+    def __init__(self, root: str | Path, max_bytes: int = 256 * 2**20):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    # ---- khoá ----
+    @staticmethod
+    def make_key(ticker: str, day_ns: np.ndarray, arrays: Sequence[np.ndarray], version: str = "") -> str:
+        """Khoá file: '<TICKER>__<YYYYMMDD>__<hash>' (hash trên ngày + các mảng OHLCV)."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(version.encode())
+        h.update(np.ascontiguousarray(day_ns, dtype=np.int64).tobytes())
+        for a in arrays:
+            h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+        last = np.datetime64(int(day_ns[-1]), "ns").astype("datetime64[D]").astype(str).replace("-", "")
+        return f"{_safe_name(ticker)}__{last}__{h.hexdigest()}"
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}{SUFFIX}"
+
+    # ---- đọc / ghi ----
+    def get(self, key: str, n_rows: int) -> Optional[Dict[str, np.ndarray]]:
+        import pyarrow.feather as feather
+
+        path = self._path(key)
+        try:
+            table = feather.read_table(path, memory_map=False)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if table.num_rows != n_rows:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+
+    def put(self, key: str, columns: Dict[str, np.ndarray]) -> None:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        path = self._path(key)
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            feather.write_feather(pa.table(columns), tmp, compression="uncompressed")
+            os.replace(tmp, path)
+            self._dirty = True
+        except OSError as exc:
+            print(f"[feature_cache] Không ghi được {path.name}: {exc}")
+
+    # ---- LRU ----
+    def evict(self) -> int:
+        """Xoá file ít dùng nhất cho tới khi tổng dung lượng <= max_bytes. Trả về số file đã xoá."""
+        if not self._dirty:
+            return 0
+        self._dirty = False
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for e in it:
+                if e.is_file() and e.name.endswith(SUFFIX):
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                    total += st.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def invalidate(self, ticker: str) -> int:
+        """Xoá mọi entry của một mã (vd. khi có sự kiện điều chỉnh giá mới)."""
+        removed = 0
+        for p in self.root.glob(f"{_safe_name(ticker)}__*{SUFFIX}"):
+            p.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        for p in self.root.glob(f"*{SUFFIX}"):
+            p.unlink(missing_ok=True)
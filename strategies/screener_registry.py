@@ -0,0 +1,66 @@
+# strategies/screener_registry.py
+"""
+Registry screener cho job live (EOD / day-stream) + chế độ shadow.
+
+- Screener đăng ký theo tên: fn(df_last, ctx) -> {ticker: score} (thứ tự = thứ tự ưu tiên).
+  df_last: lát cắt ngày cuối (chỉ đọc); ctx: phần dùng chung đã tính sẵn cho cả lượt
+  (V12: screener_context — cổng thanh khoản, regime, cột phái sinh; {} = không chọn mã).
+- run_screeners(): chạy lần lượt các screener trên CÙNG df_last/ctx → mỗi screener thêm chỉ tốn
+  phần mask + score của riêng nó. Lỗi ở một screener không ảnh hưởng các screener còn lại.
+- Screener có sẵn ('v12', 'v12_sideway_soft') được đăng ký trong strategies/v12_adapter.py.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+Screener = Callable[[pd.DataFrame, dict], Dict[str, Optional[float]]]
+
+_REGISTRY: Dict[str, Screener] = {}
+
+
+def register_screener(name: str, fn: Optional[Screener] = None):
+    """Đăng ký (hoặc thay) screener `name`. Dùng trực tiếp hoặc làm decorator."""
+    def _register(f: Screener) -> Screener:
+        _REGISTRY[str(name)] = f
+        return f
+    return _register(fn) if fn is not None else _register
+
+
+def get_screener(name: str) -> Screener:
+    try:
+        return _REGISTRY[name]
+    except KeyError:
+        raise KeyError(f"Screener '{name}' chưa đăng ký (có: {', '.join(sorted(_REGISTRY)) or '—'})") from None
+
+
+def registered() -> List[str]:
+    return sorted(_REGISTRY)
+
+
+@dataclass
+class ScreenResult:
+    name: str
+    scores: Dict[str, Optional[float]] = field(default_factory=dict)
+    elapsed_ms: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def picks(self) -> List[str]:
+        return list(self.scores)
+
+
+def run_screeners(df_last: pd.DataFrame, ctx: dict, names: Iterable[str]) -> Dict[str, ScreenResult]:
+    """Chạy các screener `names` (giữ thứ tự, bỏ trùng) trên cùng df_last/ctx."""
+    out: Dict[str, ScreenResult] = {}
+    for name in dict.fromkeys(names):
+        t0 = time.perf_counter()
+        try:
+            scores = dict(get_screener(name)(df_last, ctx))
+            out[name] = ScreenResult(name, scores, (time.perf_counter() - t0) * 1e3)
+        except Exception as exc:
+            out[name] = ScreenResult(name, {}, (time.perf_counter() - t0) * 1e3, f"{type(exc).__name__}: {exc}")
+    return out
@@ -29,14 +29,29 @@ def _macd(close: pd.Series, fast: int = 12, slow: int = 26, signal: int = 9) ->
     macd_signal = macd.ewm(span=signal, adjust=False, min_periods=signal).mean()
     return macd, macd_signal
 
-def _bb_width(close: pd.Series, n: int = 20, nstd: float = 2.0) -> pd.Series:
+def _bb_bands(close: pd.Series, n: int = 20, nstd: float = 2.0) -> tuple[pd.Series, pd.Series, pd.Series]:
     ma = close.rolling(n, min_periods=n).mean()
     sd = close.rolling(n, min_periods=n).std(ddof=0)
     upper = ma + nstd * sd
     lower = ma - nstd * sd
+    return upper, lower, ma
+
+def _bb_width(close: pd.Series, n: int = 20, nstd: float = 2.0) -> pd.Series:
+    upper, lower, ma = _bb_bands(close, n, nstd)
     width = (upper - lower) / ma
     return width
 
+def _mfi(high: pd.Series, low: pd.Series, close: pd.Series, volume: pd.Series, n: int = 14) -> pd.Series:
+    tp = (high + low + close) / 3
+    flow = tp * volume
+    delta = tp.diff()
+    pos = flow.where(delta > 0, 0.0).rolling(n, min_periods=n).sum()
+    neg = flow.where(delta < 0, 0.0).rolling(n, min_periods=n).sum()
+    return 100 - 100 / (1 + pos / neg.replace(0, np.nan))
+
+def _obv(close: pd.Series, volume: pd.Series) -> pd.Series:
+    return (np.sign(close.diff()).fillna(0.0) * volume).cumsum()
+
 def _atr(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14) -> pd.Series:
     prev_close = close.shift(1)
     tr = np.maximum.reduce([
@@ -76,10 +91,17 @@ def _try_import(name: str):
         _import_errors.append((name, exc))
         return None
 
-_v12 = _try_import("v12") or _try_import("round_2.v12")
+# Nạp v12 lần đầu khi cần screener (kéo theo numba + kernel); feature/exit engine không cần v12
+_v12 = None
+
+def _load_v12():
+    global _v12
+    if _v12 is None and not _import_errors:
+        _v12 = _try_import("v12") or _try_import("round_2.v12")
+    return _v12
 
 def _require_v12():
-    if not _v12:
+    if not _load_v12():
         context = ""
         if _import_errors:
             details = "; ".join(f"{name}: {exc}" for name, exc in _import_errors)
@@ -92,12 +114,14 @@ def _require_v12():
     miss = [x for x in (
         "precompute_technical_indicators_vectorized",
         "apply_enhanced_screener_v12",
+        "screener_context",
     ) if not hasattr(_v12, x)]
     if miss:
         raise AttributeError(
             f"[v12_adapter] Thieu ham trong v12: {', '.join(miss)}. "
             "Hay dam bao v12.py co du day cac ham API."
         )
+    return _v12
 
 # ============== API CHUẨN DÙNG V12 ==============
 
@@ -119,7 +143,8 @@ def _ensure_market_close(df: pd.DataFrame) -> pd.DataFrame:
     if 'market_close' in df.columns:
         return df
 
-    out = df.copy()
+    # Shallow copy: dùng chung dữ liệu cột với df, chỉ gắn thêm cột mới (không nhân bản frame)
+    out = df.copy(deep=False)
     idx = out.index
 
     # tìm level ngày/mã trong MultiIndex (nếu có)
@@ -189,45 +214,39 @@ def _ensure_market_close(df: pd.DataFrame) -> pd.DataFrame:
     )
     
 
-def compute_features_v12(df_hist: pd.DataFrame) -> pd.DataFrame:
-    """
-    Sinh đầy đủ cột kỹ thuật mà chiến lược V12 yêu cầu:
-    ['market_MA200','market_rsi','sma_50','sma_200','rsi_14','volume_spike','macd','macd_signal','boll_width','atr_14']
-    - Tự tạo 'date' từ ['timestamp'/'time'/...] nếu thiếu.
-    - Tính theo từng 'ticker', sau đó merge 'market_*' từ VNINDEX theo 'date'.
-    """
-    if df_hist is None or len(df_hist) == 0:
-        return df_hist
+MARKET_FEATURE_COLS = ['market_close','market_MA50','market_MA200','market_rsi','market_boll_width','market_adx']
 
-    df = df_hist.copy()
-    # Bắt buộc có 'date' để group/merge
-    if 'date' not in df.columns:
-        ts_col = next((c for c in ['timestamp', 'time', 'Date', 'datetime', 'Datetime'] if c in df.columns), None)
-        if ts_col is None:
-            raise KeyError("[v12_adapter] Thiếu cột thời gian ('timestamp'/'time') để tạo 'date'.")
-        df['date'] = pd.to_datetime(df[ts_col]).dt.date
-
-    # Sắp xếp và tính theo từng mã
-    df = df.sort_values(['ticker', 'date'])
-    def _per_ticker(g: pd.DataFrame) -> pd.DataFrame:
-        out = g.copy()
-        out['sma_50']  = _sma(out['close'], 50)
-        out['sma_200'] = _sma(out['close'], 200)
-        out['rsi_14']  = _rsi(out['close'], 14)
-        macd, macd_signal = _macd(out['close'], 12, 26, 9)
-        out['macd']        = macd
-        out['macd_signal'] = macd_signal
-        out['boll_width']  = _bb_width(out['close'], 20, 2.0)
-        out['atr_14']      = _atr(out['high'], out['low'], out['close'], 14)
-        # volume_spike = volume / SMA20(volume)
-        vma20 = out['volume'].rolling(20, min_periods=20).mean()
-        out['volume_spike'] = out['volume'] / vma20
-        return out
 
-    df = df.groupby('ticker', group_keys=False).apply(_per_ticker)
+FEATURE_COLS = [
+    'sma_50','sma_200','rsi_14','macd','macd_signal','boll_width','atr_14',
+    'volume_ma20','volume_spike','sma_5',
+    # exit engine (evaluate_exits_v12): suy yếu RSI/MFI/OBV, kẹp TP/SL theo Bollinger khi sideway
+    'mfi_14','obv','boll_upper','boll_lower',
+]
+# Tăng khi đổi công thức feature theo mã → vô hiệu toàn bộ FeatureCache cũ
+FEATURE_VERSION = "v12-2"
+
+
+def _date_series(df: pd.DataFrame) -> pd.Series:
+    """Cột 'date' của df, hoặc suy ra từ 'timestamp'/'time' (không sửa df)."""
+    if 'date' in df.columns:
+        return df['date']
+    ts_col = next((c for c in ['timestamp', 'time', 'Date', 'datetime', 'Datetime'] if c in df.columns), None)
+    if ts_col is None:
+        raise KeyError("[v12_adapter] Thiếu cột thời gian ('timestamp'/'time') để tạo 'date'.")
+    return pd.to_datetime(df[ts_col]).dt.date
 
-    # Market features từ VNINDEX (OHLC) — phục vụ filter V12 EOD
-    mkt = df[df['ticker'].eq('VNINDEX')][['date', 'open', 'high', 'low', 'close']].copy()
+
+def compute_market_features_v12(df_hist: pd.DataFrame) -> pd.DataFrame:
+    """
+    Market features từ VNINDEX (OHLC) theo 'date' — phục vụ filter V12 EOD.
+    Tách riêng để universe scan tính một lần rồi gắn vào từng chunk mã.
+    """
+    is_mkt = df_hist['ticker'].eq('VNINDEX')
+    mkt = pd.DataFrame({
+        'date': _date_series(df_hist)[is_mkt],
+        **{c: df_hist.loc[is_mkt, c] for c in ('open', 'high', 'low', 'close')},
+    })
     mkt = mkt.sort_values('date').drop_duplicates('date', keep='last')
     m_close = mkt['close']
     mkt['market_close']      = m_close
@@ -236,26 +255,111 @@ def compute_features_v12(df_hist: pd.DataFrame) -> pd.DataFrame:
     mkt['market_rsi']        = _rsi(m_close, 14)
     mkt['market_boll_width'] = _bb_width(m_close, 20, 2.0)
     mkt['market_adx']        = _adx(mkt['high'], mkt['low'], m_close, 14)
-    df = df.merge(
-        mkt[['date','market_close','market_MA50','market_MA200','market_rsi','market_boll_width','market_adx']],
-        on='date', how='left'
-    )
+    return mkt[['date'] + MARKET_FEATURE_COLS]
+
+
+def _ticker_slices(tickers: np.ndarray):
+    """(start, stop) của từng mã trên mảng đã sort theo ticker."""
+    if len(tickers) == 0:
+        return []
+    cuts = np.flatnonzero(tickers[1:] != tickers[:-1]) + 1
+    bounds = np.concatenate(([0], cuts, [len(tickers)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _ticker_feature_arrays(c: pd.Series, h: pd.Series, l: pd.Series, v: pd.Series) -> dict:
+    """FEATURE_COLS của một mã (các Series đã sort theo ngày)."""
+    macd, macd_signal = _macd(c, 12, 26, 9)
+    # volume_spike = volume / SMA20(volume)
+    vma20 = v.rolling(20, min_periods=20).mean()
+    boll_upper, boll_lower, _ = _bb_bands(c, 20, 2.0)
+    return {
+        'sma_50':       _sma(c, 50).to_numpy(),
+        'sma_200':      _sma(c, 200).to_numpy(),
+        'rsi_14':       _rsi(c, 14).to_numpy(),
+        'macd':         macd.to_numpy(),
+        'macd_signal':  macd_signal.to_numpy(),
+        'boll_width':   _bb_width(c, 20, 2.0).to_numpy(),
+        'atr_14':       _atr(h, l, c, 14).to_numpy(),
+        'volume_ma20':  vma20.to_numpy(),
+        'volume_spike': (v / vma20).to_numpy(),
+        # Screener V12 đọc volume_ma20 (cổng thanh khoản) và sma_5 (short momentum)
+        'sma_5':        _sma(c, 5).to_numpy(),
+        'mfi_14':       _mfi(h, l, c, v, 14).to_numpy(),
+        'obv':          _obv(c, v).to_numpy(),
+        'boll_upper':   boll_upper.to_numpy(),
+        'boll_lower':   boll_lower.to_numpy(),
+    }
+
+
+def compute_features_v12(df_hist: pd.DataFrame, market: Optional[pd.DataFrame] = None, cache=None) -> pd.DataFrame:
+    """
+    Sinh đầy đủ cột kỹ thuật mà chiến lược V12 yêu cầu:
+    ['market_MA200','market_rsi','sma_50','sma_200','rsi_14','volume_spike','macd','macd_signal','boll_width','atr_14']
+    - Tự tạo 'date' từ ['timestamp'/'time'/...] nếu thiếu.
+    - Tính theo từng 'ticker', sau đó gắn 'market_*' từ VNINDEX theo 'date'.
+    - market: bảng compute_market_features_v12(...) tính sẵn (khi df_hist là một chunk không có VNINDEX).
+    - cache: FeatureCache (strategies.feature_cache) — mã có nến không đổi lấy feature từ cache,
+      chỉ mã có nến thay đổi mới tính lại.
+    Kết quả sort theo (ticker, date), index 0..n-1 (sau khi bỏ phiên thiếu dữ liệu).
+    df_hist không bị sửa: bản sort (take) là bản sao duy nhất, mọi cột feature gắn thẳng vào đó.
+    """
+    if df_hist is None or len(df_hist) == 0:
+        return df_hist
+
+    dates = _date_series(df_hist)
+    keys = pd.DataFrame({'ticker': df_hist['ticker'].to_numpy(), 'date': dates.to_numpy()})
+    order = keys.sort_values(['ticker', 'date']).index.to_numpy()
+    df = df_hist.take(order)
+    df.index = pd.RangeIndex(len(df))
+    if 'date' not in df.columns:
+        df['date'] = keys['date'].to_numpy()[order]
+
+    # Tính theo từng mã trên lát cắt liên tiếp (Series view) → ghi vào mảng kết quả
+    tickers = df['ticker'].to_numpy()
+    close, high, low, volume = (df[c] for c in ('close', 'high', 'low', 'volume'))
+    if cache is not None:
+        day_ns = pd.to_datetime(df['date']).to_numpy('datetime64[ns]').view('i8')
+        ohlcv = [df[c].to_numpy(dtype=float) for c in ('open', 'high', 'low', 'close', 'volume')]
+    out = {c: np.full(len(df), np.nan) for c in FEATURE_COLS}
+    for a, b in _ticker_slices(tickers):
+        key = None
+        if cache is not None:
+            key = cache.make_key(tickers[a], day_ns[a:b], [x[a:b] for x in ohlcv], FEATURE_VERSION)
+            cached = cache.get(key, b - a)
+            if cached is not None and all(c in cached for c in FEATURE_COLS):
+                for col in FEATURE_COLS:
+                    out[col][a:b] = cached[col]
+                continue
+        arrays = _ticker_feature_arrays(close.iloc[a:b], high.iloc[a:b], low.iloc[a:b], volume.iloc[a:b])
+        for col in FEATURE_COLS:
+            out[col][a:b] = arrays[col]
+        if key is not None:
+            cache.put(key, arrays)
+    if cache is not None:
+        cache.evict()
+    for col in FEATURE_COLS:
+        df[col] = out[col]
+
+    if market is None:
+        market = compute_market_features_v12(df)
+    pos = pd.Index(market['date']).get_indexer(df['date'])
+    hit = pos >= 0
+    for col in MARKET_FEATURE_COLS:
+        vals = market[col].to_numpy(dtype=float)
+        df[col] = np.where(hit, vals[np.where(hit, pos, 0)], np.nan) if len(vals) else np.nan
 
     # Loại bỏ phiên chưa đủ dữ liệu cho các chỉ báo bắt buộc
-    req_cols = [
-        'market_close','market_MA50','market_MA200','market_rsi','market_boll_width','market_adx',
+    req_cols = MARKET_FEATURE_COLS + [
         'sma_50','sma_200','rsi_14','volume_spike','macd','macd_signal','boll_width','atr_14'
     ]
-    df = df.dropna(subset=req_cols)
-    return df
+    keep = np.ones(len(df), dtype=bool)
+    for col in req_cols:
+        keep &= df[col].notna().to_numpy()
+    return df if keep.all() else df.take(np.flatnonzero(keep))
 
 
-def apply_v12_on_last_day(feat_df):
-    """
-    Áp filter V12 trên NGÀY MỚI NHẤT.
-    feat_df: DataFrame đã qua compute_features_v12(...)
-    """
-    _require_v12()
+def _last_day_slice(feat_df):
     # Hỗ trợ cả 'timestamp' và 'time' (v12.py dùng 'time')
     ts_col = 'timestamp' if 'timestamp' in feat_df.columns else ('time' if 'time' in feat_df.columns else None)
     if ts_col is None:
@@ -264,10 +368,32 @@ def apply_v12_on_last_day(feat_df):
     if ts_col not in feat_df.columns:
         raise KeyError("[v12_adapter] Thiếu cột 'timestamp'/'time'/'date' để lấy phiên cuối.")
     last_ts = feat_df[ts_col].max()
-    df_last = feat_df[feat_df[ts_col] == last_ts].copy()
-    picks = _v12.apply_enhanced_screener_v12(df_last)
+    # Screener chỉ đọc → truyền lát cắt ngày cuối, không copy thêm
+    return feat_df.loc[feat_df[ts_col] == last_ts]
+
+def apply_v12_on_last_day(feat_df, with_scores: bool = False):
+    """
+    Áp filter V12 trên NGÀY MỚI NHẤT.
+    feat_df: DataFrame đã qua compute_features_v12(...)
+    with_scores=True → dict {ticker: score} (score của screener) thay vì list mã.
+    """
+    v12 = _require_v12()
+    df_last = _last_day_slice(feat_df)
+    if with_scores:
+        return dict(v12.apply_enhanced_screener_v12(df_last, with_scores=True))
+    picks = v12.apply_enhanced_screener_v12(df_last)
     return list(picks)
 
+def apply_screeners_on_last_day(feat_df, names):
+    """
+    Nhiều screener đã đăng ký (strategies/screener_registry.py) trên NGÀY MỚI NHẤT:
+    lát cắt ngày + screener_context tính MỘT lần, dùng chung → {name: ScreenResult}.
+    """
+    v12 = _require_v12()
+    df_last = _last_day_slice(feat_df)
+    ctx = v12.screener_context(df_last)
+    return run_screeners(df_last, ctx, names)
+
 def compute_picks_from_history(df_hist):
     """
     Pipeline tiện dụng: (1) tính feature toàn lịch sử -> (2) lọc last-day -> (3) áp V12.
@@ -275,12 +401,31 @@ def compute_picks_from_history(df_hist):
     feat = compute_features_v12(df_hist)
     return apply_v12_on_last_day(feat)
 
+# ============== Exit engine (dùng chung với backtest V12) ==============
+# Module thuần NumPy, không phụ thuộc phần script của v12.py nên import trực tiếp.
+from round_2.exit_engine import (  # noqa: E402
+    evaluate_exits_v12,
+    apply_partial_exit,
+    market_phase_v12,
+)
+
+# ============== Screener registry (live + shadow) ==============
+from strategies.screener_registry import register_screener, run_screeners  # noqa: E402
+
+register_screener("v12", lambda df, ctx: _require_v12().apply_enhanced_screener_v12(df, with_scores=True, ctx=ctx))
+register_screener(
+    "v12_sideway_soft",
+    lambda df, ctx: _require_v12().apply_enhanced_screener_v12_sideway_soft(df, with_scores=True, ctx=ctx),
+)
+
 # ============== OPTIONAL: Early signal intraday (không phải V12 đầy đủ) ==============
 
 def early_signal_from_15m_bar(prev_bar_row) -> bool:
     """
     Điều kiện 'V12-lite' intraday (demo) — chỉ cảnh báo sớm.
     Bạn có thể thay bằng tiền đề intraday thật của V12.
+    Stream 15' của bot dùng OrderFlowEngine (app/orderflow.py): cùng ý bu > sd nhưng theo cửa sổ nến,
+    cumulative delta phiên và khối lượng tương đối.
     """
     vol = float(prev_bar_row.get("volume", 0))
     bu  = float(prev_bar_row.get("bu", 0))
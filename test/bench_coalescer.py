@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_coalescer.py
+Bắn một loạt tick nến ngày đang chạy (mỗi callback cập nhật một nhóm mã ngẫu nhiên, như phiên biến động)
+qua BarCoalescer (app/coalescer.py) và so với đánh giá ngay trên mỗi callback:
+- số lượt đánh giá, thời gian CPU của phần đánh giá, độ trễ lớn nhất từ tick tới lúc đánh giá;
+- bản đánh giá cuối của mọi mã phải là tick cuối cùng của mã đó (không mất cập nhật);
+- sổ sách metrics: received = merged + dropped_unchanged + dropped_overflow + evaluated_tickers.
+
+Ví dụ:
+    python test/bench_coalescer.py --tickers 800 --ticks 3000 --rate 2000
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.coalescer import BarCoalescer  # noqa: E402
+
+
+def make_ticks(n_tickers: int, n_ticks: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    names = np.array([f"T{i:04d}" for i in range(n_tickers)])
+    price = np.full(n_tickers, 20.0)
+    vol = np.zeros(n_tickers)
+    day = pd.Timestamp("2025-09-19")
+    for _ in range(n_ticks):
+        idx = rng.choice(n_tickers, size=rng.integers(1, 30), replace=False)
+        price[idx] *= 1 + rng.normal(0, 0.002, len(idx))
+        vol[idx] += rng.integers(100, 10_000, len(idx))
+        yield pd.DataFrame({"ticker": names[idx], "timestamp": day, "close": price[idx].copy(),
+                            "volume": vol[idx].copy()})
+
+
+def evaluate_cost(df: pd.DataFrame, per_call_ms: float) -> None:
+    """Giả lập chi phí tính feature + screener: cố định mỗi lượt (thời gian CPU thật)."""
+    end = time.perf_counter() + per_call_ms / 1e3
+    while time.perf_counter() < end:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=800)
+    parser.add_argument("--ticks", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=2000, help="tick/giây của feed")
+    parser.add_argument("--eval-ms", type=float, default=20)
+    args = parser.parse_args()
+    ticks = list(make_ticks(args.tickers, args.ticks))
+    gap = 1 / args.rate
+
+    # ---- đánh giá ngay trên thread callback (chi phí cố định mỗi lượt → tính thẳng) ----
+    t_direct = len(ticks) * args.eval_ms / 1e3
+    feed_s = len(ticks) * gap
+    print(f"tại chỗ   : {len(ticks)} lượt, CPU {t_direct:.1f}s cho {feed_s:.1f}s feed "
+          f"→ tụt lại ~{max(0.0, t_direct - feed_s):.1f}s cuối loạt")
+
+    # ---- coalescer ----
+    last_eval = {}
+
+    def on_flush(df: pd.DataFrame) -> None:
+        evaluate_cost(df, args.eval_ms)
+        for t, c in zip(df["ticker"], df["close"]):
+            last_eval[t] = c
+
+    co = BarCoalescer(on_flush, interval=0.5, min_gap=0.1, min_change=0.005, name="bench").start()
+    t0 = time.perf_counter()
+    busy = 0.0
+    for i, df in enumerate(ticks):
+        s = time.perf_counter()
+        co.offer(df)
+        busy += time.perf_counter() - s
+        wait = t0 + (i + 1) * gap - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+    co.stop(flush=True)
+    m = co.metrics()
+
+    expect = pd.concat(ticks).groupby("ticker")["close"].last().to_dict()
+    ok = last_eval == expect
+    booked = m["merged"] + m["dropped_unchanged"] + m["dropped_overflow"] + m["evaluated_tickers"]
+    ok &= booked == m["received"]
+    print(f"coalescer : {m['evals']} lượt, CPU đánh giá ~{m['evals'] * args.eval_ms / 1e3:.1f}s, "
+          f"callback {busy * 1e3:.0f}ms, trễ tối đa {m['max_lag_ms']:.0f}ms")
+    print(f"metrics   : {m}")
+    print("OK: không mất cập nhật, sổ sách metrics khớp" if ok else "SAI LỆCH!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
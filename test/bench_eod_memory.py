@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_eod_memory.py
+Đo peak allocation (tracemalloc) của pipeline EOD V12 trên dữ liệu giả lập:
+  compute_features_v12 → lát cắt ngày cuối → apply_v12_on_last_day (screener).
+- Không gọi vendor/Telegram; dữ liệu sinh ngẫu nhiên (random walk) cho N mã + VNINDEX.
+- --rev <git rev>: chạy thêm bản strategies/v12_adapter.py tại revision đó để so sánh.
+
+Ví dụ:
+    python test/bench_eod_memory.py --tickers 1500 --days 260
+    python test/bench_eod_memory.py --rev HEAD~1
+"""
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "strategies.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def make_history(n_tickers: int, n_days: int, seed: int = 0) -> pd.DataFrame:
+    """Khung dữ liệu '1d' giống Fetch_Trading_Data(...).get_data() (thêm VNINDEX)."""
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_days)
+    names = ["VNINDEX"] + [f"S{i:04d}" for i in range(n_tickers)]
+    n = len(names) * n_days
+    ret = rng.normal(0.0005, 0.02, size=(len(names), n_days))
+    close = (100 * np.exp(np.cumsum(ret, axis=1))).ravel()
+    spread = np.abs(rng.normal(0, 0.01, n))
+    return pd.DataFrame({
+        "ticker": np.repeat(names, n_days),
+        "timestamp": np.tile(days.strftime("%Y-%m-%d"), len(names)),
+        "open": close * (1 + rng.normal(0, 0.005, n)),
+        "high": close * (1 + spread),
+        "low": close * (1 - spread),
+        "close": close,
+        "volume": rng.integers(50_000, 3_000_000, n).astype(float),
+        "bu": rng.uniform(0, 1e6, n),
+        "sd": rng.uniform(0, 1e6, n),
+        "fb": rng.uniform(0, 1e5, n),
+        "fs": rng.uniform(0, 1e5, n),
+        "fn": rng.normal(0, 1e5, n),
+    })
+
+
+def _load_adapter(rev: str | None):
+    if rev is None:
+        import strategies.v12_adapter as mod
+        return mod
+    src = subprocess.run(
+        ["git", "-C", str(ROOT), "show", f"{rev}:strategies/v12_adapter.py"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    mod = types.ModuleType(f"v12_adapter@{rev}")
+    exec(compile(src, mod.__name__, "exec"), mod.__dict__)
+    return mod
+
+
+def run_once(adapter, data: pd.DataFrame) -> dict:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    feat = adapter.compute_features_v12(data)
+    t_feat = time.perf_counter() - t0
+    peak_feat = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.reset_peak()
+    picks = None
+    try:
+        picks = adapter.apply_v12_on_last_day(feat)
+    except (ImportError, AttributeError) as exc:
+        # round_2.v12 không import được ở môi trường này → chỉ đo phần feature
+        print(f"  (bỏ qua screener: {str(exc).splitlines()[0][:80]})")
+    peak_screen = tracemalloc.get_traced_memory()[1]
+    t_all = time.perf_counter() - t0
+    tracemalloc.stop()
+    return {
+        "rows_out": len(feat),
+        "peak_feat_mb": peak_feat / 2**20,
+        "peak_screen_mb": peak_screen / 2**20,
+        "t_feat_s": t_feat,
+        "t_all_s": t_all,
+        "picks": picks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=400)
+    parser.add_argument("--days", type=int, default=260)
+    parser.add_argument("--rev", type=str, default=None, help="git revision để so sánh (vd HEAD~1)")
+    args = parser.parse_args()
+
+    data = make_history(args.tickers, args.days)
+    in_mb = data.memory_usage(deep=True).sum() / 2**20
+    print(f"Input: {len(data):,} dòng ({args.tickers} mã x {args.days} phiên), {in_mb:.1f} MB")
+
+    targets = [("working tree", None)] + ([(args.rev, args.rev)] if args.rev else [])
+    for label, rev in targets:
+        res = run_once(_load_adapter(rev), data)
+        print(
+            f"[{label}] features: peak {res['peak_feat_mb']:.1f} MB, {res['t_feat_s']:.2f}s | "
+            f"screener: peak {res['peak_screen_mb']:.1f} MB | tổng {res['t_all_s']:.2f}s | "
+            f"rows {res['rows_out']:,} | picks {res['picks']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_exit_engine.py
+Kiểm tra exit engine (round_2/exit_engine.py: evaluate_exits_v12) trùng vòng lặp thoát lệnh cũ của
+backtest_engine_v12 (chép nguyên logic trước khi tách engine) trên vị thế ngẫu nhiên, cả 3 pha thị trường:
+- có / không có chỉ báo tuỳ chọn (SMA5/SMA50, RSI/MFI/OBV, Bollinger) — None tương đương pivot không tồn tại;
+- so highest/trailing, trigger TP/SL/END, mất momentum, giá + loại thoát, số cổ phiếu bán, ứng viên pyramiding;
+- evaluate_sell_signals_for_day (alerts_on_date) gắn đúng loại tín hiệu (TP_PARTIAL / SL / MOMENTUM / END);
+- thời gian một lượt engine so với vòng lặp cũ.
+
+Ví dụ:
+    python test/bench_exit_engine.py --positions 2000 --rounds 30
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from round_2.exit_engine import evaluate_exits_v12  # noqa: E402
+
+TRAILING, PARTIAL, MIN_HOLD, LOT = 0.05, 0.4, 2, 100
+PHASES = {  # max_hold_days, loss_exit_threshold, pyramid_limit_phase (như backtest_engine_v12)
+    "bull": (45, -0.10, 2),
+    "sideway": (20, -0.03, 1),
+    "bear": (15, -0.12, 1),
+}
+OPTIONAL = ("sma5", "sma50", "rsi", "mfi", "obv", "prev_obv", "boll_upper", "boll_lower")
+
+
+def legacy_exit(p: dict, bar: dict, phase: str) -> dict:
+    """Một vị thế theo vòng lặp cũ (phần quyết định thoát, trước khi xét vốn / thanh khoản)."""
+    max_hold_days, loss_exit_threshold, pyramid_limit_phase = PHASES[phase]
+    open_val, high_val, low_val, close_val = bar["open"], bar["high"], bar["low"], bar["close"]
+    rsi_val, mfi_val, obv_val = bar.get("rsi"), bar.get("mfi"), bar.get("obv")
+    sma5_val = bar["sma5"] if bar.get("sma5") is not None else close_val
+    sma50_val = bar["sma50"] if bar.get("sma50") is not None else close_val
+    if pd.isna(close_val):
+        return {"valid": False}
+
+    holding_days = p["holding_days"]
+    tp, sl = p["tp"], p["sl"]
+    trailing_sl, highest_price = p["trailing_sl"], p["highest"]
+    if high_val > highest_price:
+        highest_price = high_val
+        trailing_sl = highest_price * (1 - TRAILING)
+    if phase == "sideway" and bar.get("boll_upper") is not None and bar.get("boll_lower") is not None:
+        tp = min(tp, bar["boll_upper"]) if not pd.isna(bar["boll_upper"]) else tp
+        sl = max(sl, bar["boll_lower"]) if not pd.isna(bar["boll_lower"]) else sl
+
+    trigger_tp = trigger_sl = False
+    exit_price = None
+    exit_type = "Normal"
+    if not pd.isna(open_val) and holding_days >= MIN_HOLD:
+        if open_val >= tp:
+            trigger_tp, exit_price = True, open_val
+            exit_type = "Pyramid" if p["pyramid_count"] > 0 else "Normal"
+        elif open_val <= min(sl, trailing_sl):
+            trigger_sl, exit_price = True, open_val
+    if exit_price is None and holding_days >= MIN_HOLD:
+        if high_val >= tp:
+            trigger_tp, exit_price = True, close_val
+            exit_type = "Pyramid" if p["pyramid_count"] > 0 else "Normal"
+        elif low_val <= min(sl, trailing_sl):
+            trigger_sl, exit_price = True, close_val
+
+    prev_obv = bar["prev_obv"] if bar.get("prev_obv") is not None else obv_val
+    is_weak = (rsi_val is not None and rsi_val < 30 and mfi_val is not None and mfi_val < 20
+               and obv_val is not None and obv_val < prev_obv)
+    profit = close_val / p["entry_price"] - 1
+    trigger_end = (holding_days >= max_hold_days or is_weak
+                   or (phase == "bear" and profit < loss_exit_threshold)
+                   or (phase == "sideway" and profit < -0.03))
+    if holding_days >= 50 and profit > 0.08 and phase == "bull":
+        trigger_end = False
+    momentum = phase == "sideway" and sma5_val < sma50_val and profit < 0.01
+    if momentum:
+        trigger_end = True
+        exit_type = "Momentum Loss"
+    pyramid = (not trigger_tp and not trigger_sl and not trigger_end and phase == "bull"
+               and 2 <= holding_days <= 10 and 0.05 < profit < 0.10 and p["pyramid_count"] < pyramid_limit_phase)
+
+    exit_ = (trigger_tp or trigger_sl or trigger_end) and holding_days >= MIN_HOLD
+    if exit_ and trigger_end and exit_price is None:
+        exit_price = close_val
+        exit_type = "Pyramid" if p["pyramid_count"] > 0 else "Normal"
+    return {
+        "valid": True, "highest": highest_price, "trailing_sl": trailing_sl,
+        "trigger_tp": trigger_tp, "trigger_sl": trigger_sl, "momentum_loss": momentum,
+        "exit": exit_, "exit_price": exit_price if exit_ else np.nan, "exit_type": exit_type if exit_ else None,
+        "shares_to_sell": int(p["shares"] * PARTIAL / LOT) * LOT if trigger_tp else p["shares"],
+        "pyramid": pyramid,
+    }
+
+
+def random_book(rng: np.random.Generator, n: int, with_optional: bool):
+    entry = rng.uniform(10, 50, n)
+    pos = {
+        "entry_price": entry,
+        "tp": entry * rng.uniform(1.03, 1.2, n),
+        "sl": entry * rng.uniform(0.85, 0.97, n),
+        "trailing_sl": entry * (1 - TRAILING),
+        "highest": entry * rng.uniform(1.0, 1.1, n),
+        "holding_days": rng.integers(0, 60, n),
+        "pyramid_count": rng.integers(0, 3, n),
+        "shares": rng.integers(1, 50, n) * LOT,
+    }
+    close = entry * rng.uniform(0.85, 1.15, n)
+    close[rng.random(n) < 0.03] = np.nan
+    bars = {
+        "open": close * rng.uniform(0.95, 1.05, n),
+        "high": close * rng.uniform(1.0, 1.08, n),
+        "low": close * rng.uniform(0.92, 1.0, n),
+        "close": close,
+    }
+    bars["open"][rng.random(n) < 0.03] = np.nan
+    if with_optional:
+        sma50 = close * rng.uniform(0.95, 1.05, n)
+        bars.update(
+            sma5=close * rng.uniform(0.95, 1.05, n), sma50=sma50,
+            rsi=rng.uniform(10, 70, n), mfi=rng.uniform(5, 60, n),
+            obv=rng.normal(0, 1e6, n), prev_obv=rng.normal(0, 1e6, n),
+            boll_upper=close * rng.uniform(1.0, 1.1, n), boll_lower=close * rng.uniform(0.9, 1.0, n),
+        )
+        for col in ("sma5", "rsi", "boll_upper"):
+            bars[col][rng.random(n) < 0.05] = np.nan
+    return pos, bars
+
+
+def compare(pos: dict, bars: dict, phase: str) -> tuple:
+    n = len(pos["entry_price"])
+    max_hold_days, loss_exit_threshold, pyramid_limit_phase = PHASES[phase]
+    t0 = time.perf_counter()
+    batch = evaluate_exits_v12(
+        pos["entry_price"], pos["tp"], pos["sl"], pos["trailing_sl"], pos["highest"], pos["holding_days"],
+        pos["pyramid_count"], pos["shares"], bars["open"], bars["high"], bars["low"], bars["close"],
+        market_phase=phase, max_hold_days=max_hold_days, loss_exit_threshold=loss_exit_threshold,
+        pyramid_limit_phase=pyramid_limit_phase, trailing_stop_pct=TRAILING, partial_profit_pct=PARTIAL,
+        min_holding_days=MIN_HOLD, lot_size=LOT, **{k: bars.get(k) for k in OPTIONAL},
+    )
+    t_engine = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ref = []
+    for k in range(n):
+        p = {c: v[k] for c, v in pos.items()}
+        bar = {c: (None if v is None else v[k]) for c, v in bars.items()}
+        ref.append(legacy_exit(p, bar, phase))
+    t_loop = time.perf_counter() - t0
+
+    bad = 0
+    for k, r in enumerate(ref):
+        if not r["valid"]:
+            bad += bool(batch.valid[k] or batch.exit[k])
+            continue
+        same = (
+            np.isclose(batch.highest[k], r["highest"]) and np.isclose(batch.trailing_sl[k], r["trailing_sl"])
+            and batch.trigger_tp[k] == r["trigger_tp"] and batch.trigger_sl[k] == r["trigger_sl"]
+            and batch.momentum_loss[k] == r["momentum_loss"] and batch.exit[k] == r["exit"]
+            and np.allclose(batch.exit_price[k], r["exit_price"], equal_nan=True)
+            and (not r["exit"] or (batch.exit_type_label(k) == r["exit_type"]
+                                   and batch.shares_to_sell[k] == r["shares_to_sell"]))
+            and batch.pyramid[k] == r["pyramid"]
+        )
+        bad += not same
+    exits = sum(bool(r.get("exit")) for r in ref)
+    momentum = sum(bool(r.get("exit") and r["momentum_loss"]) for r in ref)
+    return bad, exits, momentum, t_engine, t_loop
+
+
+def check_sell_signals() -> bool:
+    """alerts_on_date: loại tín hiệu theo mask của engine (MOMENTUM không còn bị nuốt thành END)."""
+    from app.jobs.alerts_on_date import Position, evaluate_sell_signals_for_day
+
+    day = pd.Timestamp("2025-09-19")
+    entry = day - pd.Timedelta(days=5)
+    rows = {  # ticker: (open, high, low, close, sma_5, sma_50) — entry 10, TP 12, SL 9
+        "TPX": (10.5, 12.5, 10.4, 12.0, 11.0, 10.0),
+        "SLX": (9.5, 9.6, 8.8, 8.9, 9.0, 10.0),
+        "MOM": (10.0, 10.1, 9.9, 10.0, 9.5, 10.0),
+        "OLD": (10.0, 10.1, 9.95, 10.05, 10.5, 10.0),
+    }
+    bars = pd.DataFrame.from_dict(rows, orient="index", columns=["open", "high", "low", "close", "sma_5", "sma_50"])
+    positions = {t: Position(t, str(entry.date()), 10.0, 12.0, 9.0, 10.2, False, 9.5, 1000, 0) for t in rows}
+    positions["OLD"].entry_date = str((day - pd.Timedelta(days=30)).date())
+    market = {"market_close": 1000, "market_MA50": 1000, "market_MA200": 1100, "market_rsi": 50,
+              "market_adx": 15, "market_boll_width": 0.2}
+    got = {t: s["type"] for t, s in evaluate_sell_signals_for_day(positions, bars, day, market).items()}
+    expect = {"TPX": "TP_PARTIAL", "SLX": "SL", "MOM": "MOMENTUM", "OLD": "END"}
+    print(f"alerts_on_date (sideway): {got} | khớp = {got == expect}")
+    return got == expect
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--positions", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    ok = True
+    for with_optional in (False, True):
+        for phase in PHASES:
+            bad = exits = momentum = 0
+            t_engine = t_loop = 0.0
+            for _ in range(args.rounds):
+                b, e, m, te, tl = compare(*random_book(rng, args.positions, with_optional), phase)
+                bad, exits, momentum = bad + b, exits + e, momentum + m
+                t_engine, t_loop = t_engine + te, t_loop + tl
+            ok &= bad == 0
+            label = "đủ chỉ báo" if with_optional else "không chỉ báo"
+            print(f"{phase:>8} | {label:>13}: lệch {bad:>4} / {args.positions * args.rounds} vị thế | "
+                  f"thoát {exits:>6} (mất momentum {momentum:>5}) | engine {t_engine / args.rounds * 1e3:.2f}ms "
+                  f"vs vòng lặp {t_loop / args.rounds * 1e3:.1f}ms mỗi lượt")
+
+    ok &= check_sell_signals()
+    print("OK: exit engine trùng vòng lặp cũ của backtest" if ok else "SAI LỆCH!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_orderflow.py
+Phát lại frame nến 15' (mỗi callback trả cả lịch sử + nến mới mở, như vendor) qua OrderFlowEngine
+(app/orderflow.py) và kiểm tra với bản tính pandas trên toàn bộ lịch sử:
+- feature của nến vừa đóng (imbalance, imbalance cửa sổ, cumulative delta phiên, khối lượng tương đối
+  theo khung giờ, VWAP / khối ngoại / áp lực mua của phiên) và tập tín hiệu (mã, nến) phải trùng;
+- FlowAccumulator với nến ngày đang chạy (giá trị luỹ kế mỗi tick): VWAP khớp Σ close×ΔKL / ΣKL;
+- frame chỉ gồm delta (như ShardPool gửi) cho cùng tín hiệu;
+- atr_last trùng _atr của V12 (atr_14) → TP/SL của DailyLevels;
+- thời gian mỗi callback so với vòng lặp cũ (groupby + early_signal_from_15m_bar từng dòng).
+
+Ví dụ:
+    python test/bench_orderflow.py --tickers 1500 --days 12 --updates 20
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.feed_sim import synthetic_bars  # noqa: E402
+from app.intraday_flow import FEATURES, FlowAccumulator  # noqa: E402
+from app.orderflow import DailyLevels, OrderFlowEngine, atr_last  # noqa: E402
+
+WINDOW, MIN_IMB, MIN_RVOL, MIN_DAYS, MIN_VWAP_DEV, MIN_FOREIGN = 4, 0.1, 1.5, 3, -1.0, -1.0
+
+
+def reference(bars: pd.DataFrame) -> pd.DataFrame:
+    """Feature order-flow của mọi nến bằng pandas (profile = trung bình mọi phiên trước, profile_days đủ lớn)."""
+    df = bars.sort_values(["ticker", "timestamp"], ignore_index=True)
+    g = df.groupby("ticker", sort=False)
+    tot = df["bu"] + df["sd"]
+    df["imbalance"] = np.where(tot > 0, (df["bu"] - df["sd"]) / tot.where(tot > 0, 1), 0.0)
+    wbu = g["bu"].transform(lambda s: s.rolling(WINDOW, min_periods=1).sum())
+    wsd = g["sd"].transform(lambda s: s.rolling(WINDOW, min_periods=1).sum())
+    wtot = wbu + wsd
+    df["window_imbalance"] = np.where(wtot > 0, (wbu - wsd) / wtot.where(wtot > 0, 1), 0.0)
+    day = df["timestamp"].dt.normalize()
+    gd = df.groupby([df["ticker"], day])
+    df["cum_delta"] = (df["bu"] - df["sd"]).groupby([df["ticker"], day]).cumsum()
+    svol = gd["volume"].cumsum()
+    pv = ((df["high"] + df["low"] + df["close"]) / 3 * df["volume"]).groupby([df["ticker"], day]).cumsum()
+    df["vwap"] = pv / svol
+    df["vwap_dev"] = df["close"] / df["vwap"] - 1
+    fb, fs, bu, sd = (gd[c].cumsum() for c in ("fb", "fs", "bu", "sd"))
+    df["foreign_net"] = fb - fs
+    df["foreign_ratio"] = (fb - fs) / svol
+    df["foreign_pressure"] = fb / (fb + fs)
+    df["buy_pressure"] = bu / (bu + sd)
+    slot = df["timestamp"].dt.hour * 4 + df["timestamp"].dt.minute // 15
+    gs = df.groupby([df["ticker"], slot])["volume"]
+    base = gs.transform(lambda s: s.shift().expanding().mean())
+    cnt = gs.cumcount()
+    df["rvol"] = np.where((cnt >= MIN_DAYS) & (base > 0), df["volume"] / base, np.nan)
+    df["signal"] = ((df["volume"] > 0) & (df["imbalance"] > 0) & (df["window_imbalance"] >= MIN_IMB)
+                    & (df["cum_delta"] > 0) & (df["rvol"] >= MIN_RVOL)
+                    & ((MIN_VWAP_DEV <= -1) | (df["vwap_dev"] >= MIN_VWAP_DEV))
+                    & ((MIN_FOREIGN <= -1) | (df["foreign_ratio"] >= MIN_FOREIGN)))
+    return df
+
+
+def frames(bars: pd.DataFrame, n_updates: int, delta: bool = False):
+    stamps = np.sort(bars["timestamp"].unique())
+    start = len(stamps) - n_updates
+    for j in range(start, len(stamps)):
+        lo = stamps[j - 1] if delta and j > start else stamps[0]
+        yield bars[(bars["timestamp"] >= lo) & (bars["timestamp"] <= stamps[j])]
+
+
+def check_running_day(bars: pd.DataFrame) -> bool:
+    day = bars["timestamp"].dt.normalize()
+    g = bars.groupby([bars["ticker"], day])
+    ticks = bars.assign(timestamp=day, high=g["high"].cummax(), low=g["low"].cummin(),
+                        **{c: g[c].cumsum() for c in ("volume", "bu", "sd", "fb", "fs")})
+    last_day = day.max()
+    ticks = ticks[ticks["timestamp"] == last_day]
+    acc, times = FlowAccumulator(), []
+    for _, tick in ticks.groupby(bars.loc[ticks.index, "timestamp"], sort=True):
+        t0 = time.perf_counter()
+        acc.observe_frame(tick)
+        times.append(time.perf_counter() - t0)
+    # lần đầu: luỹ kế theo giá điển hình; sau đó: ΔKL theo close của tick
+    sess = bars[day == last_day].sort_values(["ticker", "timestamp"])
+    first = sess.groupby("ticker").head(1)
+    rest = sess.drop(first.index)
+    pv = ((first["high"] + first["low"] + first["close"]) / 3 * first["volume"]).groupby(first["ticker"]).sum()
+    pv = pv.add((rest["close"] * rest["volume"]).groupby(rest["ticker"]).sum(), fill_value=0)
+    expect = pv / sess.groupby("ticker")["volume"].sum()
+    got = acc.attach(ticks.groupby("ticker").tail(1)).set_index("ticker")
+    same = np.allclose(got["vwap"].sort_index().to_numpy(), expect.sort_index().to_numpy())
+    fn = sess.groupby("ticker")["fb"].sum() - sess.groupby("ticker")["fs"].sum()
+    same &= np.allclose(got["foreign_net"].sort_index().to_numpy(), fn.sort_index().to_numpy())
+    print(f"nến ngày đang chạy: {len(times)} tick × {len(got)} mã, observe p50 {np.median(times) * 1e3:.2f}ms "
+          f"| VWAP + khối ngoại khớp = {same}")
+    return bool(same)
+
+
+def legacy_loop(df: pd.DataFrame) -> int:
+    from strategies.v12_adapter import early_signal_from_15m_bar
+
+    hits = 0
+    for _, g in df.sort_values(["ticker", "timestamp"]).groupby("ticker"):
+        if len(g) >= 2 and early_signal_from_15m_bar(g.iloc[-2]):
+            hits += 1
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=1500)
+    parser.add_argument("--days", type=int, default=12)
+    parser.add_argument("--updates", type=int, default=20)
+    args = parser.parse_args()
+    ok = True
+
+    bars = synthetic_bars([f"T{i:04d}" for i in range(args.tickers)], by="15m", n_bars=17 * args.days)
+    ref = reference(bars).set_index(["ticker", "timestamp"])
+    stamps = np.sort(bars["timestamp"].unique())
+    evaluated = stamps[-args.updates - 1:-1]  # nến vừa đóng ở mỗi callback
+    expect = set(ref.index[ref["signal"] & ref.index.get_level_values(1).isin(evaluated)])
+
+    for delta in (False, True):
+        eng = OrderFlowEngine(window=WINDOW, min_imbalance=MIN_IMB, min_rvol=MIN_RVOL,
+                              profile_days=10_000, profile_min_days=MIN_DAYS, min_vwap_dev=MIN_VWAP_DEV,
+                              min_foreign_ratio=MIN_FOREIGN)
+        times, got, rows = [], set(), []
+        for df in frames(bars, args.updates, delta):
+            t0 = time.perf_counter()
+            sig = eng.update(df)
+            times.append(time.perf_counter() - t0)
+            if sig is not None:
+                got |= set(zip(sig["ticker"], sig["timestamp"]))
+                rows.append(sig)
+        same = got == expect
+        if rows:
+            sig = pd.concat(rows).set_index(["ticker", "timestamp"])
+            cols = ["imbalance", "window_imbalance", "cum_delta", "rvol", *FEATURES]
+            same &= np.allclose(sig[cols].to_numpy(float), ref.loc[sig.index, cols].to_numpy(float), equal_nan=True)
+        ok &= same
+        label = "delta" if delta else "cả lịch sử"
+        print(f"frame {label:>10}: tín hiệu={len(got):>5} (kỳ vọng {len(expect)}) khớp={same} | "
+              f"lần đầu {times[0] * 1e3:.0f}ms, sau đó p50 {np.median(times[1:]) * 1e3:.1f}ms "
+              f"max {max(times[1:]) * 1e3:.1f}ms | {eng.metrics()}")
+
+    last = list(frames(bars, 1))[0]
+    t0 = time.perf_counter()
+    legacy_loop(last)
+    print(f"vòng lặp cũ (groupby + từng dòng): {(time.perf_counter() - t0) * 1e3:.0f}ms mỗi callback")
+
+    # ---- nến ngày đang chạy: mỗi tick là luỹ kế của phiên tới nến 15' đó ----
+    ok &= check_running_day(bars)
+
+    # ---- ATR ngày → TP/SL ----
+    from strategies.v12_adapter import _atr
+
+    daily = synthetic_bars([f"T{i:04d}" for i in range(50)], by="1d", n_bars=40)
+    got_atr = atr_last(daily)
+    exp_atr = pd.Series({tk: _atr(g["high"], g["low"], g["close"]).iloc[-1] for tk, g in daily.groupby("ticker")})
+    same = np.allclose(got_atr.sort_index().to_numpy(), exp_atr.sort_index().to_numpy())
+    levels = DailyLevels(atr=got_atr, regime="bull", atr_mult=2.0)
+    one = levels.apply(pd.DataFrame({"ticker": ["T0000", "NOPE"], "close": [10.0, 10.0]}))
+    same &= np.isclose(one["tp"].iloc[0], 10 + 2 * got_atr["T0000"]) and one["tp"].iloc[1] == one["sl"].iloc[1] == 10
+    ok &= bool(same)
+    print(f"ATR ngày: {len(got_atr)} mã, khớp atr_14 V12 = {same}")
+
+    print("OK: order-flow khớp bản tính pandas" if ok else "SAI LỆCH!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
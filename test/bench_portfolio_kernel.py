@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_portfolio_kernel.py
+So sánh backtest_engine_v12 (vòng lặp Python) với backtest_engine_v12_numba (kernel numba)
+trên dữ liệu giả lập có cả phiên cạn thanh khoản (hoãn bán), open NaN, pyramiding, chốt lời một phần:
+- Sổ lệnh và chuỗi giá trị danh mục phải trùng khớp tuyệt đối.
+- Đo thời gian: engine Python, engine numba (gồm screener), và riêng kernel khi signal_rank có sẵn.
+
+Import round_2.v12 như module thường (phần chạy thử kiểu notebook nằm trong _notebook_demo, không chạy khi import).
+
+Ví dụ:
+    python test/bench_portfolio_kernel.py --tickers 60 --days 750 --seeds 3
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "round_2.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def make_data(n_tickers: int, n_days: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2022-01-03", periods=n_days)
+    frames = []
+    for t in range(n_tickers):
+        c = 20 * np.cumprod(1 + rng.normal(0.001, 0.025, n_days))
+        o = c * (1 + rng.normal(0, 0.01, n_days))
+        h = np.maximum(o, c) * (1 + abs(rng.normal(0, 0.015, n_days)))
+        lo = np.minimum(o, c) * (1 - abs(rng.normal(0, 0.015, n_days)))
+        v = rng.integers(100_000, 5_000_000, n_days).astype(float)
+        v[rng.random(n_days) < 0.3] *= 0.002          # phiên cạn thanh khoản
+        o[rng.random(n_days) < 0.03] = np.nan
+        df = pd.DataFrame({"time": dates, "ticker": f"T{t:03d}", "open": o, "high": h, "low": lo,
+                           "close": c, "volume": v})
+        frames.append(df[rng.random(n_days) >= 0.02])  # thiếu phiên lẻ tẻ
+    d = pd.concat(frames)
+    g = d.groupby("ticker")
+    roll = lambda col, w: g[col].transform(lambda x: x.rolling(w, min_periods=1).mean())  # noqa: E731
+    d["volume_ma20"] = roll("volume", 20)
+    d["sma_5"], d["sma_50"], d["sma_200"] = roll("close", 5), roll("close", 50), roll("close", 200)
+    d["atr_14"] = (d["high"] - d["low"]).groupby(d["ticker"]).transform(lambda x: x.rolling(14, min_periods=1).mean())
+    d["volume_spike"] = d["volume"] / d["volume_ma20"]
+    n = len(d)
+    d["rsi_14"] = rng.uniform(20, 80, n)
+    d["macd"], d["macd_signal"] = rng.normal(0, 1, n), rng.normal(0, 1, n)
+    d["boll_width"] = rng.uniform(0.05, 0.5, n)
+    m = pd.DataFrame({"time": dates, "market_close": 1000 * np.cumprod(1 + rng.normal(0.0005, 0.01, n_days))})
+    m["market_MA50"] = m["market_close"].rolling(50, min_periods=1).mean()
+    m["market_MA200"] = m["market_close"].rolling(200, min_periods=1).mean()
+    m["market_rsi"] = rng.uniform(30, 70, n_days)
+    m["market_adx"] = rng.uniform(10, 30, n_days)
+    m["market_boll_width"] = rng.uniform(0.1, 0.5, n_days)
+    return d.merge(m, on="time").set_index("time").sort_index()
+
+
+def top_volume_spike(df_day: pd.DataFrame, min_volume_ma20: int = 0) -> list:
+    return df_day.sort_values("volume_spike", ascending=False)["ticker"].head(4).tolist()
+
+
+def _run(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=60)
+    parser.add_argument("--days", type=int, default=750)
+    parser.add_argument("--seeds", type=int, default=3)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):  # v12 in thông báo nạp thư viện khi import
+        from round_2 import v12
+    params = dict(min_holding_days=2, trade_limit_pct=0.05, liquidity_threshold=0.05, min_volume_ma20=0)
+    screeners = {"top_volume_spike": top_volume_spike, "apply_enhanced_screener_v12": v12.apply_enhanced_screener_v12}
+    start, end = "2022-01-01", "2026-12-31"
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # engine ghi log csv/parquet vào thư mục hiện hành
+        try:
+            _run(v12.backtest_engine_v12_numba, make_data(5, 60, 0), top_volume_spike, start, end, 1e9, 1e9)  # JIT
+            all_ok = True
+            for seed in range(args.seeds):
+                data = make_data(args.tickers, args.days, seed)
+                for name, screener in screeners.items():
+                    (h_py, _, tr_py), t_py = _run(v12.backtest_engine_v12, data, screener, start, end, 1e9, 1e9, **params)
+                    (h_nb, _, tr_nb), t_nb = _run(v12.backtest_engine_v12_numba, data, screener, start, end, 1e9, 1e9, **params)
+                    same = pd.DataFrame(tr_py).equals(tr_nb.to_frame()) and np.array_equal(
+                        h_py["Portfolio Value"].to_numpy(), h_nb["Portfolio Value"].to_numpy())
+                    all_ok &= same
+
+                    bt = data[(data.index >= start) & (data.index <= end)]
+                    close = bt.pivot_table(index="time", columns="ticker", values="close", fill_value=np.nan)
+                    rank = v12.screener_signal_matrix(bt, screener, params["min_volume_ma20"],
+                                                         close.index.tolist(), close.columns.tolist())
+                    _, t_kernel = _run(v12.backtest_engine_v12_numba, data, screener, start, end, 1e9, 1e9,
+                                       signal_rank=rank, **params)
+                    print(f"seed={seed} {name:<28} lệnh={len(tr_py):>4} khớp={same} | Python {t_py:.2f}s | "
+                          f"numba {t_nb:.2f}s | numba + signal_rank có sẵn {t_kernel:.2f}s")
+        finally:
+            os.chdir(cwd)
+    print("OK: sổ lệnh trùng khớp tuyệt đối" if all_ok else "SAI LỆCH giữa hai engine!")
+    sys.exit(0 if all_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
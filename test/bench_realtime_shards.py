@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_realtime_shards.py
+Phát lại một luồng callback giả lập (mỗi callback trả cả lịch sử + nến đang chạy như vendor) qua
+ShardPool (app/realtime_shards.py) và so với cách tính tại chỗ trên thread callback:
+- 15m: tập tín hiệu order-flow (mã, nến) phải trùng với OrderFlowEngine chạy tại chỗ (_on_bar_15m).
+- 1d: nến cuối (feature V12) của mọi mã phải trùng compute_features_v12 trên toàn bộ dữ liệu.
+- Đo thời gian thread callback bị chiếm và tổng thời gian tới kết quả cuối theo số shard.
+
+Ví dụ:
+    python test/bench_realtime_shards.py --tickers 300 --updates 20 --shards 1 2 4
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.realtime_shards import DayFeatures, ShardPool, Signals15m  # noqa: E402
+
+
+def make_bars(n_tickers: int, n_bars: int, freq: str, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range("2025-01-02 09:15", periods=n_bars, freq=freq)
+    names = ["VNINDEX"] + [f"T{i:04d}" for i in range(n_tickers)]
+    n = len(names) * n_bars
+    close = 20 * np.cumprod(1 + rng.normal(0.0005, 0.02, (len(names), n_bars)), axis=1).ravel()
+    return pd.DataFrame({
+        "ticker": np.repeat(names, n_bars),
+        "timestamp": np.tile(ts, len(names)),
+        "open": close * (1 + rng.normal(0, 0.005, n)),
+        "high": close * 1.01,
+        "low": close * 0.99,
+        "close": close,
+        "volume": rng.integers(200_000, 3_000_000, n).astype(float),
+        "bu": rng.uniform(0, 1e5, n),
+        "sd": rng.uniform(0, 1e5, n),
+    })
+
+
+def feed(bars: pd.DataFrame, n_updates: int, seed: int = 1):
+    """Mỗi callback: toàn bộ lịch sử tới nến t (nến cuối đang chạy, giá thay đổi giữa các lần)."""
+    rng = np.random.default_rng(seed)
+    stamps = np.sort(bars["timestamp"].unique())
+    for t in stamps[-n_updates:]:
+        df = bars[bars["timestamp"] <= t].copy()
+        last = (df["timestamp"] == t).to_numpy()
+        df.loc[last, "close"] *= 1 + rng.normal(0, 0.002, last.sum())
+        yield df
+
+
+def reference_15m(updates) -> set:
+    from app.orderflow import OrderFlowEngine
+
+    eng, out = OrderFlowEngine(), set()
+    for df in updates:
+        sig = eng.update(df)
+        if sig is not None:
+            out |= set(zip(sig["ticker"], sig["timestamp"]))
+    return out
+
+
+def run_pool(evaluator, updates, n_shards: int):
+    results = {}
+    lock = threading.Lock()
+
+    def on_result(shard, res):
+        with lock:
+            results.setdefault(shard, []).append(res)
+
+    pool = ShardPool(evaluator, on_result, n_shards=n_shards, queue_size=8, name=f"bench-{n_shards}").start()
+    time.sleep(0.5)  # chờ worker spawn (import lần đầu trong worker vẫn tính vào "tổng")
+    t0 = time.perf_counter()
+    busy = 0.0
+    for df in updates:
+        s = time.perf_counter()
+        pool.submit(df)
+        busy += time.perf_counter() - s
+    pool.stop(timeout=600)
+    return results, busy, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=300)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    ok = True
+
+    # ---- 15m ----
+    from app.feed_sim import synthetic_bars
+
+    bars = synthetic_bars([f"T{i:04d}" for i in range(args.tickers)], by="15m", n_bars=17 * 8)
+    updates = list(feed(bars, args.updates))
+    ref = reference_15m(updates)
+    for n in args.shards:
+        res, busy, total = run_pool(Signals15m, updates, n)
+        got = {(tk, pd.Timestamp(ts)) for rs in res.values() for r in rs for tk, ts in zip(r["ticker"], r["timestamp"])}
+        same = got == {(tk, pd.Timestamp(ts)) for tk, ts in ref}
+        ok &= same
+        print(f"15m shards={n}: tín hiệu={len(got):>5} khớp={same} | callback {busy:.2f}s | tổng {total:.2f}s")
+
+    # ---- 1d ----
+    from strategies.v12_adapter import compute_features_v12
+
+    updates = list(feed(make_bars(args.tickers, 300, "B"), args.updates))
+    t0 = time.perf_counter()
+    for df in updates:
+        expect = compute_features_v12(df)
+    t_inline = time.perf_counter() - t0
+    expect = expect.groupby("ticker", sort=False).tail(1).set_index("ticker").sort_index()
+    print(f"1d tính tại chỗ trên thread callback: {t_inline:.2f}s")
+    for n in args.shards:
+        res, busy, total = run_pool(DayFeatures, updates, n)
+        got = pd.concat([rs[-1] for rs in res.values()]).set_index("ticker").sort_index()
+        same = got.index.equals(expect.index) and np.allclose(
+            got[expect.columns.drop(["date"])].select_dtypes("number").to_numpy(dtype=float),
+            expect[expect.columns.drop(["date"])].select_dtypes("number").to_numpy(dtype=float), equal_nan=True)
+        ok &= same
+        print(f"1d  shards={n}: mã={len(got):>5} khớp={same} | callback {busy:.2f}s | tổng {total:.2f}s")
+
+    print("OK: kết quả sharded trùng tính tại chỗ" if ok else "SAI LỆCH!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_robustness.py
+Chạy thử round_2/robustness.py trên dữ liệu giả lập (cùng bộ sinh với bench_portfolio_kernel.py):
+- Kiểm tra path_metrics của lần chạy không nhiễu khớp calculate_enhanced_metrics của engine.
+- Monte Carlo (xáo thứ tự mua + trượt giá + bỏ phiên) qua process pool; kết quả không phụ thuộc số worker.
+- Block bootstrap lợi suất ngày; in bảng phân vị và thông lượng (mô phỏng/giây).
+
+Ví dụ:
+    python test/bench_robustness.py --sims 2000 --workers 8
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "test"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from bench_portfolio_kernel import load_engines, make_data, top_volume_spike  # noqa: E402
+from round_2.portfolio_kernel import run_kernel  # noqa: E402
+from round_2.robustness import (  # noqa: E402
+    Perturbation, bootstrap_returns, path_metrics, run_monte_carlo, summarize, _years,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=60)
+    parser.add_argument("--days", type=int, default=750)
+    parser.add_argument("--sims", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--bootstrap", type=int, default=10000)
+    args = parser.parse_args()
+
+    v12 = load_engines()
+    data = make_data(args.tickers, args.days, 0)
+    start, end = "2022-01-01", "2026-12-31"
+    params = dict(initial_capital=1e9, min_holding_days=2, trade_limit_pct=0.05, liquidity_threshold=0.05)
+
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        inputs = v12["prepare_kernel_inputs"](data, top_volume_spike, start, end, min_volume_ma20=0)
+        hist, metrics, _ = v12["backtest_engine_v12"](data, top_volume_spike, start, end, 1e9, 1e9, min_volume_ma20=0,
+                                                      **{k: v for k, v in params.items() if k != "initial_capital"})
+    print(f"Chuẩn bị KernelInputs + 1 lần engine Python: {time.perf_counter() - t0:.1f}s")
+
+    pv = run_kernel(inputs, **params)[0]
+    base = {k: float(v[0]) for k, v in path_metrics(pv, _years(inputs.dates_ns)).items()}
+    ok = all(np.isclose(base[k], metrics[k], rtol=1e-12) for k in base)
+    print(f"path_metrics khớp calculate_enhanced_metrics: {ok}")
+
+    mc = run_monte_carlo(inputs, n_sims=args.sims, params=params, perturbation=Perturbation(), workers=args.workers)
+    small = run_monte_carlo(inputs, n_sims=min(50, args.sims), params=params, workers=1)
+    same = small.equals(mc.loc[small.index])
+    print(f"Kết quả độc lập số worker: {same}")
+    print("\nMonte Carlo (xáo thứ tự mua, trượt giá, bỏ phiên):")
+    print(summarize(mc).to_string(float_format=lambda x: f"{x:,.4f}"))
+
+    t0 = time.perf_counter()
+    bs = bootstrap_returns(pv, inputs.dates_ns, n_sims=args.bootstrap)
+    print(f"\nBootstrap lợi suất ngày ({args.bootstrap} đường, {time.perf_counter() - t0:.2f}s):")
+    print(summarize(bs).to_string(float_format=lambda x: f"{x:,.4f}"))
+    sys.exit(0 if ok and same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_snapshot.py
+Đo hot snapshot (app/snapshot.py) trên feature frame giả lập:
+- thời gian publish (dựng chỉ mục + ghi Arrow IPC),
+- tra cứu trong process (ticker / ngày / picks),
+- round-trip qua server HTTP (keep-alive) và Unix socket, đối chiếu kết quả với tra cứu trực tiếp.
+
+Ví dụ:
+    python test/bench_snapshot.py --tickers 400 --days 260
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app import snapshot  # noqa: E402
+from app.config import CFG  # noqa: E402
+
+
+def make_features(n_tickers: int, n_days: int, n_cols: int = 40, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2025-01-02", periods=n_days)
+    n = n_tickers * n_days
+    df = pd.DataFrame({
+        "ticker": np.repeat([f"T{i:04d}" for i in range(n_tickers)], n_days),
+        "date": np.tile(dates, n_tickers),
+    })
+    for j in range(n_cols):
+        df[f"f{j:02d}"] = rng.normal(size=n)
+    for k in ("market_close", "market_MA50", "market_MA200", "market_rsi", "market_adx", "market_boll_width"):
+        df[k] = np.tile(rng.uniform(10, 60, n_days), n_tickers)
+    return df
+
+
+def _timeit(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=400)
+    parser.add_argument("--days", type=int, default=260)
+    parser.add_argument("--n", type=int, default=2000)
+    args = parser.parse_args()
+
+    feat = make_features(args.tickers, args.days)
+    last = feat["date"].max()
+    scores = {f"T{i:04d}": float(i) for i in range(0, args.tickers, 50)}
+
+    snapshot.FeatureSnapshot("warmup", feat.head(1))  # nạp strategy_adapter (pha V12) ngoài phép đo
+    with tempfile.TemporaryDirectory() as tmp:
+        CFG.snapshot_ipc_dir = tmp
+        t0 = time.perf_counter()
+        snap = snapshot.publish("eod", feat, scores, last)
+        t_pub = time.perf_counter() - t0
+        table, meta = snapshot.load_ipc("eod", tmp)
+        ok = table.num_rows == len(feat) and meta["picks"] == list(scores)
+        print(f"publish {len(feat):,} dòng × {feat.shape[1]} cột (gồm Arrow IPC): {t_pub * 1e3:.1f} ms")
+
+        day = feat["date"].drop_duplicates().iloc[-20].strftime("%Y-%m-%d")
+        print(f"in-process  ticker(ngày cuối) {_timeit(lambda: snap.ticker('T0123'), args.n):8.1f} µs")
+        print(f"in-process  ticker(ngày cũ)   {_timeit(lambda: snap.ticker('T0123', day), args.n):8.1f} µs")
+        print(f"in-process  picks             {_timeit(snap.picks, args.n):8.1f} µs")
+
+        CFG.use_snapshot_server = True
+        for mode in ("tcp", "unix"):
+            CFG.snapshot_port = 0
+            CFG.snapshot_socket = os.path.join(tmp, "snap.sock") if mode == "unix" else ""
+            server = snapshot.start_snapshot_server()
+            if mode == "tcp":
+                CFG.snapshot_port = server.server_address[1]
+            conn = snapshot.connect()
+            try:
+                got = snapshot.query("/ticker/t0123", conn, job="eod")["rows"]
+                ok &= got == snap.ticker("T0123")
+                ok &= snapshot.query("/picks", conn)["picks"] == list(scores)
+                ok &= len(snapshot.query(f"/date/{day}", conn)["rows"]) == args.tickers
+                ok &= "error" in snapshot.query("/ticker/NOPE", conn)
+                us = _timeit(lambda: snapshot.query("/ticker/T0123", conn, job="eod"), args.n)
+                print(f"{mode:<5} round-trip ticker (keep-alive) {us:8.1f} µs")
+            finally:
+                conn.close()
+                snapshot.stop_snapshot_server()
+
+    print("OK: kết quả server khớp tra cứu trực tiếp" if ok else "SAI LỆCH!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_startup.py
+Import graph của bot (`import app.main`) — báo cáo chi phí import theo module và kiểm tra ngân sách khởi động:
+- chạy `python -X importtime -c "import app.main"` trong process con, in các module tốn nhất (self / cumulative)
+  và tổng self-time theo package gốc;
+- đo thời gian import app.main và RSS lúc chờ lịch (sau import, chưa chạy job) — trung vị của --runs lần;
+- module nặng không được nạp lúc khởi động (pandas, numpy, numba, matplotlib, V12, FiinQuantX, ...) — chỉ nạp
+  ở job đầu tiên; in thêm chi phí lần nạp đó để biết job đầu chậm hơn bao nhiêu;
+- vượt ngân sách (--max-import-s, --max-rss-mb) hoặc nạp module cấm → exit 1 (dùng được trong CI/Docker build).
+
+Ví dụ:
+    python test/bench_startup.py
+    python test/bench_startup.py --max-import-s 0.3 --max-rss-mb 50 --top 30
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+HEAVY = ("pandas", "numpy", "numba", "matplotlib", "scipy", "sklearn", "pyarrow", "stumpy", "plotly",
+         "round_2.v12", "strategies.v12_adapter", "FiinQuantX")
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - t0
+rss = 0
+try:
+    with open("/proc/self/status") as f:
+        rss = next(int(l.split()[1]) for l in f if l.startswith("VmRSS:")) / 1024
+except OSError:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 2**20)
+print(json.dumps({"import_s": elapsed, "rss_mb": rss, "heavy": [m for m in HEAVY if m in sys.modules]}))
+"""
+
+_FIRST_JOB = r"""
+import json, sys, time
+import app.main
+t0 = time.perf_counter()
+import app.jobs.eod_scan, app.jobs.intraday_day_stream
+from strategies.v12_adapter import _require_v12
+try:
+    _require_v12()
+except Exception as exc:
+    print(f"(V12 không nạp được: {exc})", file=sys.stderr)
+print(json.dumps({"first_job_s": time.perf_counter() - t0}))
+"""
+
+
+def _run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=ROOT, capture_output=True, text=True)
+
+
+def import_report(top: int) -> None:
+    proc = _run("import app.main", "-X", "importtime")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = (p.strip() for p in line[len("import time:"):].split("|"))
+        rows.append((int(self_us), int(cum_us), name.strip()))
+    by_pkg = defaultdict(int)
+    for s, _, name in rows:
+        by_pkg[name.split(".")[0]] += s
+    print(f"--- import app.main: {len(rows)} module, tổng self {sum(r[0] for r in rows) / 1e3:.0f} ms ---")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for s, c, name in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"{c / 1e3:>14.1f} {s / 1e3:>8.1f}  {name}")
+    print(f"--- self-time theo package gốc ---")
+    for pkg, s in sorted(by_pkg.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"{s / 1e3:>8.1f} ms  {pkg}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--max-import-s", type=float, default=0.5)
+    parser.add_argument("--max-rss-mb", type=float, default=60.0)
+    args = parser.parse_args()
+
+    import_report(args.top)
+
+    probe = _PROBE.replace("HEAVY", repr(HEAVY))
+    results = []
+    for _ in range(args.runs):
+        proc = _run(probe)
+        if proc.returncode != 0:
+            print(proc.stderr)
+            sys.exit(1)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    import_s = statistics.median(r["import_s"] for r in results)
+    rss_mb = statistics.median(r["rss_mb"] for r in results)
+    heavy = sorted({m for r in results for m in r["heavy"]})
+
+    first = _run(_FIRST_JOB)
+    first_s = json.loads(first.stdout.strip().splitlines()[-1])["first_job_s"] if first.returncode == 0 else None
+
+    print("--- ngân sách khởi động ---")
+    print(f"import app.main : {import_s:.3f}s (ngân sách {args.max_import_s}s, trung vị {args.runs} lần)")
+    print(f"RSS lúc chờ     : {rss_mb:.1f} MB (ngân sách {args.max_rss_mb} MB)")
+    print(f"module nặng     : {', '.join(heavy) if heavy else 'không có'}")
+    if first_s is not None:
+        print(f"nạp job đầu tiên (pandas + feature + V12): {first_s:.2f}s — trả một lần ở lượt chạy job đầu")
+    ok = import_s <= args.max_import_s and rss_mb <= args.max_rss_mb and not heavy
+    print("OK: trong ngân sách" if ok else "VƯỢT NGÂN SÁCH!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
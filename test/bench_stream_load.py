@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_stream_load.py
+Load test cho stream 15m / 1d không cần phiên FiinQuantX: SimClient (app/feed_sim.py) phát lại nến giả lập
+qua SupervisedStream vào đúng handler của job (_handler() → _on_bar_15m / _on_bar_1d, coalescer, shard pool
+tuỳ cấu hình), với số mã tăng dần. Mỗi lượt in:
+- phân vị thời gian callback (p50/p95/p99/max), độ trễ lớn nhất so với lịch feed,
+- backlog (frame đã tới hạn chưa phát) lúc đầu → cuối và lớn nhất: tăng dần = callback không theo kịp feed,
+- số lượt đánh giá / độ trễ của coalescer (1d), số tin cảnh báo và tin/giây.
+Gửi Telegram được thay bằng bộ đếm; alert ledger, shadow log và feature cache ghi vào thư mục tạm.
+
+Ví dụ:
+    python test/bench_stream_load.py --job 1d --sizes 50 200 500 --speed 2000
+    python test/bench_stream_load.py --job 15m --sizes 100 500 1000 --speed 0 --shards 2
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+_TMP = tempfile.mkdtemp(prefix="stream_load_")
+os.environ["ALERT_LEDGER_FILE"] = os.path.join(_TMP, "alert_ledger.sqlite")
+os.environ["SHADOW_LOG_FILE"] = os.path.join(_TMP, "shadow_picks.jsonl")
+os.environ["FEATURE_CACHE_DIR"] = os.path.join(_TMP, "feature_cache")
+
+from app.config import CFG  # noqa: E402
+from app.feed_sim import SimClient  # noqa: E402
+from app.jobs import intraday_day_stream, intraday_stream  # noqa: E402
+from app.notifier import TelegramNotifier  # noqa: E402
+from app.stream_supervisor import SupervisedStream  # noqa: E402
+
+_sent = {"messages": 0}
+_sent_lock = threading.Lock()
+
+
+def _count_send(jobs, parse_mode="HTML") -> list:
+    ok = [bool(text) for _, text in jobs]
+    with _sent_lock:
+        _sent["messages"] += sum(ok)
+    return [True] * len(ok)
+
+
+def run_once(job: str, n_tickers: int, args) -> dict:
+    mod = intraday_stream if job == "15m" else intraday_day_stream
+    client = SimClient("synthetic", speed=args.speed, ticks_per_bar=args.ticks, update_fraction=args.fraction,
+                       replay_bars=args.bars, seed=n_tickers)
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    _sent["messages"] = 0
+    t0 = time.perf_counter()
+    stream = SupervisedStream(f"load-{job}", client, tickers, by=job, on_frame=mod._handler(),
+                              wait_for_full_timeFrame=(job == "15m"), stall_seconds=0)
+    stream.start()
+    client.wait()
+    feed_s = time.perf_counter() - t0
+    stream.stop()
+    co = getattr(mod, "_coalescer", None)
+    co_metrics = None
+    if co is not None:
+        co.stop(flush=True)  # đánh giá nốt cập nhật đang chờ
+        co_metrics = co.metrics()
+    if job == "15m":
+        intraday_stream.stop_intraday_stream()
+    else:
+        intraday_day_stream.stop_intraday_day_stream()
+    wall = time.perf_counter() - t0
+    out = client.events[0].stats.summary()
+    out.update(tickers=n_tickers, feed_s=round(feed_s, 2), wall_s=round(wall, 2),
+               alerts=_sent["messages"], alerts_per_s=round(_sent["messages"] / wall, 2) if wall else 0.0)
+    first = client.events[0].stats.backlog
+    out["backlog_start"] = first[0][1] if first else 0
+    if co_metrics:
+        out.update(evals=co_metrics["evals"], eval_lag_ms=round(co_metrics["max_lag_ms"]))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--job", choices=["15m", "1d"], default="1d")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--speed", type=float, default=2000, help="1 = thời gian thực, 100 = 100×, 0 = nhanh nhất")
+    parser.add_argument("--bars", type=int, default=6, help="số nến phát lại sau warmup")
+    parser.add_argument("--ticks", type=int, default=4, help="số cập nhật mỗi nến đang chạy (1d)")
+    parser.add_argument("--fraction", type=float, default=1.0, help="tỉ lệ mã có trong mỗi tick (1d)")
+    parser.add_argument("--shards", type=int, default=0, help="REALTIME_SHARDS")
+    parser.add_argument("--no-coalescer", action="store_true", help="1d: đánh giá ngay trên thread callback")
+    args = parser.parse_args()
+
+    CFG.realtime_shards = args.shards
+    CFG.use_coalescer = not args.no_coalescer
+    TelegramNotifier.send_each = staticmethod(_count_send)
+
+    mode = f"shards={args.shards}" if args.shards else "tại chỗ"
+    if args.job == "1d":
+        mode += " + coalescer" if CFG.use_coalescer else ""
+    print(f"job={args.job} speed={args.speed or 'max'} bars={args.bars} ({mode})")
+    head = (f"{'mã':>6} {'frame':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8} {'trễ ms':>9} "
+            f"{'backlog':>12} {'eval':>5} {'tin':>5} {'tin/s':>6} {'giây':>6}")
+    print(head)
+    for n in args.sizes:
+        r = run_once(args.job, n, args)
+        backlog = f"{r['backlog_start']}→{r['backlog_end']}({r['max_backlog']})"
+        print(f"{n:>6} {r['frames']:>6} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+              f"{r['max_ms']:>8.1f} {r['max_lag_ms']:>9.0f} {backlog:>12} {r.get('evals', '-'):>5} "
+              f"{r['alerts']:>5} {r['alerts_per_s']:>6.2f} {r['wall_s']:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_stream_supervisor.py
+SupervisedStream (app/stream_supervisor.py) với một feed giả lập thay cho FiinQuantX:
+- feed sinh nến theo nhịp nhanh; kết nối lại chỉ gửi tiếp từ nến hiện tại (không gửi lại phần bị hụt),
+- lần lượt tiêm sự cố: vendor tự dừng (_stop), stall (im lặng), lỗi khi kết nối,
+- kiểm tra mọi nến đã sinh đều tới handler (nhờ backfill khoảng hụt) và đo thời gian phục hồi.
+
+Ví dụ:
+    python test/bench_stream_supervisor.py
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app import stream_supervisor  # noqa: E402
+from app.stream_supervisor import SupervisedStream  # noqa: E402
+
+BAR_SECONDS = 0.05
+T0 = pd.Timestamp("2025-09-19 09:15")
+
+
+class FakeFeed:
+    """Sinh nến 1' (nén thời gian: BAR_SECONDS giây thực / nến) cho danh sách mã."""
+
+    def __init__(self, tickers):
+        self.tickers = tickers
+        self.start = time.monotonic()
+        self.fail_next_connect = False
+
+    def bar_index(self) -> int:
+        return int((time.monotonic() - self.start) / BAR_SECONDS)
+
+    def frame(self, upto: int, since: int = 0) -> pd.DataFrame:
+        idx = range(max(0, since), upto + 1)
+        rows = [(t, T0 + pd.Timedelta(minutes=i), 10.0 + i, 1000.0) for t in self.tickers for i in idx]
+        return pd.DataFrame(rows, columns=["ticker", "timestamp", "close", "volume"])
+
+
+class FakeData:
+    def __init__(self, df):
+        self._df = df
+
+    def to_dataFrame(self):
+        return self._df
+
+
+class FakeEvent:
+    def __init__(self, feed: FakeFeed, callback):
+        self.feed, self.callback = feed, callback
+        self._stop = False
+        self.silent = False
+        self.first = feed.bar_index()  # chỉ gửi từ lúc kết nối, không gửi lại phần hụt
+
+    def get_data(self):
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _pump(self):
+        last = self.first - 1
+        while not self._stop:
+            i = self.feed.bar_index()
+            if i > last and not self.silent:
+                self.callback(FakeData(self.feed.frame(i, since=self.first)))
+                last = i
+            time.sleep(BAR_SECONDS / 5)
+
+    def stop(self):
+        self._stop = True
+
+
+class FakeClient:
+    def __init__(self, feed: FakeFeed):
+        self.feed = feed
+        self.events = []
+
+    def Fetch_Trading_Data(self, realtime, tickers, fields, adjusted, by, callback=None, period=None,
+                           wait_for_full_timeFrame=True):
+        if realtime:
+            if self.feed.fail_next_connect:
+                self.feed.fail_next_connect = False
+                raise ConnectionError("giả lập lỗi kết nối")
+            ev = FakeEvent(self.feed, callback)
+            self.events.append(ev)
+            return ev
+        upto = self.feed.bar_index()
+        return FakeHistory(self.feed.frame(upto, since=upto - period + 1))
+
+
+class FakeHistory:
+    def __init__(self, df):
+        self._df = df
+
+    def get_data(self):
+        return self._df
+
+
+def main():
+    stream_supervisor.in_session = lambda now: True  # feed giả lập chạy mọi giờ
+    stream_supervisor.gap_bars = lambda by, since, now: int((pd.Timestamp(now) - since) / pd.Timedelta(minutes=1)) + 2
+    feed = FakeFeed(["AAA", "BBB", "CCC"])
+    client = FakeClient(feed)
+    seen = set()
+    lock = threading.Lock()
+
+    def on_frame(df):
+        with lock:
+            seen.update(zip(df["ticker"], df["timestamp"]))
+
+    s = SupervisedStream("bench-stream", client, feed.tickers, by="1m", on_frame=on_frame,
+                         stall_seconds=0.3, backoff_base=0.05, backoff_max=0.5, check_seconds=0.05)
+    # đồng hồ giả lập: "bây giờ" theo nến của feed → period backfill đúng khoảng hụt
+    stream_supervisor.now_local = lambda: (T0 + pd.Timedelta(minutes=feed.bar_index())).to_pydatetime()
+    s.start()
+    time.sleep(0.5)
+
+    t = time.monotonic()
+    client.events[-1]._stop = True                      # 1) vendor tự dừng
+    time.sleep(0.6)
+    client.events[-1].silent = True                     # 2) stall: kết nối còn nhưng im lặng
+    feed.fail_next_connect = True                       # 3) lần kết nối lại đầu tiên lỗi
+    time.sleep(1.5)
+    s.stop()
+    elapsed = time.monotonic() - t
+
+    produced = {(tk, T0 + pd.Timedelta(minutes=i)) for tk in feed.tickers for i in range(feed.bar_index() - 5)}
+    missing = produced - seen
+    m = s.metrics()
+    print(f"metrics: {m}")
+    print(f"nến sinh ra: {len(produced)}, thiếu ở handler: {len(missing)} (trong {elapsed:.1f}s có 3 sự cố)")
+    ok = not missing and m["stalls"] >= 1 and m["errors"] >= 1 and m["backfills"] >= 1
+    print("OK: không mất nến qua các lần kết nối lại" if ok else "SAI LỆCH!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
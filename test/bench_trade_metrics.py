@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_trade_metrics.py
+Đo chỉ số theo lệnh trên sổ lệnh lớn (mặc định 1 triệu lệnh giả lập):
+  list[dict] + vòng lặp Python (cách cũ)  vs  TradeBuffer + trade_metrics (vector).
+- Kiểm tra hai cách cho cùng kết quả, đo thời gian append (so với sổ lệnh list[dict] đủ 9 trường của engine cũ,
+  tính cả lần ghi lô vào mảng khi đọc), metrics và ghi parquet.
+
+Ví dụ:
+    python test/bench_trade_metrics.py --trades 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Thêm repo root vào sys.path để import "round_2.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from round_2.trade_buffer import TradeBuffer, trade_metrics  # noqa: E402
+
+
+def metrics_loop(trades: list) -> dict:
+    """Cách tính cũ của calculate_enhanced_metrics (list comprehension + vòng lặp)."""
+    num_trades = len(trades)
+    winning_trades = [t for t in trades if t['profit'] > 0]
+    win_rate = len(winning_trades) / num_trades if num_trades > 0 else 0
+    avg_holding_days = np.mean([t['holding_days'] for t in trades]) if trades else 0
+    total_profit = sum(t['profit'] for t in winning_trades)
+    total_loss = sum(abs(t['profit']) for t in trades if t['profit'] < 0)
+    profit_factor = total_profit / total_loss if total_loss > 0 else np.inf
+    max_consec_losses = current_streak = 0
+    for t in trades:
+        if t['profit'] < 0:
+            current_streak += 1
+            max_consec_losses = max(max_consec_losses, current_streak)
+        else:
+            current_streak = 0
+    return {
+        'Num Trades': num_trades, 'Win Rate': win_rate, 'Avg Holding Days': avg_holding_days,
+        'Profit Factor': profit_factor, 'Max Consec Losses': max_consec_losses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trades", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.trades
+
+    rng = np.random.default_rng(0)
+    tickers = [f"S{i:04d}" for i in range(500)]
+    tk = rng.integers(0, len(tickers), n)
+    entry = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, n), unit="D")
+    hold = rng.integers(1, 30, n)
+    exit_ = entry + pd.to_timedelta(hold, unit="D")
+    price = rng.uniform(5, 150, n)
+    exit_price = price * (1 + rng.normal(0.002, 0.05, n))
+    shares = rng.integers(1, 100, n) * 100
+    profit = (exit_price - price) * shares
+    labels = ("Normal", "Pyramid", "Momentum Loss")
+    et = rng.integers(0, 3, n)
+    entry, exit_ = list(entry), list(exit_)  # engine truyền Timestamp từng lệnh
+
+    t0 = time.perf_counter()
+    buf = TradeBuffer()
+    for i in range(n):
+        buf.append(tickers[tk[i]], entry[i], exit_[i], price[i], exit_price[i],
+                   shares[i], profit[i], hold[i], labels[et[i]])
+    t_buf = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    buf.column('profit')  # lần đọc đầu: ghi cả lô vào mảng theo cột
+    t_flush = time.perf_counter() - t0
+
+    # sổ lệnh cũ của engine: mỗi lệnh một dict đủ 9 trường
+    t0 = time.perf_counter()
+    rows = []
+    for i in range(n):
+        rows.append({'ticker': tickers[tk[i]], 'entry_date': entry[i], 'exit_date': exit_[i],
+                     'entry_price': price[i], 'exit_price': exit_price[i], 'shares': shares[i],
+                     'profit': profit[i], 'holding_days': hold[i], 'exit_type': labels[et[i]]})
+    t_rows = time.perf_counter() - t0
+    print(f"Ghi {n:,} lệnh: TradeBuffer.append {t_buf:.2f}s (+ ghi lô khi đọc {t_flush:.2f}s) | "
+          f"list[dict] {t_rows:.2f}s")
+    probe = rng.integers(0, n, 1000)
+    same_rows = all(buf[int(k)] == {**rows[k], 'shares': int(rows[k]['shares']),
+                                    'holding_days': int(rows[k]['holding_days'])} for k in probe)
+    print(f"Dòng đọc lại khớp list[dict]: {same_rows}")
+
+    t0 = time.perf_counter()
+    old = metrics_loop(rows)
+    t_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = trade_metrics(buf.column('profit'), buf.column('holding_days'))
+    t_new = time.perf_counter() - t0
+    same = all(np.isclose(old[k], new[k], rtol=1e-12) for k in old)
+    print(f"Metrics: vòng lặp {t_old * 1e3:.1f} ms | vector {t_new * 1e3:.2f} ms (x{t_old / t_new:.0f}) | khớp: {same}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "trades.parquet"
+        t0 = time.perf_counter()
+        buf.to_parquet(path)
+        t_pq = time.perf_counter() - t0
+        back = pd.read_parquet(path)
+        ok = back["profit"].to_numpy().tolist() == buf.column("profit").tolist() and len(back) == n
+        print(f"Parquet: ghi {t_pq * 1e3:.0f} ms, {path.stat().st_size / 2**20:.1f} MB | đọc lại khớp: {ok}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+test/bench_vi_alerts.py
+Micro-benchmark formatter/template cảnh báo VN (app/formatters/vi_alerts.py):
+  1) Kiểm tra fast path float cho ra chuỗi GIỐNG HỆT bản Decimal (fuzz, gồm các ca …5 sát ranh giới).
+  2) timeit fmt_money/fmt_num/fmt_pct, build_buy_alert_vi và render memo (formatters/render.py).
+- --rev <git rev>: so thêm với vi_alerts.py tại revision đó (builder cũ → so sánh byte với ts cố định).
+
+Ví dụ:
+    python test/bench_vi_alerts.py
+    python test/bench_vi_alerts.py --rev HEAD~1 --n 200000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import subprocess
+import sys
+import timeit
+import types
+from pathlib import Path
+
+# Thêm repo root vào sys.path để import "app.*"
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.formatters import vi_alerts as va  # noqa: E402
+from app.formatters import render  # noqa: E402
+
+TS = "2025-01-02 14:45:00"
+
+
+def _load_vi_alerts(rev: str):
+    src = subprocess.run(
+        ["git", "-C", str(ROOT), "show", f"{rev}:app/formatters/vi_alerts.py"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    mod = types.ModuleType(f"vi_alerts@{rev}")
+    exec(compile(src, mod.__name__, "exec"), mod.__dict__)
+    return mod
+
+
+def sample_values(n: int, seed: int = 0) -> list:
+    """Giá/tỷ lệ ngẫu nhiên + ca khó: x.xx5, số âm, 0, int, rất lớn, nan, None.
+    (inf không có trong mẫu: bản Decimal vốn raise InvalidOperation.)"""
+    rng = random.Random(seed)
+    vals = [None, 0, 0.0, -0.0, 1, -1, 2.675, 0.125, 1.005, -2.675, 0.005, -0.005,
+            1e7 + 0.005, 123456789.125, float("nan"), True]
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.3:
+            vals.append(round(rng.uniform(1, 200_000), rng.choice([0, 1, 2, 3])))
+        elif r < 0.5:
+            vals.append(rng.randint(0, 1_000_000) / 1000 + 0.0005 * rng.choice([0, 1]))
+        elif r < 0.7:
+            vals.append(rng.uniform(-2, 2))
+        elif r < 0.8:
+            vals.append(rng.randint(-10**6, 10**12))
+        else:
+            vals.append(rng.uniform(-1e9, 1e9))
+    return vals
+
+
+def sample_alerts(n: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    out = [(1000, 1000, 1000), (0, 10, 5), (25.5, 27.5, 25.5), (10, 10.5, 9.5), (20000, 21000, 19500)]
+    for _ in range(n):
+        entry = round(rng.uniform(5, 150), rng.choice([1, 2])) * rng.choice([1, 1000])
+        tp = round(entry * rng.uniform(1.0, 1.2), rng.choice([0, 2]))
+        sl = round(entry * rng.uniform(0.85, 1.0), rng.choice([0, 2]))
+        out.append((entry, tp, sl))
+    return out
+
+
+def check_identity(vals: list, alerts: list, ref_builder=None) -> int:
+    bad = 0
+    for v in vals:
+        for d in (0, 1, 2, 3):
+            pairs = [
+                (va.fmt_money(v, d), va._fmt_money_decimal(v, d)),
+                (va.fmt_num(v, d), va._fmt_num_decimal(v, d)),
+                (va.fmt_pct(v, d), va._fmt_pct_decimal(v, d)),
+            ]
+            for got, want in pairs:
+                if got != want:
+                    bad += 1
+                    if bad <= 10:
+                        print(f"  MISMATCH v={v!r} d={d}: {got!r} != {want!r}")
+    for entry, tp, sl in alerts:
+        got = va._buy_ratios(entry, tp, sl)
+        want = va._buy_ratios_decimal(entry, tp, sl)
+        if got != want:
+            bad += 1
+            if bad <= 10:
+                print(f"  MISMATCH ratios {entry, tp, sl}: {got} != {want}")
+        if ref_builder is not None:
+            new = va.build_buy_alert_vi("FPT", entry, tp, sl, "bull", score=1.2345, ts=TS)
+            old = _ref_with_ts(ref_builder, entry, tp, sl)
+            if new != old:
+                bad += 1
+                if bad <= 10:
+                    print(f"  MISMATCH block {entry, tp, sl}")
+    return bad
+
+
+def _ref_with_ts(ref_builder, entry, tp, sl) -> str:
+    """Builder cũ dùng datetime.now() → thay datetime trong module cũ bằng bản trả ts cố định."""
+    g = ref_builder.__globals__
+    real = g["datetime"]
+
+    class _Fixed(real):
+        @classmethod
+        def now(cls, tz=None):
+            return real(2025, 1, 2, 14, 45, 0)
+    g["datetime"] = _Fixed
+    try:
+        return ref_builder("FPT", entry, tp, sl, "bull", score=1.2345)
+    finally:
+        g["datetime"] = real
+
+
+def bench(label: str, fn, number: int, per: int = 1) -> float:
+    t = min(timeit.repeat(fn, number=number, repeat=3)) / number / per
+    print(f"  {label:<38} {t * 1e6:8.2f} µs")
+    return t
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50_000, help="số mẫu fuzz")
+    parser.add_argument("--rev", type=str, default=None, help="git revision vi_alerts.py để so sánh (vd HEAD~1)")
+    args = parser.parse_args()
+
+    old = _load_vi_alerts(args.rev) if args.rev else None
+    vals = sample_values(args.n)
+    alerts = sample_alerts(args.n // 10)
+    bad = check_identity(vals, alerts, old.build_buy_alert_vi if old else None)
+    print(f"Byte-identity: {len(vals)} giá trị x 4 digits x 3 formatter, {len(alerts)} block → "
+          f"{'OK' if bad == 0 else f'{bad} khác biệt'}")
+
+    rng = random.Random(2)
+    prices = [round(rng.uniform(1, 150), 2) * 1000 for _ in range(1000)]   # giá VNĐ kiểu HOSE
+    ratios = [rng.uniform(-0.15, 0.15) for _ in range(1000)]               # % TP/SL
+    per = len(prices)
+    print(f"\nFormatter (trung bình / lần gọi, {per} giá trị float):")
+    for name in ("fmt_money", "fmt_num", "fmt_pct"):
+        dec = getattr(va, f"_{name}_decimal")
+        fast = getattr(va, name)
+        xs = ratios if name == "fmt_pct" else prices
+        t0 = bench(f"{name} (Decimal)", lambda: [dec(x) for x in xs], 20, per)
+        t1 = bench(f"{name} (fast)", lambda: [fast(x) for x in xs], 20, per)
+        print(f"  → x{t0 / t1:.1f}")
+
+    entry, tp, sl = 25.45, 27.99, 24.18
+    print("\nBlock MUA:")
+    if old is not None:
+        bench(f"build_buy_alert_vi @{args.rev}", lambda: old.build_buy_alert_vi("FPT", entry, tp, sl), 20_000)
+    bench("build_buy_alert_vi (template)", lambda: va.build_buy_alert_vi("FPT", entry, tp, sl, ts=TS), 20_000)
+    bench("render_buy_alert (memo hit)", lambda: render.render_buy_alert("vi", "FPT", entry, tp, sl, "bull", TS), 200_000)
+
+
+if __name__ == "__main__":
+    main()